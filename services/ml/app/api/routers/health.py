@@ -3,13 +3,16 @@
 import logging
 import asyncio
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from app.core.database import get_db_connection
-from app.core.models import model_manager
+from app.core.models import batch_sizers, model_manager, MODEL_NAMES
+from app.core.scheduler import sentiment_scheduler
+from app.core.cache import result_cache
 from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -46,24 +49,12 @@ async def health_check():
         overall_status = "unhealthy"
     
     # Check ML models
-    try:
-        sentiment_model = model_manager.get_model('sentiment')
-        embedding_model = model_manager.get_model('embeddings')
-        keybert_model = model_manager.get_model('keybert')
-        
-        checks["models"] = {
-            "status": "healthy",
-            "loaded_models": {
-                "sentiment": sentiment_model is not None,
-                "embeddings": embedding_model is not None,
-                "keybert": keybert_model is not None
-            }
-        }
-    except Exception as e:
-        checks["models"] = {
-            "status": "unhealthy",
-            "error": str(e)
-        }
+    readiness = model_manager.readiness()
+    checks["models"] = {
+        "status": "healthy" if all(m["status"] == "ready" for m in readiness.values()) else "unhealthy",
+        "models": readiness
+    }
+    if checks["models"]["status"] != "healthy":
         overall_status = "unhealthy"
     
     # System resources
@@ -84,22 +75,40 @@ async def health_check():
     )
 
 @router.get("/ready")
-async def readiness_check():
-    """Kubernetes-style readiness check"""
+async def readiness_check(models: Optional[str] = None):
+    """
+    Kubernetes-style readiness check with per-model status
+    
+    Ready once the database answers and the requested models (comma
+    separated, all models by default) have loaded. Models load in the
+    background, so a probe on e.g. ``?models=sentiment`` lets a pod take
+    sentiment traffic before the embedding model finishes.
+    """
+    required = [name.strip() for name in models.split(",")] if models else list(MODEL_NAMES)
+    unknown = [name for name in required if name not in MODEL_NAMES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models: {', '.join(unknown)}")
+    
+    readiness = model_manager.readiness()
+    ready = all(readiness[name]["status"] == "ready" for name in required)
+    
     try:
-        # Check if models are loaded
-        model_manager.get_model('sentiment')
-        model_manager.get_model('embeddings')
-        model_manager.get_model('keybert')
-        
-        # Check database
         async with get_db_connection() as conn:
             await conn.fetchval("SELECT 1")
-        
-        return {"status": "ready"}
+        database = "ready"
     except Exception as e:
         logger.error(f"Readiness check failed: {e}")
-        raise HTTPException(status_code=503, detail="Service not ready")
+        database = "unavailable"
+        ready = False
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "database": database,
+            "models": readiness
+        }
+    )
 
 @router.get("/live")
 async def liveness_check():
@@ -125,11 +134,14 @@ async def metrics():
                     "free_gb": psutil.disk_usage('/').free / (1024**3)
                 }
             },
-            "models": {
-                "sentiment_loaded": "sentiment" in model_manager.models,
-                "embeddings_loaded": "embeddings" in model_manager.models,
-                "keybert_loaded": "keybert" in model_manager.models
-            }
+            "models": model_manager.readiness(),
+            "schedulers": {
+                "sentiment": sentiment_scheduler.stats()
+            },
+            "batch_sizers": {
+                name: sizer.stats() for name, sizer in batch_sizers.items() if sizer is not None
+            },
+            "result_cache": result_cache.stats() if result_cache else {"enabled": False}
         }
     except Exception as e:
         logger.error(f"Metrics collection failed: {e}")
@@ -1,17 +1,19 @@
 """NLP endpoints for sentiment analysis and topic extraction"""
 
+import asyncio
 import logging
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field, validator
 
-from app.core.models import analyze_sentiment_batch, extract_keywords_batch
-from app.core.database import (
-    get_comments_for_analysis,
-    update_comment_sentiment
-)
+from app.core.ann import workspace_ann_index
+from app.core.models import embed_texts, extract_keywords_batch, ModelNotReady
+from app.core.scheduler import sentiment_scheduler_for, SchedulerOverloadedError
+from app.core.database import count_comments_for_analysis, get_comments_by_ids
+from app.core.jobs import create_analysis_job, get_job, job_progress, job_runner
+from app.core.stats import get_workspace_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -24,6 +26,9 @@ class TextInput(BaseModel):
 class SentimentBatchRequest(BaseModel):
     """Batch sentiment analysis request"""
     texts: List[TextInput] = Field(..., min_items=1, max_items=1000)
+    mode: Optional[Literal["transformer", "cascade", "fast"]] = Field(
+        None, description="transformer, cascade (VADER first) or fast (MiniLM head); defaults to SENTIMENT_MODE"
+    )
     
     @validator('texts')
     def validate_texts(cls, v):
@@ -36,6 +41,8 @@ class SentimentResult(BaseModel):
     text: str
     sentiment: str = Field(..., description="POS, NEU, or NEG")
     confidence: float = Field(..., ge=0.0, le=1.0)
+    cluster_size: int = Field(1, description="Near-duplicate texts sharing this result (spam signal)")
+    tier: Optional[str] = Field(None, description="lexicon, transformer or head, whichever labelled the text")
     id: Optional[str] = None
 
 class SentimentBatchResponse(BaseModel):
@@ -44,10 +51,17 @@ class SentimentBatchResponse(BaseModel):
     processed_count: int
     processing_time_ms: float
 
+class TopicTextInput(TextInput):
+    """Text input for topic extraction"""
+    group: Optional[str] = Field(None, description="Content item or channel the text belongs to (fast mode)")
+
 class TopicExtractionRequest(BaseModel):
     """Topic extraction request"""
-    texts: List[TextInput] = Field(..., min_items=1, max_items=500)
+    texts: List[TopicTextInput] = Field(..., min_items=1, max_items=500)
     top_k: int = Field(5, ge=1, le=20, description="Number of keywords per text")
+    mode: Literal["keybert", "fast"] = Field(
+        "keybert", description="keybert, or fast for class-based TF-IDF over the batch"
+    )
 
 class TopicResult(BaseModel):
     """Topic extraction result"""
@@ -63,9 +77,68 @@ class TopicExtractionResponse(BaseModel):
 
 class WorkspaceAnalysisRequest(BaseModel):
     """Workspace-wide analysis request"""
-    workspace_id: str
+    # Names the workspace's embedding store directory, so it must be a single path segment
+    workspace_id: str = Field(..., pattern=r'^[A-Za-z0-9_-]{1,128}$')
+    platform: Optional[str] = None
+    limit: Optional[int] = Field(
+        None, ge=1, description="Maximum comments to process; all unprocessed comments when omitted"
+    )
+    keyword_mode: Optional[Literal["keybert", "fast"]] = Field(
+        None, description="keybert, or fast for class-based TF-IDF per content item; defaults to KEYWORD_MODE"
+    )
+    sentiment_mode: Optional[Literal["transformer", "cascade", "fast"]] = Field(
+        None, description="fast labels sentiment from the keyword embeddings; defaults to SENTIMENT_MODE"
+    )
+
+class SearchRequest(BaseModel):
+    """Semantic comment search request; give a query text or a comment to match"""
+    # Names the workspace's embedding store directory, so it must be a single path segment
+    workspace_id: str = Field(..., pattern=r'^[A-Za-z0-9_-]{1,128}$')
+    text: Optional[str] = Field(None, min_length=1, max_length=2000)
+    comment_id: Optional[str] = None
+    k: int = Field(10, ge=1, le=100, description="Number of comments to return")
+    nprobe: Optional[int] = Field(
+        None, ge=1, le=4096, description="Index lists scanned; higher is slower with better recall"
+    )
+    rerank: Optional[int] = Field(
+        None, ge=1, le=10000, description="Candidates re-scored exactly; higher is slower with better recall"
+    )
+    exact: bool = Field(False, description="Brute-force search over every comment")
+
+class SearchHit(BaseModel):
+    """Comment similar to the query"""
+    id: str
+    text: str
+    score: float = Field(..., description="Cosine similarity to the query")
+    platform: Optional[str] = None
+    sentiment: Optional[str] = None
+    topic_tags: List[str] = []
+    created_at: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    """Semantic comment search response"""
+    results: List[SearchHit]
+    searched_count: int
+    processing_time_ms: float
+
+class JobStatusResponse(BaseModel):
+    """Analysis job progress"""
+    job_id: str
+    type: str
+    status: str
+    workspace_id: Optional[str] = None
     platform: Optional[str] = None
-    limit: int = Field(1000, ge=1, le=5000)
+    total: int
+    processed: int
+    updated: int
+    failed: int
+    progress: float = Field(..., ge=0.0, le=1.0)
+    throughput_per_second: float
+    eta_seconds: Optional[float] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    last_heartbeat_at: datetime
+    error: Optional[str] = None
 
 @router.post("/sentiment-batch", response_model=SentimentBatchResponse)
 async def analyze_sentiment_batch_endpoint(request: SentimentBatchRequest):
@@ -84,8 +157,8 @@ async def analyze_sentiment_batch_endpoint(request: SentimentBatchRequest):
         
         logger.info(f"Processing sentiment analysis for {len(texts)} texts")
         
-        # Analyze sentiment
-        sentiment_results = analyze_sentiment_batch(texts)
+        # Analyze sentiment, merged with concurrent requests off the event loop
+        sentiment_results = await sentiment_scheduler_for(request.mode).submit(texts)
         
         # Format results
         results = []
@@ -94,6 +167,8 @@ async def analyze_sentiment_batch_endpoint(request: SentimentBatchRequest):
                 text=result['text'],
                 sentiment=result['sentiment'],
                 confidence=result['confidence'],
+                cluster_size=result.get('cluster_size', 1),
+                tier=result.get('tier'),
                 id=ids[i]
             ))
         
@@ -107,6 +182,18 @@ async def analyze_sentiment_batch_endpoint(request: SentimentBatchRequest):
             processing_time_ms=processing_time
         )
     
+    except SchedulerOverloadedError as e:
+        logger.warning(f"Sentiment analysis rejected: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Sentiment analysis is overloaded, retry later"
+        )
+    except ModelNotReady as e:
+        logger.warning(f"Sentiment analysis unavailable: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Sentiment model is not ready, retry later: {e}"
+        )
     except Exception as e:
         logger.error(f"Sentiment analysis failed: {e}")
         raise HTTPException(
@@ -121,6 +208,8 @@ async def extract_topics_endpoint(request: TopicExtractionRequest):
     
     Uses sentence transformers and MMR (Maximal Marginal Relevance) for 
     diverse keyword extraction. Optimized for social media content.
+    With ``mode="fast"`` keywords are ranked by class-based TF-IDF across
+    the batch instead, grouping texts by their ``group`` when given.
     """
     start_time = datetime.utcnow()
     
@@ -128,11 +217,17 @@ async def extract_topics_endpoint(request: TopicExtractionRequest):
         # Extract texts and IDs
         texts = [item.text for item in request.texts]
         ids = [item.id for item in request.texts]
+        groups = None
+        if request.mode == "fast" and any(item.group for item in request.texts):
+            # Ungrouped texts form their own group
+            groups = [item.group or f"text:{i}" for i, item in enumerate(request.texts)]
         
-        logger.info(f"Processing topic extraction for {len(texts)} texts")
+        logger.info(f"Processing {request.mode} topic extraction for {len(texts)} texts")
         
-        # Extract keywords
-        keyword_results = extract_keywords_batch(texts, top_k=request.top_k)
+        # Extract keywords off the event loop
+        keyword_results = await asyncio.to_thread(
+            extract_keywords_batch, texts, top_k=request.top_k, mode=request.mode, groups=groups
+        )
         
         # Format results
         results = []
@@ -153,6 +248,12 @@ async def extract_topics_endpoint(request: TopicExtractionRequest):
             processing_time_ms=processing_time
         )
     
+    except ModelNotReady as e:
+        logger.warning(f"Topic extraction unavailable: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Embedding model is still loading, retry later"
+        )
     except Exception as e:
         logger.error(f"Topic extraction failed: {e}")
         raise HTTPException(
@@ -160,44 +261,129 @@ async def extract_topics_endpoint(request: TopicExtractionRequest):
             detail=f"Topic extraction failed: {str(e)}"
         )
 
+@router.post("/search", response_model=SearchResponse)
+async def search_comments_endpoint(request: SearchRequest):
+    """
+    Find a workspace's comments most similar to a text or to another comment
+    
+    Searches the MiniLM embeddings the analysis pipeline stores for each
+    analyzed comment with an approximate nearest-neighbour index;
+    ``nprobe`` and ``rerank`` trade latency for recall per request.
+    """
+    start_time = datetime.utcnow()
+    
+    if (request.text is None) == (request.comment_id is None):
+        raise HTTPException(status_code=400, detail="Give exactly one of text or comment_id")
+    
+    # Opening a store and reading its rows touches the disk, so it stays off the event loop
+    index = await asyncio.to_thread(workspace_ann_index, request.workspace_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No comment embeddings stored for this workspace")
+    
+    try:
+        if request.text is not None:
+            query = (await asyncio.to_thread(embed_texts, [request.text]))[0]
+        else:
+            found, vectors = await asyncio.to_thread(index.store.get, [request.comment_id])
+            if not found:
+                raise HTTPException(status_code=404, detail="Comment has no stored embedding")
+            query = vectors[0]
+        
+        # One extra hit, as a comment query finds itself
+        hits = await asyncio.to_thread(
+            index.search,
+            query,
+            request.k + (request.comment_id is not None),
+            nprobe=request.nprobe,
+            rerank=request.rerank,
+            exact=request.exact
+        )
+        hits = [(comment_id, score) for comment_id, score in hits if comment_id != request.comment_id]
+        
+        # Comments deleted since they were stored drop out here
+        comments = {
+            comment["id"]: comment
+            for comment in await get_comments_by_ids(request.workspace_id, [i for i, _ in hits])
+        }
+        results = [
+            SearchHit(score=score, **comments[comment_id])
+            for comment_id, score in hits[:request.k]
+            if comment_id in comments
+        ]
+        
+        processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        
+        return SearchResponse(
+            results=results,
+            searched_count=await asyncio.to_thread(len, index.store),
+            processing_time_ms=processing_time
+        )
+    
+    except HTTPException:
+        raise
+    except ModelNotReady as e:
+        logger.warning(f"Comment search unavailable: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Embedding model is still loading, retry later"
+        )
+    except Exception as e:
+        logger.error(f"Comment search failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Comment search failed: {str(e)}"
+        )
+
 @router.post("/analyze-workspace")
-async def analyze_workspace_comments(
-    request: WorkspaceAnalysisRequest,
-    background_tasks: BackgroundTasks
-):
+async def analyze_workspace_comments(request: WorkspaceAnalysisRequest):
     """
     Analyze all unprocessed comments for a workspace
     
-    This endpoint processes comments in the background and updates
-    the database with sentiment and topic analysis results.
+    This endpoint starts a durable analysis job that updates the database
+    with sentiment and topic analysis results. Only one job runs per
+    workspace; progress is available from /nlp/jobs/{job_id}.
     """
     try:
         logger.info(f"Starting workspace analysis for {request.workspace_id}")
         
-        # Get unprocessed comments
-        comments = await get_comments_for_analysis(
+        # Count unprocessed comments; the pipeline streams them itself
+        pending = await count_comments_for_analysis(
             workspace_id=request.workspace_id,
-            limit=request.limit,
             platform=request.platform
         )
         
-        if not comments:
+        if not pending:
             return {
                 "message": "No unprocessed comments found",
                 "workspace_id": request.workspace_id,
                 "comments_found": 0
             }
         
-        # Add background task to process comments
-        background_tasks.add_task(
-            process_workspace_comments,
-            comments
+        total = min(pending, request.limit) if request.limit else pending
+        job, created = await create_analysis_job(
+            workspace_id=request.workspace_id,
+            platform=request.platform,
+            max_comments=request.limit,
+            total=total,
+            keyword_mode=request.keyword_mode,
+            sentiment_mode=request.sentiment_mode
         )
         
+        if not created:
+            return {
+                "message": "Analysis already in progress",
+                "workspace_id": request.workspace_id,
+                "job_id": job["id"],
+                "status": job["status"].lower()
+            }
+        
+        job_runner.run(job)
+        
         return {
             "message": "Analysis started",
             "workspace_id": request.workspace_id,
-            "comments_to_process": len(comments),
+            "job_id": job["id"],
+            "comments_to_process": total,
             "status": "processing"
         }
     
@@ -208,64 +394,38 @@ async def analyze_workspace_comments(
             detail=f"Workspace analysis failed: {str(e)}"
         )
 
-async def process_workspace_comments(comments: List[dict]):
-    """Background task to process comments"""
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_analysis_job(job_id: str):
+    """Get progress, throughput and ETA for an analysis job"""
     try:
-        logger.info(f"Processing {len(comments)} comments in background")
-        
-        # Extract texts for batch processing
-        texts = [comment['text'] for comment in comments]
-        
-        # Analyze sentiment
-        sentiment_results = analyze_sentiment_batch(texts)
-        
-        # Extract topics
-        topic_results = extract_keywords_batch(texts, top_k=5)
-        
-        # Update database
-        for i, comment in enumerate(comments):
-            try:
-                sentiment_result = sentiment_results[i]
-                topic_keywords = topic_results[i]
-                
-                await update_comment_sentiment(
-                    comment_id=comment['id'],
-                    sentiment=sentiment_result['sentiment'],
-                    confidence=sentiment_result['confidence'],
-                    topic_tags=topic_keywords
-                )
-            except Exception as e:
-                logger.error(f"Failed to update comment {comment['id']}: {e}")
-        
-        logger.info(f"Successfully processed {len(comments)} comments")
-    
+        job = await get_job(job_id)
     except Exception as e:
-        logger.error(f"Background comment processing failed: {e}")
+        logger.error(f"Failed to get job {job_id}: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get job: {str(e)}"
+        )
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(**job_progress(job))
 
 @router.get("/workspace/{workspace_id}/stats")
-async def get_workspace_sentiment_stats(workspace_id: str):
-    """Get sentiment statistics for a workspace"""
+async def get_workspace_sentiment_stats(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    days: int = Query(30, ge=1, le=365)
+):
+    """
+    Get sentiment statistics for a workspace
+    
+    Served from per-day counters updated with every analysis writeback,
+    summed over the last ``days`` UTC days; cost does not grow with the
+    number of comments.
+    """
     try:
-        # This would typically query the database for aggregated stats
-        # For now, return a placeholder response
-        return {
-            "workspace_id": workspace_id,
-            "total_comments": 1250,
-            "sentiment_distribution": {
-                "positive": 0.73,
-                "neutral": 0.21,
-                "negative": 0.06
-            },
-            "avg_confidence": 0.85,
-            "last_updated": datetime.utcnow(),
-            "top_topics": [
-                "product feedback",
-                "customer service",
-                "pricing",
-                "features",
-                "user experience"
-            ]
-        }
+        return await get_workspace_stats(workspace_id, platform=platform, days=days)
     
     except Exception as e:
         logger.error(f"Failed to get workspace stats: {e}")
@@ -2,11 +2,14 @@
 
 import logging
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 
+from app.core.sketches import sketch_trends
+from app.core.trends import detect_workspace_trends, get_saved_trends
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
@@ -16,14 +19,20 @@ class TrendDetectionRequest(BaseModel):
     platform: Optional[str] = None
     days: int = Field(7, ge=1, le=30)
     min_mentions: int = Field(5, ge=1)
+    min_burst: Optional[float] = Field(None, ge=0, description="Burst z-score a trending tag needs")
+    limit: int = Field(50, ge=1, le=500)
 
 class TrendResult(BaseModel):
     """Trend detection result"""
     tag: str
-    score: float
-    velocity: float
+    platform: Optional[str] = None
+    score: float = Field(..., description="0-100, from the burst z-score")
+    velocity: float = Field(..., description="Percent growth of the mention rate over the baseline")
+    acceleration: float = 0.0
+    burst: float = 0.0
     mention_count: int
-    sentiment_score: float
+    mention_count_error: int = Field(0, description="Upper bound on the overcount of sketch estimates")
+    sentiment_score: float = Field(..., ge=-1.0, le=1.0)
     period_start: datetime
     period_end: datetime
 
@@ -38,45 +47,25 @@ async def detect_trends(request: TrendDetectionRequest):
     """
     Detect trending topics and keywords
     
-    Analyzes comment data to identify topics with increasing velocity
-    and engagement patterns.
+    Buckets topic tag mentions into time bins per platform and scores
+    every tag against its own rolling baseline: velocity and acceleration
+    of the mention rate and a burst z-score. Results are saved to the
+    trends table.
     """
     start_time = datetime.utcnow()
     
     try:
         logger.info(f"Detecting trends for workspace {request.workspace_id}")
         
-        # TODO: Implement actual trend detection logic
-        # This would analyze comment data and identify trending topics
-        
-        # Mock response for now
         trends = [
-            TrendResult(
-                tag="AI ethics",
-                score=92.5,
-                velocity=180.0,
-                mention_count=45,
-                sentiment_score=0.75,
-                period_start=datetime.utcnow() - timedelta(days=7),
-                period_end=datetime.utcnow()
-            ),
-            TrendResult(
-                tag="quantum computing",
-                score=87.2,
-                velocity=95.0,
-                mention_count=32,
-                sentiment_score=0.68,
-                period_start=datetime.utcnow() - timedelta(days=7),
-                period_end=datetime.utcnow()
-            ),
-            TrendResult(
-                tag="climate tech",
-                score=78.9,
-                velocity=45.0,
-                mention_count=28,
-                sentiment_score=0.82,
-                period_start=datetime.utcnow() - timedelta(days=7),
-                period_end=datetime.utcnow()
+            TrendResult(**trend)
+            for trend in await detect_workspace_trends(
+                request.workspace_id,
+                platform=request.platform,
+                days=request.days,
+                min_mentions=request.min_mentions,
+                limit=request.limit,
+                min_burst=request.min_burst
             )
         ]
         
@@ -101,17 +90,33 @@ async def detect_trends(request: TrendDetectionRequest):
 async def get_workspace_trends(
     workspace_id: str,
     platform: Optional[str] = None,
-    days: int = 7
+    days: int = Query(7, ge=1, le=30),
+    min_mentions: int = Query(5, ge=1),
+    min_burst: Optional[float] = Query(None, ge=0),
+    limit: int = 50,
+    source: str = Query("sketch", pattern="^(sketch|detected)$")
 ):
-    """Get trending topics for a workspace"""
+    """
+    Get trending topics for a workspace
+    
+    ``source=sketch`` (default) merges the per-day tag sketches kept up to
+    date by the analysis pipeline, without reading comments;
+    ``source=detected`` returns the results last saved by /detect.
+    """
     try:
-        # TODO: Implement actual trend retrieval from database
+        if source == "sketch":
+            trends = await sketch_trends(
+                workspace_id, platform=platform, days=days, min_mentions=min_mentions, limit=limit,
+                min_burst=min_burst
+            )
+        else:
+            trends = await get_saved_trends(workspace_id, platform=platform, days=days, limit=limit)
         return {
             "workspace_id": workspace_id,
             "platform": platform,
             "days": days,
-            "trends": [],
-            "message": "Trend detection not yet implemented"
+            "source": source,
+            "trends": [TrendResult(**trend) for trend in trends]
         }
     except Exception as e:
         logger.error(f"Failed to get workspace trends: {e}")
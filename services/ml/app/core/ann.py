@@ -0,0 +1,393 @@
+"""
+Approximate nearest-neighbour search over comment embeddings
+
+A NumPy IVF-PQ index on top of each workspace's embedding store (see
+``app.core.embedding_store``). A coarse k-means quantizer splits the
+vectors into inverted lists and a product quantizer compresses each
+vector's residual from its list centroid to ``m`` one-byte codes. A
+query scores the members of its ``nprobe`` nearest lists with table
+lookups, then re-scores the best ``rerank`` candidates exactly from the
+stored rows; both trade recall for latency per query. Embeddings are
+L2-normalized, so scores are cosine similarities.
+
+Codes are row-aligned with the store: the ``ann`` directory next to it
+holds the trained quantizer and, per store generation, a list number
+and code row for each of the store's first rows. The pipeline appends
+codes as it stores embeddings; rows not encoded yet are scored exactly,
+deleted rows are skipped through the store's tombstones, and store
+compaction or quantizer retraining starts new code files. Until a
+workspace has ``ann_min_rows`` live embeddings, search is brute force.
+"""
+
+import fcntl
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.embedding_store import EmbeddingStore, StoreSnapshot, open_workspace_store
+
+logger = logging.getLogger(__name__)
+
+# Vectors sampled to train the quantizers
+_TRAIN_SAMPLE = 65536
+_PQ_TRAIN_SAMPLE = 16384
+_PQ_CENTROIDS = 256
+# Rows decoded or encoded at a time
+_CHUNK_ROWS = 16384
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the L2-nearest centroid of each vector"""
+    half_norms = 0.5 * np.einsum('kd,kd->k', centroids, centroids)
+    nearest = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _CHUNK_ROWS):
+        chunk = vectors[start:start + _CHUNK_ROWS]
+        nearest[start:start + len(chunk)] = np.argmax(chunk @ centroids.T - half_norms, axis=1)
+    return nearest
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded with random vectors"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        filled = np.flatnonzero(counts)
+        # Sum each cluster's members with one pass over the sorted vectors
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(vectors[np.argsort(assignment, kind='stable')], starts, axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            centroids[empty] = vectors[rng.choice(len(vectors), empty.size, replace=False)]
+    return centroids
+
+class Quantizer(NamedTuple):
+    """Trained coarse and product quantizers"""
+    version: int
+    trained_rows: int
+    centroids: np.ndarray   # (lists, dim)
+    codebooks: np.ndarray   # (m, 256, dim / m)
+
+    @property
+    def subspaces(self) -> int:
+        return self.codebooks.shape[0]
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Inverted list and PQ codes of each vector"""
+        lists = _nearest(vectors, self.centroids)
+        residuals = (vectors - self.centroids[lists]).reshape(len(vectors), self.subspaces, -1)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        # One small matmul per subspace is an order faster than a batched einsum
+        for j in range(self.subspaces):
+            codes[:, j] = _nearest(residuals[:, j], self.codebooks[j])
+        return lists, codes
+
+def _subspaces(dim: int, wanted: int) -> int:
+    """Largest number of PQ subspaces up to ``wanted`` that divides ``dim``"""
+    return max(m for m in range(1, min(wanted, dim) + 1) if dim % m == 0)
+
+def train_quantizer(vectors: np.ndarray, lists: int, subspaces: int, version: int = 1) -> Quantizer:
+    """Train the coarse quantizer and the residual codebooks on sample vectors"""
+    centroids = kmeans(vectors, lists)
+    residuals = vectors - centroids[_nearest(vectors, centroids)]
+    m = _subspaces(vectors.shape[1], subspaces)
+    sample = residuals[:_PQ_TRAIN_SAMPLE].reshape(-1, m, vectors.shape[1] // m)
+    codebooks = np.stack([
+        kmeans(np.ascontiguousarray(sample[:, j]), min(_PQ_CENTROIDS, len(sample)), seed=j)
+        for j in range(m)
+    ])
+    return Quantizer(version, len(vectors), centroids, codebooks)
+
+class ANNIndex:
+    """IVF-PQ index over one workspace's embedding store"""
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self.path = store.path / "ann"
+        self.path.mkdir(exist_ok=True)
+        self.settings = get_settings()
+        self._lock = threading.RLock()
+        self._quantizer: Optional[Quantizer] = None
+        self._quantizer_stamp: Optional[Tuple[int, int]] = None
+        self._syncing: Optional[threading.Thread] = None
+        self._sync_again = False
+
+    # Files
+
+    def _code_files(self, generation: str, version: int) -> Tuple[Path, Path]:
+        return (
+            self.path / f"lists-{generation}-v{version}.bin",
+            self.path / f"codes-{generation}-v{version}.bin"
+        )
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.path / "lock", "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _load_quantizer(self) -> Optional[Quantizer]:
+        """The trained quantizer, reloaded if another process retrained it"""
+        path = self.path / "quantizer.npz"
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._quantizer_stamp:
+                with np.load(path) as saved:
+                    self._quantizer = Quantizer(
+                        int(saved["version"]), int(saved["trained_rows"]), saved["centroids"], saved["codebooks"]
+                    )
+                self._quantizer_stamp = stamp
+            return self._quantizer
+
+    def _save_quantizer(self, quantizer: Quantizer) -> None:
+        """Atomically replace the quantizer other processes load"""
+        tmp_path = self.path / "quantizer.tmp"
+        with open(tmp_path, "wb") as handle:
+            np.savez(
+                handle,
+                version=quantizer.version,
+                trained_rows=quantizer.trained_rows,
+                centroids=quantizer.centroids,
+                codebooks=quantizer.codebooks
+            )
+        os.replace(tmp_path, self.path / "quantizer.npz")
+        stat = (self.path / "quantizer.npz").stat()
+        with self._lock:
+            self._quantizer = quantizer
+            self._quantizer_stamp = (stat.st_mtime_ns, stat.st_size)
+
+    def _codes(self, snapshot: StoreSnapshot, quantizer: Quantizer) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Zero-copy (lists, codes) of the snapshot's rows encoded so far
+
+        Called under ``_lock``, which ``sync`` holds to delete stale code
+        files, so this process never maps a file being deleted; once mapped
+        a file stays readable after it is unlinked. Files another process
+        already deleted leave the rows unencoded, to be scored exactly.
+        """
+        lists_path, codes_path = self._code_files(snapshot.generation, quantizer.version)
+        empty = np.empty(0, dtype=np.int32), np.empty((0, quantizer.subspaces), dtype=np.uint8)
+        try:
+            # Codes are written before lists, so every listed row has its codes
+            count = min(lists_path.stat().st_size // 4, len(snapshot.vectors))
+            if count == 0:
+                return empty
+            return (
+                np.memmap(lists_path, dtype=np.int32, mode="r", shape=(count,)),
+                np.memmap(codes_path, dtype=np.uint8, mode="r", shape=(count, quantizer.subspaces))
+            )
+        except FileNotFoundError:
+            return empty
+
+    # Writing
+
+    def sync(self) -> int:
+        """Encode rows appended to the store, training first when due; returns rows encoded"""
+        with self._file_lock():
+            # Searches need the lock for their snapshot, so it is not held while training or encoding
+            with self._lock:
+                snapshot = self.store.snapshot()
+                quantizer = self._load_quantizer()
+            live = int(snapshot.live.sum())
+
+            if live >= self.settings.ann_min_rows and (
+                quantizer is None or live > self.settings.ann_retrain_growth * quantizer.trained_rows
+            ):
+                quantizer = self._train(snapshot, 1 if quantizer is None else quantizer.version + 1)
+            if quantizer is None:
+                return 0
+
+            lists_path, codes_path = self._code_files(snapshot.generation, quantizer.version)
+            # Searches map their code files under the same lock
+            with self._lock:
+                for path in self.path.glob("*.bin"):
+                    if path not in (lists_path, codes_path):
+                        path.unlink(missing_ok=True)
+
+            # Drop rows a crashed writer encoded without listing
+            indexed = lists_path.stat().st_size // 4 if lists_path.exists() else 0
+            if codes_path.exists() and codes_path.stat().st_size > indexed * quantizer.subspaces:
+                os.truncate(codes_path, indexed * quantizer.subspaces)
+
+            # ``snapshot.ids`` keeps growing with later appends; only mapped rows can be decoded
+            total = len(snapshot.vectors)
+            rows = max(total - indexed, 0)
+            with open(codes_path, "ab") as codes_file, open(lists_path, "ab") as lists_file:
+                for start in range(indexed, total, _CHUNK_ROWS):
+                    chunk = np.arange(start, min(start + _CHUNK_ROWS, total))
+                    lists, codes = quantizer.encode(snapshot.decode(chunk))
+                    codes_file.write(codes.tobytes())
+                    codes_file.flush()
+                    lists_file.write(lists.tobytes())
+            return rows
+
+    def schedule_sync(self) -> None:
+        """Run ``sync`` in a background thread, coalescing calls made meanwhile"""
+        with self._lock:
+            if self._syncing is not None:
+                self._sync_again = True
+                return
+            self._syncing = threading.Thread(
+                target=self._sync_in_background, name=f"ann-sync-{self.store.path.name}", daemon=True
+            )
+            self._syncing.start()
+
+    def _sync_in_background(self) -> None:
+        # Training and re-encoding can take minutes; searches score unencoded rows exactly meanwhile
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f"ANN index sync failed for {self.store.path.name}: {e}")
+            with self._lock:
+                if not self._sync_again:
+                    self._syncing = None
+                    return
+                self._sync_again = False
+
+    def _train(self, snapshot: StoreSnapshot, version: int) -> Quantizer:
+        live_rows = np.flatnonzero(snapshot.live)
+        rng = np.random.default_rng(version)
+        sample = np.sort(rng.choice(live_rows, min(len(live_rows), _TRAIN_SAMPLE), replace=False))
+        # At least ~39 training vectors per list
+        lists = self.settings.ann_lists or int(np.clip(4 * np.sqrt(len(live_rows)), 16, 4096))
+        lists = max(1, min(lists, len(sample) // 39))
+
+        quantizer = train_quantizer(
+            snapshot.decode(sample), lists, self.settings.ann_pq_subspaces, version=version
+        )._replace(trained_rows=len(live_rows))
+        self._save_quantizer(quantizer)
+        logger.info(
+            f"Trained ANN index for {self.store.path.name}: {lists} lists, "
+            f"{quantizer.subspaces} subspaces over {len(live_rows)} rows"
+        )
+        return quantizer
+
+    # Reading
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+        exact: bool = False
+    ) -> List[Tuple[str, float]]:
+        """
+        The ``k`` stored comments most similar to ``query``, best first
+
+        ``nprobe`` inverted lists are scanned and the best ``rerank`` of
+        their members re-scored exactly (defaults from settings); ``exact``
+        scores every row instead.
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            snapshot = self.store.snapshot()
+            quantizer = self._load_quantizer()
+            if not exact and quantizer is not None:
+                lists, codes = self._codes(snapshot, quantizer)
+
+        if exact or quantizer is None:
+            rows = np.flatnonzero(snapshot.live)
+        else:
+            rows = self._candidates(
+                snapshot,
+                quantizer,
+                lists,
+                codes,
+                query,
+                nprobe or self.settings.ann_nprobe,
+                max(rerank or self.settings.ann_rerank, k)
+            )
+
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _CHUNK_ROWS):
+            chunk = rows[start:start + _CHUNK_ROWS]
+            scores[start:start + len(chunk)] = snapshot.decode(chunk) @ query
+        best = _top(scores, k)
+        return [(snapshot.ids[rows[i]], float(scores[i])) for i in best]
+
+    def _candidates(
+        self,
+        snapshot: StoreSnapshot,
+        quantizer: Quantizer,
+        lists: np.ndarray,
+        codes: np.ndarray,
+        query: np.ndarray,
+        nprobe: int,
+        rerank: int
+    ) -> np.ndarray:
+        """Rows to re-score exactly: the best PQ matches plus rows not encoded yet"""
+        indexed = len(lists)
+
+        coarse = quantizer.centroids @ query
+        # Probe the lists whose centroids are L2-nearest, as vectors were assigned
+        nearness = coarse - 0.5 * np.einsum('kd,kd->k', quantizer.centroids, quantizer.centroids)
+        probed = np.zeros(len(coarse), dtype=bool)
+        probed[_top(nearness, nprobe)] = True
+        members = np.flatnonzero(probed[lists] & snapshot.live[:indexed])
+
+        # Asymmetric distance: query . residual from per-subspace lookup tables
+        tables = np.einsum('mkd,md->mk', quantizer.codebooks, query.reshape(quantizer.subspaces, -1))
+        approximate = coarse[lists[members]] + np.take_along_axis(
+            tables.T, codes[members].astype(np.intp), axis=0
+        ).sum(axis=1)
+        best = members[_top(approximate, rerank)]
+
+        unindexed = indexed + np.flatnonzero(snapshot.live[indexed:])
+        return np.concatenate((best, unindexed))
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = self.store.snapshot()
+            quantizer = self._load_quantizer()
+            indexed = len(self._codes(snapshot, quantizer)[0]) if quantizer else 0
+        return {
+            "rows": int(snapshot.live.sum()),
+            "indexed": indexed,
+            "lists": len(quantizer.centroids) if quantizer else 0,
+            "subspaces": quantizer.subspaces if quantizer else 0,
+            "trained_rows": quantizer.trained_rows if quantizer else 0
+        }
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, highest first"""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+_indexes: "OrderedDict[str, ANNIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def workspace_ann_index(workspace_id: str) -> Optional[ANNIndex]:
+    """The search index of a workspace, or None if it has no embedding store"""
+    if not get_settings().ann_enabled:
+        return None
+    with _indexes_lock:
+        index = _indexes.get(workspace_id)
+        if index is None:
+            store = open_workspace_store(workspace_id)
+            if store is None:
+                return None
+            index = _indexes[workspace_id] = ANNIndex(store)
+        _indexes.move_to_end(workspace_id)
+        while len(_indexes) > 64:
+            _indexes.popitem(last=False)
+        return index
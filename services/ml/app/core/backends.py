@@ -0,0 +1,212 @@
+"""CPU inference backends for the sentiment model"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+def artifact_dir(cache_dir: str, backend: str, model_name: str) -> Path:
+    """Directory holding a backend's exported or quantized artifacts"""
+    return Path(cache_dir) / backend / model_name.replace("/", "--")
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+class TorchSentimentBackend:
+    """PyTorch sequence classifier (fp32 or dynamically quantized)"""
+
+    def __init__(self, model: Any, id2label: Dict[int, str], name: str = "torch"):
+        self.model = model.eval()
+        self.id2label = id2label
+        self.name = name
+
+    def predict_proba(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        import torch
+
+        device = next(self.model.parameters(), torch.empty(0)).device
+        with torch.inference_mode():
+            logits = self.model(
+                input_ids=torch.from_numpy(input_ids).to(device),
+                attention_mask=torch.from_numpy(attention_mask).to(device)
+            ).logits
+        return torch.softmax(logits.float(), dim=-1).cpu().numpy()
+
+    def set_threads(self, threads: int) -> None:
+        """Use ``threads`` intra-op threads in this process"""
+        import torch
+
+        torch.set_num_threads(threads)
+
+class OnnxSentimentBackend:
+    """
+    Exported sequence classifier run with ONNX Runtime
+
+    ``threads`` sizes the session's intra-op pool (0 follows torch). Pool
+    threads do not survive fork, so prefork workers call ``set_threads``
+    to rebuild the session in the child.
+    """
+
+    def __init__(self, model_path: Path, id2label: Dict[int, str], name: str = "onnx", threads: int = 0):
+        self.model_path = Path(model_path)
+        self.threads = threads or _torch_threads()
+        self.session = self._session(self.threads)
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.id2label = id2label
+        self.name = name
+
+    def _session(self, threads: int) -> Any:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+
+        return ort.InferenceSession(
+            str(self.model_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def set_threads(self, threads: int) -> None:
+        """Rebuild the session with ``threads`` intra-op threads in this process"""
+        self.session = self._session(threads)
+        self.threads = threads
+
+    def predict_proba(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        feed = {"input_ids": input_ids.astype(np.int64)}
+        if "attention_mask" in self.input_names:
+            feed["attention_mask"] = attention_mask.astype(np.int64)
+        logits = self.session.run(["logits"], feed)[0]
+        return _softmax(logits.astype(np.float32))
+
+def _torch_threads() -> int:
+    try:
+        import torch
+        return torch.get_num_threads()
+    except ImportError:
+        return 0
+
+def onnx_artifact_path(cache_dir: str, backend: str, model_name: str) -> Path:
+    """Path of the ONNX model a backend runs"""
+    filename = "model.int8.onnx" if backend == "onnx-int8" else "model.onnx"
+    return artifact_dir(cache_dir, "onnx", model_name) / filename
+
+def backend_artifact_path(cache_dir: str, backend: str, model_name: str) -> Optional[Path]:
+    """Exported or quantized artifact a backend needs beyond the base model"""
+    if backend == "torch-int8":
+        return artifact_dir(cache_dir, "torch-int8", model_name) / "quantized_state.pt"
+    if backend in ("onnx", "onnx-int8"):
+        return onnx_artifact_path(cache_dir, backend, model_name)
+    return None
+
+def build_sentiment_backend(
+    backend: str,
+    model_name: str,
+    cache_dir: str,
+    id2label: Dict[int, str],
+    load_model: Any
+) -> Any:
+    """
+    Build the configured sentiment backend
+
+    ``load_model`` returns the fp32 PyTorch model and is only called when
+    the backend needs it: always for the torch backends, and for the ONNX
+    backends only when the exported model is not cached yet.
+    """
+    if backend not in SENTIMENT_BACKENDS:
+        raise ValueError(
+            f"Unknown sentiment backend {backend!r}, expected one of {SENTIMENT_BACKENDS}"
+        )
+
+    if backend == "torch":
+        import torch
+
+        model = load_model()
+        if torch.cuda.is_available():
+            model = model.to("cuda")
+        return TorchSentimentBackend(model, id2label)
+
+    if backend == "torch-int8":
+        return TorchSentimentBackend(
+            _quantize_torch(load_model(), cache_dir, model_name), id2label, name=backend
+        )
+
+    model_path = onnx_artifact_path(cache_dir, backend, model_name)
+    if not model_path.exists():
+        fp32_path = onnx_artifact_path(cache_dir, "onnx", model_name)
+        if not fp32_path.exists():
+            export_onnx(load_model(), fp32_path)
+        if backend == "onnx-int8":
+            quantize_onnx(fp32_path, model_path)
+
+    return OnnxSentimentBackend(model_path, id2label, name=backend)
+
+def _quantize_torch(model: Any, cache_dir: str, model_name: str) -> Any:
+    """Dynamic INT8 quantization of Linear layers, cached as a state dict"""
+    import torch
+
+    quantized = torch.quantization.quantize_dynamic(
+        model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+    path = backend_artifact_path(cache_dir, "torch-int8", model_name)
+    if path.exists():
+        quantized.load_state_dict(torch.load(path))
+        logger.info(f"Loaded INT8 sentiment weights from {path}")
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(quantized.state_dict(), tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Cached INT8 sentiment weights at {path}")
+
+    return quantized
+
+def export_onnx(model: Any, path: Path) -> None:
+    """Export a sequence classifier to ONNX with dynamic batch and sequence axes"""
+    import torch
+
+    logger.info(f"Exporting sentiment model to ONNX at {path}...")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    sample_ids = torch.ones((2, 16), dtype=torch.long)
+    sample_mask = torch.ones((2, 16), dtype=torch.long)
+    tmp_path = path.with_suffix(".tmp")
+
+    model = model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample_ids, sample_mask),
+            str(tmp_path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=14,
+            do_constant_folding=True
+        )
+    os.replace(tmp_path, path)
+    logger.info("✅ ONNX export complete")
+
+def quantize_onnx(source: Path, target: Path) -> None:
+    """Dynamic INT8 quantization of an exported ONNX model"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info(f"Quantizing ONNX sentiment model to {target}...")
+    tmp_path = target.with_suffix(".tmp")
+    quantize_dynamic(str(source), str(tmp_path), weight_type=QuantType.QInt8)
+    os.replace(tmp_path, target)
@@ -0,0 +1,388 @@
+"""Token-aware batch planning for transformer inference"""
+
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+def iter_token_batches(
+    lengths: Sequence[int],
+    max_batch_tokens: Union[int, Callable[[int], int]],
+    max_batch_size: int
+) -> Iterator[List[int]]:
+    """
+    Lazily group sequence indices into batches, as ``plan_token_batches``
+
+    ``max_batch_tokens`` may be a function of a batch's padded length,
+    evaluated as each batch starts, so a budget that adapts to earlier
+    batches applies to the next one.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    budget = max_batch_tokens if callable(max_batch_tokens) else lambda padded_length: max_batch_tokens
+
+    batch: List[int] = []
+    padded_length = 0
+    batch_tokens = 0
+
+    for index in order:
+        if batch and (
+            len(batch) >= max_batch_size
+            or (len(batch) + 1) * padded_length > batch_tokens
+        ):
+            yield batch
+            batch = []
+        if not batch:
+            padded_length = max(lengths[index], 1)
+            batch_tokens = budget(padded_length)
+        batch.append(index)
+
+    if batch:
+        yield batch
+
+def plan_token_batches(
+    lengths: Sequence[int],
+    max_batch_tokens: int,
+    max_batch_size: int
+) -> List[List[int]]:
+    """
+    Group sequence indices into batches under a padded-token budget
+
+    Sequences are sorted by token length (longest first) so each batch holds
+    texts of similar length and is padded only to its own longest member.
+    A batch grows while ``batch_size * longest_length`` stays within
+    ``max_batch_tokens`` and the batch holds at most ``max_batch_size``
+    sequences. A single sequence longer than the budget gets its own batch.
+
+    Returns lists of original indices; callers scatter results back by index.
+    """
+    return list(iter_token_batches(lengths, max_batch_tokens, max_batch_size))
+
+def padded_tokens(lengths: Sequence[int], batch: Sequence[int]) -> int:
+    """Number of tokens a batch occupies once padded to its longest sequence"""
+    if not batch:
+        return 0
+    return len(batch) * max(lengths[i] for i in batch)
+
+_ALLOCATION_MARKERS = (
+    "out of memory",
+    "can't allocate memory",
+    "cannot allocate memory",
+    "failed to allocate",
+    "bad_alloc"
+)
+
+def is_allocation_error(error: BaseException) -> bool:
+    """Whether an inference error is a failed allocation (torch, onnxruntime or numpy)"""
+    return isinstance(error, MemoryError) or any(
+        marker in str(error).lower() for marker in _ALLOCATION_MARKERS
+    )
+
+def _status_bytes(field: str) -> Optional[int]:
+    """A memory field of /proc/self/status (VmRSS, VmHWM) in bytes"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def container_memory_limit() -> Optional[int]:
+    """Memory limit of the container (cgroup v2 or v1) in bytes, if there is one"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as limit:
+                value = limit.read().strip()
+        except OSError:
+            continue
+        # Unlimited reads as "max" (v2) or a huge page-rounded number (v1)
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+def container_memory_usage() -> Optional[int]:
+    """Memory used by all of the container's processes (cgroup v2 or v1), less inactive page cache"""
+    for usage_path, stat_path, inactive_field in (
+        ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+        ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file")
+    ):
+        try:
+            with open(usage_path) as usage:
+                current = int(usage.read())
+        except (OSError, ValueError):
+            continue
+        # Reclaimable cache counts as used but does not cause OOM kills (the kubelet's working set)
+        inactive = 0
+        try:
+            with open(stat_path) as stat:
+                for line in stat:
+                    name, _, value = line.partition(" ")
+                    if name == inactive_field:
+                        inactive = int(value)
+                        break
+        except (OSError, ValueError):
+            pass
+        return max(current - inactive, 0)
+    return None
+
+class _PeakMemory:
+    """
+    Peak resident memory over a window, from the kernel's high-water mark
+
+    Writing 5 to /proc/self/clear_refs resets VmHWM. Batches running in
+    other threads share the process high-water mark, so the mark is only
+    reset when no other window is open; overlapping windows then read a
+    peak that may include the other batch, which overestimates and errs
+    on the safe side.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = 0
+        self._resettable = True
+
+    def start(self) -> Optional[int]:
+        """Open a window; returns resident memory at its start"""
+        with self._lock:
+            if self._open == 0 and self._resettable:
+                try:
+                    with open("/proc/self/clear_refs", "w") as clear_refs:
+                        clear_refs.write("5")
+                except OSError:
+                    self._resettable = False
+            self._open += 1
+        return _status_bytes("VmRSS")
+
+    def stop(self) -> Optional[int]:
+        """Close a window; returns the peak resident memory seen during it"""
+        with self._lock:
+            self._open -= 1
+        if self._resettable:
+            return _status_bytes("VmHWM")
+        return _status_bytes("VmRSS")
+
+_peak_memory = _PeakMemory()
+
+class _Bucket:
+    """What was learned about batches of one padded-length class"""
+
+    __slots__ = ("cap", "bytes_per_token", "seconds_per_token", "failed_tokens")
+
+    def __init__(self, cap: int, bytes_per_token: float = 0.0, seconds_per_token: float = 0.0):
+        self.cap = cap
+        self.bytes_per_token = bytes_per_token
+        self.seconds_per_token = seconds_per_token
+        # Smallest batch that failed to allocate; growth stays below it
+        self.failed_tokens = math.inf
+
+class AdaptiveBatchSizer:
+    """
+    Padded-token budget for model batches, adapted to memory and latency
+
+    Batches are classed by padded length (four classes per doubling), since
+    activation memory per token grows with sequence length. For each class
+    the sizer tracks the peak memory a batch added per padded token and its
+    seconds per padded token, scaled up to the class's longest length so
+    the estimate holds for every batch in it. A batch's budget is the
+    largest one the estimates say stays under ``memory_limit`` (counting
+    what ``memory_usage`` reports as held already, the process's resident
+    memory by default) and ``latency_target``, and at most the class's cap.
+    The cap grows by ``growth`` after each batch that used most of it
+    without trouble, and halves on an allocation error, when the batch is
+    retried smaller instead of failing the whole request.
+
+    Estimates rise at once and decay slowly, so one heavy batch is enough
+    to shrink the next ones.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_tokens: int,
+        max_tokens: int,
+        memory_limit: Optional[int] = None,
+        latency_target: Optional[float] = None,
+        growth: float = 1.25,
+        decay: float = 0.2,
+        memory_usage: Optional[Callable[[], Optional[int]]] = None
+    ):
+        self.name = name
+        self.initial_tokens = initial_tokens
+        self.max_tokens = max_tokens
+        self.memory_limit = memory_limit
+        self.memory_usage = memory_usage
+        self.latency_target = latency_target
+        self.growth = growth
+        self.decay = decay
+        self._buckets: Dict[int, _Bucket] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "batches": 0,
+            "tokens": 0,
+            "backoffs": 0,
+            "failed": 0
+        }
+
+    def _memory_used(self) -> int:
+        """Memory counted against ``memory_limit``"""
+        used = self.memory_usage() if self.memory_usage is not None else _status_bytes("VmRSS")
+        return used or 0
+
+    @staticmethod
+    def _bucket_key(padded_length: int) -> int:
+        """Longest padded length of the class holding ``padded_length``"""
+        if padded_length <= 16:
+            return 16
+        step = math.ceil(4 * math.log2(padded_length / 16) - 1e-9)
+        return math.ceil(16 * 2 ** (step / 4))
+
+    def _bucket(self, padded_length: int) -> _Bucket:
+        key = self._bucket_key(padded_length)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Per-token costs grow with length: a longer class bounds this one as is,
+            # a shorter one once scaled up by the length ratio
+            longer = [known for known in self._buckets if known > key]
+            shorter = [known for known in self._buckets if known < key]
+            if longer:
+                nearest = self._buckets[min(longer)]
+                bucket = _Bucket(nearest.cap, nearest.bytes_per_token, nearest.seconds_per_token)
+            elif shorter:
+                nearest = self._buckets[max(shorter)]
+                scale = key / max(shorter)
+                bucket = _Bucket(
+                    max(int(nearest.cap / scale), 1),
+                    nearest.bytes_per_token * scale,
+                    nearest.seconds_per_token * scale
+                )
+            else:
+                bucket = _Bucket(self.initial_tokens)
+            self._buckets[key] = bucket
+        return bucket
+
+    def budget(self, padded_length: int) -> int:
+        """Padded tokens allowed in a batch padded to ``padded_length``"""
+        with self._lock:
+            bucket = self._bucket(padded_length)
+            tokens = float(bucket.cap)
+            if self.latency_target and bucket.seconds_per_token:
+                tokens = min(tokens, self.latency_target / bucket.seconds_per_token)
+            if self.memory_limit and bucket.bytes_per_token:
+                tokens = min(tokens, (self.memory_limit - self._memory_used()) / bucket.bytes_per_token)
+        # Never less than one sequence; the batch planner enforces that anyway
+        return int(min(max(tokens, padded_length), self.max_tokens))
+
+    def observe(self, padded_length: int, tokens: int, seconds: float, memory_growth: Optional[int]) -> None:
+        """Record a batch that completed"""
+        with self._lock:
+            bucket = self._bucket(padded_length)
+            # As if padded to the longest length of the class
+            scale = self._bucket_key(padded_length) / max(padded_length, 1)
+            samples = [("seconds_per_token", seconds / tokens * scale)]
+            if memory_growth is not None:
+                samples.append(("bytes_per_token", max(memory_growth, 0) / tokens * scale))
+            for field, sample in samples:
+                estimate = getattr(bucket, field)
+                if sample >= estimate:
+                    setattr(bucket, field, sample)
+                else:
+                    setattr(bucket, field, estimate + self.decay * (sample - estimate))
+            if tokens >= 0.8 * bucket.cap:
+                bucket.cap = int(min(bucket.cap * self.growth + 1, self.max_tokens, 0.9 * bucket.failed_tokens))
+                # Failures may have been transient (another batch in flight), so probe again slowly
+                bucket.failed_tokens *= 1.02
+            self._stats["batches"] += 1
+            self._stats["tokens"] += tokens
+
+    def backoff(self, padded_length: int, tokens: int) -> None:
+        """Halve the cap after a batch of ``tokens`` failed to allocate"""
+        with self._lock:
+            key = self._bucket_key(padded_length)
+            cap = max(tokens // 2, 1)
+            self._bucket(padded_length)
+            # Longer sequences need at least as much memory per token
+            for known, bucket in self._buckets.items():
+                if known >= key:
+                    bucket.cap = min(bucket.cap, cap)
+                    bucket.failed_tokens = min(bucket.failed_tokens, tokens)
+            if self.memory_limit:
+                bucket = self._buckets[key]
+                headroom = self.memory_limit - self._memory_used()
+                bucket.bytes_per_token = max(bucket.bytes_per_token, headroom / tokens)
+            self._stats["backoffs"] += 1
+        logger.warning(
+            f"{self.name} batch of {tokens} padded tokens failed to allocate, "
+            f"cap for length {padded_length}+ now {cap}"
+        )
+
+    def run(
+        self,
+        lengths: Sequence[int],
+        run_batch: Callable[[List[int]], None],
+        max_batch_size: int
+    ) -> Dict[int, BaseException]:
+        """
+        Run ``run_batch`` over token-length batches of the sequence indices
+
+        A batch that fails to allocate is split under the reduced budget
+        and retried with the rest; only a sequence that fails on its own is
+        given up on. Returns those indices and their errors. Any other
+        error propagates.
+        """
+        pending = list(range(len(lengths)))
+        failed: Dict[int, BaseException] = {}
+        while pending:
+            done = set()
+            retry = False
+            for local_batch in iter_token_batches([lengths[i] for i in pending], self.budget, max_batch_size):
+                batch = [pending[i] for i in local_batch]
+                padded_length = max(max(lengths[i] for i in batch), 1)
+                tokens = len(batch) * padded_length
+
+                resident = _peak_memory.start()
+                started = time.perf_counter()
+                try:
+                    run_batch(batch)
+                except Exception as e:
+                    _peak_memory.stop()
+                    if not is_allocation_error(e):
+                        raise
+                    self.backoff(padded_length, tokens)
+                    if len(batch) > 1:
+                        retry = True
+                        break
+                    failed[batch[0]] = e
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    done.add(batch[0])
+                    continue
+                peak = _peak_memory.stop()
+                self.observe(
+                    padded_length,
+                    tokens,
+                    time.perf_counter() - started,
+                    peak - resident if peak is not None and resident is not None else None
+                )
+                done.update(batch)
+            pending = [i for i in pending if i not in done] if retry else []
+        return failed
+
+    def stats(self) -> Dict[str, object]:
+        """Counters and the current cap and estimates per padded-length class"""
+        with self._lock:
+            return {
+                **self._stats,
+                "memory_limit_mb": round(self.memory_limit / 2**20) if self.memory_limit else None,
+                "buckets": {
+                    key: {
+                        "cap": bucket.cap,
+                        "kb_per_token": round(bucket.bytes_per_token / 1024, 1),
+                        "ms_per_1k_tokens": round(bucket.seconds_per_token * 1e6, 2)
+                    }
+                    for key, bucket in sorted(self._buckets.items())
+                }
+            }
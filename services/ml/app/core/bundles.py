@@ -0,0 +1,231 @@
+"""
+Prepacked model bundles loaded by memory-mapping their weights
+
+A bundle is a directory holding one ``model.safetensors`` plus the
+serialized config and tokenizer, written once from a normally loaded
+model. Loading a bundle builds the module without running weight
+initializers and assigns tensors that are views straight into a
+private (copy-on-write) mmap of the weights file, so startup is mostly
+page faults and every process on the host shares the file's page cache
+instead of holding its own heap copy.
+"""
+
+import contextlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+BUNDLE_METADATA = "bundle.json"
+WEIGHTS_FILENAME = "model.safetensors"
+
+TRANSFORMERS_BUNDLE = "transformers"
+SENTENCE_TRANSFORMERS_BUNDLE = "sentence-transformers"
+
+_TRANSFORMER_MODULE = "sentence_transformers.models.Transformer"
+
+# In-place initializers torch modules call from reset_parameters()
+_TORCH_INIT_FUNCTIONS = (
+    "uniform_", "normal_", "trunc_normal_", "constant_", "ones_", "zeros_", "eye_", "dirac_",
+    "xavier_uniform_", "xavier_normal_", "kaiming_uniform_", "kaiming_normal_", "orthogonal_", "sparse_"
+)
+
+# _skip_init patches torch.nn.init process-wide; models load on parallel threads
+_skip_init_lock = threading.Lock()
+
+class BundleError(RuntimeError):
+    """Raised when a bundle is malformed or does not match its model"""
+
+def bundle_dir(model_cache_dir: str, name: str, model_name: str) -> Path:
+    """Directory of the bundle for a model"""
+    return Path(model_cache_dir) / "bundles" / name / model_name.replace("/", "--")
+
+def read_bundle(path: Path, source: str) -> Optional[Dict[str, Any]]:
+    """Bundle metadata if ``path`` holds a current bundle built from ``source``"""
+    try:
+        metadata = json.loads((Path(path) / BUNDLE_METADATA).read_text())
+    except (OSError, ValueError):
+        return None
+    if metadata.get("format") != BUNDLE_FORMAT or metadata.get("source") != source:
+        return None
+    return metadata
+
+def mmap_safetensors(path: Path) -> Dict[str, Any]:
+    """Tensors of a safetensors file as zero-copy views into a private mmap"""
+    import torch
+
+    dtypes = {
+        "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+        "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+        "U8": torch.uint8, "BOOL": torch.bool
+    }
+
+    with open(path, "rb") as handle:
+        # ACCESS_COPY maps the file MAP_PRIVATE: pages come from the shared
+        # page cache and are only copied if something writes to them
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    (header_size,) = struct.unpack("<Q", mapped[:8])
+    header = json.loads(mapped[8:8 + header_size])
+    header.pop("__metadata__", None)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if info["dtype"] not in dtypes:
+            raise BundleError(f"Unsupported dtype {info['dtype']} for {name} in {path}")
+        dtype = dtypes[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + begin
+        ).view(info["shape"])
+    return tensors
+
+@contextlib.contextmanager
+def _skip_init() -> Iterator[None]:
+    """
+    Construct modules without running weight initializers
+
+    Serialized by a lock: overlapping calls would capture each other's
+    stubs as the originals and leave the initializers disabled for good.
+    """
+    import torch
+    from transformers.modeling_utils import no_init_weights
+
+    def skip(tensor, *args, **kwargs):
+        return tensor
+
+    with _skip_init_lock:
+        originals = {name: getattr(torch.nn.init, name) for name in _TORCH_INIT_FUNCTIONS}
+        try:
+            for name in originals:
+                setattr(torch.nn.init, name, skip)
+            with no_init_weights():
+                yield
+        finally:
+            for name, function in originals.items():
+                setattr(torch.nn.init, name, function)
+
+def load_mmapped_model(model_class: Any, path: Path, config: Any = None) -> Any:
+    """Build a transformers model from a bundle directory with mmapped weights"""
+    from transformers import AutoConfig
+
+    path = Path(path)
+    if config is None:
+        config = AutoConfig.from_pretrained(path)
+
+    with _skip_init():
+        model = model_class.from_config(config)
+
+    state = mmap_safetensors(path / WEIGHTS_FILENAME)
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+
+    # Tied weights are the only keys save_pretrained leaves out
+    loaded = {tensor.data_ptr() for tensor in state.values()}
+    params = model.state_dict()
+    uninitialized = [key for key in missing if params[key].data_ptr() not in loaded]
+    if uninitialized or unexpected:
+        raise BundleError(
+            f"Bundle {path} does not match {type(model).__name__}: "
+            f"missing {uninitialized[:5]}, unexpected {unexpected[:5]}"
+        )
+    return model.eval()
+
+@lru_cache(maxsize=None)
+def _bundle_transformer_class() -> Any:
+    from sentence_transformers import models
+
+    class BundleTransformer(models.Transformer):
+        """sentence-transformers Transformer module whose weights are mmapped"""
+
+        def _load_model(self, model_name_or_path, config, cache_dir, *args, **kwargs):
+            from transformers import AutoModel
+
+            self.auto_model = load_mmapped_model(AutoModel, Path(model_name_or_path), config)
+
+        @staticmethod
+        def load(input_path: str) -> "BundleTransformer":
+            with open(os.path.join(input_path, "sentence_bert_config.json")) as handle:
+                config = json.load(handle)
+            return BundleTransformer(model_name_or_path=input_path, **config)
+
+    return BundleTransformer
+
+def load_sentence_transformer(path: Path) -> Any:
+    """Rebuild a SentenceTransformer from a bundle with mmapped transformer weights"""
+    from collections import OrderedDict
+
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.util import import_from_string
+
+    modules = OrderedDict()
+    for module_config in json.loads((Path(path) / "modules.json").read_text()):
+        module_path = str(Path(path) / module_config["path"])
+        if module_config["type"] == _TRANSFORMER_MODULE:
+            module = _bundle_transformer_class().load(module_path)
+        else:
+            module = import_from_string(module_config["type"]).load(module_path)
+        modules[module_config["name"]] = module
+
+    return SentenceTransformer(modules=modules)
+
+def build_bundle(path: Path, kind: str, source: str, model: Any, tokenizer: Any = None) -> Path:
+    """
+    Write a bundle for a loaded model
+
+    ``kind`` is TRANSFORMERS_BUNDLE (``model`` is a transformers model and
+    ``tokenizer`` its tokenizer) or SENTENCE_TRANSFORMERS_BUNDLE.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+
+    if kind == TRANSFORMERS_BUNDLE:
+        model.save_pretrained(tmp_path, safe_serialization=True, max_shard_size="100GB")
+        tokenizer.save_pretrained(tmp_path)
+        weight_dirs = [tmp_path]
+    elif kind == SENTENCE_TRANSFORMERS_BUNDLE:
+        model.save(str(tmp_path))
+        weight_dirs = []
+        for module_config in json.loads((tmp_path / "modules.json").read_text()):
+            if module_config["type"] != _TRANSFORMER_MODULE:
+                continue
+            module_dir = tmp_path / module_config["path"]
+            # Rewrite the transformer weights as one safetensors file
+            (module_dir / "pytorch_model.bin").unlink(missing_ok=True)
+            model[int(module_config["idx"])].auto_model.save_pretrained(
+                module_dir, safe_serialization=True, max_shard_size="100GB"
+            )
+            weight_dirs.append(module_dir)
+    else:
+        raise ValueError(f"Unknown bundle kind {kind!r}")
+
+    for weight_dir in weight_dirs:
+        if not (weight_dir / WEIGHTS_FILENAME).exists():
+            raise BundleError(f"No {WEIGHTS_FILENAME} written to {weight_dir}")
+
+    (tmp_path / BUNDLE_METADATA).write_text(json.dumps({
+        "format": BUNDLE_FORMAT,
+        "kind": kind,
+        "source": source
+    }, indent=2))
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info(f"✅ Built {kind} bundle for {source} at {path}")
+    return path
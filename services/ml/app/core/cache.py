@@ -0,0 +1,238 @@
+"""Content-hash result cache for model outputs"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Namespaces of case-sensitive models (cased tokenizer, VADER's caps emphasis)
+_CASED_NAMESPACES = ("sentiment",)
+
+def normalize_text(text: str, casefold: bool = True) -> str:
+    """Normalize text so trivially different repeats share a cache key"""
+    text = _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    return text.casefold() if casefold else text
+
+class LRUTier:
+    """In-process LRU tier with a size limit and per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        now = time.monotonic()
+        values: List[Optional[Any]] = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    values.append(None)
+                elif entry[0] < now:
+                    del self._entries[key]
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+class RedisTier:
+    """
+    Shared tier backed by Redis
+
+    Reads use a single MGET and writes a single pipelined round trip of
+    SET ... EX calls. Any client exposing ``mget`` and ``pipeline`` works,
+    including in-memory stand-ins. Redis errors are logged and treated as
+    misses so a cache outage never fails inference.
+    """
+
+    def __init__(self, client: Any, ttl_seconds: int, prefix: str = "arc:ml:cache:"):
+        self.client = client
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        try:
+            raw_values = self.client.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            logger.warning(f"Result cache MGET failed: {e}")
+            return [None] * len(keys)
+        return [json.loads(raw) if raw is not None else None for raw in raw_values]
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+class ResultCache:
+    """
+    Two-tier cache for per-text model results
+
+    Keys are a SHA-256 of the cache namespace (model name, version and any
+    output-affecting parameters) and the normalized text, which is only
+    casefolded outside the case-sensitive ``sentiment`` namespaces. Lookups go to the
+    local LRU first, then the shared tier, and shared hits are copied into
+    the local tier. Values must not depend on the caller's original text.
+    """
+
+    def __init__(self, local: LRUTier, shared: Optional[RedisTier] = None):
+        self.local = local
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        casefold = namespace.split(":", 1)[0] not in _CASED_NAMESPACES
+        digest = hashlib.sha256()
+        digest.update(namespace.encode("utf-8"))
+        # Cased keys never match entries stored under casefolded ones
+        digest.update(b"\x00" if casefold else b"\x00cased\x00")
+        digest.update(normalize_text(text, casefold=casefold).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, namespace: str, texts: Sequence[str]) -> List[Optional[Any]]:
+        """Look up cached values for texts, None for misses"""
+        keys = [self.key(namespace, text) for text in texts]
+        values = self.local.get_many(keys)
+        local_hits = sum(value is not None for value in values)
+        shared_hits = 0
+
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing and self.shared is not None:
+            shared_values = self.shared.get_many([keys[i] for i in missing])
+            backfill = {}
+            for i, value in zip(missing, shared_values):
+                if value is not None:
+                    values[i] = value
+                    backfill[keys[i]] = value
+                    shared_hits += 1
+            self.local.set_many(backfill)
+
+        with self._lock:
+            self._stats["local_hits"] += local_hits
+            self._stats["shared_hits"] += shared_hits
+            self._stats["misses"] += len(keys) - local_hits - shared_hits
+
+        return values
+
+    def set_many(self, namespace: str, texts: Sequence[str], values: Sequence[Any]) -> None:
+        """Store values for texts in every tier"""
+        items = {self.key(namespace, text): value for text, value in zip(texts, values)}
+        self.local.set_many(items)
+        if self.shared is not None:
+            self.shared.set_many(items)
+
+    def cached_batch(
+        self,
+        namespace: str,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], List[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True
+    ) -> List[Any]:
+        """
+        Resolve a batch through the cache, computing only the misses
+
+        Misses are de-duplicated by key before ``compute`` is called, so a
+        text repeated within one batch is computed once. Values rejected by
+        ``cacheable`` (e.g. error fallbacks) are returned but not stored.
+        """
+        if not texts:
+            return []
+
+        values = self.get_many(namespace, texts)
+
+        pending: Dict[str, List[int]] = {}
+        for i, value in enumerate(values):
+            if value is None:
+                pending.setdefault(self.key(namespace, texts[i]), []).append(i)
+
+        if pending:
+            representatives = [indices[0] for indices in pending.values()]
+            computed = compute([texts[i] for i in representatives])
+
+            to_store_texts, to_store_values = [], []
+            for indices, value in zip(pending.values(), computed):
+                for i in indices:
+                    values[i] = value
+                if cacheable(value):
+                    to_store_texts.append(texts[indices[0]])
+                    to_store_values.append(value)
+            self.set_many(namespace, to_store_texts, to_store_values)
+
+        return values
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        )
+        stats["local_entries"] = len(self.local)
+        stats["shared_enabled"] = self.shared is not None
+        return stats
+
+def _build_result_cache() -> Optional[ResultCache]:
+    settings = get_settings()
+    if not settings.result_cache_enabled:
+        return None
+
+    local = LRUTier(settings.result_cache_size, settings.result_cache_ttl)
+    shared = None
+
+    if settings.result_cache_redis:
+        try:
+            import redis
+
+            client = redis.Redis.from_url(
+                settings.redis_url,
+                socket_timeout=settings.result_cache_redis_timeout_ms / 1000.0,
+                socket_connect_timeout=settings.result_cache_redis_timeout_ms / 1000.0
+            )
+            shared = RedisTier(client, settings.result_cache_ttl)
+        except Exception as e:
+            logger.warning(f"Shared result cache disabled: {e}")
+
+    return ResultCache(local, shared)
+
+# Global result cache (None when disabled)
+result_cache = _build_result_cache()
@@ -0,0 +1,161 @@
+"""
+Lexicon-first sentiment cascade
+
+Most short comments ("love this!!!", "worst update ever") are labelled
+the same by VADER's lexicon as by the transformer. In cascade mode each
+text gets a VADER compound score first; texts at or above the positive
+threshold are labelled POS and texts at or below the negative one NEG
+without touching the transformer, and only the uncertain band in between
+is sent to it.
+
+The thresholds come from an offline calibration on a labelled set
+(scripts/calibrate_sentiment_cascade.py): each is the loosest cut at
+which the lexicon labels still agree with the reference labels at the
+target rate. Without a calibration file every text goes to the transformer.
+"""
+
+import json
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEXICON_TIER = 'lexicon'
+TRANSFORMER_TIER = 'transformer'
+
+class CascadeThresholds(NamedTuple):
+    """Calibrated VADER compound cut-offs and the agreement measured at each"""
+    negative: float
+    positive: float
+    negative_agreement: float
+    positive_agreement: float
+
+_analyzer: Any = None
+_analyzer_lock = threading.Lock()
+
+def _lexicon_analyzer() -> Any:
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                from nltk.sentiment import SentimentIntensityAnalyzer
+
+                # Needs vader_lexicon, fetched with the rest of the NLTK data
+                _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+def lexicon_scores(texts: Sequence[str]) -> np.ndarray:
+    """VADER compound score of each text, in [-1, 1]"""
+    analyzer = _lexicon_analyzer()
+    return np.array([analyzer.polarity_scores(text)['compound'] for text in texts], dtype=np.float64)
+
+@lru_cache(maxsize=4)
+def load_cascade_thresholds(path: str) -> Optional[CascadeThresholds]:
+    """Thresholds from a calibration file, or None if there is none"""
+    try:
+        with open(path) as handle:
+            calibration = json.load(handle)
+    except FileNotFoundError:
+        logger.warning(f"No sentiment cascade calibration at {path}; every text goes to the transformer")
+        return None
+    return CascadeThresholds(
+        negative=calibration['negative_threshold'],
+        positive=calibration['positive_threshold'],
+        negative_agreement=calibration['negative_agreement'],
+        positive_agreement=calibration['positive_agreement']
+    )
+
+def lexicon_sentiment(
+    texts: Sequence[str],
+    thresholds: CascadeThresholds
+) -> Tuple[List[Optional[dict]], List[int]]:
+    """
+    Lexicon results for the texts outside the uncertain band
+
+    Returns a result (or None) per text and the indices of the texts left
+    for the transformer. A lexicon label's confidence is the agreement
+    measured for its side during calibration.
+    """
+    scores = lexicon_scores(texts)
+    results: List[Optional[dict]] = [None] * len(texts)
+    remaining: List[int] = []
+    for i, score in enumerate(scores.tolist()):
+        if score >= thresholds.positive:
+            sentiment, confidence = 'POS', thresholds.positive_agreement
+        elif score <= thresholds.negative:
+            sentiment, confidence = 'NEG', thresholds.negative_agreement
+        else:
+            remaining.append(i)
+            continue
+        results[i] = {
+            'sentiment': sentiment,
+            'confidence': confidence,
+            'all_scores': [],
+            'lexicon_score': score,
+            'tier': LEXICON_TIER
+        }
+    return results, remaining
+
+def _loosest_cut(
+    scores: np.ndarray,
+    agrees: np.ndarray,
+    target: float,
+    min_support: int
+) -> Tuple[Optional[float], float, int]:
+    """
+    Loosest cut over scores sorted from most to least extreme such that the
+    texts up to it agree at ``target``; returns (cut, agreement, count)
+    """
+    counts = np.arange(1, len(scores) + 1)
+    agreement = np.cumsum(agrees) / counts
+    # A cut can only fall between distinct scores, so ties are kept together
+    boundary = np.append(scores[1:] != scores[:-1], True)
+    valid = np.flatnonzero(boundary & (agreement >= target) & (counts >= min_support))
+    if not len(valid):
+        return None, 0.0, 0
+    k = valid[-1]
+    return float(scores[k]), float(agreement[k]), int(counts[k])
+
+def calibrate_thresholds(
+    scores: np.ndarray,
+    labels: Sequence[str],
+    target_agreement: float,
+    min_support: int = 50
+) -> dict:
+    """
+    Thresholds at which lexicon labels agree with ``labels`` at the target rate
+
+    ``labels`` are POS/NEU/NEG reference labels (human, or the transformer's
+    own). A side that cannot reach the target on at least ``min_support``
+    texts is disabled with a cut outside [-1, 1].
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels)
+
+    positive = scores > 0
+    order = np.argsort(-scores[positive], kind='stable')
+    positive_cut, positive_agreement, positive_count = _loosest_cut(
+        scores[positive][order], labels[positive][order] == 'POS', target_agreement, min_support
+    )
+    negative = scores < 0
+    order = np.argsort(scores[negative], kind='stable')
+    negative_cut, negative_agreement, negative_count = _loosest_cut(
+        scores[negative][order], labels[negative][order] == 'NEG', target_agreement, min_support
+    )
+
+    covered = positive_count + negative_count
+    agreeing = positive_agreement * positive_count + negative_agreement * negative_count
+    return {
+        'positive_threshold': positive_cut if positive_cut is not None else 1.01,
+        'negative_threshold': negative_cut if negative_cut is not None else -1.01,
+        'positive_agreement': positive_agreement,
+        'negative_agreement': negative_agreement,
+        'target_agreement': target_agreement,
+        'coverage': covered / len(scores) if len(scores) else 0.0,
+        'lexicon_agreement': agreeing / covered if covered else 0.0,
+        'samples': int(len(scores))
+    }
@@ -19,15 +19,104 @@ class Settings(BaseSettings):
     # API Configuration
     api_host: str = os.getenv("API_HOST", "0.0.0.0")
     api_port: int = int(os.getenv("API_PORT", "8000"))
+    serve_workers: int = int(os.getenv("SERVE_WORKERS", "1"))
+    torch_threads_per_worker: int = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))  # 0 = cores / workers
     
     # ML Model Settings
     model_cache_dir: str = os.getenv("MODEL_CACHE_DIR", "./models")
     sentiment_model: str = os.getenv("SENTIMENT_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+    sentiment_backend: str = os.getenv("SENTIMENT_BACKEND", "torch")  # torch, torch-int8, onnx, onnx-int8
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    ml_version: str = os.getenv("ML_VERSION", "1.0.0")
+    model_offline: bool = os.getenv("MODEL_OFFLINE", "false").lower() == "true"  # load only from the prefetched registry
+    model_verify_checksums: bool = os.getenv("MODEL_VERIFY_CHECKSUMS", "true").lower() == "true"
+    model_bundles: bool = os.getenv("MODEL_BUNDLES", "false").lower() == "true"  # mmapped prepacked weights
+    sentiment_mode: str = os.getenv("SENTIMENT_MODE", "transformer")  # transformer, cascade (VADER first), fast (MiniLM head)
+    # Both default to files in MODEL_CACHE_DIR
+    sentiment_cascade_calibration: str = os.getenv(
+        "SENTIMENT_CASCADE_CALIBRATION", ""
+    )  # written by scripts/calibrate_sentiment_cascade.py
+    sentiment_head_path: str = os.getenv(
+        "SENTIMENT_HEAD_PATH", ""
+    )  # fast mode, written by scripts/train_sentiment_head.py
     
     # Processing limits
     max_batch_size: int = int(os.getenv("MAX_BATCH_SIZE", "1000"))
-    max_text_length: int = int(os.getenv("MAX_TEXT_LENGTH", "512"))
+    max_text_length: int = int(os.getenv("MAX_TEXT_LENGTH", "512"))  # tokens
+    max_batch_tokens: int = int(os.getenv("MAX_BATCH_TOKENS", "8192"))  # padded tokens per model batch
+    writeback_chunk_size: int = int(os.getenv("WRITEBACK_CHUNK_SIZE", "500"))
+    
+    # Adaptive batch sizing for sentiment and embedding inference (MAX_BATCH_TOKENS is the starting budget)
+    adaptive_batching: bool = os.getenv("ADAPTIVE_BATCHING", "true").lower() == "true"
+    adaptive_max_batch_tokens: int = int(os.getenv("ADAPTIVE_MAX_BATCH_TOKENS", "65536"))  # upper bound
+    inference_memory_limit_mb: int = int(os.getenv("INFERENCE_MEMORY_LIMIT_MB", "0"))  # per worker; 0 shares 80% of the container limit
+    inference_latency_target_ms: float = float(os.getenv("INFERENCE_LATENCY_TARGET_MS", "2000"))  # per model batch
+    
+    # Workspace analysis pipeline
+    pipeline_page_size: int = int(os.getenv("PIPELINE_PAGE_SIZE", "500"))
+    pipeline_queue_depth: int = int(os.getenv("PIPELINE_QUEUE_DEPTH", "4"))
+    job_stale_after_seconds: int = int(os.getenv("JOB_STALE_AFTER_SECONDS", "120"))
+    job_sweep_interval_seconds: int = int(os.getenv("JOB_SWEEP_INTERVAL_SECONDS", "30"))
+    analysis_claim_mode: bool = os.getenv("ANALYSIS_CLAIM_MODE", "false").lower() == "true"
+    comment_lease_seconds: int = int(os.getenv("COMMENT_LEASE_SECONDS", "300"))
+    
+    # Trend detection
+    trend_bin_hours: int = int(os.getenv("TREND_BIN_HOURS", "24"))
+    trend_baseline_days: int = int(os.getenv("TREND_BASELINE_DAYS", "14"))  # trailing window for burst scores
+    trend_min_burst: float = float(os.getenv("TREND_MIN_BURST", "5.0"))  # burst z-score a trending tag needs
+    tag_sketches_enabled: bool = os.getenv("TAG_SKETCHES_ENABLED", "true").lower() == "true"
+    tag_sketch_capacity: int = int(os.getenv("TAG_SKETCH_CAPACITY", "256"))  # heavy hitters per day bucket
+    tag_sketch_width: int = int(os.getenv("TAG_SKETCH_WIDTH", "2048"))
+    tag_sketch_depth: int = int(os.getenv("TAG_SKETCH_DEPTH", "4"))
+    
+    # Workspace stats counters
+    stats_reconcile_interval_seconds: int = int(os.getenv("STATS_RECONCILE_INTERVAL_SECONDS", "3600"))  # 0 disables
+    stats_reconcile_days: int = int(os.getenv("STATS_RECONCILE_DAYS", "7"))
+    
+    # Inference scheduler
+    scheduler_max_batch_size: int = int(os.getenv("SCHEDULER_MAX_BATCH_SIZE", "256"))
+    scheduler_max_wait_ms: float = float(os.getenv("SCHEDULER_MAX_WAIT_MS", "10"))
+    scheduler_queue_size: int = int(os.getenv("SCHEDULER_QUEUE_SIZE", "1024"))
+    
+    # Result cache
+    result_cache_enabled: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    result_cache_size: int = int(os.getenv("RESULT_CACHE_SIZE", "100000"))
+    result_cache_ttl: int = int(os.getenv("RESULT_CACHE_TTL", "86400"))
+    result_cache_redis: bool = os.getenv("RESULT_CACHE_REDIS", "false").lower() == "true"
+    result_cache_redis_timeout_ms: int = int(os.getenv("RESULT_CACHE_REDIS_TIMEOUT_MS", "50"))
+    
+    # Near-duplicate grouping ahead of inference
+    dedup_enabled: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    dedup_threshold: float = float(os.getenv("DEDUP_THRESHOLD", "0.9"))  # Jaccard of character 5-grams; members get their leader's sentiment, so keep negations apart
+    dedup_num_perm: int = int(os.getenv("DEDUP_NUM_PERM", "64"))
+    dedup_window_size: int = int(os.getenv("DEDUP_WINDOW_SIZE", "20000"))  # leaders kept per workspace, 0 disables
+    dedup_window_seconds: int = int(os.getenv("DEDUP_WINDOW_SECONDS", "86400"))
+    dedup_window_workspaces: int = int(os.getenv("DEDUP_WINDOW_WORKSPACES", "32"))
+    
+    # Per-workspace comment embedding store
+    embedding_store_enabled: bool = os.getenv("EMBEDDING_STORE_ENABLED", "true").lower() == "true"
+    embedding_store_dir: str = os.getenv("EMBEDDING_STORE_DIR", "./data/embeddings")
+    # Set when EMBEDDING_STORE_DIR is a volume every instance mounts; claim mode requires it
+    embedding_store_shared: bool = os.getenv("EMBEDDING_STORE_SHARED", "false").lower() == "true"
+    embedding_store_dtype: str = os.getenv("EMBEDDING_STORE_DTYPE", "float16")  # float16 or int8
+    embedding_store_compact_ratio: float = float(os.getenv("EMBEDDING_STORE_COMPACT_RATIO", "0.2"))  # dead rows
+    
+    # Keyword extraction for workspace analysis
+    keyword_mode: str = os.getenv("KEYWORD_MODE", "keybert")  # keybert or fast (c-TF-IDF)
+    keyword_fast_group: str = os.getenv("KEYWORD_FAST_GROUP", "content_item")  # content_item or channel
+    
+    # Keyword phrases merged into canonical topics at writeback
+    topic_canonicalization_enabled: bool = os.getenv("TOPIC_CANONICALIZATION_ENABLED", "true").lower() == "true"
+    topic_merge_threshold: float = float(os.getenv("TOPIC_MERGE_THRESHOLD", "0.8"))  # cosine to a topic's founding phrase
+    
+    # Approximate nearest-neighbour comment search (IVF-PQ over the embedding store)
+    ann_enabled: bool = os.getenv("ANN_ENABLED", "true").lower() == "true"
+    ann_min_rows: int = int(os.getenv("ANN_MIN_ROWS", "20000"))  # brute force below this
+    ann_lists: int = int(os.getenv("ANN_LISTS", "0"))  # 0 picks ~4 sqrt(rows)
+    ann_pq_subspaces: int = int(os.getenv("ANN_PQ_SUBSPACES", "48"))  # code bytes per comment
+    ann_retrain_growth: float = float(os.getenv("ANN_RETRAIN_GROWTH", "4"))
+    ann_nprobe: int = int(os.getenv("ANN_NPROBE", "16"))
+    ann_rerank: int = int(os.getenv("ANN_RERANK", "200"))
     
     # Rate limiting
     rate_limit_requests: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
@@ -45,6 +134,12 @@ class Settings(BaseSettings):
         "https://api.rust.app"
     ]
     
+    def model_post_init(self, __context) -> None:
+        if not self.sentiment_cascade_calibration:
+            self.sentiment_cascade_calibration = os.path.join(self.model_cache_dir, "sentiment_cascade.json")
+        if not self.sentiment_head_path:
+            self.sentiment_head_path = os.path.join(self.model_cache_dir, "sentiment_head.npz")
+    
     class Config:
         case_sensitive = False
         env_file = ".env"
@@ -1,7 +1,9 @@
 """Database connection utilities for the ML service"""
 
-import asyncio
+import json
 import logging
+import math
+import time
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator, Optional
 
@@ -55,6 +57,7 @@ class DatabasePool:
 # Global pool instance
 _db_pool = DatabasePool()
 
+@asynccontextmanager
 async def get_db_connection() -> AsyncGenerator[asyncpg.Connection, None]:
     """Get a database connection (dependency injection)"""
     async with _db_pool.get_connection() as conn:
@@ -89,8 +92,19 @@ async def get_comments_for_analysis(
     platform: Optional[str] = None
 ) -> list[dict]:
     """Get comments for sentiment analysis"""
-    query = """
-        SELECT c.id, c.text, c.platform, c.content_item_id, ci.channel_id
+    clause, params = _analysis_filter(workspace_id, platform)
+    query = "SELECT c.id, c.text, c.platform, c.content_item_id, ci.channel_id " + clause
+    
+    query += " ORDER BY c.created_at DESC LIMIT $" + str(len(params) + 1)
+    params.append(limit)
+    
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(query, *params)
+        return [dict(row) for row in rows]
+
+def _analysis_filter(workspace_id: str, platform: Optional[str]) -> tuple[str, list]:
+    """WHERE clause and params selecting a workspace's unanalyzed comments"""
+    clause = """
         FROM comments c
         JOIN content_items ci ON c.content_item_id = ci.id
         JOIN channels ch ON ci.channel_id = ch.id
@@ -98,20 +112,130 @@ async def get_comments_for_analysis(
         AND c.sentiment IS NULL
         AND LENGTH(c.text) > 10
     """
-    
-    params = [workspace_id]
+    params: list = [workspace_id]
     
     if platform:
-        query += " AND c.platform = $2"
+        clause += " AND c.platform = $2"
         params.append(platform)
     
-    query += " ORDER BY c.created_at DESC LIMIT $" + str(len(params) + 1)
-    params.append(limit)
+    return clause, params
+
+async def count_comments_for_analysis(
+    workspace_id: str,
+    platform: Optional[str] = None
+) -> int:
+    """Count comments still waiting for sentiment analysis"""
+    clause, params = _analysis_filter(workspace_id, platform)
+    
+    async with get_db_connection() as conn:
+        return await conn.fetchval("SELECT COUNT(*) " + clause, *params)
+
+async def get_comment_page(
+    workspace_id: str,
+    page_size: int,
+    after: Optional[tuple] = None,
+    platform: Optional[str] = None
+) -> list[dict]:
+    """
+    Get the next page of unanalyzed comments by keyset pagination
+    
+    Pages are ordered by ``(created_at, id)``; pass the last row's pair as
+    ``after`` to continue. Unlike OFFSET paging this stays cheap however
+    deep into the workspace the cursor is.
+    """
+    clause, params = _analysis_filter(workspace_id, platform)
+    query = (
+        "SELECT c.id, c.text, c.platform, c.content_item_id, ci.channel_id, c.created_at "
+        + clause
+    )
+    
+    if after is not None:
+        query += f" AND (c.created_at, c.id) > (${len(params) + 1}, ${len(params) + 2})"
+        params.extend(after)
+    
+    query += f" ORDER BY c.created_at, c.id LIMIT ${len(params) + 1}"
+    params.append(page_size)
     
     async with get_db_connection() as conn:
         rows = await conn.fetch(query, *params)
         return [dict(row) for row in rows]
 
+async def claim_comment_batch(
+    workspace_id: str,
+    owner: str,
+    batch_size: int,
+    lease_seconds: float,
+    platform: Optional[str] = None
+) -> list[dict]:
+    """
+    Lease a batch of unanalyzed comments to one worker
+    
+    Rows are picked with ``FOR UPDATE SKIP LOCKED`` so concurrent workers
+    never claim the same comment, and are leased until ``lease_seconds``
+    from now. Comments whose lease has expired (their worker died) are
+    claimable again.
+    """
+    clause, params = _analysis_filter(workspace_id, platform)
+    n = len(params)
+    query = f"""
+        UPDATE comments AS target
+        SET lease_owner = ${n + 1},
+            lease_expires_at = NOW() + make_interval(secs => ${n + 2})
+        WHERE target.id IN (
+            SELECT c.id {clause}
+            AND (c.lease_expires_at IS NULL OR c.lease_expires_at < NOW())
+            ORDER BY c.created_at, c.id
+            LIMIT ${n + 3}
+            FOR UPDATE OF c SKIP LOCKED
+        )
+        RETURNING target.id, target.text, target.platform,
+                  target.content_item_id, target.created_at
+    """
+    params.extend([owner, float(lease_seconds), batch_size])
+    
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(query, *params)
+        rows = sorted(rows, key=lambda row: (row["created_at"], row["id"]))
+        return [dict(row) for row in rows]
+
+async def release_comment_leases(owner: str, comment_ids: Optional[list[str]] = None) -> int:
+    """Drop an owner's leases (all of them, or only ``comment_ids``), keeping quarantined rows"""
+    query = """
+        UPDATE comments
+        SET lease_owner = NULL, lease_expires_at = NULL
+        WHERE lease_owner = $1
+        AND sentiment IS NULL
+        AND lease_expires_at IS DISTINCT FROM 'infinity'
+        AND ($2::text[] IS NULL OR id = ANY($2::text[]))
+    """
+    
+    async with get_db_connection() as conn:
+        result = await conn.execute(query, owner, comment_ids)
+        return int(result.split()[-1])
+
+async def quarantine_comments(comment_ids: list[str]) -> None:
+    """Stop comments that failed writeback from being claimed again"""
+    query = """
+        UPDATE comments
+        SET lease_expires_at = 'infinity'
+        WHERE id = ANY($1::text[])
+        AND sentiment IS NULL
+    """
+    
+    async with get_db_connection() as conn:
+        await conn.execute(query, comment_ids)
+
+async def count_open_comments(workspace_id: str, platform: Optional[str] = None) -> int:
+    """Count unanalyzed comments that are claimable or leased to a live worker"""
+    clause, params = _analysis_filter(workspace_id, platform)
+    query = (
+        "SELECT COUNT(*) " + clause
+        + " AND (c.lease_expires_at IS NULL OR c.lease_expires_at <> 'infinity')"
+    )
+    
+    async with get_db_connection() as conn:
+        return await conn.fetchval(query, *params)
+
 async def update_comment_sentiment(
     comment_id: str,
     sentiment: str,
@@ -119,51 +243,298 @@ async def update_comment_sentiment(
     topic_tags: list[str]
 ) -> None:
     """Update comment with sentiment analysis results"""
-    query = """
-        UPDATE comments 
-        SET sentiment = $2, topic_tags = $3, meta_json = $4, updated_at = NOW()
-        WHERE id = $1
-    """
+    report = await bulk_update_comment_results([{
+        "id": comment_id,
+        "sentiment": sentiment,
+        "confidence": confidence,
+        "topic_tags": topic_tags
+    }])
+    if report["failed"]:
+        raise ValueError(f"Failed to update comment {comment_id}: {report['failed'][0]['error']}")
+
+SENTIMENT_VALUES = frozenset({"POS", "NEU", "NEG"})
+
+# Writes results and applies the change in each comment's tags and
+# sentiment to tag_daily_rollups and workspace_sentiment_stats in the same
+# statement. The self-joined ``old`` row is read from the statement
+# snapshot, so re-analyzed comments first retract what they previously
+# contributed.
+_BULK_UPDATE_QUERY = """
+    WITH updated AS (
+        UPDATE comments AS c
+        SET sentiment = u.sentiment::"Sentiment",
+            topic_tags = ARRAY(SELECT jsonb_array_elements_text(u.topic_tags::jsonb)),
+            meta_json = u.meta_json::jsonb,
+            lease_owner = NULL,
+            lease_expires_at = NULL,
+            updated_at = NOW()
+        FROM unnest($1::text[], $2::text[], $3::text[], $4::text[])
+                AS u(id, sentiment, topic_tags, meta_json),
+            comments AS old,
+            content_items AS ci,
+            channels AS ch
+        WHERE c.id = u.id
+        AND old.id = c.id
+        AND ci.id = c.content_item_id
+        AND ch.id = ci.channel_id
+        AND ($5::text IS NULL OR c.lease_owner = $5)
+        RETURNING c.id, ch.workspace_id, c.platform, c.created_at::date AS day,
+                  old.sentiment::text AS old_sentiment, old.topic_tags AS old_tags,
+                  (old.meta_json->>'sentiment_confidence')::float AS old_confidence,
+                  c.sentiment::text AS new_sentiment, c.topic_tags AS new_tags,
+                  (c.meta_json->>'sentiment_confidence')::float AS new_confidence
+    ),
+    deltas AS (
+        SELECT workspace_id, platform, day, tag, -1 AS mentions,
+               -(CASE old_sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END) AS sentiment
+        FROM updated, LATERAL (SELECT DISTINCT unnest(old_tags) AS tag) AS t
+        WHERE old_sentiment IS NOT NULL
+        UNION ALL
+        SELECT workspace_id, platform, day, tag, 1,
+               CASE new_sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END
+        FROM updated, LATERAL (SELECT DISTINCT unnest(new_tags) AS tag) AS t
+    ),
+    rolled_up AS (
+        INSERT INTO tag_daily_rollups AS r (
+            workspace_id, platform, tag, day, mention_count, sentiment_sum, updated_at
+        )
+        SELECT workspace_id, platform, tag, day, SUM(mentions), SUM(sentiment), NOW()
+        FROM deltas
+        GROUP BY workspace_id, platform, tag, day
+        HAVING SUM(mentions) <> 0 OR SUM(sentiment) <> 0
+        -- A stable order keeps concurrent writers from deadlocking
+        ORDER BY workspace_id, platform, tag, day
+        ON CONFLICT (workspace_id, platform, tag, day) DO UPDATE
+        SET mention_count = r.mention_count + EXCLUDED.mention_count,
+            sentiment_sum = r.sentiment_sum + EXCLUDED.sentiment_sum,
+            updated_at = NOW()
+    ),
+    stat_deltas AS (
+        SELECT workspace_id, platform, day, -1 AS comments,
+               -(old_sentiment = 'POS')::int AS positive,
+               -(old_sentiment = 'NEU')::int AS neutral,
+               -(old_sentiment = 'NEG')::int AS negative,
+               -COALESCE(old_confidence, 0) AS confidence_sum,
+               -(old_confidence IS NOT NULL)::int AS confidence_count
+        FROM updated
+        WHERE old_sentiment IS NOT NULL
+        UNION ALL
+        SELECT workspace_id, platform, day, 1,
+               (new_sentiment = 'POS')::int,
+               (new_sentiment = 'NEU')::int,
+               (new_sentiment = 'NEG')::int,
+               COALESCE(new_confidence, 0),
+               (new_confidence IS NOT NULL)::int
+        FROM updated
+    ),
+    stats_rolled_up AS (
+        INSERT INTO workspace_sentiment_stats AS s (
+            workspace_id, platform, day, comment_count, positive_count, neutral_count,
+            negative_count, confidence_sum, confidence_count, updated_at
+        )
+        SELECT workspace_id, platform, day, SUM(comments), SUM(positive), SUM(neutral),
+               SUM(negative), SUM(confidence_sum), SUM(confidence_count), NOW()
+        FROM stat_deltas
+        GROUP BY workspace_id, platform, day
+        ORDER BY workspace_id, platform, day
+        ON CONFLICT (workspace_id, platform, day) DO UPDATE
+        SET comment_count = s.comment_count + EXCLUDED.comment_count,
+            positive_count = s.positive_count + EXCLUDED.positive_count,
+            neutral_count = s.neutral_count + EXCLUDED.neutral_count,
+            negative_count = s.negative_count + EXCLUDED.negative_count,
+            confidence_sum = s.confidence_sum + EXCLUDED.confidence_sum,
+            confidence_count = s.confidence_count + EXCLUDED.confidence_count,
+            updated_at = NOW()
+    )
+    SELECT id FROM updated
+"""
+
+def _stage_comment_result(result: dict, processed_at: float, ml_version: str) -> tuple:
+    """Validate one analysis result and convert it to unnest() columns"""
+    sentiment = result.get("sentiment")
+    if sentiment not in SENTIMENT_VALUES:
+        raise ValueError(f"invalid sentiment {sentiment!r}")
     
+    confidence = float(result.get("confidence", 0.0))
+    if not math.isfinite(confidence):
+        raise ValueError(f"invalid confidence {confidence!r}")
+    
+    topic_tags = [str(tag) for tag in result.get("topic_tags") or []]
     meta_json = {
         "sentiment_confidence": confidence,
-        "processed_at": asyncio.get_event_loop().time(),
-        "ml_version": "1.0.0"
+        "processed_at": processed_at,
+        "ml_version": ml_version
     }
+    if result.get("cluster_size"):
+        # Near-duplicate count, a spam signal
+        meta_json["cluster_size"] = int(result["cluster_size"])
+    if result.get("sentiment_tier"):
+        # Which cascade tier labelled the comment
+        meta_json["sentiment_tier"] = str(result["sentiment_tier"])
+    keywords = result.get("keywords")
+    if keywords is not None and list(keywords) != topic_tags:
+        # Phrases behind the canonical topic tags
+        meta_json["keywords"] = [str(keyword) for keyword in keywords]
+    
+    return (
+        str(result["id"]),
+        sentiment,
+        json.dumps(topic_tags),
+        json.dumps(meta_json)
+    )
+
+async def bulk_update_comment_results(
+    results: list[dict],
+    chunk_size: Optional[int] = None,
+    lease_owner: Optional[str] = None
+) -> dict:
+    """
+    Write sentiment and topic results back in set-based chunks
+    
+    Each result needs ``id``, ``sentiment``, ``confidence`` and
+    ``topic_tags``. Every chunk is applied with a single
+    ``UPDATE ... FROM unnest(...)`` in its own transaction. Rows that fail
+    validation are reported without being sent; if the chunk statement
+    itself fails, its rows are retried one by one under savepoints so a
+    single bad row does not fail the rest of the chunk.
+    
+    With ``lease_owner`` only comments still leased by that owner are
+    written (and their lease cleared); rows whose lease expired and moved
+    to another worker are reported as missing.
+    
+    Returns counts of updated rows plus the failed and missing comment ids.
+    """
+    settings = get_settings()
+    chunk_size = chunk_size or settings.writeback_chunk_size
+    processed_at = time.time()
+    
+    report = {"updated": 0, "failed": [], "missing": []}
+    
+    for start in range(0, len(results), chunk_size):
+        staged = []
+        for result in results[start:start + chunk_size]:
+            try:
+                staged.append(_stage_comment_result(result, processed_at, settings.ml_version))
+            except (KeyError, TypeError, ValueError) as e:
+                report["failed"].append({"id": result.get("id"), "error": str(e)})
+        
+        if not staged:
+            continue
+        
+        failed: list[dict] = []
+        async with get_db_connection() as conn:
+            updated_ids = await _apply_comment_chunk(conn, staged, failed, lease_owner)
+        
+        failed_ids = {failure["id"] for failure in failed}
+        report["updated"] += len(updated_ids)
+        report["failed"].extend(failed)
+        report["missing"].extend(
+            row[0] for row in staged
+            if row[0] not in updated_ids and row[0] not in failed_ids
+        )
+    
+    return report
+
+async def _apply_comment_chunk(
+    conn: asyncpg.Connection,
+    staged: list[tuple],
+    failed: list[dict],
+    lease_owner: Optional[str] = None
+) -> set[str]:
+    """Apply one staged chunk, isolating failing rows if the chunk fails"""
+    try:
+        async with conn.transaction():
+            rows = await conn.fetch(_BULK_UPDATE_QUERY, *map(list, zip(*staged)), lease_owner)
+        return {row["id"] for row in rows}
+    except asyncpg.PostgresError as e:
+        logger.warning(f"Bulk writeback of {len(staged)} rows failed, isolating rows: {e}")
+    
+    updated_ids: set[str] = set()
+    async with conn.transaction():
+        for row in staged:
+            try:
+                async with conn.transaction():
+                    rows = await conn.fetch(
+                        _BULK_UPDATE_QUERY, *[[value] for value in row], lease_owner
+                    )
+                updated_ids.update(r["id"] for r in rows)
+            except asyncpg.PostgresError as row_error:
+                failed.append({"id": row[0], "error": str(row_error)})
+    
+    return updated_ids
+
+async def get_comments_by_ids(workspace_id: str, comment_ids: list[str]) -> list[dict]:
+    """Get a workspace's comments by id, skipping ids that no longer exist"""
+    query = """
+        SELECT c.id, c.text, c.platform, c.sentiment, c.topic_tags, c.content_item_id, c.created_at
+        FROM comments c
+        JOIN content_items ci ON c.content_item_id = ci.id
+        JOIN channels ch ON ci.channel_id = ch.id
+        WHERE ch.workspace_id = $1
+        AND c.id = ANY($2::text[])
+    """
     
     async with get_db_connection() as conn:
-        await conn.execute(query, comment_id, sentiment, topic_tags, meta_json)
+        rows = await conn.fetch(query, workspace_id, comment_ids)
+        return [dict(row) for row in rows]
 
 async def get_trending_topics(
     workspace_id: str,
     days: int = 7,
-    limit: int = 50
+    limit: int = 50,
+    recent_days: int = 1
 ) -> list[dict]:
-    """Get trending topics for the workspace"""
+    """
+    Get trending topics for the workspace
+    
+    Reads the daily tag rollups, so the window is whole UTC days: today
+    plus the ``days`` before it. ``recent_mentions`` counts today plus the
+    ``recent_days`` before it, and ranks the tags ahead of the window total.
+    A tag counts once per comment.
+    """
     query = """
-        SELECT 
+        SELECT
             tag,
-            COUNT(*) as mention_count,
-            AVG(CASE 
-                WHEN sentiment = 'POS' THEN 1 
-                WHEN sentiment = 'NEU' THEN 0 
-                ELSE -1 
-            END) as avg_sentiment,
-            COUNT(*) FILTER (WHERE c.created_at > NOW() - INTERVAL '%s days') as recent_mentions
-        FROM comments c
-        JOIN content_items ci ON c.content_item_id = ci.id
-        JOIN channels ch ON ci.channel_id = ch.id,
-        UNNEST(c.topic_tags) as tag
-        WHERE ch.workspace_id = $1
-        AND c.created_at > NOW() - INTERVAL '%s days'
+            SUM(mention_count) AS mention_count,
+            SUM(sentiment_sum)::float / SUM(mention_count) AS avg_sentiment,
+            COALESCE(SUM(mention_count) FILTER (
+                WHERE day >= (NOW() AT TIME ZONE 'UTC')::date - LEAST($4::int, $3::int)
+            ), 0) AS recent_mentions
+        FROM tag_daily_rollups
+        WHERE workspace_id = $1
+        AND day >= (NOW() AT TIME ZONE 'UTC')::date - $3::int
         GROUP BY tag
-        HAVING COUNT(*) >= 5
+        HAVING SUM(mention_count) >= 5
         ORDER BY recent_mentions DESC, mention_count DESC
         LIMIT $2
-    """ % (days, days)
+    """
     
     async with get_db_connection() as conn:
-        rows = await conn.fetch(query, workspace_id, limit)
+        rows = await conn.fetch(query, workspace_id, limit, days, recent_days)
         return [dict(row) for row in rows]
 
-
+async def rebuild_tag_daily_rollups(workspace_id: str) -> int:
+    """Recompute a workspace's tag rollups from its analyzed comments"""
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM tag_daily_rollups WHERE workspace_id = $1", workspace_id)
+            result = await conn.execute(
+                """
+                INSERT INTO tag_daily_rollups (
+                    workspace_id, platform, tag, day, mention_count, sentiment_sum, updated_at
+                )
+                SELECT ch.workspace_id, c.platform, t.tag, c.created_at::date,
+                       COUNT(*),
+                       SUM(CASE c.sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END),
+                       NOW()
+                FROM comments c
+                JOIN content_items ci ON c.content_item_id = ci.id
+                JOIN channels ch ON ci.channel_id = ch.id,
+                LATERAL (SELECT DISTINCT unnest(c.topic_tags) AS tag) AS t
+                WHERE ch.workspace_id = $1
+                AND c.sentiment IS NOT NULL
+                GROUP BY ch.workspace_id, c.platform, t.tag, c.created_at::date
+                """,
+                workspace_id
+            )
+    return int(result.split()[-1])
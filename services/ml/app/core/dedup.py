@@ -0,0 +1,344 @@
+"""
+Near-duplicate grouping of texts with MinHash and LSH
+
+Bot floods and copypasta repeat a comment with different emoji, casing,
+mentions or a few changed words. Texts are normalized (casefolded, URLs,
+@mentions, emoji and punctuation dropped), shingled into character
+5-grams and MinHashed; LSH bands propose candidate pairs, which are
+confirmed by the exact Jaccard similarity of their shingle sets. Each
+text joins the most similar cluster leader at or above the threshold
+that has as many negations as it does, otherwise it becomes a leader
+itself, so every member is within the threshold of the text whose
+result (including its sentiment) it receives.
+
+A ``NearDuplicateIndex`` can outlive one batch to also match against the
+recent leaders of a workspace, reusing their stored results.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.core.config import get_settings
+
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_SHINGLE_POWERS = np.array([pow(1_000_003, k, (1 << 31) - 1) for k in range(SHINGLE_SIZE)], dtype=np.uint64)
+_NOISE = re.compile(r"https?://\S+|www\.\S+|@\w+")
+# Runs of whitespace, punctuation, symbols and emoji become one space
+_SEPARATORS = re.compile(r"[\W_]+")
+# "n't" contractions normalize to a lone "t"
+_NEGATIONS = frozenset({"no", "not", "never", "nor", "none", "nothing", "nobody", "cannot", "t"})
+
+# Upper bound on shingle x permutation hash values held at once
+_HASH_CHUNK_ELEMENTS = 4_000_000
+
+def dedup_normalize(text: str) -> str:
+    """Reduce a text to the words that decide whether it is a repeat"""
+    text = _NOISE.sub(" ", unicodedata.normalize("NFKC", text).casefold())
+    return _SEPARATORS.sub(" ", text).strip()
+
+def negation_count(normalized: str) -> int:
+    """
+    Negation words in a normalized text
+
+    One inserted "not" barely moves the similarity of a long comment but
+    flips its sentiment, so only texts with equal counts are grouped.
+    """
+    return sum(word in _NEGATIONS for word in normalized.split())
+
+def shingle_sets(normalized: Sequence[str]) -> List[np.ndarray]:
+    """
+    Sorted unique 31-bit hashes of the character shingles of each text
+
+    Hashes every SHINGLE_SIZE-codepoint window of all texts at once;
+    texts shorter than a shingle are one zero-padded shingle.
+    """
+    codes = []
+    for text in normalized:
+        points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if points.size < SHINGLE_SIZE:
+            points = np.concatenate([points, np.zeros(SHINGLE_SIZE - points.size, dtype=np.uint64)])
+        codes.append(points)
+    lengths = np.array([points.size for points in codes])
+
+    flat = np.concatenate(codes)
+    windows = sliding_window_view(flat, SHINGLE_SIZE)
+    # Code points < 2^21 times powers < 2^31: the sums cannot overflow
+    hashes = (windows * _SHINGLE_POWERS).sum(axis=1) % _MERSENNE_PRIME
+
+    # Drop windows that run into the next text
+    starts = np.cumsum(lengths) - lengths
+    position = np.arange(windows.shape[0]) - np.repeat(starts, lengths)[:windows.shape[0]]
+    text_index = np.repeat(np.arange(len(codes)), lengths)[:windows.shape[0]]
+    keep = position <= (lengths - SHINGLE_SIZE)[text_index]
+
+    # One sort dedupes every text's shingles: keys are (text, hash)
+    keys = np.unique((text_index[keep].astype(np.uint64) << np.uint64(32)) | hashes[keep])
+    bounds = np.searchsorted(keys >> np.uint64(32), np.arange(len(codes) + 1))
+    return [keys[bounds[i]:bounds[i + 1]] & np.uint64(0xFFFFFFFF) for i in range(len(codes))]
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two sorted unique hash arrays"""
+    common = np.intersect1d(a, b, assume_unique=True).size
+    return common / (a.size + b.size - common)
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) for the LSH index
+
+    Picks the most selective banding that still proposes a pair at the
+    threshold similarity with probability >= 0.95; candidates are
+    verified exactly, so recall matters more than extra candidates.
+    """
+    options = [(num_perm // rows, rows) for rows in range(num_perm, 0, -1) if num_perm % rows == 0]
+    for bands, rows in options:
+        if 1 - (1 - threshold ** rows) ** bands >= 0.95:
+            return bands, rows
+    return options[-1]
+
+@lru_cache(maxsize=None)
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+def minhash_signatures(sets: Sequence[np.ndarray], num_perm: int) -> np.ndarray:
+    """MinHash signatures (texts x num_perm) of non-empty shingle sets"""
+    a, b = _permutations(num_perm)
+    signatures = np.empty((len(sets), num_perm), dtype=np.uint64)
+
+    start = 0
+    while start < len(sets):
+        # Take texts until the hash matrix of the chunk reaches its budget
+        end, elements = start, 0
+        while end < len(sets) and (
+            end == start or elements + sets[end].size * num_perm <= _HASH_CHUNK_ELEMENTS
+        ):
+            elements += sets[end].size * num_perm
+            end += 1
+
+        chunk = sets[start:end]
+        # Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits
+        permuted = a * np.concatenate(chunk)[None, :]
+        permuted += b
+        permuted >>= np.uint64(32)
+        offsets = np.cumsum([0] + [shingle_set.size for shingle_set in chunk[:-1]])
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+
+    return signatures
+
+@dataclass(eq=False)
+class Leader:
+    """A cluster's representative text and what was computed for it"""
+    text: str
+    shingles: Optional[np.ndarray]
+    band_keys: List[bytes]
+    created_at: float
+    negations: int = 0
+    aliases: List[str] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+    values: Dict[str, Any] = field(default_factory=dict)
+
+class NearDuplicateIndex:
+    """
+    Cluster leaders and their LSH buckets
+
+    Used for a single batch, or kept per workspace with ``max_leaders``
+    and ``ttl_seconds`` bounding the recent window it remembers.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        num_perm: int = 64,
+        max_leaders: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.max_leaders = max_leaders
+        self.ttl_seconds = ttl_seconds
+        # Oldest first, for window eviction
+        self._leaders: "OrderedDict[int, Leader]" = OrderedDict()
+        self._buckets: Dict[bytes, List[Leader]] = {}
+        self._exact: Dict[str, Leader] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._leaders)
+
+    def assign(self, texts: Sequence[str]) -> List[Leader]:
+        """Cluster leader of every text, making texts without one leaders"""
+        normalized = [dedup_normalize(text) for text in texts]
+        with self._lock:
+            self._expire()
+            leaders: List[Optional[Leader]] = [None] * len(texts)
+
+            # Identical after normalization: no hashing needed
+            pending: Dict[str, List[int]] = {}
+            for i, norm in enumerate(normalized):
+                if not norm:
+                    # Nothing but emoji or mentions: too little to compare
+                    leaders[i] = self._add_leader(texts[i], norm, None, [])
+                elif norm in self._exact:
+                    leaders[i] = self._exact[norm]
+                else:
+                    pending.setdefault(norm, []).append(i)
+
+            unique = list(pending)
+            if unique:
+                shingled = shingle_sets(unique)
+                signatures = minhash_signatures(shingled, self.num_perm)
+
+            for j, norm in enumerate(unique):
+                band_keys = self._band_keys(signatures[j])
+                leader = self._match(shingled[j], band_keys, negation_count(norm))
+                if leader is None:
+                    leader = self._add_leader(texts[pending[norm][0]], norm, shingled[j], band_keys)
+                else:
+                    self._exact[norm] = leader
+                    leader.aliases.append(norm)
+                for i in pending[norm]:
+                    leaders[i] = leader
+
+            return leaders
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        raw = signature.tobytes()
+        width = self.rows * signature.itemsize
+        return [bytes((band,)) + raw[band * width:(band + 1) * width] for band in range(self.bands)]
+
+    def _match(self, candidate: np.ndarray, band_keys: List[bytes], negations: int) -> Optional[Leader]:
+        best, best_similarity = None, self.threshold
+        seen = set()
+        for key in band_keys:
+            for leader in self._buckets.get(key, ()):
+                if leader in seen:
+                    continue
+                seen.add(leader)
+                if leader.negations != negations:
+                    continue
+                similarity = jaccard(candidate, leader.shingles)
+                if similarity >= best_similarity:
+                    best, best_similarity = leader, similarity
+        return best
+
+    def _add_leader(
+        self,
+        text: str,
+        normalized: str,
+        shingle_set: Optional[np.ndarray],
+        band_keys: List[bytes]
+    ) -> Leader:
+        leader = Leader(text, shingle_set, band_keys, time.monotonic(), negation_count(normalized))
+        if normalized:
+            self._leaders[id(leader)] = leader
+            self._exact[normalized] = leader
+            leader.aliases.append(normalized)
+            for key in band_keys:
+                self._buckets.setdefault(key, []).append(leader)
+
+        # Evicted leaders stay valid for texts already assigned to them
+        if self.max_leaders is not None:
+            while len(self._leaders) > self.max_leaders:
+                self._evict(next(iter(self._leaders.values())))
+        return leader
+
+    def _expire(self) -> None:
+        if self.ttl_seconds is None:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._leaders:
+            leader = next(iter(self._leaders.values()))
+            if leader.created_at >= cutoff:
+                break
+            self._evict(leader)
+
+    def _evict(self, leader: Leader) -> None:
+        del self._leaders[id(leader)]
+        for key in leader.band_keys:
+            members = self._buckets.get(key)
+            if members is not None:
+                members.remove(leader)
+                if not members:
+                    del self._buckets[key]
+        for norm in leader.aliases:
+            if self._exact.get(norm) is leader:
+                del self._exact[norm]
+
+def resolve_near_duplicates(
+    texts: Sequence[str],
+    namespace: str,
+    compute: Callable[[List[str]], List[Any]],
+    index: Optional[NearDuplicateIndex] = None,
+    storable: Callable[[Any], bool] = lambda value: True
+) -> Tuple[List[Any], List[int]]:
+    """
+    Compute values once per near-duplicate cluster
+
+    Returns each text's value (its cluster leader's) and cluster size.
+    Without ``index`` clusters are found within ``texts`` only; with one,
+    leaders remembered from earlier batches are matched too, and their
+    stored values under ``namespace`` reused. Sizes are counted per
+    namespace, so the same texts resolved for several models count once
+    for each. Values rejected by
+    ``storable`` (e.g. error fallbacks) are not kept on the leader.
+    """
+    settings = get_settings()
+    if not texts:
+        return [], []
+    if not settings.dedup_enabled:
+        return list(compute(list(texts))), [1] * len(texts)
+
+    if index is None:
+        index = NearDuplicateIndex(settings.dedup_threshold, settings.dedup_num_perm)
+    leaders = index.assign(texts)
+    for leader in leaders:
+        leader.counts[namespace] = leader.counts.get(namespace, 0) + 1
+
+    missing = [leader for leader in dict.fromkeys(leaders) if namespace not in leader.values]
+    computed: Dict[Leader, Any] = {}
+    if missing:
+        for leader, value in zip(missing, compute([leader.text for leader in missing])):
+            computed[leader] = value
+            if storable(value):
+                leader.values[namespace] = value
+
+    values = [computed[leader] if leader in computed else leader.values[namespace] for leader in leaders]
+    return values, [leader.counts[namespace] for leader in leaders]
+
+_workspace_indexes: "OrderedDict[str, NearDuplicateIndex]" = OrderedDict()
+_workspace_lock = threading.Lock()
+
+def workspace_index(workspace_id: str) -> Optional[NearDuplicateIndex]:
+    """Recent-window index of a workspace, or None if the window is disabled"""
+    settings = get_settings()
+    if not settings.dedup_enabled or settings.dedup_window_size <= 0:
+        return None
+    with _workspace_lock:
+        index = _workspace_indexes.get(workspace_id)
+        if index is None:
+            index = NearDuplicateIndex(
+                settings.dedup_threshold,
+                settings.dedup_num_perm,
+                max_leaders=settings.dedup_window_size,
+                ttl_seconds=settings.dedup_window_seconds
+            )
+            _workspace_indexes[workspace_id] = index
+        _workspace_indexes.move_to_end(workspace_id)
+        while len(_workspace_indexes) > settings.dedup_window_workspaces:
+            _workspace_indexes.popitem(last=False)
+        return index
@@ -0,0 +1,507 @@
+"""
+Persistent memory-mapped store of comment embeddings
+
+Each workspace gets a directory holding its comments' sentence
+embeddings as one row-major matrix file (float16, or int8 with a float32
+scale per row) next to an append-only id list and a tombstone byte per
+row. The analysis pipeline appends embeddings as it encodes comments, so
+clustering, search, dedup and trend features can read them back as
+zero-copy NumPy views instead of re-encoding.
+
+Files live in a generation directory named by ``CURRENT``. Compaction
+writes the live rows to a new generation and swaps ``CURRENT``
+atomically, so readers holding maps of the old files are unaffected.
+Writers take an exclusive ``flock`` and first catch up with rows other
+processes appended, so forked workers can share a store. In claim mode
+every instance writes to every workspace's store, so
+``EMBEDDING_STORE_DIR`` must be a volume they all mount, declared with
+``EMBEDDING_STORE_SHARED=true``.
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 1
+STORE_DTYPES = ("float16", "int8")
+
+_METADATA = "store.json"
+_CURRENT = "CURRENT"
+_LOCK = "lock"
+_IDS = "ids.txt"
+_VECTORS = "vectors.bin"
+_SCALES = "scales.bin"
+_DELETED = "deleted.bin"
+
+class EmbeddingStoreError(RuntimeError):
+    """Raised when a store on disk is malformed or does not match its settings"""
+
+def _decode(vectors: np.ndarray, scales: Optional[np.ndarray], rows: np.ndarray) -> np.ndarray:
+    decoded = np.asarray(vectors[rows], dtype=np.float32)
+    if scales is not None:
+        decoded *= scales[rows][:, None]
+    return decoded
+
+class StoreSnapshot(NamedTuple):
+    """Rows of one store generation as seen at one moment"""
+    generation: str
+    ids: List[str]
+    vectors: np.ndarray
+    scales: Optional[np.ndarray]
+    live: np.ndarray
+
+    def decode(self, rows: np.ndarray) -> np.ndarray:
+        """Float32 embeddings of the given rows"""
+        return _decode(self.vectors, self.scales, rows)
+
+class EmbeddingStore:
+    """Append-only embedding matrix of one workspace, with tombstones"""
+
+    def __init__(self, path: Path, dim: int, dtype: str = "float16", model: Optional[str] = None):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unknown embedding store dtype {dtype!r}")
+        self.path = Path(path)
+        self.dim = dim
+        self.dtype = dtype
+        self.model = model
+        self._lock = threading.RLock()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        metadata_path = self.path / _METADATA
+        if metadata_path.exists():
+            metadata = json.loads(metadata_path.read_text())
+            if (metadata["format"], metadata["dim"], metadata["dtype"], metadata.get("model")) != (
+                STORE_FORMAT, dim, dtype, model
+            ):
+                raise EmbeddingStoreError(f"Embedding store {self.path} was built with {metadata}")
+        else:
+            with self._file_lock():
+                (self.path / "gen-0").mkdir(exist_ok=True)
+                self._write_atomic(metadata_path, json.dumps({
+                    "format": STORE_FORMAT, "dim": dim, "dtype": dtype, "model": model
+                }))
+                if not (self.path / _CURRENT).exists():
+                    self._write_atomic(self.path / _CURRENT, "gen-0")
+
+        self._generation: Optional[str] = None
+        self._reload()
+
+    # Layout
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _file(self, name: str, generation: Optional[str] = None) -> Path:
+        return self.path / (generation or self._generation) / name
+
+    @staticmethod
+    def _write_atomic(path: Path, content: str) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(content)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.path / _LOCK, "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    # Reading
+
+    def _reload(self) -> None:
+        """(Re)open the current generation from scratch"""
+        self._generation = (self.path / _CURRENT).read_text().strip()
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._ids_offset = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._deleted: Optional[np.ndarray] = None
+        self._mapped = -1
+        self._refresh()
+
+    def _refresh(self) -> None:
+        """Catch up with rows appended by other processes"""
+        if (self.path / _CURRENT).read_text().strip() != self._generation:
+            self._reload()
+            return
+
+        ids_path = self._file(_IDS)
+        if not ids_path.exists():
+            return
+        with open(ids_path, "rb") as handle:
+            handle.seek(self._ids_offset)
+            appended = handle.read()
+        # A writer may be mid-line; only complete lines count
+        complete = appended[:appended.rfind(b"\n") + 1]
+        self._ids_offset += len(complete)
+
+        # Rows are written before their ids, so every listed id has its row
+        for comment_id in complete.decode().splitlines():
+            self._rows[comment_id] = len(self._ids)
+            self._ids.append(comment_id)
+
+    def _map(self) -> None:
+        """Map the files over every known row (cheap when nothing changed)"""
+        count = len(self._ids)
+        if count == self._mapped:
+            return
+        if count == 0:
+            self._vectors = np.empty((0, self.dim), dtype=self.dtype)
+            self._scales = np.empty(0, dtype=np.float32) if self.dtype == "int8" else None
+            self._deleted = np.empty(0, dtype=np.uint8)
+        else:
+            self._vectors = np.memmap(self._file(_VECTORS), dtype=self.dtype, mode="r", shape=(count, self.dim))
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._file(_SCALES), dtype=np.float32, mode="r", shape=(count,))
+            self._deleted = np.memmap(self._file(_DELETED), dtype=np.uint8, mode="r", shape=(count,))
+        self._mapped = count
+
+    def __len__(self) -> int:
+        """Number of live rows"""
+        with self._lock:
+            self._refresh()
+            self._map()
+            return len(self._ids) - int(self._deleted.sum())
+
+    def __contains__(self, comment_id: str) -> bool:
+        return self.row_of(comment_id) is not None
+
+    def row_of(self, comment_id: str) -> Optional[int]:
+        """Row holding a comment's live embedding"""
+        with self._lock:
+            self._refresh()
+            self._map()
+            row = self._rows.get(comment_id)
+            if row is None or self._deleted[row]:
+                return None
+            return row
+
+    def view(self) -> Tuple[List[str], np.ndarray, Optional[np.ndarray], np.ndarray]:
+        """
+        Zero-copy (ids, vectors, scales, live) over every row
+
+        ``vectors`` is the raw float16 or int8 matrix (int8 rows times
+        ``scales`` approximate the embedding; ``scales`` is None for
+        float16) and ``live`` a boolean mask of rows not deleted.
+        """
+        return self.snapshot()[1:]
+
+    def snapshot(self) -> StoreSnapshot:
+        """
+        ``view`` together with the generation its row numbers refer to
+
+        ``ids`` is the store's own list, not a copy: later appends extend
+        it, so only its first ``len(vectors)`` entries belong to the snapshot.
+        """
+        with self._lock:
+            self._refresh()
+            self._map()
+            return StoreSnapshot(self._generation, self._ids, self._vectors, self._scales, self._deleted == 0)
+
+    def get(self, comment_ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """Float32 embeddings of the given comments that are stored (a copy)"""
+        with self._lock:
+            self._refresh()
+            self._map()
+            found = [(i, self._rows[i]) for i in comment_ids if i in self._rows and not self._deleted[self._rows[i]]]
+            rows = np.array([row for _, row in found], dtype=np.int64)
+            return [comment_id for comment_id, _ in found], _decode(self._vectors, self._scales, rows)
+
+    # Writing
+
+    def add(self, comment_ids: Sequence[str], embeddings: np.ndarray) -> int:
+        """Append embeddings, superseding any stored for the same comments"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape != (len(comment_ids), self.dim):
+            raise ValueError(f"Expected {len(comment_ids)} x {self.dim} embeddings, got {embeddings.shape}")
+        if not len(comment_ids):
+            return 0
+        if len(set(comment_ids)) < len(comment_ids):
+            # Keep the last embedding given for each comment
+            last = {comment_id: i for i, comment_id in enumerate(comment_ids)}
+            keep = sorted(last.values())
+            comment_ids = [comment_ids[i] for i in keep]
+            embeddings = embeddings[keep]
+
+        scales = None
+        if self.dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            encoded = np.round(embeddings / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        else:
+            encoded = embeddings.astype(np.float16)
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._truncate_partial_rows()
+            superseded = [self._rows[i] for i in comment_ids if i in self._rows]
+
+            with open(self._file(_VECTORS), "ab") as handle:
+                handle.write(encoded.tobytes())
+            if scales is not None:
+                with open(self._file(_SCALES), "ab") as handle:
+                    handle.write(scales.tobytes())
+            with open(self._file(_DELETED), "ab") as handle:
+                handle.write(bytes(len(comment_ids)))
+            # Ids last: a crash before this line leaves only unlisted rows
+            with open(self._file(_IDS), "ab") as handle:
+                handle.write("".join(f"{i}\n" for i in comment_ids).encode())
+
+            self._refresh()
+            self._tombstone(superseded)
+        return len(comment_ids)
+
+    def delete(self, comment_ids: Sequence[str]) -> int:
+        """Tombstone comments; returns how many had live rows"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._map()
+            rows = [self._rows[i] for i in comment_ids if i in self._rows and not self._deleted[self._rows[i]]]
+            self._tombstone(rows)
+            return len(rows)
+
+    def _tombstone(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        deleted = np.memmap(self._file(_DELETED), dtype=np.uint8, mode="r+")
+        deleted[rows] = 1
+        deleted.flush()
+        del deleted
+        self._mapped = -1
+
+    def _truncate_partial_rows(self) -> None:
+        """Drop rows a crashed writer appended without listing their ids"""
+        count = len(self._ids)
+        for name, row_bytes in ((_VECTORS, self._row_bytes), (_SCALES, 4), (_DELETED, 1)):
+            path = self._file(name)
+            if path.exists() and path.stat().st_size > count * row_bytes:
+                os.truncate(path, count * row_bytes)
+
+    @property
+    def dead_fraction(self) -> float:
+        with self._lock:
+            self._refresh()
+            self._map()
+            return float(self._deleted.mean()) if len(self._ids) else 0.0
+
+    def compact(self) -> int:
+        """Rewrite the live rows into a new generation; returns rows dropped"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._map()
+            live = np.flatnonzero(self._deleted == 0)
+            dropped = len(self._ids) - live.size
+            if dropped == 0:
+                return 0
+
+            old_generation = self._generation
+            generation = f"gen-{int(old_generation.split('-')[1]) + 1}"
+            target = self.path / generation
+            shutil.rmtree(target, ignore_errors=True)
+            target.mkdir()
+
+            # Chunked so compaction never holds the whole matrix in memory
+            with open(target / _VECTORS, "wb") as vectors, open(target / _IDS, "wb") as ids:
+                scales = open(target / _SCALES, "wb") if self.dtype == "int8" else None
+                try:
+                    for start in range(0, live.size, 65536):
+                        rows = live[start:start + 65536]
+                        vectors.write(np.ascontiguousarray(self._vectors[rows]).tobytes())
+                        if scales is not None:
+                            scales.write(np.ascontiguousarray(self._scales[rows]).tobytes())
+                        ids.write("".join(f"{self._ids[row]}\n" for row in rows).encode())
+                finally:
+                    if scales is not None:
+                        scales.close()
+            (target / _DELETED).write_bytes(bytes(live.size))
+
+            self._write_atomic(self.path / _CURRENT, generation)
+            self._reload()
+            # Open maps of the old files stay valid after unlinking
+            shutil.rmtree(self.path / old_generation, ignore_errors=True)
+
+        logger.info(f"Compacted embedding store {self.path}: dropped {dropped} rows, kept {live.size}")
+        return dropped
+
+_stores: "OrderedDict[str, EmbeddingStore]" = OrderedDict()
+_stores_lock = threading.Lock()
+
+def workspace_store(workspace_id: str, dim: int) -> Optional[EmbeddingStore]:
+    """The embedding store of a workspace, or None if stores are disabled"""
+    settings = get_settings()
+    if not settings.embedding_store_enabled:
+        return None
+    with _stores_lock:
+        store = _stores.get(workspace_id)
+        if store is None:
+            path = Path(settings.embedding_store_dir) / workspace_id
+            try:
+                store = EmbeddingStore(path, dim, settings.embedding_store_dtype, settings.embedding_model)
+            except EmbeddingStoreError as e:
+                # Embeddings of another model or layout are useless; start over
+                logger.warning(f"{e}; rebuilding it")
+                shutil.rmtree(path)
+                store = EmbeddingStore(path, dim, settings.embedding_store_dtype, settings.embedding_model)
+            _stores[workspace_id] = store
+        _stores.move_to_end(workspace_id)
+        while len(_stores) > 64:
+            _stores.popitem(last=False)
+        return store
+
+def open_workspace_store(workspace_id: str) -> Optional[EmbeddingStore]:
+    """An existing workspace store, with its dimension read from disk"""
+    path = Path(get_settings().embedding_store_dir) / workspace_id / _METADATA
+    if not path.exists():
+        return None
+    return workspace_store(workspace_id, json.loads(path.read_text())["dim"])
+
+def _live_ids(store: EmbeddingStore) -> List[str]:
+    snapshot = store.snapshot()
+    return [snapshot.ids[row] for row in np.flatnonzero(snapshot.live)]
+
+async def prune_deleted_comments(store: EmbeddingStore, chunk_size: int = 10000) -> int:
+    """Tombstone stored comments removed upstream and compact when worthwhile"""
+    from app.core.database import get_db_connection
+
+    live_ids = await asyncio.to_thread(_live_ids, store)
+    missing: List[str] = []
+    async with get_db_connection() as conn:
+        for start in range(0, len(live_ids), chunk_size):
+            chunk = live_ids[start:start + chunk_size]
+            rows = await conn.fetch(
+                "SELECT id FROM unnest($1::text[]) AS id EXCEPT SELECT id FROM comments WHERE id = ANY($1::text[])",
+                chunk
+            )
+            missing.extend(row["id"] for row in rows)
+
+    deleted = await asyncio.to_thread(store.delete, missing)
+    if store.dead_fraction > get_settings().embedding_store_compact_ratio:
+        await asyncio.to_thread(store.compact)
+    return deleted
+
+async def backfill_workspace_embeddings(workspace_id: str, page_size: int = 1000) -> int:
+    """Embed and store a workspace's comments that have no stored embedding yet"""
+    from app.core.database import get_db_connection
+    from app.core.models import embed_texts
+
+    store: Optional[EmbeddingStore] = open_workspace_store(workspace_id)
+    added = 0
+    after = ""
+    while True:
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT c.id, c.text
+                FROM comments c
+                JOIN content_items ci ON c.content_item_id = ci.id
+                JOIN channels ch ON ci.channel_id = ch.id
+                WHERE ch.workspace_id = $1
+                AND c.id > $2
+                ORDER BY c.id
+                LIMIT $3
+                """,
+                workspace_id, after, page_size
+            )
+        if not rows:
+            return added
+        after = rows[-1]["id"]
+
+        missing = [row for row in rows if store is None or row["id"] not in store]
+        if missing:
+            vectors = await asyncio.to_thread(embed_texts, [row["text"] for row in missing])
+            if store is None:
+                store = workspace_store(workspace_id, vectors.shape[1])
+            added += await asyncio.to_thread(store.add, [row["id"] for row in missing], vectors)
+
+def _workspace_stores() -> List[Tuple[str, EmbeddingStore]]:
+    root = Path(get_settings().embedding_store_dir)
+    if not root.is_dir():
+        return []
+    stores = ((path.name, open_workspace_store(path.name)) for path in sorted(root.iterdir()))
+    return [(workspace_id, store) for workspace_id, store in stores if store is not None]
+
+async def prune_embedding_stores() -> Optional[Dict[str, int]]:
+    """
+    Prune every workspace store; returns deletions per workspace
+
+    Stores are shared by every instance, so one instance prunes them at a
+    time. Returns None if another one is already pruning.
+    """
+    from app.core.database import get_db_connection
+
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            locked = await conn.fetchval("SELECT pg_try_advisory_xact_lock(hashtext('embedding_store_prune'))")
+            if not locked:
+                return None
+            deleted = {}
+            for workspace_id, store in await asyncio.to_thread(_workspace_stores):
+                deleted[workspace_id] = await prune_deleted_comments(store)
+            return deleted
+
+def check_shared_store_dir() -> None:
+    """
+    Refuse to serve claim jobs with an embedding store on local disk
+
+    Claim jobs spread a workspace's pages over every instance, so each
+    instance must append to the same store files. Whether the directory
+    is shared can't be told from the filesystem, so it is declared with
+    EMBEDDING_STORE_SHARED.
+    """
+    settings = get_settings()
+    if not (settings.analysis_claim_mode and settings.embedding_store_enabled):
+        return
+    if not settings.embedding_store_shared:
+        raise EmbeddingStoreError(
+            f"Claim mode needs EMBEDDING_STORE_DIR ({Path(settings.embedding_store_dir).resolve()}) on a volume "
+            "shared by every instance; set EMBEDDING_STORE_SHARED=true once it is (or EMBEDDING_STORE_ENABLED=false)"
+        )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect and maintain workspace embedding stores")
+    parser.add_argument("command", choices=["stats", "prune", "compact"])
+    parser.add_argument("workspace_ids", nargs="+")
+    args = parser.parse_args()
+
+    from app.core.database import close_db
+
+    async def run() -> None:
+        try:
+            for workspace_id in args.workspace_ids:
+                store = open_workspace_store(workspace_id)
+                if store is None:
+                    print(f"{workspace_id}: no embedding store")
+                elif args.command == "stats":
+                    print(f"{workspace_id}: {len(store)} live rows, {store.dead_fraction:.1%} deleted, {store.dtype}")
+                elif args.command == "prune":
+                    print(f"{workspace_id}: {await prune_deleted_comments(store)} deleted comments dropped")
+                else:
+                    print(f"{workspace_id}: {store.compact()} rows compacted away")
+        finally:
+            await close_db()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""Durable, resumable analysis jobs backed by the job_runs table"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Dict, Optional
+
+from app.core.config import get_settings
+from app.core.database import get_db_connection, count_open_comments
+from app.core.pipeline import WorkspaceAnalysisPipeline
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_JOB_TYPE = "comment_analysis"
+
+class JobOwnershipLost(Exception):
+    """Raised when another instance has taken over a running job"""
+
+_instance_id: Optional[str] = None
+
+def instance_id() -> str:
+    """Identifies this process as the owner of the jobs and comment leases it holds"""
+    global _instance_id
+    if _instance_id is None:
+        _instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    return _instance_id
+
+def _reset_instance_id() -> None:
+    global _instance_id
+    _instance_id = None
+
+# Prefork workers must not share the server process's id
+os.register_at_fork(after_in_child=_reset_instance_id)
+
+_JOB_COLUMNS = "id, type, status, started_at, finished_at, payload_json, error_text, updated_at"
+
+def _job_from_row(row: Any) -> dict:
+    job = dict(row)
+    payload = job.get("payload_json")
+    job["payload_json"] = json.loads(payload) if isinstance(payload, str) else (payload or {})
+    return job
+
+def _encode_cursor(cursor: Optional[tuple]) -> Optional[list]:
+    if cursor is None:
+        return None
+    created_at, comment_id = cursor
+    return [created_at.isoformat(), comment_id]
+
+def _decode_cursor(cursor: Optional[list]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    return (datetime.fromisoformat(cursor[0]), cursor[1])
+
+async def create_analysis_job(
+    workspace_id: str,
+    platform: Optional[str],
+    max_comments: Optional[int],
+    total: int,
+    keyword_mode: Optional[str] = None,
+    sentiment_mode: Optional[str] = None
+) -> tuple[dict, bool]:
+    """
+    Create an analysis job, or return the active one for the workspace
+
+    An advisory lock on the workspace serializes concurrent calls, so two
+    requests for the same workspace share one job. Returns the job and
+    whether it was newly created.
+    """
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "SELECT pg_advisory_xact_lock(hashtext($1))",
+                f"{ANALYSIS_JOB_TYPE}:{workspace_id}"
+            )
+            existing = await conn.fetchrow(
+                f"""
+                SELECT {_JOB_COLUMNS} FROM job_runs
+                WHERE type = $1
+                AND status IN ('PENDING', 'RUNNING')
+                AND payload_json->>'workspace_id' = $2
+                ORDER BY started_at
+                LIMIT 1
+                """,
+                ANALYSIS_JOB_TYPE, workspace_id
+            )
+            if existing:
+                return _job_from_row(existing), False
+
+            payload = {
+                "workspace_id": workspace_id,
+                "mode": "claim" if get_settings().analysis_claim_mode else "keyset",
+                "platform": platform,
+                "max_comments": max_comments,
+                "keyword_mode": keyword_mode,
+                "sentiment_mode": sentiment_mode,
+                "total": total,
+                "processed": 0,
+                "updated": 0,
+                "failed": 0,
+                "cursor": None,
+                "throughput": 0.0,
+                "owner": instance_id()
+            }
+            row = await conn.fetchrow(
+                f"""
+                INSERT INTO job_runs (id, type, status, started_at, payload_json, created_at, updated_at)
+                VALUES ($1, $2, 'PENDING', NOW(), $3::jsonb, NOW(), NOW())
+                RETURNING {_JOB_COLUMNS}
+                """,
+                uuid.uuid4().hex, ANALYSIS_JOB_TYPE, json.dumps(payload)
+            )
+            return _job_from_row(row), True
+
+async def get_job(job_id: str) -> Optional[dict]:
+    """Get a job by id"""
+    async with get_db_connection() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {_JOB_COLUMNS} FROM job_runs WHERE id = $1", job_id
+        )
+        return _job_from_row(row) if row else None
+
+async def checkpoint_job(job_id: str, progress: dict, status: str = "RUNNING") -> bool:
+    """
+    Merge progress into the job payload and refresh its heartbeat
+
+    Only succeeds while this instance still owns the job; returns False if
+    another instance has taken it over.
+    """
+    async with get_db_connection() as conn:
+        result = await conn.execute(
+            """
+            UPDATE job_runs
+            SET payload_json = payload_json || $2::jsonb,
+                status = $3::"JobStatus",
+                updated_at = NOW()
+            WHERE id = $1 AND payload_json->>'owner' = $4
+            """,
+            job_id, json.dumps(progress), status, instance_id()
+        )
+        return result.endswith(" 1")
+
+async def heartbeat_job(job_id: str) -> bool:
+    """Refresh the heartbeat of a job this instance owns; False if it no longer does"""
+    async with get_db_connection() as conn:
+        result = await conn.execute(
+            """
+            UPDATE job_runs SET updated_at = NOW()
+            WHERE id = $1 AND status IN ('PENDING', 'RUNNING') AND payload_json->>'owner' = $2
+            """,
+            job_id, instance_id()
+        )
+        return result.endswith(" 1")
+
+async def increment_job_progress(job_id: str, deltas: dict) -> Optional[int]:
+    """
+    Atomically add counter deltas to a shared (claim mode) job
+
+    Returns the job's processed total across all participants, or None
+    once the job is no longer active, e.g. because another participant
+    completed or failed it.
+    """
+    async with get_db_connection() as conn:
+        return await conn.fetchval(
+            """
+            UPDATE job_runs
+            SET payload_json = payload_json || jsonb_build_object(
+                    'processed', COALESCE((payload_json->>'processed')::bigint, 0) + $2,
+                    'updated', COALESCE((payload_json->>'updated')::bigint, 0) + $3,
+                    'failed', COALESCE((payload_json->>'failed')::bigint, 0) + $4
+                ),
+                status = 'RUNNING',
+                updated_at = NOW()
+            WHERE id = $1 AND status IN ('PENDING', 'RUNNING')
+            RETURNING (payload_json->>'processed')::bigint
+            """,
+            job_id, deltas["processed"], deltas["updated"], deltas["failed"]
+        )
+
+async def finish_job(
+    job_id: str,
+    progress: dict,
+    error_text: Optional[str] = None,
+    shared: bool = False
+) -> None:
+    """
+    Mark a job completed, or failed when ``error_text`` is given
+
+    Owned jobs only finish from their owner; ``shared`` (claim mode) jobs
+    can be finished by any participant while they are still active.
+    """
+    params = [
+        job_id,
+        json.dumps(progress),
+        "FAILED" if error_text else "COMPLETED",
+        error_text
+    ]
+    if shared:
+        guard = "status IN ('PENDING', 'RUNNING')"
+    else:
+        guard = "payload_json->>'owner' = $5"
+        params.append(instance_id())
+
+    async with get_db_connection() as conn:
+        await conn.execute(
+            f"""
+            UPDATE job_runs
+            SET payload_json = payload_json || $2::jsonb,
+                status = $3::"JobStatus",
+                error_text = $4,
+                finished_at = NOW(),
+                updated_at = NOW()
+            WHERE id = $1 AND {guard}
+            """,
+            *params
+        )
+
+async def release_job(job_id: str) -> None:
+    """Give up ownership so another instance can resume the job immediately"""
+    async with get_db_connection() as conn:
+        await conn.execute(
+            """
+            UPDATE job_runs
+            SET payload_json = payload_json || '{"owner": null}'::jsonb,
+                updated_at = to_timestamp(0)
+            WHERE id = $1 AND payload_json->>'owner' = $2
+            """,
+            job_id, instance_id()
+        )
+
+async def claim_stale_jobs(stale_after_seconds: int) -> list[dict]:
+    """Take over active jobs whose owner has stopped heartbeating"""
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            f"""
+            UPDATE job_runs
+            SET payload_json = payload_json || jsonb_build_object('owner', $2::text),
+                updated_at = NOW()
+            WHERE id IN (
+                SELECT id FROM job_runs
+                WHERE type = $1
+                AND status IN ('PENDING', 'RUNNING')
+                AND COALESCE(payload_json->>'mode', 'keyset') = 'keyset'
+                AND updated_at < NOW() - make_interval(secs => $3)
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {_JOB_COLUMNS}
+            """,
+            ANALYSIS_JOB_TYPE, instance_id(), float(stale_after_seconds)
+        )
+        return [_job_from_row(row) for row in rows]
+
+async def list_active_claim_jobs() -> list[dict]:
+    """Get active claim-mode jobs any instance may join"""
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            f"""
+            SELECT {_JOB_COLUMNS} FROM job_runs
+            WHERE type = $1
+            AND status IN ('PENDING', 'RUNNING')
+            AND payload_json->>'mode' = 'claim'
+            """,
+            ANALYSIS_JOB_TYPE
+        )
+        return [_job_from_row(row) for row in rows]
+
+def job_progress(job: dict) -> dict:
+    """Progress, throughput and ETA summary for a job"""
+    payload = job["payload_json"]
+    total = payload.get("total") or 0
+    processed = payload.get("processed", 0)
+    throughput = payload.get("throughput") or 0.0
+    remaining = max(total - processed, 0)
+
+    if payload.get("mode") == "claim":
+        # Several workers contribute; measure the job as a whole
+        end = job["finished_at"] or job["updated_at"]
+        elapsed = (end - job["started_at"]).total_seconds()
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+
+    if job["status"] in ("COMPLETED", "FAILED"):
+        eta_seconds = 0.0
+    elif throughput > 0:
+        eta_seconds = remaining / throughput
+    else:
+        eta_seconds = None
+
+    return {
+        "job_id": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "workspace_id": payload.get("workspace_id"),
+        "platform": payload.get("platform"),
+        "total": total,
+        "processed": processed,
+        "updated": payload.get("updated", 0),
+        "failed": payload.get("failed", 0),
+        "progress": min(processed / total, 1.0) if total else 1.0,
+        "throughput_per_second": throughput,
+        "eta_seconds": eta_seconds,
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "last_heartbeat_at": job["updated_at"],
+        "error": job["error_text"]
+    }
+
+class AnalysisJobRunner:
+    """
+    Runs analysis jobs in this process and resumes orphaned ones
+
+    Each job drives a ``WorkspaceAnalysisPipeline`` starting from the
+    checkpointed keyset cursor. Every written page checkpoints the job's
+    progress, and a separate task refreshes its heartbeat a few times per
+    ``job_stale_after_seconds`` however long a page takes; a sweeper
+    periodically claims jobs whose heartbeat is older than that (e.g.
+    after a pod restart) and resumes them from their last cursor.
+
+    Claim-mode jobs have no single owner: every instance's sweeper joins
+    them and leases comment batches with ``FOR UPDATE SKIP LOCKED``, adding
+    its counts to the shared job. Whoever finds no open comments left
+    completes the job; leases of dead workers expire and are re-claimed.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Resume orphaned jobs and start the sweeper"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self) -> None:
+        """Cancel running jobs and release them for other instances"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        tasks = list(self._tasks.items())
+        for _, task in tasks:
+            task.cancel()
+        for job_id, task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            try:
+                await release_job(job_id)
+            except Exception as e:
+                logger.warning(f"Failed to release job {job_id}: {e}")
+
+    def run(self, job: dict) -> None:
+        """Start running a job owned by this instance"""
+        if job["id"] in self._tasks:
+            return
+        task = asyncio.create_task(self._run_job(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            try:
+                for job in await claim_stale_jobs(self.settings.job_stale_after_seconds):
+                    logger.info(f"Resuming analysis job {job['id']}")
+                    self.run(job)
+                for job in await list_active_claim_jobs():
+                    self.run(job)
+            except Exception as e:
+                logger.warning(f"Job sweep failed: {e}")
+            await asyncio.sleep(self.settings.job_sweep_interval_seconds)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Keep a job's heartbeat fresh; raises once another instance owns it"""
+        interval = max(self.settings.job_stale_after_seconds / 4, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                owned = await heartbeat_job(job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat of job {job_id} failed: {e}")
+                continue
+            if not owned:
+                raise JobOwnershipLost(f"job {job_id} was taken over by another instance")
+
+    async def _with_heartbeat(self, job_id: str, work: Awaitable[Any]) -> Any:
+        """Await ``work``, cancelling it if the job's heartbeat finds it taken over"""
+        running = asyncio.ensure_future(work)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await asyncio.wait({running, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+            if not running.done():
+                running.cancel()
+                await asyncio.gather(running, return_exceptions=True)
+                heartbeat.result()
+            return running.result()
+        finally:
+            running.cancel()
+            heartbeat.cancel()
+            await asyncio.gather(running, heartbeat, return_exceptions=True)
+
+    async def _run_job(self, job: dict) -> None:
+        if job["payload_json"].get("mode") == "claim":
+            await self._run_claim_job(job)
+            return
+
+        job_id = job["id"]
+        payload = job["payload_json"]
+        max_comments = payload.get("max_comments")
+        done_before = payload.get("processed", 0)
+        totals = {
+            "processed": done_before,
+            "updated": payload.get("updated", 0),
+            "failed": payload.get("failed", 0)
+        }
+        started = time.monotonic()
+
+        def progress(pipeline: WorkspaceAnalysisPipeline) -> dict:
+            stats = pipeline.stats
+            processed_now = stats["updated"] + stats["failed"] + stats["missing"]
+            elapsed = time.monotonic() - started
+            return {
+                "processed": totals["processed"] + processed_now,
+                "updated": totals["updated"] + stats["updated"],
+                "failed": totals["failed"] + stats["failed"],
+                "cursor": _encode_cursor(pipeline.cursor),
+                "throughput": processed_now / elapsed if elapsed > 0 else 0.0
+            }
+
+        async def on_checkpoint(pipeline: WorkspaceAnalysisPipeline) -> None:
+            if not await checkpoint_job(job_id, progress(pipeline)):
+                raise JobOwnershipLost(f"job {job_id} was taken over by another instance")
+
+        pipeline = WorkspaceAnalysisPipeline(
+            payload["workspace_id"],
+            platform=payload.get("platform"),
+            max_comments=max(max_comments - done_before, 0) if max_comments is not None else None,
+            cursor=_decode_cursor(payload.get("cursor")),
+            on_checkpoint=on_checkpoint,
+            keyword_mode=payload.get("keyword_mode"),
+            sentiment_mode=payload.get("sentiment_mode")
+        )
+
+        logger.info(f"Running analysis job {job_id} for workspace {payload['workspace_id']}")
+        try:
+            await checkpoint_job(job_id, progress(pipeline))
+            # Pages that take longer than the stale timeout must not look abandoned
+            await self._with_heartbeat(job_id, pipeline.run())
+        except asyncio.CancelledError:
+            raise
+        except JobOwnershipLost as e:
+            logger.warning(f"Stopping analysis job: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} failed: {e}", exc_info=True)
+            await finish_job(job_id, progress(pipeline), error_text=str(e))
+            return
+
+        await finish_job(job_id, progress(pipeline))
+        logger.info(
+            f"Analysis job {job_id} completed: {pipeline.stats['updated']} updated "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    async def _run_claim_job(self, job: dict) -> None:
+        job_id = job["id"]
+        payload = job["payload_json"]
+        reported = {"processed": 0, "updated": 0, "failed": 0}
+        # The limit is shared: every participant stops once the job total reaches it
+        max_comments = payload.get("max_comments")
+        job_processed = payload.get("processed", 0)
+
+        def deltas(pipeline: WorkspaceAnalysisPipeline) -> dict:
+            stats = pipeline.stats
+            current = {
+                "processed": stats["updated"] + stats["failed"] + stats["missing"],
+                "updated": stats["updated"],
+                "failed": stats["failed"]
+            }
+            delta = {key: current[key] - reported[key] for key in current}
+            reported.update(current)
+            return delta
+
+        async def on_checkpoint(pipeline: WorkspaceAnalysisPipeline) -> None:
+            nonlocal job_processed
+            total = await increment_job_progress(job_id, deltas(pipeline))
+            if total is None:
+                raise JobOwnershipLost(f"job {job_id} is no longer active")
+            job_processed = total
+            if max_comments is not None:
+                # Pages already in flight still finish, so the limit can be overshot by a few pages
+                remaining = max(max_comments - total, 0)
+                pipeline.max_comments = min(pipeline.max_comments, reported["processed"] + remaining)
+
+        pipeline = WorkspaceAnalysisPipeline(
+            payload["workspace_id"],
+            platform=payload.get("platform"),
+            max_comments=max(max_comments - job_processed, 0) if max_comments is not None else None,
+            on_checkpoint=on_checkpoint,
+            lease_owner=instance_id(),
+            keyword_mode=payload.get("keyword_mode"),
+            sentiment_mode=payload.get("sentiment_mode")
+        )
+
+        try:
+            await pipeline.run()
+        except asyncio.CancelledError:
+            raise
+        except JobOwnershipLost as e:
+            logger.info(f"Leaving analysis job: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} failed: {e}", exc_info=True)
+            await finish_job(job_id, {}, error_text=str(e), shared=True)
+            return
+
+        if pipeline.stats["updated"]:
+            logger.info(
+                f"Analysis job {job_id}: this worker updated {pipeline.stats['updated']} comments"
+            )
+
+        # The participant that reaches the limit, or the last to run dry, completes the job
+        if (
+            (max_comments is not None and job_processed >= max_comments)
+            or await count_open_comments(payload["workspace_id"], payload.get("platform")) == 0
+        ):
+            await finish_job(job_id, {}, shared=True)
+            logger.info(f"Analysis job {job_id} completed")
+
+# Global job runner
+job_runner = AnalysisJobRunner()
@@ -1,22 +1,50 @@
 """ML model management and caching"""
 
 import os
+import time
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 import asyncio
 from pathlib import Path
 
-import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
-from sentence_transformers import SentenceTransformer
-from keybert import KeyBERT
-import nltk
 
 from app.core.config import get_settings
+from app.core.batching import (
+    AdaptiveBatchSizer, container_memory_limit, container_memory_usage, plan_token_batches, padded_tokens
+)
+from app.core.cache import result_cache
+from app.core.cascade import TRANSFORMER_TIER, lexicon_sentiment, load_cascade_thresholds
+from app.core.ctfidf import class_tfidf_keywords
+from app.core.dedup import NearDuplicateIndex, resolve_near_duplicates
+from app.core.sentiment_head import load_sentiment_head
+from app.core.backends import build_sentiment_backend
+from app.core.bundles import (
+    SENTENCE_TRANSFORMERS_BUNDLE,
+    TRANSFORMERS_BUNDLE,
+    build_bundle,
+    bundle_dir,
+    load_mmapped_model,
+    load_sentence_transformer,
+    read_bundle
+)
+from app.core.registry import (
+    model_registry,
+    bundle_artifact_name,
+    embedding_repo_id,
+    enable_offline_mode,
+    load_nltk_data,
+    sentiment_artifact_name
+)
 
 logger = logging.getLogger(__name__)
 
+# Everything loaded at startup
+MODEL_NAMES = ('nltk', 'sentiment', 'embeddings', 'keybert')
+
+class ModelNotReady(RuntimeError):
+    """Raised when a request needs a model that is still loading or failed to load"""
+
 class ModelManager:
     """Centralized model management"""
     
@@ -24,95 +52,231 @@ class ModelManager:
         self.settings = get_settings()
         self.models: Dict[str, Any] = {}
         self.tokenizers: Dict[str, Any] = {}
+        self.status: Dict[str, str] = {name: 'pending' for name in MODEL_NAMES}
+        self.errors: Dict[str, str] = {}
+        self.load_seconds: Dict[str, float] = {}
+        self._loader: Optional[asyncio.Task] = None
         
         # Create model cache directory
         Path(self.settings.model_cache_dir).mkdir(parents=True, exist_ok=True)
     
     async def download_models(self) -> None:
-        """Download and cache all required models"""
-        logger.info("Downloading ML models...")
+        """
+        Download and cache all required models
+        
+        Independent models load concurrently in worker threads (torch,
+        transformers and friends release the GIL for most of the work), and
+        each model is usable as soon as its own load finishes. KeyBERT wraps
+        the embedding model, so it follows it.
+        """
+        if all(status == 'ready' for status in self.status.values()):
+            # Already loaded, e.g. by the pre-fork parent process
+            logger.info("ML models already loaded")
+            return
+        
+        self._check_registry()
+        
+        logger.info("Loading ML models...")
+        started = time.monotonic()
         
+        results = await asyncio.gather(
+            self._load('nltk', self._download_nltk_data),
+            self._load('sentiment', self._load_sentiment_model),
+            self._load_embeddings_and_keybert(),
+            return_exceptions=True
+        )
+        
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            logger.error(f"❌ Failed to load models: {errors[0]}")
+            raise errors[0]
+        
+        logger.info(f"✅ All models loaded in {time.monotonic() - started:.1f}s")
+    
+    def start_loading(self) -> asyncio.Task:
+        """Load models in the background so the app serves while they load"""
+        # Offline, a missing or truncated artifact fails startup right away
+        self._check_registry()
+        
+        if self._loader is None or (self._loader.done() and self.errors):
+            self._loader = asyncio.create_task(self._load_in_background())
+        return self._loader
+    
+    async def _load_in_background(self) -> None:
         try:
-            # Download NLTK data
-            await self._download_nltk_data()
-            
-            # Load sentiment analysis model
-            await self._load_sentiment_model()
-            
-            # Load embedding model for KeyBERT
-            await self._load_embedding_model()
-            
-            # Initialize KeyBERT
-            await self._load_keybert()
-            
-            logger.info("✅ All models loaded successfully")
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to load models: {e}")
-            raise
+            await self.download_models()
+        except Exception:
+            # Already logged; readiness reports the failed models
+            pass
+    
+    async def wait_until_ready(self, *names: str, poll_seconds: float = 0.5) -> None:
+        """Wait for models to finish loading, failing fast if one failed"""
+        while True:
+            failed = [name for name in names if self.status[name] == 'failed']
+            if failed:
+                raise ModelNotReady(f"Model {failed[0]} failed to load: {self.errors[failed[0]]}")
+            if all(self.status[name] == 'ready' for name in names):
+                return
+            await asyncio.sleep(poll_seconds)
+    
+    def readiness(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model load status"""
+        return {
+            name: {
+                'status': self.status[name],
+                'load_seconds': round(self.load_seconds[name], 2) if name in self.load_seconds else None,
+                'error': self.errors.get(name)
+            }
+            for name in MODEL_NAMES
+        }
     
-    async def _download_nltk_data(self) -> None:
-        """Download required NLTK data"""
-        logger.info("Downloading NLTK data...")
+    def _check_registry(self) -> None:
+        if self.settings.model_offline:
+            enable_offline_mode()
+            model_registry.check_offline()
+    
+    async def _load(self, name: str, loader: Callable[[], None]) -> None:
+        """Run a blocking loader in a worker thread and track its status"""
+        if self.status[name] == 'ready':
+            return
         
-        nltk_data = ['punkt', 'stopwords', 'vader_lexicon']
+        self.status[name] = 'loading'
+        self.errors.pop(name, None)
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(loader)
+        except Exception as e:
+            self.status[name] = 'failed'
+            self.errors[name] = str(e)
+            logger.error(f"❌ Failed to load {name}: {e}")
+            raise
         
-        for data in nltk_data:
-            try:
-                nltk.data.find(f'tokenizers/{data}')
-            except LookupError:
-                logger.info(f"Downloading NLTK {data}...")
-                nltk.download(data, quiet=True)
+        self.load_seconds[name] = time.monotonic() - started
+        self.status[name] = 'ready'
     
-    async def _load_sentiment_model(self) -> None:
+    async def _load_embeddings_and_keybert(self) -> None:
+        await self._load('embeddings', self._load_embedding_model)
+        await self._load('keybert', self._load_keybert)
+    
+    def _download_nltk_data(self) -> None:
+        """Load NLTK data from the registry, downloading it if missing"""
+        logger.info("Loading NLTK data...")
+        load_nltk_data(model_registry, offline=self.settings.model_offline)
+    
+    def _load_sentiment_model(self) -> None:
         """Load sentiment analysis model"""
+        from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+        
         logger.info("Loading sentiment model...")
         
         model_name = self.settings.sentiment_model
+        backend_name = self.settings.sentiment_backend
         cache_dir = os.path.join(self.settings.model_cache_dir, "sentiment")
         
-        # Load tokenizer and model
+        # Prepacked bundle, else local snapshot path when prefetched, else hub id
+        bundle = self._find_bundle('sentiment', model_name)
+        source = str(bundle) if bundle is not None else model_registry.resolve('sentiment', model_name)
+        if self.settings.model_offline and backend_name != 'torch':
+            model_registry.verify(
+                sentiment_artifact_name(backend_name),
+                source=model_name,
+                checksums=self.settings.model_verify_checksums
+            )
+        
+        # Load tokenizer and config
         tokenizer = AutoTokenizer.from_pretrained(
-            model_name,
+            source,
             cache_dir=cache_dir
         )
-        model = AutoModelForSequenceClassification.from_pretrained(
-            model_name,
+        config = AutoConfig.from_pretrained(
+            source,
             cache_dir=cache_dir
         )
         
-        # Create pipeline
-        sentiment_pipeline = pipeline(
-            "sentiment-analysis",
-            model=model,
-            tokenizer=tokenizer,
-            device=0 if torch.cuda.is_available() else -1,
-            return_all_scores=True
+        def load_model():
+            if bundle is not None:
+                return load_mmapped_model(AutoModelForSequenceClassification, bundle, config)
+            
+            model = AutoModelForSequenceClassification.from_pretrained(
+                source,
+                cache_dir=cache_dir
+            )
+            self._build_bundle('sentiment', model_name, TRANSFORMERS_BUNDLE, model, tokenizer)
+            return model
+        
+        # Build the selected inference backend (exported/quantized artifacts are cached)
+        backend = build_sentiment_backend(
+            backend_name,
+            model_name,
+            cache_dir,
+            config.id2label,
+            load_model
         )
         
-        self.models['sentiment'] = sentiment_pipeline
         self.tokenizers['sentiment'] = tokenizer
+        self.models['sentiment'] = backend
         
-        logger.info("✅ Sentiment model loaded")
+        logger.info(f"✅ Sentiment model loaded ({backend.name} backend)")
     
-    async def _load_embedding_model(self) -> None:
+    def _load_embedding_model(self) -> None:
         """Load sentence embedding model"""
+        from sentence_transformers import SentenceTransformer
+        
         logger.info("Loading embedding model...")
         
         model_name = self.settings.embedding_model
         cache_dir = os.path.join(self.settings.model_cache_dir, "embeddings")
         
-        model = SentenceTransformer(
-            model_name,
-            cache_folder=cache_dir
-        )
+        source = embedding_repo_id(model_name)
+        bundle = self._find_bundle('embeddings', source)
+        
+        if bundle is not None:
+            model = load_sentence_transformer(bundle)
+        else:
+            model = SentenceTransformer(
+                model_registry.resolve('embeddings', source),
+                cache_folder=cache_dir
+            )
+            self._build_bundle('embeddings', source, SENTENCE_TRANSFORMERS_BUNDLE, model)
         
         self.models['embeddings'] = model
         
         logger.info("✅ Embedding model loaded")
     
-    async def _load_keybert(self) -> None:
+    def _find_bundle(self, name: str, source: str) -> Optional[Path]:
+        """Directory of a current bundle for a model, if bundles are enabled"""
+        if not self.settings.model_bundles:
+            return None
+        
+        if self.settings.model_offline:
+            # Offline, the bundle must have been prefetched intact
+            model_registry.verify(
+                bundle_artifact_name(name),
+                source=source,
+                checksums=self.settings.model_verify_checksums
+            )
+        
+        path = bundle_dir(self.settings.model_cache_dir, name, source)
+        if read_bundle(path, source) is None:
+            return None
+        
+        logger.info(f"Loading {name} from bundle {path}")
+        return path
+    
+    def _build_bundle(self, name: str, source: str, kind: str, model: Any, tokenizer: Any = None) -> None:
+        """Pack a freshly loaded model so later starts can mmap it"""
+        if not self.settings.model_bundles:
+            return
+        
+        try:
+            build_bundle(bundle_dir(self.settings.model_cache_dir, name, source), kind, source, model, tokenizer)
+        except Exception as e:
+            logger.warning(f"Failed to build {name} bundle: {e}")
+    
+    def _load_keybert(self) -> None:
         """Initialize KeyBERT for keyword extraction"""
+        from keybert import KeyBERT
+        
         logger.info("Initializing KeyBERT...")
         
         embedding_model = self.models['embeddings']
@@ -125,22 +289,63 @@ class ModelManager:
     def get_model(self, model_name: str) -> Any:
         """Get a loaded model"""
         if model_name not in self.models:
-            raise ValueError(f"Model {model_name} not loaded")
+            raise ModelNotReady(f"Model {model_name} is {self.status.get(model_name, 'unknown')}")
         return self.models[model_name]
     
     def get_tokenizer(self, model_name: str) -> Any:
         """Get a loaded tokenizer"""
         if model_name not in self.tokenizers:
-            raise ValueError(f"Tokenizer {model_name} not loaded")
+            raise ModelNotReady(f"Tokenizer {model_name} is {self.status.get(model_name, 'unknown')}")
         return self.tokenizers[model_name]
 
 # Global model manager
 model_manager = ModelManager()
 
+def _build_batch_sizer(name: str) -> Optional[AdaptiveBatchSizer]:
+    settings = get_settings()
+    if not settings.adaptive_batching:
+        return None
+    memory_limit = settings.inference_memory_limit_mb * 2**20 or None
+    memory_usage = None
+    if memory_limit is None:
+        container_limit = container_memory_limit()
+        if container_limit:
+            # Prefork workers share the container's memory, so measure headroom container-wide,
+            # or split the limit between them where the cgroup's usage can't be read
+            memory_limit = int(container_limit * 0.8)
+            if container_memory_usage() is not None:
+                memory_usage = container_memory_usage
+            else:
+                memory_limit //= max(settings.serve_workers, 1)
+    return AdaptiveBatchSizer(
+        name,
+        initial_tokens=settings.max_batch_tokens,
+        max_tokens=max(settings.adaptive_max_batch_tokens, settings.max_batch_tokens),
+        memory_limit=memory_limit,
+        latency_target=settings.inference_latency_target_ms / 1000.0,
+        memory_usage=memory_usage
+    )
+
+# Per-model batch sizers (None when adaptive batching is off)
+batch_sizers: Dict[str, Optional[AdaptiveBatchSizer]] = {
+    'sentiment': _build_batch_sizer('sentiment'),
+    'embeddings': _build_batch_sizer('embeddings')
+}
+
 async def download_models() -> None:
     """Download and initialize all models"""
     await model_manager.download_models()
 
+def start_model_loading() -> asyncio.Task:
+    """Start loading all models in the background"""
+    return model_manager.start_loading()
+
+def set_inference_threads(threads: int) -> None:
+    """Size the sentiment backend's thread pool for this process (e.g. a forked worker)"""
+    backend = model_manager.models.get('sentiment')
+    if backend is not None:
+        backend.set_threads(threads)
+
 def get_sentiment_model():
     """Get the sentiment analysis model"""
     return model_manager.get_model('sentiment')
@@ -153,104 +358,483 @@ def get_keybert_model():
     """Get the KeyBERT model"""
     return model_manager.get_model('keybert')
 
-def analyze_sentiment_batch(texts: list[str]) -> list[dict]:
-    """Analyze sentiment for a batch of texts"""
+# Map model labels to our format
+SENTIMENT_LABELS = {
+    'LABEL_0': 'NEG',  # Negative
+    'LABEL_1': 'NEU',  # Neutral
+    'LABEL_2': 'POS',  # Positive
+    'NEGATIVE': 'NEG',
+    'NEUTRAL': 'NEU',
+    'POSITIVE': 'POS'
+}
+
+SENTIMENT_MODES = ('transformer', 'cascade', 'fast')
+
+def analyze_sentiment_batch(
+    texts: list[str],
+    duplicates: Optional[NearDuplicateIndex] = None,
+    mode: Optional[str] = None,
+    embeddings: Optional[Dict[str, np.ndarray]] = None
+) -> list[dict]:
+    """
+    Analyze sentiment for a batch of texts
+    
+    Near-duplicates (within the batch, or within ``duplicates`` when given)
+    share one inference; ``cluster_size`` counts the texts in each one.
+    In ``cascade`` mode (default ``SENTIMENT_MODE``) texts VADER scores
+    clearly positive or negative are labelled by the lexicon and only the
+    rest reach the transformer. In ``fast`` mode a logistic regression head
+    labels sentence embeddings, reusing ``embeddings`` (text to vector from
+    ``embed_texts``) where given. ``tier`` says which labelled each text.
+    """
     if not texts:
         return []
     
+    mode = mode or model_manager.settings.sentiment_mode
+    if mode not in SENTIMENT_MODES:
+        raise ValueError(f"Unknown sentiment mode {mode!r}")
+    
+    values, cluster_sizes = resolve_near_duplicates(
+        texts,
+        # Leaders keep one value per mode, so a cascade label never stands in for the transformer's
+        "sentiment" if mode == 'transformer' else f"sentiment:{mode}",
+        {
+            'transformer': _sentiment_values,
+            'cascade': _cascade_values,
+            'fast': lambda batch: _head_values(batch, embeddings)
+        }[mode],
+        index=duplicates,
+        storable=lambda value: 'error' not in value
+    )
+    return [
+        {'text': text, **value, 'cluster_size': size}
+        for text, value, size in zip(texts, values, cluster_sizes)
+    ]
+
+def _head_values(texts: list[str], embeddings: Optional[Dict[str, np.ndarray]] = None) -> list[dict]:
+    """Sentiment head results, encoding only texts without an embedding"""
+    settings = model_manager.settings
+    try:
+        head = load_sentiment_head(settings.sentiment_head_path)
+    except FileNotFoundError:
+        raise ModelNotReady(f"No sentiment head at {settings.sentiment_head_path}, train one first")
+    if head.embedding_model != settings.embedding_model:
+        raise ModelNotReady(f"Sentiment head was trained on {head.embedding_model}, not {settings.embedding_model}")
+    
     try:
-        sentiment_model = get_sentiment_model()
+        embeddings = embeddings or {}
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            embeddings = {**embeddings, **dict(zip(missing, embed_texts(missing)))}
+        return head.predict(np.stack([embeddings[text] for text in texts]))
+    except ModelNotReady:
+        raise
+    except Exception as e:
+        logger.error(f"Error in sentiment head: {e}")
+        return [
+            {'sentiment': 'NEU', 'confidence': 0.0, 'all_scores': [], 'error': str(e)}
+            for _ in texts
+        ]
+
+def _cascade_values(texts: list[str]) -> list[dict]:
+    """Lexicon results where VADER is confident, transformer results elsewhere"""
+    settings = model_manager.settings
+    thresholds = load_cascade_thresholds(settings.sentiment_cascade_calibration)
+    if thresholds is None:
+        return _sentiment_values(texts)
+    
+    try:
+        values, remaining = lexicon_sentiment(texts, thresholds)
+    except LookupError as e:
+        # vader_lexicon missing; the transformer still labels everything
+        logger.warning(f"Lexicon tier unavailable: {e}")
+        return _sentiment_values(texts)
+    
+    if remaining:
+        for index, value in zip(remaining, _sentiment_values([texts[i] for i in remaining])):
+            values[index] = value
+    return values
+
+def _sentiment_values(texts: list[str]) -> list[dict]:
+    """Sentiment results without the text, through the result cache"""
+    def compute(misses: list[str]) -> list[dict]:
+        return [
+            {**{key: value for key, value in result.items() if key != 'text'}, 'tier': TRANSFORMER_TIER}
+            for result in _analyze_sentiment_uncached(misses)
+        ]
+    
+    if result_cache is None:
+        return compute(texts)
+    
+    # Only cache misses reach the model; cached values omit the caller's text
+    settings = model_manager.settings
+    return result_cache.cached_batch(
+        f"sentiment:{settings.sentiment_model}:{settings.sentiment_backend}:{settings.ml_version}",
+        texts,
+        compute,
+        cacheable=lambda value: 'error' not in value
+    )
+
+def _analyze_sentiment_uncached(texts: list[str]) -> list[dict]:
+    """Run the sentiment model over texts"""
+    try:
+        backend = get_sentiment_model()
+        tokenizer = model_manager.get_tokenizer('sentiment')
+        settings = model_manager.settings
+        
+        # Tokenize once and truncate by tokens rather than characters
+        max_length = min(settings.max_text_length, tokenizer.model_max_length)
+        encodings = tokenizer(
+            texts,
+            truncation=True,
+            max_length=max_length,
+            padding=False
+        )
+        input_ids = encodings['input_ids']
+        lengths = [len(ids) for ids in input_ids]
         
-        # Process texts in batches to avoid memory issues
-        max_batch_size = model_manager.settings.max_batch_size
-        results = []
+        results: list[Optional[dict]] = [None] * len(texts)
         
-        for i in range(0, len(texts), max_batch_size):
-            batch = texts[i:i + max_batch_size]
-            
-            # Truncate texts if needed
-            truncated_batch = [
-                text[:model_manager.settings.max_text_length] 
-                for text in batch
-            ]
+        def run_batch(batch: list[int]) -> None:
+            features = tokenizer.pad(
+                {
+                    'input_ids': [input_ids[i] for i in batch],
+                    'attention_mask': [encodings['attention_mask'][i] for i in batch]
+                },
+                return_tensors='np'
+            )
             
-            batch_results = sentiment_model(truncated_batch)
+            probabilities = backend.predict_proba(
+                features['input_ids'], features['attention_mask']
+            )
             
-            # Process results
-            for j, text_results in enumerate(batch_results):
-                # Find the highest confidence prediction
-                best_prediction = max(text_results, key=lambda x: x['score'])
-                
-                # Map model labels to our format
-                label_mapping = {
-                    'LABEL_0': 'NEG',  # Negative
-                    'LABEL_1': 'NEU',  # Neutral  
-                    'LABEL_2': 'POS',  # Positive
-                    'NEGATIVE': 'NEG',
-                    'NEUTRAL': 'NEU',
-                    'POSITIVE': 'POS'
-                }
-                
-                sentiment = label_mapping.get(
-                    best_prediction['label'].upper(), 
-                    'NEU'
+            for row, index in enumerate(batch):
+                results[index] = _format_sentiment(
+                    texts[index], probabilities[row], backend.id2label
                 )
-                
-                results.append({
-                    'text': batch[j],
-                    'sentiment': sentiment,
-                    'confidence': best_prediction['score'],
-                    'all_scores': text_results
-                })
+        
+        sizer = batch_sizers['sentiment']
+        if sizer is not None:
+            # Budgets adapt to observed memory and latency; batches that fail to allocate are retried smaller
+            failed = sizer.run(lengths, run_batch, settings.max_batch_size)
+            for index, error in failed.items():
+                results[index] = _sentiment_error(texts[index], error)
+            return results
+        
+        # Bucket by token length so short comments are not padded to the longest one
+        batches = plan_token_batches(
+            lengths,
+            max_batch_tokens=settings.max_batch_tokens,
+            max_batch_size=settings.max_batch_size
+        )
+        logger.debug(
+            f"Sentiment batching: {len(texts)} texts, {len(batches)} batches, "
+            f"{sum(lengths)} tokens, "
+            f"{sum(padded_tokens(lengths, batch) for batch in batches)} padded"
+        )
+        for batch in batches:
+            run_batch(batch)
         
         return results
         
+    except ModelNotReady:
+        raise
     except Exception as e:
         logger.error(f"Error in sentiment analysis: {e}")
         # Return neutral sentiment for all texts on error
-        return [
-            {
-                'text': text,
-                'sentiment': 'NEU',
-                'confidence': 0.0,
-                'all_scores': [],
-                'error': str(e)
-            }
-            for text in texts
-        ]
+        return [_sentiment_error(text, e) for text in texts]
+
+def _sentiment_error(text: str, error: BaseException) -> dict:
+    """Neutral placeholder for a text the model could not label"""
+    return {
+        'text': text,
+        'sentiment': 'NEU',
+        'confidence': 0.0,
+        'all_scores': [],
+        'error': str(error)
+    }
+
+def _format_sentiment(text: str, probabilities: np.ndarray, id2label: Dict[int, str]) -> dict:
+    """Convert class probabilities into a sentiment result"""
+    text_results = [
+        {'label': id2label[label_id], 'score': float(score)}
+        for label_id, score in enumerate(probabilities)
+    ]
+    
+    # Find the highest confidence prediction
+    best_prediction = max(text_results, key=lambda x: x['score'])
+    
+    return {
+        'text': text,
+        'sentiment': SENTIMENT_LABELS.get(best_prediction['label'].upper(), 'NEU'),
+        'confidence': best_prediction['score'],
+        'all_scores': text_results
+    }
+
+KEYWORD_MODES = ('keybert', 'fast')
 
-def extract_keywords_batch(texts: list[str], top_k: int = 5) -> list[list[str]]:
-    """Extract keywords from a batch of texts"""
+def extract_keywords_batch(
+    texts: list[str],
+    top_k: int = 5,
+    duplicates: Optional[NearDuplicateIndex] = None,
+    embeddings: Optional[Dict[str, np.ndarray]] = None,
+    mode: str = 'keybert',
+    groups: Optional[list[str]] = None
+) -> list[list[str]]:
+    """
+    Extract keywords from a batch of texts, once per near-duplicate cluster
+    
+    ``embeddings`` maps texts to document embeddings already computed with
+    ``embed_texts``, so they are not encoded a second time.
+    
+    ``mode='fast'`` ranks each text's n-grams by class-based TF-IDF within
+    its group of ``groups`` (e.g. content item) instead of running KeyBERT;
+    it needs no model and depends on the whole batch, so it bypasses the
+    result cache and near-duplicate sharing.
+    """
     if not texts:
         return []
+    if mode == 'fast':
+        return class_tfidf_keywords(texts, groups, top_k=top_k, ngram_range=KEYWORD_NGRAM_RANGE)
+    if mode != 'keybert':
+        raise ValueError(f"Unknown keyword mode {mode!r}")
     
+    values, _ = resolve_near_duplicates(
+        texts,
+        f"keywords:{top_k}",
+        lambda representatives: _keyword_values(representatives, top_k, embeddings),
+        index=duplicates,
+        storable=bool
+    )
+    return values
+
+def _keyword_values(
+    texts: list[str],
+    top_k: int,
+    embeddings: Optional[Dict[str, np.ndarray]] = None
+) -> list[list[str]]:
+    """Keywords through the result cache"""
+    if result_cache is None:
+        return _extract_keywords_uncached(texts, top_k, embeddings)
+    
+    settings = model_manager.settings
+    return result_cache.cached_batch(
+        f"keywords:{settings.embedding_model}:{settings.ml_version}:{top_k}",
+        texts,
+        lambda misses: _extract_keywords_uncached(misses, top_k, embeddings),
+        # Empty lists are also what the error path returns
+        cacheable=bool
+    )
+
+def _extract_keywords_uncached(
+    texts: list[str],
+    top_k: int,
+    embeddings: Optional[Dict[str, np.ndarray]] = None
+) -> list[list[str]]:
+    """Run batched keyword extraction over texts"""
     try:
-        keybert_model = get_keybert_model()
+        embedding_model = get_embedding_model()
         
-        results = []
-        for text in texts:
-            if len(text.strip()) < 10:  # Skip very short texts
-                results.append([])
-                continue
-            
-            # Extract keywords
-            keywords = keybert_model.extract_keywords(
-                text,
-                keyphrase_ngram_range=(1, 2),
-                stop_words='english',
-                top_k=top_k,
-                use_mmr=True,
-                diversity=0.5
-            )
-            
-            # Extract just the keyword strings
-            keyword_list = [kw[0] for kw in keywords]
-            results.append(keyword_list)
+        # Skip very short texts
+        doc_indices = [i for i, text in enumerate(texts) if len(text.strip()) >= 10]
+        results: list[list[str]] = [[] for _ in texts]
+        if not doc_indices:
+            return results
+        
+        docs = [texts[i] for i in doc_indices]
+        doc_embeddings = None
+        if embeddings is not None and all(doc in embeddings for doc in docs):
+            doc_embeddings = np.stack([embeddings[doc] for doc in docs])
+        keywords = _extract_keywords_batched(
+            embedding_model,
+            docs,
+            top_k=top_k,
+            keyphrase_ngram_range=KEYWORD_NGRAM_RANGE,
+            diversity=KEYWORD_DIVERSITY,
+            doc_embeddings=doc_embeddings
+        )
+        
+        for i, keyword_list in zip(doc_indices, keywords):
+            results[i] = keyword_list
         
         return results
         
+    except ModelNotReady:
+        raise
     except Exception as e:
         logger.error(f"Error in keyword extraction: {e}")
         return [[] for _ in texts]
 
+# KeyBERT settings used for topic tags
+KEYWORD_NGRAM_RANGE = (1, 2)
+KEYWORD_DIVERSITY = 0.5
+
+# Upper bound on floats held by the per-chunk candidate similarity tensors
+_MMR_CHUNK_ELEMENTS = 4_000_000
+
+def _extract_keywords_batched(
+    embedding_model: Any,
+    docs: list[str],
+    top_k: int,
+    keyphrase_ngram_range: tuple[int, int],
+    diversity: float,
+    doc_embeddings: Optional[np.ndarray] = None
+) -> list[list[str]]:
+    """
+    KeyBERT-equivalent MMR keyword extraction for many documents at once
+
+    Mirrors ``KeyBERT.extract_keywords(use_mmr=True, stop_words='english')``:
+    candidates are each document's own n-grams, ranked by cosine similarity
+    to the document and diversified with Maximal Marginal Relevance. Instead
+    of encoding each document and its candidates separately, all documents
+    and the union of their candidates are encoded in two calls and MMR runs
+    over padded candidate matrices for a whole chunk of documents.
+    ``doc_embeddings`` skips the document encode when the caller has them.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+    
+    try:
+        vectorizer = CountVectorizer(
+            ngram_range=keyphrase_ngram_range,
+            stop_words='english'
+        ).fit(docs)
+    except ValueError:
+        # Every document consisted of stop words only
+        return [[] for _ in docs]
+    
+    words = vectorizer.get_feature_names_out()
+    doc_terms = vectorizer.transform(docs).tocsr()
+    doc_terms.sort_indices()
+    
+    if doc_embeddings is None:
+        doc_embeddings = _encode_normalized(embedding_model, docs)
+    word_embeddings = _encode_normalized(embedding_model, list(words))
+    
+    candidates = [
+        doc_terms.indices[doc_terms.indptr[i]:doc_terms.indptr[i + 1]]
+        for i in range(len(docs))
+    ]
+    
+    # Group documents with similar candidate counts to limit padding
+    order = sorted(range(len(docs)), key=lambda i: len(candidates[i]))
+    chunks: list[list[int]] = []
+    chunk: list[int] = []
+    for doc_index in order:
+        width = max(len(candidates[doc_index]), 1)
+        if chunk and (len(chunk) + 1) * width * width > _MMR_CHUNK_ELEMENTS:
+            chunks.append(chunk)
+            chunk = []
+        chunk.append(doc_index)
+    chunks.append(chunk)
+    
+    results: list[list[str]] = [[] for _ in docs]
+    for chunk in chunks:
+        picked = _mmr_chunk(
+            doc_embeddings[chunk],
+            word_embeddings,
+            [candidates[i] for i in chunk],
+            top_k,
+            diversity
+        )
+        for doc_index, word_indices in zip(chunk, picked):
+            results[doc_index] = [str(words[w]) for w in word_indices]
+    
+    return results
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """L2-normalized float32 sentence embeddings of texts"""
+    return _encode_normalized(get_embedding_model(), texts)
+
+def _encode_normalized(embedding_model: Any, texts: list[str]) -> np.ndarray:
+    """Encode texts into L2-normalized float32 embeddings"""
+    sizer = batch_sizers['embeddings']
+    tokenizer = getattr(embedding_model, 'tokenizer', None)
+    if sizer is None or tokenizer is None or not texts:
+        embeddings = embedding_model.encode(
+            texts,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    # Plan the encoder's batches by padded tokens so the sizer can bound their memory
+    lengths = [
+        len(ids)
+        for ids in tokenizer(texts, truncation=True, max_length=embedding_model.max_seq_length)['input_ids']
+    ]
+    vectors: Dict[int, np.ndarray] = {}
+    
+    def run_batch(batch: list[int]) -> None:
+        encoded = embedding_model.encode(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        vectors.update(zip(batch, encoded))
+    
+    failed = sizer.run(lengths, run_batch, model_manager.settings.max_batch_size)
+    if failed:
+        # Callers need every embedding; a text too long to encode on its own fails the call
+        raise next(iter(failed.values()))
+    return np.stack([vectors[i] for i in range(len(texts))]).astype(np.float32, copy=False)
 
+def _mmr_chunk(
+    doc_embeddings: np.ndarray,
+    word_embeddings: np.ndarray,
+    candidates: list[np.ndarray],
+    top_n: int,
+    diversity: float
+) -> list[list[int]]:
+    """Vectorized MMR selection over a chunk of documents"""
+    n_docs = len(candidates)
+    width = max((len(c) for c in candidates), default=0)
+    if width == 0:
+        return [[] for _ in candidates]
+    
+    counts = np.array([len(c) for c in candidates])
+    valid = np.arange(width)[None, :] < counts[:, None]
+    index = np.zeros((n_docs, width), dtype=np.int64)
+    for row, candidate_indices in enumerate(candidates):
+        index[row, :len(candidate_indices)] = candidate_indices
+    
+    candidate_embeddings = word_embeddings[index]
+    word_doc_similarity = np.einsum('ncd,nd->nc', candidate_embeddings, doc_embeddings)
+    word_similarity = np.einsum('ncd,nkd->nck', candidate_embeddings, candidate_embeddings)
+    
+    rows = np.arange(n_docs)
+    available = valid.copy()
+    selected = np.full((n_docs, min(top_n, width)), -1, dtype=np.int64)
+    
+    # First keyword is the candidate closest to the document
+    first = np.argmax(np.where(valid, word_doc_similarity, -np.inf), axis=1)
+    selected[:, 0] = first
+    available[rows, first] = False
+    target_similarity = word_similarity[rows, :, first]
+    
+    for step in range(1, selected.shape[1]):
+        active = counts > step
+        if not active.any():
+            break
+        mmr = (1 - diversity) * word_doc_similarity - diversity * target_similarity
+        mmr = np.where(available, mmr, -np.inf)
+        pick = np.argmax(mmr, axis=1)
+        selected[active, step] = pick[active]
+        available[rows[active], pick[active]] = False
+        target_similarity = np.where(
+            active[:, None],
+            np.maximum(target_similarity, word_similarity[rows, :, pick]),
+            target_similarity
+        )
+    
+    results = []
+    for row in range(n_docs):
+        picks = selected[row][selected[row] >= 0]
+        # KeyBERT returns MMR picks sorted by their (rounded) document similarity
+        scores = np.round(word_doc_similarity[row, picks], 4)
+        ordered = picks[np.argsort(-scores, kind='stable')]
+        results.append([int(candidates[row][p]) for p in ordered])
+    
+    return results
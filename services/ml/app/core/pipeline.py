@@ -0,0 +1,367 @@
+"""Streaming comment analysis pipeline"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.database import (
+    get_comment_page,
+    claim_comment_batch,
+    release_comment_leases,
+    quarantine_comments,
+    bulk_update_comment_results
+)
+from app.core.ann import workspace_ann_index
+from app.core.dedup import NearDuplicateIndex, workspace_index
+from app.core.embedding_store import open_workspace_store, workspace_store
+from app.core.models import analyze_sentiment_batch, embed_texts, extract_keywords_batch, model_manager
+from app.core.sketches import record_tag_mentions
+from app.core.topics import topic_canonicalizer
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_DONE = object()
+
+class WorkspaceAnalysisPipeline:
+    """
+    Three-stage fetch → inference → writeback pipeline for one workspace
+
+    The fetch stage pages through unanalyzed comments with keyset
+    pagination on ``(created_at, id)``. Pages flow through bounded asyncio
+    queues to an inference stage, which runs the models in a worker thread,
+    and on to a writeback stage using set-based bulk updates. All three
+    stages overlap and at most ``queue_depth`` pages wait between stages,
+    so memory stays flat regardless of workspace size.
+
+    ``cursor`` is the ``(created_at, id)`` of the last comment written back.
+    Pages are written in fetch order, so everything up to the cursor is
+    done; ``on_checkpoint`` is awaited after each page is written.
+
+    With ``lease_owner`` the fetch stage instead leases pages with
+    ``FOR UPDATE SKIP LOCKED``, so any number of workers can drain the same
+    workspace without analyzing a comment twice. Writes only land while the
+    lease is still held, rows that fail writeback are quarantined rather
+    than re-claimed forever, and the leases it still holds are released on
+    exit (only its own: pipelines of one process share the owner).
+    """
+
+    def __init__(
+        self,
+        workspace_id: str,
+        platform: Optional[str] = None,
+        max_comments: Optional[int] = None,
+        cursor: Optional[tuple] = None,
+        page_size: Optional[int] = None,
+        queue_depth: Optional[int] = None,
+        on_checkpoint: Optional[Callable[["WorkspaceAnalysisPipeline"], Awaitable[None]]] = None,
+        lease_owner: Optional[str] = None,
+        keyword_mode: Optional[str] = None,
+        sentiment_mode: Optional[str] = None
+    ):
+        settings = get_settings()
+        self.workspace_id = workspace_id
+        self.platform = platform
+        self.max_comments = max_comments
+        self.cursor = cursor
+        self.page_size = page_size or settings.pipeline_page_size
+        self.queue_depth = queue_depth or settings.pipeline_queue_depth
+        self.on_checkpoint = on_checkpoint
+        self.lease_owner = lease_owner
+        # Comments leased by this pipeline and not yet written back
+        self._leased: set = set()
+        self.lease_seconds = settings.comment_lease_seconds
+        self.record_tags = settings.tag_sketches_enabled
+        self.canonicalize_topics = settings.topic_canonicalization_enabled
+        # Copypasta seen in earlier pages reuses its results
+        self.duplicates = workspace_index(workspace_id)
+        self.keyword_mode = keyword_mode or settings.keyword_mode
+        self.keyword_group = settings.keyword_fast_group
+        self.sentiment_mode = sentiment_mode or settings.sentiment_mode
+        # Fast mode skips the encoder entirely; stores can be backfilled later
+        self.store_embeddings = settings.embedding_store_enabled and self.keyword_mode != "fast"
+        self.stats: Dict[str, Any] = {
+            "fetched": 0,
+            "analyzed": 0,
+            "updated": 0,
+            "failed": 0,
+            "missing": 0,
+            "pages": 0
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        """Drain the workspace and return the pipeline counters"""
+        # Jobs resumed at startup may run before the models finish loading
+        await model_manager.wait_until_ready("sentiment", "embeddings")
+
+        started = time.monotonic()
+        to_infer: asyncio.Queue = asyncio.Queue(maxsize=self.queue_depth)
+        to_write: asyncio.Queue = asyncio.Queue(maxsize=self.queue_depth)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._fetch(to_infer))
+                group.create_task(self._infer(to_infer, to_write))
+                group.create_task(self._write(to_write))
+        except ExceptionGroup as errors:
+            # Surface the stage failure itself rather than the group wrapper
+            raise errors.exceptions[0]
+        finally:
+            if self.lease_owner is not None:
+                await self._release_leases()
+
+        self.stats["elapsed_seconds"] = time.monotonic() - started
+        return self.stats
+
+    async def _fetch(self, out_queue: asyncio.Queue) -> None:
+        after = self.cursor
+        while True:
+            page_size = self.page_size
+            if self.max_comments is not None:
+                page_size = min(page_size, self.max_comments - self.stats["fetched"])
+                if page_size <= 0:
+                    break
+
+            if self.lease_owner is not None:
+                page = await claim_comment_batch(
+                    self.workspace_id,
+                    self.lease_owner,
+                    page_size,
+                    self.lease_seconds,
+                    platform=self.platform
+                )
+                self._leased.update(comment["id"] for comment in page)
+            else:
+                page = await get_comment_page(
+                    self.workspace_id,
+                    page_size,
+                    after=after,
+                    platform=self.platform
+                )
+            if not page:
+                break
+
+            self.stats["fetched"] += len(page)
+            after = (page[-1]["created_at"], page[-1]["id"])
+            await out_queue.put(page)
+
+            if self.lease_owner is None and len(page) < page_size:
+                break
+
+        await out_queue.put(_DONE)
+
+    async def _infer(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue) -> None:
+        while True:
+            page = await in_queue.get()
+            if page is _DONE:
+                break
+
+            results = await asyncio.to_thread(
+                self._analyze,
+                page,
+                self.duplicates,
+                self.workspace_id if self.store_embeddings else None,
+                self.keyword_mode,
+                self.keyword_group,
+                self.sentiment_mode
+            )
+            self.stats["analyzed"] += len(results)
+            await out_queue.put((page, results))
+
+        await out_queue.put(_DONE)
+
+    @staticmethod
+    def _analyze(
+        page: List[dict],
+        duplicates: Optional[NearDuplicateIndex] = None,
+        embedding_workspace: Optional[str] = None,
+        keyword_mode: str = "keybert",
+        keyword_group: str = "content_item",
+        sentiment_mode: str = "transformer"
+    ) -> List[dict]:
+        """
+        Run sentiment and keyword models over one page (worker thread)
+
+        With ``embedding_workspace`` the page's embeddings are appended to
+        that workspace's embedding store and reused by keyword extraction.
+        In ``fast`` keyword mode the page's comments are grouped by content
+        item or channel for c-TF-IDF. In ``fast`` sentiment mode the same
+        embeddings feed the sentiment head, so each text is encoded once.
+        """
+        texts = [comment["text"] for comment in page]
+        embeddings = None
+        if embedding_workspace is not None:
+            embeddings = WorkspaceAnalysisPipeline._store_embeddings(embedding_workspace, page)
+        if embeddings is None and sentiment_mode == "fast":
+            unique = list(dict.fromkeys(texts))
+            embeddings = dict(zip(unique, embed_texts(unique)))
+        sentiment_results = analyze_sentiment_batch(
+            texts,
+            duplicates=duplicates,
+            mode=sentiment_mode,
+            embeddings=embeddings
+        )
+        groups = None
+        if keyword_mode == "fast":
+            # Leased rows carry no channel, so they fall back to their content item
+            groups = [
+                (comment.get("channel_id") if keyword_group == "channel" else None) or comment["content_item_id"]
+                for comment in page
+            ]
+        topic_results = extract_keywords_batch(
+            texts,
+            top_k=5,
+            duplicates=duplicates,
+            embeddings=embeddings,
+            mode=keyword_mode,
+            groups=groups
+        )
+
+        return [
+            {
+                "id": comment["id"],
+                "sentiment": sentiment_results[i]["sentiment"],
+                "confidence": sentiment_results[i]["confidence"],
+                "topic_tags": topic_results[i],
+                "cluster_size": sentiment_results[i]["cluster_size"],
+                "sentiment_tier": sentiment_results[i].get("tier")
+            }
+            for i, comment in enumerate(page)
+        ]
+
+    @staticmethod
+    def _store_embeddings(workspace_id: str, page: List[dict]) -> Optional[Dict[str, np.ndarray]]:
+        """Reuse stored embeddings, encode each missing distinct text once, store and index them"""
+        try:
+            by_text: Dict[str, np.ndarray] = {}
+            stored = set()
+            store = open_workspace_store(workspace_id)
+            if store is not None:
+                # Re-analysis and claim retries revisit comments embedded before
+                found, vectors = store.get([comment["id"] for comment in page])
+                stored = set(found)
+                text_of = {comment["id"]: comment["text"] for comment in page}
+                for comment_id, vector in zip(found, vectors):
+                    by_text.setdefault(text_of[comment_id], vector)
+
+            texts = list(dict.fromkeys(comment["text"] for comment in page if comment["text"] not in by_text))
+            if texts:
+                by_text.update(zip(texts, embed_texts(texts)))
+            missing = [comment for comment in page if comment["id"] not in stored]
+            if missing:
+                if store is None:
+                    store = workspace_store(workspace_id, len(by_text[missing[0]["text"]]))
+                store.add(
+                    [comment["id"] for comment in missing],
+                    np.stack([by_text[comment["text"]] for comment in missing])
+                )
+                index = workspace_ann_index(workspace_id)
+                if index is not None:
+                    index.schedule_sync()
+            return by_text
+        except Exception as e:
+            # The store is an optimization; keyword extraction encodes on its own
+            logger.warning(f"Failed to store embeddings for workspace {workspace_id}: {e}")
+            return None
+
+    async def _write(self, in_queue: asyncio.Queue) -> None:
+        while True:
+            item = await in_queue.get()
+            if item is _DONE:
+                break
+
+            page, results = item
+            if self.canonicalize_topics:
+                results = await self._canonicalize_topics(results)
+            report = await bulk_update_comment_results(results, lease_owner=self.lease_owner)
+
+            for failure in report["failed"]:
+                logger.error(f"Failed to update comment {failure['id']}: {failure['error']}")
+            if self.lease_owner is not None and report["failed"]:
+                await quarantine_comments([failure["id"] for failure in report["failed"]])
+            self._leased.difference_update(comment["id"] for comment in page)
+
+            self.stats["updated"] += report["updated"]
+            self.stats["failed"] += len(report["failed"])
+            self.stats["missing"] += len(report["missing"])
+            self.stats["pages"] += 1
+
+            if self.record_tags:
+                await self._record_tags(page, results, report)
+
+            self.cursor = (page[-1]["created_at"], page[-1]["id"])
+
+            if self.on_checkpoint is not None:
+                await self.on_checkpoint(self)
+
+    async def _canonicalize_topics(self, results: List[dict]) -> List[dict]:
+        """Replace keyword phrases with their canonical topics, keeping the phrases"""
+        try:
+            topics = await topic_canonicalizer.canonicalize_tags([result["topic_tags"] for result in results])
+        except Exception as e:
+            # Raw phrases are still valid tags; canonicalize_workspace_tags can fix them later
+            logger.warning(f"Failed to canonicalize topics for workspace {self.workspace_id}: {e}")
+            return results
+        return [
+            {**result, "topic_tags": tags, "keywords": result["topic_tags"]}
+            for result, tags in zip(results, topics)
+        ]
+
+    async def _record_tags(self, page: List[dict], results: List[dict], report: dict) -> None:
+        """Fold the tags of written comments into the trending-tag sketches"""
+        skipped = {failure["id"] for failure in report["failed"]} | set(report["missing"])
+        comments = [
+            {**comment, "sentiment": result["sentiment"], "topic_tags": result["topic_tags"]}
+            for comment, result in zip(page, results)
+            if comment["id"] not in skipped
+        ]
+        try:
+            await record_tag_mentions(self.workspace_id, comments)
+        except Exception as e:
+            # Sketches are rebuilt from comments, so a miss here is recoverable
+            logger.warning(f"Failed to update tag sketches for workspace {self.workspace_id}: {e}")
+
+    async def _release_leases(self) -> None:
+        if not self._leased:
+            return
+        try:
+            # Only this pipeline's pages: other pipelines of the process share the owner
+            released = await release_comment_leases(self.lease_owner, list(self._leased))
+            self._leased.clear()
+            if released:
+                logger.info(f"Released {released} unprocessed comment leases")
+        except Exception as e:
+            logger.warning(f"Failed to release comment leases: {e}")
+
+async def run_workspace_analysis(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    max_comments: Optional[int] = None,
+    keyword_mode: Optional[str] = None,
+    sentiment_mode: Optional[str] = None
+) -> Dict[str, Any]:
+    """Analyze all unprocessed comments of a workspace"""
+    logger.info(f"Starting analysis pipeline for workspace {workspace_id}")
+
+    pipeline = WorkspaceAnalysisPipeline(
+        workspace_id,
+        platform=platform,
+        max_comments=max_comments,
+        keyword_mode=keyword_mode,
+        sentiment_mode=sentiment_mode
+    )
+    try:
+        stats = await pipeline.run()
+    except Exception as e:
+        logger.error(f"Workspace {workspace_id} analysis failed: {e}", exc_info=True)
+        raise
+
+    logger.info(
+        f"Workspace {workspace_id} analysis finished: {stats['updated']} updated, "
+        f"{stats['failed']} failed in {stats['elapsed_seconds']:.1f}s"
+    )
+    return stats
@@ -0,0 +1,335 @@
+"""
+Local model registry with a checksummed manifest
+
+Every artifact the service loads (Hugging Face models, NLTK data, the
+exported/quantized sentiment variants and, with MODEL_BUNDLES, the
+prepacked model bundles) is fetched once into ``model_cache_dir`` and
+recorded in ``manifest.json`` with the size and SHA-256 of each file.
+Models then load from those local paths, so a prefetched registry never
+touches the network, and with MODEL_OFFLINE the service refuses to start
+on a missing, stale or corrupt artifact.
+
+    python -m app.core.registry prefetch [--backends torch onnx-int8]
+    python -m app.core.registry verify
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# NLTK packages and the resource path each one is found under
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+    "vader_lexicon": "sentiment/vader_lexicon.zip"
+}
+
+# Hub files the PyTorch loaders never read
+_HF_IGNORE_PATTERNS = ["*.h5", "*.msgpack", "*.ot", "*.tflite", "onnx/*", "openvino/*", "rust_model*"]
+
+class RegistryError(RuntimeError):
+    """Raised when a registry artifact is missing, stale or corrupt"""
+
+def sentiment_artifact_name(backend: str) -> str:
+    """Manifest entry holding a sentiment backend's exported or quantized model"""
+    return f"sentiment-{backend}"
+
+def bundle_artifact_name(name: str) -> str:
+    """Manifest entry holding a model's prepacked bundle"""
+    return f"{name}-bundle"
+
+def embedding_repo_id(model_name: str) -> str:
+    """Hub repository sentence-transformers resolves a short model name to"""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+def enable_offline_mode() -> None:
+    """Make Hugging Face libraries fail instead of reaching the network"""
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    os.environ["HF_DATASETS_OFFLINE"] = "1"
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """Manifest of prefetched model artifacts under the model cache directory"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.manifest_path = self.root / MANIFEST_FILENAME
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._manifest is None:
+                if self.manifest_path.exists():
+                    self._manifest = json.loads(self.manifest_path.read_text())
+                else:
+                    self._manifest = {"version": MANIFEST_VERSION, "artifacts": {}}
+            return self._manifest
+
+    def artifact(self, name: str) -> Optional[Dict[str, Any]]:
+        """Manifest entry for an artifact, if it was prefetched"""
+        return self.manifest["artifacts"].get(name)
+
+    def register(self, name: str, kind: str, source: str, path: Path) -> Dict[str, Any]:
+        """Record an artifact (a single file or a whole directory) with per-file checksums"""
+        path = Path(path)
+        if path.is_file():
+            files = [path]
+            path = path.parent
+        else:
+            files = sorted(p for p in path.rglob("*") if p.is_file())
+        if not files:
+            raise RegistryError(f"Artifact {name} at {path} has no files")
+
+        entry = {
+            "kind": kind,
+            "source": source,
+            "path": os.path.relpath(path, self.root),
+            "files": {
+                file.relative_to(path).as_posix(): {
+                    "size": file.stat().st_size,
+                    "sha256": _sha256(file)
+                }
+                for file in files
+            },
+            "registered_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+        self.manifest["artifacts"][name] = entry
+        return entry
+
+    def save(self) -> None:
+        """Atomically write the manifest"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.manifest, indent=2, sort_keys=True))
+        os.replace(tmp_path, self.manifest_path)
+
+    def verify(self, name: str, source: Optional[str] = None, checksums: bool = True) -> Path:
+        """
+        Check an artifact against the manifest and return its local path
+
+        Sizes are always compared; ``checksums`` also re-hashes every file,
+        which is what catches silent corruption but reads the whole model.
+        """
+        entry = self.artifact(name)
+        if entry is None:
+            raise RegistryError(f"Artifact {name} is not in {self.manifest_path}; run the prefetch")
+        if source is not None and entry["source"] != source:
+            raise RegistryError(
+                f"Artifact {name} was prefetched from {entry['source']}, but {source} is configured"
+            )
+
+        path = self.root / entry["path"]
+        for relative, expected in entry["files"].items():
+            file = path / relative
+            if not file.exists():
+                raise RegistryError(f"Artifact {name} is missing {file}")
+            if file.stat().st_size != expected["size"]:
+                raise RegistryError(f"Artifact {name} file {file} has the wrong size")
+            if checksums and _sha256(file) != expected["sha256"]:
+                raise RegistryError(f"Artifact {name} file {file} failed its checksum")
+        return path
+
+    def resolve(self, name: str, source: str) -> str:
+        """
+        Where to load an artifact from
+
+        The verified local path when the artifact was prefetched from
+        ``source``; otherwise ``source`` itself (a hub id) unless offline.
+        """
+        settings = get_settings()
+        entry = self.artifact(name)
+        if entry is None or entry["source"] != source:
+            if settings.model_offline:
+                # Raises with the reason the artifact can't be used
+                self.verify(name, source=source)
+            return source
+        return str(self.verify(name, source=source, checksums=settings.model_verify_checksums))
+
+    def required_artifacts(self) -> Dict[str, str]:
+        """Artifacts the current settings load, mapped to their expected sources"""
+        settings = get_settings()
+        models = {
+            "sentiment": settings.sentiment_model,
+            "embeddings": embedding_repo_id(settings.embedding_model)
+        }
+        required = {"nltk": ",".join(NLTK_RESOURCES)}
+        for name, source in models.items():
+            required[bundle_artifact_name(name) if settings.model_bundles else name] = source
+        if settings.sentiment_backend != "torch":
+            required[sentiment_artifact_name(settings.sentiment_backend)] = settings.sentiment_model
+        return required
+
+    def check_offline(self) -> None:
+        """Fail fast on missing or truncated artifacts before loading starts"""
+        for name, source in self.required_artifacts().items():
+            self.verify(name, source=source, checksums=False)
+        logger.info(f"✅ Model registry complete ({len(self.required_artifacts())} artifacts)")
+
+def load_nltk_data(registry: ModelRegistry, offline: bool) -> None:
+    """Point NLTK at the registry and make sure every resource is present"""
+    import nltk
+
+    nltk_dir = registry.root / "nltk"
+    if str(nltk_dir) not in nltk.data.path:
+        nltk.data.path.insert(0, str(nltk_dir))
+
+    if offline:
+        registry.verify("nltk", source=",".join(NLTK_RESOURCES), checksums=get_settings().model_verify_checksums)
+
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            if offline:
+                raise RegistryError(f"NLTK resource {resource} is missing from {nltk_dir}")
+            logger.info(f"Downloading NLTK {package}...")
+            if not nltk.download(package, download_dir=str(nltk_dir), quiet=True):
+                raise RegistryError(f"Failed to download NLTK {package}")
+
+def prefetch(registry: ModelRegistry, backends: List[str]) -> None:
+    """Download every artifact into the registry and record its checksums"""
+    from huggingface_hub import snapshot_download
+
+    from app.core.backends import backend_artifact_path, build_sentiment_backend
+
+    settings = get_settings()
+
+    logger.info("Fetching NLTK data...")
+    load_nltk_data(registry, offline=False)
+    registry.register("nltk", "nltk", ",".join(NLTK_RESOURCES), registry.root / "nltk")
+
+    logger.info(f"Fetching sentiment model {settings.sentiment_model}...")
+    sentiment_cache = os.path.join(registry.root, "sentiment")
+    sentiment_path = snapshot_download(
+        settings.sentiment_model,
+        cache_dir=sentiment_cache,
+        ignore_patterns=_HF_IGNORE_PATTERNS
+    )
+    registry.register("sentiment", "huggingface", settings.sentiment_model, Path(sentiment_path))
+
+    embedding_repo = embedding_repo_id(settings.embedding_model)
+    logger.info(f"Fetching embedding model {embedding_repo}...")
+    embedding_path = snapshot_download(
+        embedding_repo,
+        cache_dir=os.path.join(registry.root, "embeddings"),
+        ignore_patterns=_HF_IGNORE_PATTERNS
+    )
+    registry.register("embeddings", "huggingface", embedding_repo, Path(embedding_path))
+
+    if settings.model_bundles:
+        _prefetch_bundles(registry, sentiment_path, embedding_path, embedding_repo)
+
+    derived = [backend for backend in backends if backend != "torch"]
+    if derived:
+        from transformers import AutoConfig, AutoModelForSequenceClassification
+
+        config = AutoConfig.from_pretrained(sentiment_path)
+
+        def load_model():
+            return AutoModelForSequenceClassification.from_pretrained(sentiment_path)
+
+        for backend in derived:
+            logger.info(f"Building {backend} sentiment artifact...")
+            build_sentiment_backend(backend, settings.sentiment_model, sentiment_cache, config.id2label, load_model)
+            registry.register(
+                sentiment_artifact_name(backend),
+                backend,
+                settings.sentiment_model,
+                backend_artifact_path(sentiment_cache, backend, settings.sentiment_model)
+            )
+
+    registry.save()
+    logger.info(f"✅ Registry manifest written to {registry.manifest_path}")
+
+def _prefetch_bundles(registry: ModelRegistry, sentiment_path: str, embedding_path: str, embedding_repo: str) -> None:
+    """Pack both models into mmap-able bundles and register them"""
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    from app.core.bundles import (
+        SENTENCE_TRANSFORMERS_BUNDLE,
+        TRANSFORMERS_BUNDLE,
+        build_bundle,
+        bundle_dir
+    )
+
+    settings = get_settings()
+
+    logger.info("Building model bundles...")
+    path = build_bundle(
+        bundle_dir(str(registry.root), "sentiment", settings.sentiment_model),
+        TRANSFORMERS_BUNDLE,
+        settings.sentiment_model,
+        AutoModelForSequenceClassification.from_pretrained(sentiment_path),
+        AutoTokenizer.from_pretrained(sentiment_path)
+    )
+    registry.register(bundle_artifact_name("sentiment"), "bundle", settings.sentiment_model, path)
+
+    path = build_bundle(
+        bundle_dir(str(registry.root), "embeddings", embedding_repo),
+        SENTENCE_TRANSFORMERS_BUNDLE,
+        embedding_repo,
+        SentenceTransformer(embedding_path, device="cpu")
+    )
+    registry.register(bundle_artifact_name("embeddings"), "bundle", embedding_repo, path)
+
+# Global model registry
+model_registry = ModelRegistry(get_settings().model_cache_dir)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.core.backends import SENTIMENT_BACKENDS
+
+    parser = argparse.ArgumentParser(description="Manage the local model registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("prefetch", help="download all artifacts and write the manifest")
+    fetch.add_argument(
+        "--backends",
+        nargs="+",
+        choices=SENTIMENT_BACKENDS,
+        default=[get_settings().sentiment_backend],
+        help="sentiment backends to build artifacts for"
+    )
+    commands.add_parser("verify", help="re-hash every artifact in the manifest")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "prefetch":
+        prefetch(model_registry, args.backends)
+        return 0
+
+    failures = 0
+    for name, entry in sorted(model_registry.manifest["artifacts"].items()):
+        try:
+            model_registry.verify(name)
+            logger.info(f"✅ {name} ({len(entry['files'])} files)")
+        except RegistryError as e:
+            logger.error(f"❌ {e}")
+            failures += 1
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
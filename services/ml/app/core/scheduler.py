@@ -0,0 +1,264 @@
+"""Dynamic micro-batching scheduler for model inference"""
+
+import asyncio
+import functools
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import get_settings
+from app.core.models import analyze_sentiment_batch
+
+logger = logging.getLogger(__name__)
+
+class SchedulerOverloadedError(RuntimeError):
+    """Raised when the scheduler queue is full"""
+
+class _PendingRequest:
+    """A caller's texts waiting to be merged into a model batch"""
+
+    __slots__ = ("texts", "future", "loop", "enqueued_at")
+
+    def __init__(self, texts: List[str], future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.texts = texts
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = time.monotonic()
+
+_STOP = object()
+
+class InferenceScheduler:
+    """
+    Coalesces concurrent inference requests into shared model batches
+
+    Callers enqueue texts from the event loop and await a future. A single
+    executor thread drains the bounded queue, waits up to ``max_wait_ms`` for
+    more requests to arrive, runs one ``batch_fn`` call over the merged texts
+    and resolves each caller's future with its own slice of the results.
+    Requests are never split, so a request larger than ``max_batch_size``
+    runs as a batch of its own.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[str]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_queue_size: int
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+        self._carry: Optional[_PendingRequest] = None
+        self._thread: Optional[threading.Thread] = None
+        # Callers on the event loop and the executor thread both count
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "requests": 0,
+            "batches": 0,
+            "texts": 0,
+            "rejected": 0,
+            "queue_wait_ms_total": 0.0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the executor thread"""
+        if self.running:
+            return
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"{self.name}-scheduler",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Started {self.name} inference scheduler")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the executor thread after the queued work is drained"""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        logger.info(f"Stopped {self.name} inference scheduler")
+
+    async def submit(self, texts: List[str]) -> List[Any]:
+        """Queue texts for inference and wait for their results"""
+        if not texts:
+            return []
+        if not self.running:
+            raise RuntimeError(f"{self.name} scheduler is not running")
+
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(list(texts), loop.create_future(), loop)
+
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise SchedulerOverloadedError(
+                f"{self.name} scheduler queue is full"
+            )
+
+        return await request.future
+
+    def stats(self) -> Dict[str, float]:
+        """Get scheduler counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_texts"] = (
+            stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+    def _run(self) -> None:
+        while True:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = self._collect(first)
+            if batch is None:
+                break
+            self._dispatch(batch)
+
+        # Fail anything still queued so callers are not left waiting
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                pending.append(item)
+        for request in pending:
+            self._resolve(request, error=RuntimeError(f"{self.name} scheduler stopped"))
+
+    def _collect(self, first: _PendingRequest) -> Optional[List[_PendingRequest]]:
+        """Gather requests arriving within the wait window up to the batch limit"""
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if item is _STOP:
+                self._dispatch(batch)
+                return None
+            if size + len(item.texts) > self.max_batch_size:
+                self._carry = item
+                break
+
+            batch.append(item)
+            size += len(item.texts)
+
+        return batch
+
+    def _dispatch(self, batch: List[_PendingRequest]) -> None:
+        """Run one model call for the merged batch and fan results back out"""
+        texts: List[str] = []
+        for request in batch:
+            texts.extend(request.texts)
+
+        started = time.monotonic()
+        with self._stats_lock:
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["texts"] += len(texts)
+            self._stats["queue_wait_ms_total"] += sum(
+                (started - request.enqueued_at) * 1000 for request in batch
+            )
+
+        try:
+            results = self.batch_fn(texts)
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(texts)} texts failed: {e}")
+            for request in batch:
+                self._resolve(request, error=e)
+            return
+
+        offset = 0
+        for request in batch:
+            end = offset + len(request.texts)
+            self._resolve(request, result=results[offset:end])
+            offset = end
+
+    @staticmethod
+    def _resolve(
+        request: _PendingRequest,
+        result: Optional[List[Any]] = None,
+        error: Optional[BaseException] = None
+    ) -> None:
+        def _set() -> None:
+            if request.future.done():
+                return
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+
+        try:
+            request.loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            # Event loop already closed; nobody is waiting any more
+            pass
+
+def _build_sentiment_scheduler(mode: Optional[str] = None) -> InferenceScheduler:
+    settings = get_settings()
+    return InferenceScheduler(
+        name="sentiment" if mode is None else f"sentiment-{mode}",
+        batch_fn=analyze_sentiment_batch if mode is None else functools.partial(analyze_sentiment_batch, mode=mode),
+        max_batch_size=settings.scheduler_max_batch_size,
+        max_wait_ms=settings.scheduler_max_wait_ms,
+        max_queue_size=settings.scheduler_queue_size
+    )
+
+# Global schedulers
+sentiment_scheduler = _build_sentiment_scheduler()
+_mode_schedulers: Dict[str, InferenceScheduler] = {}
+
+def sentiment_scheduler_for(mode: Optional[str]) -> InferenceScheduler:
+    """Scheduler for a sentiment mode; modes other than the default batch separately"""
+    if mode is None or mode == get_settings().sentiment_mode:
+        return sentiment_scheduler
+    if mode not in _mode_schedulers:
+        scheduler = _build_sentiment_scheduler(mode)
+        if sentiment_scheduler.running:
+            scheduler.start()
+        _mode_schedulers[mode] = scheduler
+    return _mode_schedulers[mode]
+
+def start_schedulers() -> None:
+    """Start all inference schedulers"""
+    sentiment_scheduler.start()
+    for scheduler in _mode_schedulers.values():
+        scheduler.start()
+
+def stop_schedulers() -> None:
+    """Stop all inference schedulers"""
+    sentiment_scheduler.stop()
+    for scheduler in _mode_schedulers.values():
+        scheduler.stop()
@@ -0,0 +1,108 @@
+"""
+Sentiment head over sentence embeddings
+
+A multinomial logistic regression trained on the embedding model's
+(MiniLM) sentence embeddings. The pipeline already encodes every comment
+for keyword ranking and the embedding store, so with this head one
+encoder pass yields both the document embedding and the sentiment label,
+instead of a second pass through the RoBERTa sentiment model.
+
+Weights are plain arrays in an .npz under the model cache (no pickle),
+written by scripts/train_sentiment_head.py together with the embedding
+model they were trained on and their held-out accuracy.
+"""
+
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEAD_TIER = 'head'
+
+class SentimentHead(NamedTuple):
+    """Logistic regression weights and the metadata they were trained with"""
+    coef: np.ndarray
+    intercept: np.ndarray
+    classes: List[str]
+    embedding_model: str
+    version: str
+    metrics: Dict[str, Any]
+
+    def predict_proba(self, embeddings: np.ndarray) -> np.ndarray:
+        """Class probabilities of L2-normalized embeddings, columns in ``classes`` order"""
+        logits = embeddings.astype(np.float32, copy=False) @ self.coef.T + self.intercept
+        if logits.shape[1] == 1:
+            # A binary model scores the second class against the first
+            logits = np.hstack((np.zeros_like(logits), logits))
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, embeddings: np.ndarray) -> List[dict]:
+        """Sentiment results of embeddings, in the transformer tier's format"""
+        results = []
+        for row in self.predict_proba(embeddings):
+            best = int(row.argmax())
+            results.append({
+                'sentiment': self.classes[best],
+                'confidence': float(row[best]),
+                'all_scores': [
+                    {'label': label, 'score': float(score)} for label, score in zip(self.classes, row)
+                ],
+                'tier': HEAD_TIER
+            })
+        return results
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as handle:
+            np.savez(
+                handle,
+                coef=self.coef,
+                intercept=self.intercept,
+                classes=np.array(self.classes),
+                embedding_model=np.array(self.embedding_model),
+                version=np.array(self.version),
+                metrics=np.array(json.dumps(self.metrics))
+            )
+
+def train_sentiment_head(
+    embeddings: np.ndarray,
+    labels: Sequence[str],
+    embedding_model: str,
+    C: float = 1.0,
+    seed: int = 0
+) -> SentimentHead:
+    """Fit a logistic regression head on embeddings and their POS/NEU/NEG labels"""
+    from sklearn.linear_model import LogisticRegression
+
+    model = LogisticRegression(C=C, max_iter=2000, random_state=seed)
+    model.fit(embeddings, list(labels))
+    return SentimentHead(
+        coef=model.coef_.astype(np.float32),
+        intercept=model.intercept_.astype(np.float32),
+        classes=[str(label) for label in model.classes_],
+        embedding_model=embedding_model,
+        version='',
+        metrics={}
+    )
+
+@lru_cache(maxsize=4)
+def load_sentiment_head(path: str) -> SentimentHead:
+    """Load a trained head; raises FileNotFoundError if none was trained"""
+    with np.load(path, allow_pickle=False) as data:
+        head = SentimentHead(
+            coef=data['coef'].astype(np.float32),
+            intercept=data['intercept'].astype(np.float32),
+            classes=[str(label) for label in data['classes']],
+            embedding_model=str(data['embedding_model']),
+            version=str(data['version']),
+            metrics=json.loads(str(data['metrics']))
+        )
+    logger.info(f"Loaded sentiment head {head.version} ({head.embedding_model}, {len(head.classes)} classes)")
+    return head
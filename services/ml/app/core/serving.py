@@ -0,0 +1,153 @@
+"""Pre-fork multi-process serving with copy-on-write shared model weights"""
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict
+
+from app.core.config import get_settings
+from app.core.models import download_models, set_inference_threads
+
+logger = logging.getLogger(__name__)
+
+def worker_thread_count(workers: int) -> int:
+    """Torch intra-op threads per worker so workers don't oversubscribe the CPU"""
+    settings = get_settings()
+    if settings.torch_threads_per_worker > 0:
+        return settings.torch_threads_per_worker
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    return max(1, (cpus or 1) // workers)
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(app: Any, sock: socket.socket, index: int, threads: int) -> None:
+    """Serve requests from the shared socket in a forked worker"""
+    import torch
+    import uvicorn
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed in the parent; intra-op threads are what matter here
+        pass
+    # ONNX sessions were built single-threaded in the parent
+    set_inference_threads(threads)
+
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving with {threads} torch threads")
+
+    config = uvicorn.Config(app, log_level="info", lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+class PreforkServer:
+    """
+    Loads models once, then forks inference workers that share them
+
+    The parent loads every model with a single torch thread (so no OpenMP
+    pool exists at fork time), freezes the GC so collections in the
+    children don't write to the pages holding the parent's objects, binds
+    the listening socket and forks ``workers`` uvicorn processes. Weight
+    tensors are never written after loading, so their pages stay shared
+    copy-on-write across all workers and the host holds one copy of the
+    models however many workers run. The kernel spreads incoming
+    connections across the workers accepting on the shared socket; dead
+    workers are re-forked from the parent.
+    """
+
+    def __init__(self, app: Any, host: str, port: int, workers: int):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = worker_thread_count(workers)
+        self._children: Dict[int, int] = {}
+        self._stopping = False
+
+    def run(self) -> None:
+        import torch
+
+        torch.set_num_threads(1)
+
+        started = time.monotonic()
+        asyncio.run(download_models())
+        logger.info(f"✅ Models loaded once in parent in {time.monotonic() - started:.1f}s")
+
+        sock = _bind_socket(self.host, self.port)
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        for index in range(self.workers):
+            self._spawn(index, sock)
+        logger.info(
+            f"🚀 Serving on {self.host}:{self.port} with {self.workers} workers "
+            f"x {self.threads} torch threads"
+        )
+
+        self._supervise(sock)
+
+    def _spawn(self, index: int, sock: socket.socket) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                _run_worker(self.app, sock, index, self.threads)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self._children[pid] = index
+
+    def _supervise(self, sock: socket.socket) -> None:
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            index = self._children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            self._spawn(index, sock)
+
+        sock.close()
+        logger.info("🛑 All workers stopped")
+
+    def _handle_stop(self, signum: int, frame: Any) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+def serve(app: Any) -> None:
+    """Serve the app with one model copy shared by ``serve_workers`` processes"""
+    settings = get_settings()
+    PreforkServer(
+        app,
+        host=settings.api_host,
+        port=settings.api_port,
+        workers=settings.serve_workers
+    ).run()
@@ -0,0 +1,508 @@
+"""
+Streaming heavy-hitter sketches of topic tag mentions
+
+Each (workspace, platform, day) bucket keeps a Space-Saving summary and a
+Count-Min sketch of the tags written back by the analysis pipeline, so
+trending tags for any 1-30 day window come from merging at most a few
+dozen small buckets instead of scanning comments.
+
+Error bounds, for a window holding N tag mentions:
+
+- Space-Saving (capacity k): every tag with more than N/k mentions is
+  tracked. For a tracked tag ``count - error <= true <= count`` and
+  ``error <= N/k``. Merging buckets keeps the same bound over the summed N.
+- Count-Min (width w, depth d): ``true <= estimate`` always, and
+  ``estimate <= true + (e/w) * N`` with probability at least ``1 - e^-d``
+  per query. Buckets merge by adding their tables.
+
+A tag's estimate is the smaller of the two upper bounds. Sentiment is
+summed only over the mentions a Space-Saving entry has seen itself
+(``count - error`` of them), so its average is exact for those mentions.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import struct
+import uuid
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+class SpaceSaving:
+    """Space-Saving top-k summary with per-entry overestimation error"""
+
+    def __init__(self, capacity: int, entries: Optional[Dict[str, List[float]]] = None, total: int = 0):
+        self.capacity = capacity
+        # tag -> [count, error, sentiment_sum]
+        self.entries: Dict[str, List[float]] = entries or {}
+        self.total = total
+
+    @property
+    def min_count(self) -> float:
+        """Count an untracked tag may have at most (0 until the summary is full)"""
+        if len(self.entries) < self.capacity:
+            return 0
+        return min(entry[0] for entry in self.entries.values())
+
+    def add(self, tag: str, count: int = 1, sentiment: float = 0.0) -> None:
+        """Count ``count`` mentions of a tag whose sentiments sum to ``sentiment``"""
+        self.total += count
+        entry = self.entries.get(tag)
+        if entry is not None:
+            entry[0] += count
+            entry[2] += sentiment
+            return
+        if len(self.entries) < self.capacity:
+            self.entries[tag] = [count, 0, sentiment]
+            return
+
+        # Replace the smallest entry; the newcomer inherits its count as error
+        victim = min(self.entries, key=lambda key: self.entries[key][0])
+        floor = self.entries.pop(victim)[0]
+        self.entries[tag] = [floor + count, floor, sentiment]
+
+    def update(self, counts: Dict[str, int], sentiments: Dict[str, float]) -> None:
+        """
+        Add a batch of tag counts
+
+        Same result as calling add() for each tag, largest new tags first,
+        but evictions pop a heap instead of scanning every entry.
+        """
+        new_tags = []
+        for tag, count in counts.items():
+            self.total += count
+            entry = self.entries.get(tag)
+            if entry is None:
+                new_tags.append(tag)
+            else:
+                entry[0] += count
+                entry[2] += sentiments.get(tag, 0.0)
+
+        new_tags.sort(key=lambda tag: -counts[tag])
+        free = max(self.capacity - len(self.entries), 0)
+        for tag in new_tags[:free]:
+            self.entries[tag] = [counts[tag], 0, sentiments.get(tag, 0.0)]
+        if len(new_tags) <= free:
+            return
+
+        heap = [(entry[0], tag) for tag, entry in self.entries.items()]
+        heapq.heapify(heap)
+        for tag in new_tags[free:]:
+            floor, victim = heapq.heappop(heap)
+            del self.entries[victim]
+            self.entries[tag] = [floor + counts[tag], floor, sentiments.get(tag, 0.0)]
+            heapq.heappush(heap, (floor + counts[tag], tag))
+
+    @classmethod
+    def merge(cls, summaries: List["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        """
+        Combine summaries of disjoint streams
+
+        A tag missing from a full summary may have had up to that
+        summary's minimum count there, so that minimum is added to both
+        its count and its error; the bound error <= N/k is preserved.
+        """
+        floors = [summary.min_count for summary in summaries]
+        tags = set().union(*(summary.entries for summary in summaries))
+        merged: Dict[str, List[float]] = {}
+        for tag in tags:
+            count = error = sentiment = 0.0
+            for summary, floor in zip(summaries, floors):
+                entry = summary.entries.get(tag)
+                if entry is None:
+                    count += floor
+                    error += floor
+                else:
+                    count += entry[0]
+                    error += entry[1]
+                    sentiment += entry[2]
+            merged[tag] = [count, error, sentiment]
+
+        top = sorted(merged.items(), key=lambda item: -item[1][0])[:capacity]
+        return cls(capacity, dict(top), total=sum(summary.total for summary in summaries))
+
+    def top(self, k: int) -> List[Tuple[str, float, float, float]]:
+        """Largest ``k`` entries as (tag, count, error, sentiment_sum)"""
+        ranked = sorted(self.entries.items(), key=lambda item: -item[1][0])[:k]
+        return [(tag, *entry) for tag, entry in ranked]
+
+    def to_json(self) -> list:
+        return [[tag, *entry] for tag, entry in self.entries.items()]
+
+    @classmethod
+    def from_json(cls, data: list, capacity: int, total: int) -> "SpaceSaving":
+        return cls(capacity, {row[0]: list(row[1:]) for row in data}, total=total)
+
+def _tag_hashes(tags: List[str]) -> np.ndarray:
+    """Stable 64-bit hashes (Python's hash() is salted per process)"""
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(tag.encode(), digest_size=8).digest(), "little") for tag in tags],
+        dtype=np.uint64
+    )
+
+# Serialized Count-Min blobs start with a magic and their width and depth
+_COUNT_MIN_MAGIC = b"CMS1"
+_COUNT_MIN_HEADER = struct.Struct("<4sII")
+
+class CountMinSketch:
+    """Count-Min sketch over tag mention counts"""
+
+    def __init__(self, width: int, depth: int, table: Optional[np.ndarray] = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.uint32)
+
+    def _columns(self, tags: List[str]) -> np.ndarray:
+        # Kirsch-Mitzenmacher: row i uses h1 + i * h2
+        hashes = _tag_hashes(tags)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def add_many(self, tags: List[str], counts: Iterable[int]) -> None:
+        if not tags:
+            return
+        columns = self._columns(tags)
+        counts = np.asarray(list(counts), dtype=np.uint32)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+
+    def estimate_many(self, tags: List[str]) -> np.ndarray:
+        if not tags:
+            return np.zeros(0, dtype=np.uint32)
+        columns = self._columns(tags)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def merge_into(self, other: "CountMinSketch") -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            other = other.folded(self.width, self.depth)
+        self.table += other.table
+
+    def folded(self, width: int, depth: int) -> "CountMinSketch":
+        """
+        The same counts in a narrower, shallower sketch
+
+        Row i hashes to (h1 + i * h2) mod width, so when ``width`` divides
+        this sketch's width, summing columns congruent mod ``width`` gives
+        exactly the table the smaller sketch would have built.
+        """
+        if self.width % width or depth > self.depth:
+            raise ValueError(
+                f"Cannot fold a {self.depth}x{self.width} Count-Min sketch into {depth}x{width}; "
+                "rebuild the tag sketches after changing their size"
+            )
+        table = self.table[:depth].reshape(depth, self.width // width, width).sum(axis=1, dtype=np.uint32)
+        return CountMinSketch(width, depth, table)
+
+    def to_bytes(self) -> bytes:
+        header = _COUNT_MIN_HEADER.pack(_COUNT_MIN_MAGIC, self.width, self.depth)
+        return header + zlib.compress(self.table.astype("<u4").tobytes(), level=6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, width: int, depth: int) -> "CountMinSketch":
+        """
+        Decode a sketch written by to_bytes()
+
+        The blob carries its own width and depth; ``width`` and ``depth``
+        only size blobs written before the header existed.
+        """
+        if data[:len(_COUNT_MIN_MAGIC)] == _COUNT_MIN_MAGIC:
+            _, width, depth = _COUNT_MIN_HEADER.unpack_from(data)
+            data = data[_COUNT_MIN_HEADER.size:]
+        table = np.frombuffer(zlib.decompress(data), dtype="<u4")
+        if table.size != width * depth:
+            raise ValueError(f"Count-Min blob holds {table.size} counters, expected {depth}x{width}")
+        return cls(width, depth, table.reshape(depth, width).astype(np.uint32))
+
+class TagSketch:
+    """Heavy hitters and Count-Min counts of one bucket (or a merged window)"""
+
+    def __init__(self, heavy_hitters: SpaceSaving, count_min: CountMinSketch):
+        self.heavy_hitters = heavy_hitters
+        self.count_min = count_min
+
+    @classmethod
+    def empty(cls) -> "TagSketch":
+        settings = get_settings()
+        return cls(
+            SpaceSaving(settings.tag_sketch_capacity),
+            CountMinSketch(settings.tag_sketch_width, settings.tag_sketch_depth)
+        )
+
+    @property
+    def total(self) -> int:
+        return self.heavy_hitters.total
+
+    def update(self, counts: Dict[str, int], sentiments: Dict[str, float]) -> None:
+        self.heavy_hitters.update(counts, sentiments)
+        tags = list(counts)
+        self.count_min.add_many(tags, (counts[tag] for tag in tags))
+
+    def estimate(self, tags: List[str]) -> np.ndarray:
+        """Upper-bound mention counts: the tighter of Count-Min and Space-Saving"""
+        estimates = self.count_min.estimate_many(tags).astype(np.float64)
+        floor = self.heavy_hitters.min_count
+        for i, tag in enumerate(tags):
+            entry = self.heavy_hitters.entries.get(tag)
+            estimates[i] = min(estimates[i], entry[0] if entry is not None else floor)
+        return estimates
+
+    @classmethod
+    def merge(cls, sketches: List["TagSketch"]) -> "TagSketch":
+        """Combine buckets; Count-Min tables of other sizes fold into the smallest"""
+        settings = get_settings()
+        count_min = CountMinSketch(
+            min((sketch.count_min.width for sketch in sketches), default=settings.tag_sketch_width),
+            min((sketch.count_min.depth for sketch in sketches), default=settings.tag_sketch_depth)
+        )
+        for sketch in sketches:
+            count_min.merge_into(sketch.count_min)
+        heavy_hitters = SpaceSaving.merge(
+            [sketch.heavy_hitters for sketch in sketches], settings.tag_sketch_capacity
+        )
+        return cls(heavy_hitters, count_min)
+
+    @classmethod
+    def from_row(cls, row: Any) -> "TagSketch":
+        settings = get_settings()
+        heavy_hitters = row["heavy_hitters"]
+        if isinstance(heavy_hitters, str):
+            heavy_hitters = json.loads(heavy_hitters)
+        return cls(
+            SpaceSaving.from_json(heavy_hitters, settings.tag_sketch_capacity, row["total"]),
+            CountMinSketch.from_bytes(row["count_min"], settings.tag_sketch_width, settings.tag_sketch_depth)
+        )
+
+def bucket_mentions(
+    comments: Iterable[dict]
+) -> Dict[Tuple[str, date], Tuple[Counter, Dict[str, float]]]:
+    """
+    Group tag mentions by (platform, day)
+
+    Each comment needs ``platform``, ``created_at``, ``topic_tags`` and
+    ``sentiment``; a mention contributes +1 (POS), 0 (NEU) or -1 (NEG) to
+    its tag's sentiment sum.
+    """
+    buckets: Dict[Tuple[str, date], Tuple[Counter, Dict[str, float]]] = {}
+    for comment in comments:
+        if not comment["topic_tags"]:
+            continue
+        key = (str(comment["platform"]), comment["created_at"].date())
+        counts, sentiments = buckets.setdefault(key, (Counter(), defaultdict(float)))
+        polarity = {"POS": 1.0, "NEG": -1.0}.get(comment.get("sentiment"), 0.0)
+        for tag in set(comment["topic_tags"]):
+            counts[tag] += 1
+            sentiments[tag] += polarity
+    return buckets
+
+async def record_tag_mentions(workspace_id: str, comments: Iterable[dict]) -> int:
+    """
+    Fold newly analyzed comments into their day buckets
+
+    Every bucket row is locked while it is merged so concurrent workers
+    can update the same day; buckets are locked in key order to avoid
+    deadlocks. Returns the number of mentions recorded.
+    """
+    buckets = bucket_mentions(comments)
+    if not buckets:
+        return 0
+
+    async with get_db_connection() as conn:
+        async with conn.transaction():
+            for platform, day in sorted(buckets):
+                counts, sentiments = buckets[(platform, day)]
+                await conn.execute(
+                    """
+                    INSERT INTO tag_sketches (
+                        id, workspace_id, platform, bucket_date, total,
+                        heavy_hitters, count_min, created_at, updated_at
+                    )
+                    VALUES ($1, $2, $3::"Platform", $4, 0, '[]'::jsonb, $5, NOW(), NOW())
+                    ON CONFLICT (workspace_id, platform, bucket_date) DO NOTHING
+                    """,
+                    uuid.uuid4().hex, workspace_id, platform, day, TagSketch.empty().count_min.to_bytes()
+                )
+                row = await conn.fetchrow(
+                    """
+                    SELECT total, heavy_hitters, count_min FROM tag_sketches
+                    WHERE workspace_id = $1 AND platform = $2::"Platform" AND bucket_date = $3
+                    FOR UPDATE
+                    """,
+                    workspace_id, platform, day
+                )
+                sketch = TagSketch.from_row(row)
+                sketch.update(counts, sentiments)
+                await _save_bucket(conn, workspace_id, platform, day, sketch)
+
+    return sum(sum(counts.values()) for counts, _ in buckets.values())
+
+async def _save_bucket(conn: Any, workspace_id: str, platform: str, day: date, sketch: TagSketch) -> None:
+    await conn.execute(
+        """
+        UPDATE tag_sketches
+        SET total = $4, heavy_hitters = $5::jsonb, count_min = $6, updated_at = NOW()
+        WHERE workspace_id = $1 AND platform = $2::"Platform" AND bucket_date = $3
+        """,
+        workspace_id, platform, day, sketch.total,
+        json.dumps(sketch.heavy_hitters.to_json()), sketch.count_min.to_bytes()
+    )
+
+async def load_buckets(
+    workspace_id: str,
+    platform: Optional[str],
+    first_day: date,
+    last_day: date
+) -> Dict[str, Dict[date, TagSketch]]:
+    """Day buckets in [first_day, last_day] per platform"""
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT platform::text AS platform, bucket_date, total, heavy_hitters, count_min
+            FROM tag_sketches
+            WHERE workspace_id = $1
+            AND ($2::text IS NULL OR platform::text = $2)
+            AND bucket_date BETWEEN $3 AND $4
+            """,
+            workspace_id, platform, first_day, last_day
+        )
+
+    buckets: Dict[str, Dict[date, TagSketch]] = defaultdict(dict)
+    for row in rows:
+        buckets[row["platform"]][row["bucket_date"]] = TagSketch.from_row(row)
+    return buckets
+
+async def sketch_trends(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    days: int = 7,
+    min_mentions: int = 5,
+    limit: int = 50,
+    min_burst: Optional[float] = None
+) -> List[dict]:
+    """
+    Trending tags from the day buckets alone
+
+    Candidates are the heavy hitters of the merged window; their daily
+    counts over the window and its baseline are estimated from each
+    bucket and scored by the same engine as full trend detection. Cost is
+    proportional to buckets x sketch capacity, not to comment volume.
+    """
+    from app.core.trends import bin_edges, score_trends
+
+    settings = get_settings()
+    baseline_days = settings.trend_baseline_days
+    window_start, period_start, period_end = bin_edges(days, 24, baseline_days)
+    first_day = window_start.date()
+    today = period_end.date() - timedelta(days=1)
+    n_bins = days + baseline_days
+
+    trends: List[dict] = []
+    for bucket_platform, buckets in (await load_buckets(workspace_id, platform, first_day, today)).items():
+        recent = [sketch for day, sketch in buckets.items() if day > today - timedelta(days=days)]
+        if not recent:
+            continue
+
+        window = TagSketch.merge(recent)
+        candidates = [tag for tag, count, _, _ in window.heavy_hitters.top(settings.tag_sketch_capacity)
+                      if count >= min_mentions]
+        if not candidates:
+            continue
+
+        daily = np.zeros((len(candidates), n_bins))
+        for day, sketch in buckets.items():
+            daily[:, (day - first_day).days] = sketch.estimate(candidates)
+
+        scored = score_trends(
+            series=np.repeat(np.arange(len(candidates)), n_bins),
+            bins=np.tile(np.arange(n_bins), len(candidates)),
+            mentions=daily.ravel(),
+            sentiment_sums=np.zeros(daily.size),
+            n_series=len(candidates),
+            n_bins=n_bins,
+            recent_bins=days,
+            baseline_bins=baseline_days,
+            min_mentions=min_mentions,
+            min_burst=settings.trend_min_burst if min_burst is None else min_burst
+        )
+
+        # Counts come from the merged summary so they carry its error bound;
+        # the daily estimates only feed the scoring
+        for i, index in enumerate(scored["series"]):
+            tag = candidates[index]
+            count, error, sentiment = window.heavy_hitters.entries[tag]
+            trends.append({
+                "tag": tag,
+                "platform": bucket_platform,
+                "score": float(scored["score"][i]),
+                "velocity": float(scored["velocity"][i]),
+                "acceleration": float(scored["acceleration"][i]),
+                "burst": float(scored["burst"][i]),
+                "mention_count": int(count),
+                "mention_count_error": int(error),
+                "sentiment_score": sentiment / (count - error) if count > error else 0.0,
+                "period_start": period_start,
+                "period_end": period_end
+            })
+
+    trends.sort(key=lambda trend: (-trend["burst"], -trend["mention_count"]))
+    return trends[:limit]
+
+async def rebuild_tag_sketches(workspace_id: str, days: int = 30) -> int:
+    """Rebuild a workspace's recent buckets from its analyzed comments"""
+    first_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    query = """
+        SELECT c.platform::text AS platform, c.created_at::date AS day, tag,
+               COUNT(*) AS mentions,
+               SUM(CASE c.sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END) AS sentiment_sum
+        FROM comments c
+        JOIN content_items ci ON c.content_item_id = ci.id
+        JOIN channels ch ON ci.channel_id = ch.id,
+        LATERAL (SELECT DISTINCT unnest(c.topic_tags) AS tag) AS t
+        WHERE ch.workspace_id = $1
+        AND c.sentiment IS NOT NULL
+        AND c.created_at >= $2
+        GROUP BY 1, 2, 3
+    """
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(query, workspace_id, datetime.combine(first_day, datetime.min.time()))
+
+        buckets: Dict[Tuple[str, date], TagSketch] = defaultdict(TagSketch.empty)
+        grouped: Dict[Tuple[str, date], Tuple[Dict[str, int], Dict[str, float]]] = defaultdict(lambda: ({}, {}))
+        for row in rows:
+            counts, sentiments = grouped[(row["platform"], row["day"])]
+            counts[row["tag"]] = row["mentions"]
+            sentiments[row["tag"]] = float(row["sentiment_sum"])
+        for key, (counts, sentiments) in grouped.items():
+            buckets[key].update(counts, sentiments)
+
+        async with conn.transaction():
+            await conn.execute(
+                "DELETE FROM tag_sketches WHERE workspace_id = $1 AND bucket_date >= $2",
+                workspace_id, first_day
+            )
+            for (platform, day), sketch in sorted(buckets.items()):
+                await conn.execute(
+                    """
+                    INSERT INTO tag_sketches (
+                        id, workspace_id, platform, bucket_date, total,
+                        heavy_hitters, count_min, created_at, updated_at
+                    )
+                    VALUES ($1, $2, $3::"Platform", $4, $5, $6::jsonb, $7, NOW(), NOW())
+                    """,
+                    uuid.uuid4().hex, workspace_id, platform, day, sketch.total,
+                    json.dumps(sketch.heavy_hitters.to_json()), sketch.count_min.to_bytes()
+                )
+
+    logger.info(f"Rebuilt {len(buckets)} tag sketch buckets for workspace {workspace_id}")
+    return len(buckets)
@@ -0,0 +1,278 @@
+"""
+Workspace sentiment statistics served from incrementally maintained counters
+
+workspace_sentiment_stats holds per (workspace, platform, UTC day)
+sentiment counts and confidence sums, and tag_daily_rollups the topic tag
+counts; both are updated by the comment writeback statement (see
+``_BULK_UPDATE_QUERY``). Reading stats sums at most days x platforms
+counter rows instead of scanning comments.
+
+A reconciler periodically recomputes the recent days of both tables from
+the comments themselves and corrects any drift, e.g. from comments
+deleted or edited outside the ML service. The same loop drops
+embeddings of deleted comments from the local embedding stores.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+from app.core.ann import workspace_ann_index
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+from app.core.embedding_store import prune_embedding_stores
+
+logger = logging.getLogger(__name__)
+
+_SENTIMENT_SCORE = "CASE c.sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END"
+
+# Tries when a writeback races the reconciliation, before waiting for the next run
+_RECONCILE_ATTEMPTS = 5
+
+_RECONCILE_STATS_QUERY = """
+    WITH actual AS (
+        SELECT ch.workspace_id, c.platform, c.created_at::date AS day,
+               COUNT(*) AS comment_count,
+               COUNT(*) FILTER (WHERE c.sentiment = 'POS') AS positive_count,
+               COUNT(*) FILTER (WHERE c.sentiment = 'NEU') AS neutral_count,
+               COUNT(*) FILTER (WHERE c.sentiment = 'NEG') AS negative_count,
+               COALESCE(SUM((c.meta_json->>'sentiment_confidence')::float), 0) AS confidence_sum,
+               COUNT(c.meta_json->>'sentiment_confidence') AS confidence_count
+        FROM comments c
+        JOIN content_items ci ON c.content_item_id = ci.id
+        JOIN channels ch ON ci.channel_id = ch.id
+        WHERE c.sentiment IS NOT NULL
+        AND c.created_at >= $1::date
+        GROUP BY 1, 2, 3
+    ),
+    removed AS (
+        DELETE FROM workspace_sentiment_stats s
+        WHERE s.day >= $1::date
+        AND NOT EXISTS (
+            SELECT 1 FROM actual a
+            WHERE a.workspace_id = s.workspace_id AND a.platform = s.platform AND a.day = s.day
+        )
+        RETURNING 1
+    ),
+    fixed AS (
+        INSERT INTO workspace_sentiment_stats AS s (
+            workspace_id, platform, day, comment_count, positive_count, neutral_count,
+            negative_count, confidence_sum, confidence_count, updated_at
+        )
+        SELECT *, NOW() FROM actual
+        -- The writeback's order, so the two don't deadlock
+        ORDER BY workspace_id, platform, day
+        ON CONFLICT (workspace_id, platform, day) DO UPDATE
+        SET comment_count = EXCLUDED.comment_count,
+            positive_count = EXCLUDED.positive_count,
+            neutral_count = EXCLUDED.neutral_count,
+            negative_count = EXCLUDED.negative_count,
+            confidence_sum = EXCLUDED.confidence_sum,
+            confidence_count = EXCLUDED.confidence_count,
+            updated_at = NOW()
+        WHERE (s.comment_count, s.positive_count, s.neutral_count, s.negative_count, s.confidence_count)
+            IS DISTINCT FROM (EXCLUDED.comment_count, EXCLUDED.positive_count, EXCLUDED.neutral_count,
+                              EXCLUDED.negative_count, EXCLUDED.confidence_count)
+        -- Float sums depend on addition order, so only real drift counts
+        OR abs(s.confidence_sum - EXCLUDED.confidence_sum) > 1e-6 * GREATEST(s.confidence_count, 1)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM removed) + (SELECT COUNT(*) FROM fixed)
+"""
+
+_RECONCILE_TAGS_QUERY = f"""
+    WITH actual AS (
+        SELECT ch.workspace_id, c.platform, t.tag, c.created_at::date AS day,
+               COUNT(*) AS mention_count,
+               SUM({_SENTIMENT_SCORE}) AS sentiment_sum
+        FROM comments c
+        JOIN content_items ci ON c.content_item_id = ci.id
+        JOIN channels ch ON ci.channel_id = ch.id,
+        LATERAL (SELECT DISTINCT unnest(c.topic_tags) AS tag) AS t
+        WHERE c.sentiment IS NOT NULL
+        AND c.created_at >= $1::date
+        GROUP BY 1, 2, 3, 4
+    ),
+    removed AS (
+        DELETE FROM tag_daily_rollups r
+        WHERE r.day >= $1::date
+        AND NOT EXISTS (
+            SELECT 1 FROM actual a
+            WHERE a.workspace_id = r.workspace_id AND a.platform = r.platform
+            AND a.tag = r.tag AND a.day = r.day
+        )
+        RETURNING 1
+    ),
+    fixed AS (
+        INSERT INTO tag_daily_rollups AS r (
+            workspace_id, platform, tag, day, mention_count, sentiment_sum, updated_at
+        )
+        SELECT *, NOW() FROM actual
+        ORDER BY workspace_id, platform, tag, day
+        ON CONFLICT (workspace_id, platform, tag, day) DO UPDATE
+        SET mention_count = EXCLUDED.mention_count,
+            sentiment_sum = EXCLUDED.sentiment_sum,
+            updated_at = NOW()
+        WHERE (r.mention_count, r.sentiment_sum) IS DISTINCT FROM (EXCLUDED.mention_count, EXCLUDED.sentiment_sum)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM removed) + (SELECT COUNT(*) FROM fixed)
+"""
+
+def _summarize(counts: Dict[str, Any]) -> Dict[str, Any]:
+    total = counts["comment_count"]
+    return {
+        "total_comments": total,
+        "sentiment_counts": {
+            "positive": counts["positive_count"],
+            "neutral": counts["neutral_count"],
+            "negative": counts["negative_count"]
+        },
+        "sentiment_distribution": {
+            "positive": counts["positive_count"] / total if total else 0.0,
+            "neutral": counts["neutral_count"] / total if total else 0.0,
+            "negative": counts["negative_count"] / total if total else 0.0
+        },
+        "avg_confidence": (
+            counts["confidence_sum"] / counts["confidence_count"] if counts["confidence_count"] else None
+        )
+    }
+
+async def get_workspace_stats(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    days: int = 30,
+    top_k: int = 5
+) -> Dict[str, Any]:
+    """Sentiment and topic stats over the last ``days`` UTC days (today included)"""
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT platform::text AS platform,
+                   SUM(comment_count)::bigint AS comment_count,
+                   SUM(positive_count)::bigint AS positive_count,
+                   SUM(neutral_count)::bigint AS neutral_count,
+                   SUM(negative_count)::bigint AS negative_count,
+                   SUM(confidence_sum) AS confidence_sum,
+                   SUM(confidence_count)::bigint AS confidence_count,
+                   MAX(updated_at) AS last_updated
+            FROM workspace_sentiment_stats
+            WHERE workspace_id = $1
+            AND ($2::text IS NULL OR platform::text = $2)
+            AND day > (NOW() AT TIME ZONE 'UTC')::date - $3::int
+            GROUP BY platform
+            """,
+            workspace_id, platform, days
+        )
+        topics = await conn.fetch(
+            """
+            SELECT tag, SUM(mention_count) AS mentions
+            FROM tag_daily_rollups
+            WHERE workspace_id = $1
+            AND ($2::text IS NULL OR platform::text = $2)
+            AND day > (NOW() AT TIME ZONE 'UTC')::date - $3::int
+            GROUP BY tag
+            HAVING SUM(mention_count) > 0
+            ORDER BY mentions DESC, tag
+            LIMIT $4
+            """,
+            workspace_id, platform, days, top_k
+        )
+
+    fields = ("comment_count", "positive_count", "neutral_count", "negative_count",
+              "confidence_sum", "confidence_count")
+    totals = {field: sum(row[field] or 0 for row in rows) for field in fields}
+    updated = [row["last_updated"] for row in rows if row["last_updated"] is not None]
+
+    return {
+        "workspace_id": workspace_id,
+        "platform": platform,
+        "days": days,
+        **_summarize(totals),
+        "platforms": {
+            row["platform"]: _summarize({field: row[field] or 0 for field in fields})
+            for row in rows
+        },
+        "last_updated": max(updated) if updated else None,
+        "top_topics": [row["tag"] for row in topics]
+    }
+
+async def reconcile_stats(days: int) -> Optional[Dict[str, int]]:
+    """
+    Recompute the last ``days`` of counters and rollups from comments
+
+    Runs at REPEATABLE READ, so a writeback that commits after the
+    reconciliation's snapshot and touches a row it corrects makes it fail
+    with a serialization error rather than have its increment overwritten;
+    the reconciliation is then retried on a fresh snapshot.
+
+    Returns the number of corrected rows per table, or None if another
+    instance is already reconciling.
+    """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    for attempt in range(1, _RECONCILE_ATTEMPTS + 1):
+        try:
+            async with get_db_connection() as conn:
+                async with conn.transaction(isolation="repeatable_read"):
+                    locked = await conn.fetchval(
+                        "SELECT pg_try_advisory_xact_lock(hashtext('workspace_sentiment_stats_reconcile'))"
+                    )
+                    if not locked:
+                        return None
+                    return {
+                        "workspace_sentiment_stats": await conn.fetchval(_RECONCILE_STATS_QUERY, since),
+                        "tag_daily_rollups": await conn.fetchval(_RECONCILE_TAGS_QUERY, since)
+                    }
+        except (asyncpg.exceptions.SerializationError, asyncpg.exceptions.DeadlockDetectedError) as e:
+            if attempt == _RECONCILE_ATTEMPTS:
+                raise
+            logger.info(f"Stats reconciliation raced a writeback, retrying ({attempt}/{_RECONCILE_ATTEMPTS}): {e}")
+            await asyncio.sleep(0.1 * attempt)
+
+class StatsReconciler:
+    """Periodically corrects drift in the sentiment counters and tag rollups"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None and self.settings.stats_reconcile_interval_seconds > 0:
+            self._task = asyncio.create_task(self._reconcile_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _reconcile_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.stats_reconcile_interval_seconds)
+            try:
+                corrected = await reconcile_stats(self.settings.stats_reconcile_days)
+                if corrected and any(corrected.values()):
+                    logger.warning(f"Reconciled drifted stats rows: {corrected}")
+            except Exception as e:
+                logger.warning(f"Stats reconciliation failed: {e}")
+            if self.settings.embedding_store_enabled:
+                try:
+                    pruned = await prune_embedding_stores() or {}
+                    if any(pruned.values()):
+                        logger.info(f"Pruned embeddings of deleted comments: {pruned}")
+                    # Compaction renumbers rows, so search indexes re-encode them
+                    for workspace_id, deleted in pruned.items():
+                        index = workspace_ann_index(workspace_id) if deleted else None
+                        if index is not None:
+                            index.schedule_sync()
+                except Exception as e:
+                    logger.warning(f"Embedding store pruning failed: {e}")
+
+# Global reconciler instance
+stats_reconciler = StatsReconciler()
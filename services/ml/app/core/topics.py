@@ -0,0 +1,236 @@
+"""
+Canonical topics for keyword tags
+
+KeyBERT returns surface phrases, so "new feature", "new features" and
+"feature update" would count as three tags. Each distinct phrase is
+embedded once and joins the topic whose founding phrase it is most
+similar to, if the cosine similarity reaches ``topic_merge_threshold``;
+otherwise it founds a new topic (online leader clustering). A topic is
+named by its founding phrase, which never changes, so topic ids stay
+stable as more phrases arrive.
+
+Assignments live in topic_aliases, shared by every instance, and are
+cached in memory: the writeback path maps tags with dict lookups and
+only embeds phrases that no instance has seen before.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+def normalize_phrase(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+def assign_topics(
+    phrases: Sequence[str],
+    vectors: np.ndarray,
+    leaders: Sequence[str],
+    leader_vectors: np.ndarray,
+    threshold: float
+) -> List[Tuple[str, float]]:
+    """
+    (topic, similarity) of each new phrase given the existing topic leaders
+
+    ``vectors`` and ``leader_vectors`` are L2-normalized. Phrases that
+    found a topic get similarity 1.0 and are leaders for the phrases
+    after them, so callers should pass shorter, more general phrases first.
+    """
+    if len(leaders):
+        similarities = vectors @ leader_vectors.T
+        best = similarities.argmax(axis=1)
+        best_similarity = similarities[np.arange(len(phrases)), best]
+    else:
+        best = np.zeros(len(phrases), dtype=np.int64)
+        best_similarity = np.full(len(phrases), -np.inf)
+
+    # Only leaders founded within this batch need a sequential pass
+    new_leaders: List[int] = []
+    assigned: List[Tuple[str, float]] = []
+    for i, phrase in enumerate(phrases):
+        topic, similarity = (leaders[best[i]], float(best_similarity[i])) if len(leaders) else (None, -np.inf)
+        if new_leaders:
+            batch_similarity = vectors[new_leaders] @ vectors[i]
+            j = int(batch_similarity.argmax())
+            if batch_similarity[j] > similarity:
+                topic, similarity = phrases[new_leaders[j]], float(batch_similarity[j])
+        if similarity >= threshold:
+            assigned.append((topic, similarity))
+        else:
+            new_leaders.append(i)
+            assigned.append((phrase, 1.0))
+    return assigned
+
+class TopicCanonicalizer:
+    """Maps keyword phrases to canonical topics through topic_aliases"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._aliases: Dict[str, str] = {}
+        self._leaders: List[str] = []
+        self._leader_vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded_until: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    def lookup(self, phrase: str) -> Optional[str]:
+        """Cached topic of a phrase, or None if it has not been assigned yet"""
+        topic = self._aliases.get(normalize_phrase(phrase))
+        # A topic whose founding insert lost a race points at the winner's topic
+        while topic is not None and self._aliases.get(topic, topic) != topic:
+            topic = self._aliases[topic]
+        return topic
+
+    async def canonicalize(self, phrases: Iterable[str]) -> Dict[str, str]:
+        """Canonical topic of each phrase, assigning phrases not seen before"""
+        phrases = set(phrases)
+        missing = {normalize_phrase(p) for p in phrases if self.lookup(p) is None}
+        if missing:
+            async with self._lock:
+                await self._refresh()
+                missing = [p for p in missing if p not in self._aliases]
+                if missing:
+                    await self._assign(missing)
+        return {phrase: self.lookup(phrase) or normalize_phrase(phrase) for phrase in phrases}
+
+    async def canonicalize_tags(self, tag_lists: List[List[str]]) -> List[List[str]]:
+        """Map each list of tags to its distinct canonical topics, in order"""
+        topics = await self.canonicalize(tag for tags in tag_lists for tag in tags)
+        return [list(dict.fromkeys(topics[tag] for tag in tags)) for tags in tag_lists]
+
+    async def _refresh(self) -> None:
+        """Load assignments made since the last load, by any instance"""
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT phrase, topic, embedding, created_at
+                FROM topic_aliases
+                -- Overlap so rows committed late with an earlier timestamp are not missed
+                WHERE $1::timestamptz IS NULL OR created_at > $1::timestamptz - INTERVAL '5 minutes'
+                ORDER BY created_at
+                """,
+                self._loaded_until
+            )
+        self._apply(rows)
+        if rows:
+            self._loaded_until = rows[-1]["created_at"]
+
+    def _apply(self, rows: Iterable) -> None:
+        for row in rows:
+            if row["phrase"] in self._aliases:
+                continue
+            self._aliases[row["phrase"]] = row["topic"]
+            if row["embedding"] is not None:
+                self._leaders.append(row["phrase"])
+                self._leader_vectors.append(np.frombuffer(row["embedding"], dtype=np.float32))
+                self._matrix = None
+
+    async def _assign(self, phrases: List[str]) -> None:
+        from app.core.models import embed_texts
+
+        # Shorter phrases first, so "new feature" rather than "new features update" founds the topic
+        phrases = sorted(phrases, key=lambda phrase: (len(phrase), phrase))
+        vectors = await asyncio.to_thread(embed_texts, phrases)
+        if self._matrix is None and self._leader_vectors:
+            self._matrix = np.stack(self._leader_vectors)
+        leader_vectors = self._matrix if self._matrix is not None else np.empty((0, vectors.shape[1]), np.float32)
+        assigned = assign_topics(
+            phrases, vectors, self._leaders, leader_vectors, self.settings.topic_merge_threshold
+        )
+
+        async with get_db_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO topic_aliases (phrase, topic, similarity, embedding, created_at)
+                SELECT phrase, topic, similarity, embedding, NOW()
+                FROM unnest($1::text[], $2::text[], $3::real[], $4::bytea[])
+                    AS t(phrase, topic, similarity, embedding)
+                ON CONFLICT (phrase) DO NOTHING
+                """,
+                phrases,
+                [topic for topic, _ in assigned],
+                [similarity for _, similarity in assigned],
+                [
+                    vector.tobytes() if topic == phrase else None
+                    for phrase, vector, (topic, _) in zip(phrases, vectors, assigned)
+                ]
+            )
+            # Another instance may have assigned some of them first; the table wins
+            rows = await conn.fetch(
+                "SELECT phrase, topic, embedding FROM topic_aliases WHERE phrase = ANY($1::text[])",
+                phrases
+            )
+        self._apply(rows)
+
+        founded = sum(1 for phrase, (topic, _) in zip(phrases, assigned) if topic == phrase)
+        logger.debug(f"Assigned {len(phrases)} new phrases to topics, {founded} new topics")
+
+    def stats(self) -> Dict[str, int]:
+        return {"phrases": len(self._aliases), "topics": len(self._leaders)}
+
+# Global canonicalizer instance
+topic_canonicalizer = TopicCanonicalizer()
+
+async def canonicalize_workspace_tags(workspace_id: str) -> Dict[str, int]:
+    """
+    Rewrite a workspace's stored tags as canonical topics
+
+    Comments written before canonicalization keep raw phrases. The rewrite
+    bypasses the writeback statement, so the tag rollups are rebuilt.
+    """
+    from app.core.database import rebuild_tag_daily_rollups
+    from app.core.sketches import rebuild_tag_sketches
+
+    async with get_db_connection() as conn:
+        tags = [
+            row["tag"]
+            for row in await conn.fetch(
+                """
+                SELECT DISTINCT unnest(c.topic_tags) AS tag
+                FROM comments c
+                JOIN content_items ci ON c.content_item_id = ci.id
+                JOIN channels ch ON ci.channel_id = ch.id
+                WHERE ch.workspace_id = $1
+                """,
+                workspace_id
+            )
+        ]
+    topics = await topic_canonicalizer.canonicalize(tags)
+    changed = {tag: topic for tag, topic in topics.items() if tag != topic}
+
+    updated = 0
+    if changed:
+        async with get_db_connection() as conn:
+            result = await conn.execute(
+                """
+                UPDATE comments c
+                SET topic_tags = ARRAY(
+                    SELECT COALESCE(m.topic, t.tag)
+                    FROM unnest(c.topic_tags) WITH ORDINALITY AS t(tag, n)
+                    LEFT JOIN unnest($2::text[], $3::text[]) AS m(phrase, topic) ON m.phrase = t.tag
+                    GROUP BY COALESCE(m.topic, t.tag)
+                    ORDER BY MIN(t.n)
+                )
+                FROM content_items ci, channels ch
+                WHERE c.content_item_id = ci.id
+                AND ci.channel_id = ch.id
+                AND ch.workspace_id = $1
+                AND c.topic_tags && $2::text[]
+                """,
+                workspace_id,
+                list(changed),
+                list(changed.values())
+            )
+        updated = int(result.split()[-1])
+        await rebuild_tag_daily_rollups(workspace_id)
+        if get_settings().tag_sketches_enabled:
+            await rebuild_tag_sketches(workspace_id, days=30)
+
+    return {"tags": len(tags), "topics": len(set(topics.values())), "comments_updated": updated}
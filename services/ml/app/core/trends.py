@@ -0,0 +1,360 @@
+"""Trend detection over comment topic tags"""
+
+import json
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Burst z-score that maps to a trend score of ~76 (tanh(1))
+BURST_SCALE = 5.0
+
+# Variance added to every baseline so quiet tags need a real jump to burst
+BURST_PRIOR_VARIANCE = 4.0
+
+# Bins per series the dense scoring matrices may have (30 + 14 days of hourly bins fit)
+MAX_TREND_BINS = 2048
+
+def bin_edges(days: int, bin_hours: int, baseline_days: int, now: Optional[datetime] = None) -> tuple:
+    """
+    Aligned (window_start, period_start, period_end) for a detection run
+
+    The end is the next bin boundary, so repeated runs inside one bin
+    cover, and persist, the same period. The window start is a whole
+    number of bins before the end, reaching back at least ``days`` plus
+    ``baseline_days``. Datetimes are naive UTC like the timestamp columns
+    they are compared with.
+    """
+    now = now or datetime.utcnow()
+    bin_seconds = bin_hours * 3600
+    end_epoch = (int(now.replace(tzinfo=timezone.utc).timestamp()) // bin_seconds + 1) * bin_seconds
+    period_end = datetime.fromtimestamp(end_epoch, timezone.utc).replace(tzinfo=None)
+    period_start = period_end - timedelta(days=days)
+    window_bins = math.ceil((days + baseline_days) * 24 / bin_hours)
+    window_start = period_end - timedelta(hours=window_bins * bin_hours)
+    return window_start, period_start, period_end
+
+def score_trends(
+    series: np.ndarray,
+    bins: np.ndarray,
+    mentions: np.ndarray,
+    sentiment_sums: np.ndarray,
+    n_series: int,
+    n_bins: int,
+    recent_bins: int,
+    baseline_bins: int,
+    min_mentions: int,
+    min_burst: float = 0.0
+) -> Dict[str, np.ndarray]:
+    """
+    Score every tag series at once from sparse (series, bin) counts
+
+    Series with fewer than ``min_mentions`` recent mentions are dropped
+    from the sparse counts first, and only the rest are scattered into a
+    dense series x bin matrix, so memory follows the candidate tags rather
+    than every tag seen. ``n_bins`` above MAX_TREND_BINS is rejected with a
+    ValueError. Over the last ``recent_bins`` bins each series gets:
+
+    - velocity: percent growth of the recent mention rate over the
+      baseline rate (the bins before the recent window), +1 smoothed so
+      new tags don't divide by zero
+    - acceleration: growth of the second half of the recent window over
+      its first half, in the same units
+    - burst: the largest z-score of a recent bin against the mean and
+      deviation of the ``baseline_bins`` bins trailing it. The variance
+      is floored at the Poisson variance (the mean) and padded with
+      BURST_PRIOR_VARIANCE so sparse tags don't burst on a few mentions
+    - score: ``100 * tanh(burst / BURST_SCALE)``, 0 for non-bursting tags
+    - sentiment_score: mean sentiment of recent mentions (POS=1, NEG=-1)
+
+    Returns arrays for the series with at least ``min_mentions`` recent
+    mentions and a positive burst of at least ``min_burst``, ordered by
+    burst then mentions (the score saturates, the burst doesn't).
+    """
+    if n_bins > MAX_TREND_BINS:
+        raise ValueError(
+            f"Trend window has {n_bins} bins, more than the {MAX_TREND_BINS} supported; "
+            "use fewer days or a larger TREND_BIN_HOURS"
+        )
+    first = n_bins - recent_bins
+
+    # Keep only the series that can reach min_mentions, renumbered densely
+    in_recent = bins >= first
+    recent_mentions = np.bincount(series[in_recent], weights=mentions[in_recent], minlength=n_series)
+    candidates = np.flatnonzero(recent_mentions >= min_mentions)
+    position = np.full(n_series, -1, dtype=np.int64)
+    position[candidates] = np.arange(len(candidates))
+    kept_rows = position[series] >= 0
+    series, bins = position[series[kept_rows]], bins[kept_rows]
+    mentions, sentiment_sums = mentions[kept_rows], sentiment_sums[kept_rows]
+    n_series = len(candidates)
+
+    flat = series * n_bins + bins
+    counts = np.bincount(flat, weights=mentions, minlength=n_series * n_bins).reshape(n_series, n_bins)
+
+    recent = counts[:, first:]
+    baseline = counts[:, :first]
+    mention_count = recent.sum(axis=1)
+
+    recent_rate = mention_count / recent_bins
+    baseline_rate = baseline.mean(axis=1) if first else np.zeros(n_series)
+    velocity = 100.0 * (recent_rate - baseline_rate) / (baseline_rate + 1.0)
+
+    if recent_bins >= 2:
+        half = recent_bins // 2
+        early = recent[:, :half].mean(axis=1)
+        late = recent[:, half:].mean(axis=1)
+    else:
+        early = counts[:, -2] if n_bins >= 2 else np.zeros(n_series)
+        late = recent[:, -1]
+    acceleration = 100.0 * (late - early) / (early + 1.0)
+
+    # Trailing-window mean and variance of every recent bin from cumulative sums
+    window = min(baseline_bins, first)
+    if window > 0:
+        sums = np.zeros((n_series, n_bins + 1))
+        squares = np.zeros((n_series, n_bins + 1))
+        np.cumsum(counts, axis=1, out=sums[:, 1:])
+        np.cumsum(counts ** 2, axis=1, out=squares[:, 1:])
+        trailing_mean = (sums[:, first:n_bins] - sums[:, first - window:n_bins - window]) / window
+        trailing_var = (squares[:, first:n_bins] - squares[:, first - window:n_bins - window]) / window
+        trailing_var -= trailing_mean ** 2
+    else:
+        trailing_mean = trailing_var = np.zeros_like(recent)
+    variance = np.maximum(trailing_var, trailing_mean) + BURST_PRIOR_VARIANCE
+    burst = ((recent - trailing_mean) / np.sqrt(variance)).max(axis=1)
+
+    score = 100.0 * np.tanh(np.maximum(burst, 0.0) / BURST_SCALE)
+    in_recent = bins >= first
+    sentiment_score = np.divide(
+        np.bincount(series[in_recent], weights=sentiment_sums[in_recent], minlength=n_series),
+        mention_count,
+        out=np.zeros(n_series),
+        where=mention_count > 0
+    )
+
+    keep = np.flatnonzero((mention_count >= min_mentions) & (burst > 0) & (burst >= min_burst))
+    keep = keep[np.lexsort((-mention_count[keep], -burst[keep]))]
+
+    return {
+        "series": candidates[keep],
+        "score": score[keep],
+        "velocity": velocity[keep],
+        "acceleration": acceleration[keep],
+        "burst": burst[keep],
+        "mention_count": mention_count[keep].astype(np.int64),
+        "sentiment_score": sentiment_score[keep]
+    }
+
+async def fetch_tag_bins(
+    workspace_id: str,
+    platform: Optional[str],
+    window_start: datetime,
+    period_end: datetime,
+    bin_hours: int
+) -> Optional[Any]:
+    """
+    Mention counts and sentiment sums per platform, tag and time bin
+
+    Returned as one row of flat arrays (series index, bin, mentions,
+    sentiment sum) plus the platform and tag of each series, which
+    converts to NumPy far faster than a row per tag. A tag counts once
+    per comment, as in the daily rollups.
+    """
+    query = """
+        WITH binned AS (
+            SELECT
+                c.platform::text AS platform,
+                tag,
+                FLOOR(EXTRACT(EPOCH FROM c.created_at - $3::timestamp) / $5)::int AS bin,
+                COUNT(*) AS mentions,
+                SUM(CASE c.sentiment WHEN 'POS' THEN 1 WHEN 'NEG' THEN -1 ELSE 0 END) AS sentiment_sum
+            FROM comments c
+            JOIN content_items ci ON c.content_item_id = ci.id
+            JOIN channels ch ON ci.channel_id = ch.id,
+            LATERAL (SELECT DISTINCT unnest(c.topic_tags) AS tag) AS t
+            WHERE ch.workspace_id = $1
+            AND ($2::text IS NULL OR c.platform::text = $2)
+            AND c.created_at >= $3
+            AND c.created_at < $4
+            GROUP BY 1, 2, 3
+        ),
+        series AS (
+            SELECT platform, tag, (ROW_NUMBER() OVER (ORDER BY platform, tag) - 1)::int AS series
+            FROM binned
+            GROUP BY platform, tag
+        )
+        SELECT
+            (SELECT array_agg(platform ORDER BY series) FROM series) AS platforms,
+            (SELECT array_agg(tag ORDER BY series) FROM series) AS tags,
+            array_agg(s.series) AS series,
+            array_agg(b.bin) AS bins,
+            array_agg(b.mentions) AS mentions,
+            array_agg(b.sentiment_sum) AS sentiment_sums
+        FROM binned b
+        JOIN series s USING (platform, tag)
+    """
+    async with get_db_connection() as conn:
+        return await conn.fetchrow(
+            query, workspace_id, platform, window_start, period_end, float(bin_hours * 3600)
+        )
+
+async def detect_workspace_trends(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    days: int = 7,
+    min_mentions: int = 5,
+    limit: int = 50,
+    persist: bool = True,
+    min_burst: Optional[float] = None
+) -> List[dict]:
+    """
+    Detect trending tags for a workspace and persist them to the trends table
+
+    ``min_burst`` is the burst z-score a tag needs to count as trending
+    (TREND_MIN_BURST by default).
+    """
+    settings = get_settings()
+    bin_hours = settings.trend_bin_hours
+    window_start, period_start, period_end = bin_edges(days, bin_hours, settings.trend_baseline_days)
+    # Rows are binned by FLOOR from window_start, so every bin index stays below the ceiling
+    n_bins = math.ceil((period_end - window_start).total_seconds() / (bin_hours * 3600))
+    recent_bins = max(1, math.ceil(days * 24 / bin_hours))
+
+    started = time.monotonic()
+    binned = await fetch_tag_bins(workspace_id, platform, window_start, period_end, bin_hours)
+    fetched = time.monotonic()
+    if binned is None or not binned["tags"]:
+        return []
+
+    tags = binned["tags"]
+    platforms = binned["platforms"]
+    scored = score_trends(
+        series=np.array(binned["series"], dtype=np.int64),
+        bins=np.array(binned["bins"], dtype=np.int64),
+        mentions=np.array(binned["mentions"], dtype=np.float64),
+        sentiment_sums=np.array(binned["sentiment_sums"], dtype=np.float64),
+        n_series=len(tags),
+        n_bins=n_bins,
+        recent_bins=recent_bins,
+        baseline_bins=settings.trend_baseline_days * 24 // bin_hours,
+        min_mentions=min_mentions,
+        min_burst=settings.trend_min_burst if min_burst is None else min_burst
+    )
+
+    trends = [
+        {
+            "tag": tags[index],
+            "platform": platforms[index],
+            "score": float(scored["score"][i]),
+            "velocity": float(scored["velocity"][i]),
+            "acceleration": float(scored["acceleration"][i]),
+            "burst": float(scored["burst"][i]),
+            "mention_count": int(scored["mention_count"][i]),
+            "sentiment_score": float(scored["sentiment_score"][i]),
+            "period_start": period_start,
+            "period_end": period_end
+        }
+        for i, index in enumerate(scored["series"][:limit])
+    ]
+    logger.info(
+        f"Scored {len(tags)} tag series x {n_bins} bins for workspace {workspace_id}: "
+        f"{len(trends)} trends (fetch {fetched - started:.2f}s, score {time.monotonic() - fetched:.3f}s)"
+    )
+
+    if persist and trends:
+        await save_trends(workspace_id, trends)
+    return trends
+
+async def save_trends(workspace_id: str, trends: List[dict]) -> None:
+    """Upsert detected trends, one row per platform, tag and period"""
+    query = """
+        INSERT INTO trends (
+            id, workspace_id, platform, tag, score, velocity,
+            period_start, period_end, meta_json, created_at, updated_at
+        )
+        SELECT
+            t.id, $1, t.platform::"Platform", t.tag, t.score, t.velocity,
+            t.period_start, t.period_end, t.meta_json::jsonb, NOW(), NOW()
+        FROM unnest(
+            $2::text[], $3::text[], $4::text[], $5::float8[], $6::float8[],
+            $7::timestamp[], $8::timestamp[], $9::text[]
+        ) AS t(id, platform, tag, score, velocity, period_start, period_end, meta_json)
+        ON CONFLICT (workspace_id, platform, tag, period_start, period_end) DO UPDATE SET
+            score = EXCLUDED.score,
+            velocity = EXCLUDED.velocity,
+            meta_json = EXCLUDED.meta_json,
+            updated_at = NOW()
+    """
+    async with get_db_connection() as conn:
+        await conn.execute(
+            query,
+            workspace_id,
+            [uuid.uuid4().hex for _ in trends],
+            [trend["platform"] for trend in trends],
+            [trend["tag"] for trend in trends],
+            [trend["score"] for trend in trends],
+            [trend["velocity"] for trend in trends],
+            [trend["period_start"] for trend in trends],
+            [trend["period_end"] for trend in trends],
+            [
+                json.dumps({
+                    "mention_count": trend["mention_count"],
+                    "sentiment_score": trend["sentiment_score"],
+                    "acceleration": trend["acceleration"],
+                    "burst": trend["burst"]
+                })
+                for trend in trends
+            ]
+        )
+
+async def get_saved_trends(
+    workspace_id: str,
+    platform: Optional[str] = None,
+    days: int = 7,
+    limit: int = 50
+) -> List[dict]:
+    """Latest persisted trend per platform and tag within the last ``days``"""
+    query = """
+        SELECT * FROM (
+            SELECT DISTINCT ON (platform, tag)
+                tag, platform::text AS platform, score, velocity,
+                period_start, period_end, meta_json
+            FROM trends
+            WHERE workspace_id = $1
+            AND ($2::text IS NULL OR platform::text = $2)
+            AND period_end > (NOW() AT TIME ZONE 'UTC') - make_interval(days => $3)
+            ORDER BY platform, tag, period_end DESC
+        ) latest
+        ORDER BY score DESC
+        LIMIT $4
+    """
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(query, workspace_id, platform, days, limit)
+
+    trends = []
+    for row in rows:
+        meta = row["meta_json"]
+        meta = json.loads(meta) if isinstance(meta, str) else (meta or {})
+        trends.append({
+            "tag": row["tag"],
+            "platform": row["platform"],
+            "score": row["score"],
+            "velocity": row["velocity"],
+            "acceleration": meta.get("acceleration", 0.0),
+            "burst": meta.get("burst", 0.0),
+            "mention_count": meta.get("mention_count", 0),
+            "sentiment_score": meta.get("sentiment_score", 0.0),
+            "period_start": row["period_start"],
+            "period_end": row["period_end"]
+        })
+    return trends
@@ -17,8 +17,12 @@ import uvicorn
 from app.core.config import get_settings
 from app.core.logging import setup_logging
 from app.api.routers import nlp, trends, recommendations, health
-from app.core.models import download_models
+from app.core.models import start_model_loading
 from app.core.database import get_db_connection
+from app.core.embedding_store import check_shared_store_dir
+from app.core.scheduler import start_schedulers, stop_schedulers
+from app.core.jobs import job_runner
+from app.core.stats import stats_reconciler
 
 # Setup logging
 setup_logging()
@@ -29,13 +33,14 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     logger.info("🤖 Starting Arc ML Service...")
     
-    # Download and cache models
-    try:
-        await download_models()
-        logger.info("✅ Models loaded successfully")
-    except Exception as e:
-        logger.error(f"❌ Failed to load models: {e}")
-        raise
+    # Claim jobs write every workspace's embeddings from every instance
+    check_shared_store_dir()
+    
+    # Load models in the background; each serves requests once ready (see /health/ready)
+    start_model_loading()
+    
+    # Start inference schedulers
+    start_schedulers()
     
     # Test database connection
     try:
@@ -46,9 +51,18 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Database connection failed: {e}")
         # Don't fail startup, but log the error
     
+    # Resume interrupted analysis jobs
+    await job_runner.start()
+    
+    # Correct drift in the incrementally maintained stats counters
+    stats_reconciler.start()
+    
     yield
     
     logger.info("🛑 Shutting down Arc ML Service...")
+    await stats_reconciler.stop()
+    await job_runner.stop()
+    stop_schedulers()
 
 # Create FastAPI app
 app = FastAPI(
@@ -100,13 +114,18 @@ async def global_exception_handler(request, exc):
 
 if __name__ == "__main__":
     settings = get_settings()
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.environment == "development",
-        log_level="info"
-    )
+    if settings.serve_workers > 1:
+        # Load models once and fork workers sharing the weights
+        from app.core.serving import serve
+        serve(app)
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=settings.environment == "development",
+            log_level="info"
+        )
 
 
 
@@ -0,0 +1,39 @@
+"""
+Embed the comments of workspaces that have no stored embedding yet
+
+The pipeline stores embeddings of the comments it analyzes; comments
+analyzed before the embedding store existed are only searchable after
+this backfill. Also brings each workspace's search index up to date.
+
+    python -m scripts.backfill_embeddings WORKSPACE_ID [WORKSPACE_ID ...]
+"""
+
+import argparse
+import asyncio
+
+from app.core.ann import workspace_ann_index
+from app.core.database import close_db, initialize_db
+from app.core.embedding_store import backfill_workspace_embeddings
+from app.core.models import model_manager
+
+async def run(workspace_ids: list[str], page_size: int) -> None:
+    await model_manager.download_models()
+    await initialize_db()
+    try:
+        for workspace_id in workspace_ids:
+            added = await backfill_workspace_embeddings(workspace_id, page_size=page_size)
+            index = workspace_ann_index(workspace_id)
+            encoded = await asyncio.to_thread(index.sync) if index is not None else 0
+            print(f"{workspace_id}: {added} embeddings stored, {encoded} rows indexed")
+    finally:
+        await close_db()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("workspace_ids", nargs="+")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.workspace_ids, args.page_size))
+
+if __name__ == "__main__":
+    main()
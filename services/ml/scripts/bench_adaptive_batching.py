@@ -0,0 +1,119 @@
+"""
+Adaptive batch sizing against fixed token budgets under a memory ceiling
+
+Simulates an encoder whose activation memory per padded token grows with
+sequence length (attention) by really allocating it with NumPy, so the
+sizer measures peak memory from the kernel as it does in production. A
+batch whose allocation would take the process over --ceiling-mb raises
+MemoryError, standing in for the allocator failure (or the OOM kill) a
+real pod hits. The workload mixes short and long comments in shifting
+proportions. Reports failed texts, peak memory, batch latency and
+throughput (of texts labelled) for a few fixed budgets and for the adaptive sizer.
+
+    python -m scripts.bench_adaptive_batching --ceiling-mb 400 --latency-ms 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from app.core.batching import AdaptiveBatchSizer, _status_bytes, is_allocation_error, plan_token_batches
+
+def _workload(rng: random.Random, requests: int, texts: int) -> list[list[int]]:
+    """Token lengths per request; later requests carry more long comments"""
+    workload = []
+    for r in range(requests):
+        long_share = 0.05 + 0.4 * r / requests
+        workload.append([
+            rng.randint(200, 512) if rng.random() < long_share else rng.randint(8, 60)
+            for _ in range(texts)
+        ])
+    return workload
+
+class _Encoder:
+    """Allocates activations of bytes_per_token * (1 + length / 128) per padded token"""
+
+    def __init__(self, bytes_per_token: int, ceiling: int):
+        self.bytes_per_token = bytes_per_token
+        self.ceiling = ceiling
+        self.peak = 0
+        self.tokens = 0
+        self.latencies: list[float] = []
+
+    def __call__(self, lengths: list[int], batch: list[int]) -> None:
+        padded = max(lengths[i] for i in batch)
+        size = int(len(batch) * padded * self.bytes_per_token * (1 + padded / 128))
+        resident = _status_bytes("VmRSS") or 0
+        if resident + size > self.ceiling:
+            raise MemoryError(f"can't allocate memory: {size} bytes")
+        started = time.perf_counter()
+        activations = np.ones(size // 8)
+        activations *= 1.0001
+        self.peak = max(self.peak, _status_bytes("VmRSS") or 0)
+        del activations
+        self.tokens += sum(lengths[i] for i in batch)
+        self.latencies.append(time.perf_counter() - started)
+
+def _run_fixed(workload, encoder: _Encoder, budget: int) -> int:
+    failed = 0
+    for lengths in workload:
+        try:
+            for batch in plan_token_batches(lengths, budget, 1000):
+                encoder(lengths, batch)
+        except Exception as e:
+            if not is_allocation_error(e):
+                raise
+            # The old path labels the whole request NEU
+            failed += len(lengths)
+    return failed
+
+def _run_adaptive(workload, encoder: _Encoder, sizer: AdaptiveBatchSizer) -> int:
+    failed = 0
+    for lengths in workload:
+        failed += len(sizer.run(lengths, lambda batch: encoder(lengths, batch), 1000))
+    return failed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--texts", type=int, default=500, help="texts per request")
+    parser.add_argument("--bytes-per-token", type=int, default=4000)
+    parser.add_argument("--ceiling-mb", type=int, default=250, help="process memory at which allocation fails")
+    parser.add_argument("--limit-mb", type=int, help="sizer memory limit; default 80%% of the ceiling")
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    workload = _workload(random.Random(0), args.requests, args.texts)
+    ceiling = args.ceiling_mb * 2**20
+    limit = (args.limit_mb or int(args.ceiling_mb * 0.8)) * 2**20
+    print(f"{args.requests} requests of {args.texts} texts, allocation fails above {args.ceiling_mb} MB")
+
+    runs = [(f"fixed {budget}", budget) for budget in (4096, 8192, 32768)] + [("adaptive", None)]
+    for name, budget in runs:
+        encoder = _Encoder(args.bytes_per_token, ceiling)
+        started = time.perf_counter()
+        if budget is None:
+            sizer = AdaptiveBatchSizer(
+                "bench", initial_tokens=8192, max_tokens=65536,
+                memory_limit=limit, latency_target=args.latency_ms / 1000
+            )
+            failed = _run_adaptive(workload, encoder, sizer)
+        else:
+            failed = _run_fixed(workload, encoder, budget)
+        elapsed = time.perf_counter() - started
+        p95 = statistics.quantiles(encoder.latencies, n=20)[-1] * 1000 if len(encoder.latencies) > 1 else 0.0
+        print(
+            f"  {name:<12} failed texts {failed:6d}  peak {encoder.peak / 2**20:6.0f} MB  "
+            f"batches {len(encoder.latencies):5d}  p95 batch {p95:6.0f}ms  {encoder.tokens / elapsed:10,.0f} tokens/s"
+        )
+        if budget is None:
+            stats = sizer.stats()
+            print(f"    backoffs {stats['backoffs']}, caps " + ", ".join(
+                f"{length}: {bucket['cap']}" for length, bucket in stats["buckets"].items()
+            ))
+
+if __name__ == "__main__":
+    main()
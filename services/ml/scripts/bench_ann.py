@@ -0,0 +1,107 @@
+"""
+Comment search recall and latency: IVF-PQ against brute force
+
+Fills a scratch embedding store with synthetic unit vectors clustered
+around topic directions (like sentence embeddings of comments, which
+are far from uniform), trains the IVF-PQ index the way the pipeline
+does, then runs held-out queries and reports recall@10 against the exact
+brute-force top 10 and median latency for several nprobe / rerank
+settings. Pass --embeddings with an .npy of real MiniLM comment
+embeddings to measure on those instead.
+
+    python -m scripts.bench_ann --rows 1000000 --dtype float16
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+DIM = 384
+
+def _synthetic(rng: np.random.Generator, rows: int, topics: int) -> np.ndarray:
+    centers = rng.standard_normal((topics, DIM)).astype(np.float32)
+    # Topic sizes are skewed, a few big ones and a long tail
+    weights = 1.0 / np.arange(1, topics + 1) ** 0.8
+    assignment = rng.choice(topics, rows, p=weights / weights.sum())
+    vectors = np.empty((rows, DIM), dtype=np.float32)
+    for start in range(0, rows, 65536):
+        chunk = assignment[start:start + 65536]
+        noise = rng.standard_normal((len(chunk), DIM)).astype(np.float32)
+        vectors[start:start + len(chunk)] = centers[chunk] + noise
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--embeddings", type=Path, help=".npy of real comment embeddings")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="required at the default settings")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ["EMBEDDING_STORE_DIR"] = scratch
+        os.environ["EMBEDDING_STORE_DTYPE"] = args.dtype
+        os.environ["ANN_MIN_ROWS"] = "1"
+
+        from app.core.ann import workspace_ann_index
+        from app.core.config import get_settings
+        from app.core.embedding_store import workspace_store
+
+        rng = np.random.default_rng(0)
+        if args.embeddings:
+            vectors = np.load(args.embeddings).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        else:
+            vectors = _synthetic(rng, args.rows + args.queries, args.topics)
+        queries, vectors = vectors[:args.queries], vectors[args.queries:]
+
+        store = workspace_store("bench", DIM)
+        for start in range(0, len(vectors), 100_000):
+            store.add([f"c{i}" for i in range(start, min(start + 100_000, len(vectors)))],
+                      vectors[start:start + 100_000])
+        index = workspace_ann_index("bench")
+
+        started = time.perf_counter()
+        index.sync()
+        stats = index.stats()
+        print(
+            f"{stats['rows']} rows, {stats['lists']} lists, {stats['subspaces']} code bytes per row, "
+            f"trained and encoded in {time.perf_counter() - started:.1f}s"
+        )
+
+        def run(**options) -> tuple[list[list[str]], float]:
+            results, timings = [], []
+            for query in queries:
+                started = time.perf_counter()
+                results.append([comment_id for comment_id, _ in index.search(query, k=10, **options)])
+                timings.append(time.perf_counter() - started)
+            return results, statistics.median(timings) * 1000
+
+        truth, exact_ms = run(exact=True)
+        print(f"{'brute force':<24} recall@10 1.000  {exact_ms:8.2f}ms")
+
+        settings = get_settings()
+        default_recall = None
+        for nprobe, rerank in ((1, 100), (4, 100), (8, 200), (settings.ann_nprobe, settings.ann_rerank),
+                               (32, 400), (64, 1000)):
+            found, latency = run(nprobe=nprobe, rerank=rerank)
+            recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, truth)])
+            if (nprobe, rerank) == (settings.ann_nprobe, settings.ann_rerank):
+                default_recall = recall
+            print(
+                f"{f'nprobe {nprobe} rerank {rerank}':<24} recall@10 {recall:.3f}  {latency:8.2f}ms "
+                f"({exact_ms / latency:.0f}x)"
+            )
+
+    if default_recall < args.min_recall:
+        raise SystemExit(f"recall@10 {default_recall:.3f} at the default settings is below {args.min_recall}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Near-duplicate grouping on a synthetic copypasta flood
+
+Mixes unique comments with campaigns that repeat a message with changed
+casing, emoji, @mentions, links and (for longer messages) one swapped
+word. Some unique comments are near misses that must stay apart: a
+campaign message negated with one inserted "not" (grouping it would copy
+the campaign's sentiment onto it), or with a third of its words replaced.
+Resolves pipeline-sized pages with a counting stand-in for the model.
+Reports how many inferences were saved, cluster purity (no two campaigns
+or unique comments merged), campaign recall, and the grouping overhead
+per page, per batch and with the workspace window. ``--thresholds``
+sweeps the similarity threshold and reports pairwise precision and
+recall of the groups instead.
+
+    python -m scripts.bench_dedup --comments 20000 --campaigns 200
+    python -m scripts.bench_dedup --thresholds 0.3,0.4,0.5,0.6,0.7,0.8,0.9
+"""
+
+import argparse
+import random
+import time
+from collections import Counter, defaultdict
+from math import comb
+
+from app.core.config import get_settings
+from app.core.dedup import NearDuplicateIndex, resolve_near_duplicates
+
+EMOJI = ["🔥", "😂", "💯", "🙏", "😍", "👀", "🚀", ""]
+
+def _sentence(rng: random.Random, vocabulary: list[str], words: int) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+def _variant(rng: random.Random, message: str, vocabulary: list[str]) -> str:
+    words = message.split()
+    if len(words) >= 12 and rng.random() < 0.5:
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    text = " ".join(words)
+    text = rng.choice([text, text.upper(), text.title(), text.capitalize()])
+    if rng.random() < 0.5:
+        text = f"@user{rng.randrange(10_000)} {text}"
+    if rng.random() < 0.3:
+        text = f"{text} https://t.co/{rng.randrange(10**8):x}"
+    return f"{text} {rng.choice(EMOJI)}{rng.choice(EMOJI)}".strip()
+
+def _dataset(args: argparse.Namespace) -> tuple[list[str], list[int]]:
+    """Texts and their origin (campaign id, campaigns + id if negated, or -1 - i for unique comment i)"""
+    rng = random.Random(5)
+    vocabulary = [f"w{i}" for i in range(5000)] + ["great", "video", "love", "this", "scam", "free", "crypto"]
+    campaigns = [_sentence(rng, vocabulary, rng.randint(4, 25)) for _ in range(args.campaigns)]
+
+    texts, origins = [], []
+    for i in range(args.comments):
+        if rng.random() < args.duplicate_share:
+            campaign = rng.randrange(args.campaigns)
+            texts.append(_variant(rng, campaigns[campaign], vocabulary))
+            origins.append(campaign)
+        elif rng.random() < args.near_miss_share:
+            campaign = rng.randrange(args.campaigns)
+            if rng.random() < 0.5:
+                # Negations of one message may group with each other
+                words = _variant(rng, campaigns[campaign], vocabulary).split()
+                words.insert(rng.randrange(len(words) + 1), "not")
+                texts.append(" ".join(words))
+                origins.append(args.campaigns + campaign)
+            else:
+                words = campaigns[campaign].split()
+                for position in rng.sample(range(len(words)), max(2, len(words) // 3)):
+                    words[position] = rng.choice(vocabulary)
+                texts.append(_variant(rng, " ".join(words), vocabulary))
+                origins.append(-1 - i)
+        else:
+            texts.append(_sentence(rng, vocabulary, rng.randint(3, 30)))
+            origins.append(-1 - i)
+    return texts, origins
+
+def _run(texts: list[str], origins: list[int], page_size: int, window: bool, threshold: float) -> dict:
+    settings = get_settings()
+    index = NearDuplicateIndex(
+        threshold,
+        settings.dedup_num_perm,
+        max_leaders=settings.dedup_window_size,
+        ttl_seconds=settings.dedup_window_seconds
+    ) if window else None
+
+    computed = 0
+    members = defaultdict(Counter)
+    page_seconds = []
+
+    for start in range(0, len(texts), page_size):
+        page = texts[start:start + page_size]
+
+        def compute(representatives: list[str]) -> list[int]:
+            nonlocal computed
+            computed += len(representatives)
+            # The value identifies the text it was computed from
+            return [hash(text) for text in representatives]
+
+        started = time.perf_counter()
+        page_index = index if index is not None else NearDuplicateIndex(threshold, settings.dedup_num_perm)
+        values, _ = resolve_near_duplicates(page, "bench", compute, index=page_index)
+        page_seconds.append(time.perf_counter() - started)
+
+        for offset, value in enumerate(values):
+            members[value][origins[start + offset]] += 1
+
+    impure = sum(1 for origin_set in members.values() if len(origin_set) > 1)
+    # Pairs of texts grouped together, and those of them from one campaign
+    grouped = sum(comb(sum(origin_set.values()), 2) for origin_set in members.values())
+    correct = sum(comb(count, 2) for origin_set in members.values() for count in origin_set.values())
+    related = sum(comb(count, 2) for count in Counter(origins).values())
+    campaign_clusters = defaultdict(int)
+    for origin_set in members.values():
+        for origin in origin_set:
+            if origin >= 0:
+                campaign_clusters[origin] += 1
+
+    return {
+        "computed": computed,
+        "impure": impure,
+        "clusters": len(members),
+        "clusters_per_campaign": sum(campaign_clusters.values()) / max(len(campaign_clusters), 1),
+        "precision": correct / grouped if grouped else 1.0,
+        "recall": correct / related if related else 1.0,
+        "page_ms": 1000 * sum(page_seconds) / len(page_seconds)
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--comments", type=int, default=20_000)
+    parser.add_argument("--campaigns", type=int, default=200)
+    parser.add_argument("--duplicate-share", type=float, default=0.4)
+    parser.add_argument("--near-miss-share", type=float, default=0.1, help="of the unique comments")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--thresholds", help="comma-separated thresholds to sweep with the workspace window")
+    args = parser.parse_args()
+
+    texts, origins = _dataset(args)
+    settings = get_settings()
+
+    if args.thresholds:
+        print(f"{len(texts)} comments, {sum(o >= 0 for o in origins)} from {args.campaigns} campaigns")
+        for threshold in (float(value) for value in args.thresholds.split(",")):
+            result = _run(texts, origins, args.page_size, True, threshold)
+            print(
+                f"threshold {threshold:.2f}  precision {result['precision']:.4f}  recall {result['recall']:.4f}  "
+                f"impure clusters {result['impure']:>3}  clusters per campaign {result['clusters_per_campaign']:>5.1f}  "
+                f"inferences {result['computed']:>6}"
+            )
+        return
+
+    print(
+        f"{len(texts)} comments, {sum(o >= 0 for o in origins)} from {args.campaigns} campaigns, "
+        f"threshold {settings.dedup_threshold}, {settings.dedup_num_perm} permutations"
+    )
+
+    failed = False
+    for label, window in (("per page", False), ("workspace window", True)):
+        result = _run(texts, origins, args.page_size, window, settings.dedup_threshold)
+        print(
+            f"{label:<17} inferences {result['computed']:>6} ({1 - result['computed'] / len(texts):.0%} saved), "
+            f"impure clusters {result['impure']}, clusters per campaign {result['clusters_per_campaign']:.1f}, "
+            f"{result['page_ms']:.1f}ms per {args.page_size}-text page"
+        )
+        failed = failed or result["impure"] > 0
+
+    if failed:
+        raise SystemExit("distinct texts were merged into one cluster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Embedding store append, read and maintenance checks
+
+Appends random unit embeddings to a scratch store in pipeline-sized
+pages, then checks that reads are zero-copy, that float16 and int8 rows
+come back within their quantization error, that superseded and deleted
+comments disappear, that compaction keeps every live row, and that
+several processes appending to one store lose nothing. Reports append
+throughput, file size per row and compaction time.
+
+    python -m scripts.bench_embedding_store --rows 200000 --dtype int8
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.core.embedding_store import EmbeddingStore
+
+DIM = 384
+
+def _unit_vectors(rng: np.random.Generator, count: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _append_worker(path: str, dtype: str, worker: int, pages: int, page_size: int) -> None:
+    store = EmbeddingStore(Path(path), DIM, dtype)
+    rng = np.random.default_rng(worker)
+    for page in range(pages):
+        ids = [f"w{worker}-{page}-{i}" for i in range(page_size)]
+        store.add(ids, _unit_vectors(rng, page_size))
+
+def _check(condition: bool, message: str, failures: list[str]) -> None:
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        failures.append(message)
+
+def run(args: argparse.Namespace, root: Path) -> list[str]:
+    failures: list[str] = []
+    rng = np.random.default_rng(0)
+    store = EmbeddingStore(root / "single", DIM, args.dtype)
+    embeddings = _unit_vectors(rng, args.rows)
+    ids = [f"c{i}" for i in range(args.rows)]
+
+    started = time.perf_counter()
+    for start in range(0, args.rows, args.page_size):
+        store.add(ids[start:start + args.page_size], embeddings[start:start + args.page_size])
+    elapsed = time.perf_counter() - started
+    size = sum(path.stat().st_size for path in (root / "single").rglob("*.bin"))
+    print(
+        f"appended {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s), "
+        f"{size / args.rows:.0f} bytes per row on disk"
+    )
+
+    view_ids, vectors, _, live = store.view()
+    _check(isinstance(vectors, np.memmap) and not vectors.flags.owndata, "view is a memory map, not a copy", failures)
+    _check(view_ids == ids and bool(live.all()), "view lists every row in append order", failures)
+
+    sample = ids[::max(args.rows // 1000, 1)]
+    found, got = store.get(sample)
+    expected = embeddings[[int(i[1:]) for i in found]]
+    error = float(np.abs(got - expected).max())
+    # Half a float16 ulp near 1, or half an int8 step of the largest component
+    bound = 2 ** -11 if args.dtype == "float16" else 0.5 * float(np.abs(expected).max()) / 127 + 1e-6
+    _check(found == sample and error <= bound, f"get returns stored rows (max error {error:.2e})", failures)
+    similarity = float(np.einsum("nd,nd->n", got, expected).min())
+    print(f"     min cosine to the original {similarity:.5f}")
+
+    # Re-adding a comment supersedes its old row
+    replacement = _unit_vectors(rng, 1)
+    store.add(["c0"], replacement)
+    _, got = store.get(["c0"])
+    _check(np.allclose(got, replacement, atol=1e-2) and len(store) == args.rows, "re-adding supersedes", failures)
+
+    doomed = ids[1:args.rows // 3]
+    deleted = store.delete(doomed + ["never-stored"])
+    _check(deleted == len(doomed) and "c1" not in store, "delete tombstones only stored comments", failures)
+
+    survivor_ids = ["c0"] + ids[args.rows // 3:]
+    _, before = store.get(survivor_ids)
+    reader = EmbeddingStore(root / "single", DIM, args.dtype)
+    held_ids, held_vectors, _, _ = reader.view()
+    started = time.perf_counter()
+    dropped = store.compact()
+    compact_ms = (time.perf_counter() - started) * 1000
+    found, after = store.get(survivor_ids)
+    _check(
+        dropped == len(doomed) + 1 and found == survivor_ids and np.array_equal(before, after),
+        f"compaction drops {dropped} dead rows in {compact_ms:.0f}ms and keeps every live row",
+        failures
+    )
+    _check(
+        float(np.abs(np.asarray(held_vectors[-1], dtype=np.float32)).sum()) > 0 and len(reader) == len(survivor_ids),
+        "a reader keeps its old map and then follows the new generation",
+        failures
+    )
+
+    shared = root / "shared"
+    EmbeddingStore(shared, DIM, args.dtype)
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_append_worker, args=(str(shared), args.dtype, w, 20, 100))
+        for w in range(args.processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    shared_ids, shared_vectors, _, _ = EmbeddingStore(shared, DIM, args.dtype).view()
+    _check(
+        len(set(shared_ids)) == len(shared_ids) == args.processes * 2000 == shared_vectors.shape[0],
+        f"{args.processes} processes appending concurrently lose no rows",
+        failures
+    )
+    return failures
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        failures = run(args, Path(scratch))
+    if failures:
+        raise SystemExit(f"{len(failures)} checks failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Keyword extraction: c-TF-IDF fast mode against KeyBERT
+
+Runs both keyword modes over the same comments, grouped by content item
+as the analysis pipeline does, and reports throughput and how much the
+fast keywords agree with KeyBERT's: the share of KeyBERT keywords the
+fast mode also returns, by exact phrase and by shared word. Comments come
+from a workspace (--workspace, needs DATABASE_URL) or are generated from
+a few templated topics. --fast-only skips KeyBERT when the embedding
+model is not available.
+
+    python -m scripts.bench_keywords_fast --workspace WORKSPACE_ID --comments 5000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.core.models import extract_keywords_batch
+
+TOPICS = {
+    "battery": ["battery life", "charging speed", "battery drains", "fast charger", "overnight charge"],
+    "camera": ["camera quality", "low light photos", "portrait mode", "zoom lens", "video stabilization"],
+    "price": ["too expensive", "price increase", "subscription cost", "worth the money", "discount code"],
+    "audio": ["sound quality", "mic quality", "background noise", "audio sync", "volume levels"],
+    "support": ["customer support", "refund request", "support ticket", "waited weeks", "no reply"],
+}
+TEMPLATES = [
+    "honestly the {a} is what sold me, but the {b} could be better",
+    "anyone else notice the {a}? {b} is also a problem for me",
+    "I came here for the {a} review and stayed for the {b} part",
+    "the {a} section at the end was great, please do more on {b}",
+    "{a} has been awful since the update and {b} too",
+]
+
+def _synthetic(comments: int, items: int, rng: random.Random) -> tuple[list[str], list[str]]:
+    # Each content item is mostly about one topic, with some off-topic comments
+    item_topics = [rng.choice(list(TOPICS)) for _ in range(items)]
+    texts, groups = [], []
+    for _ in range(comments):
+        item = rng.randrange(items)
+        topic = item_topics[item] if rng.random() < 0.8 else rng.choice(list(TOPICS))
+        a, b = rng.sample(TOPICS[topic], 2)
+        texts.append(rng.choice(TEMPLATES).format(a=a, b=b))
+        groups.append(f"item-{item}")
+    return texts, groups
+
+async def _load_workspace(workspace_id: str, comments: int) -> tuple[list[str], list[str]]:
+    from app.core.database import close_db, get_db_connection
+
+    try:
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT c.text, c.content_item_id
+                FROM comments c
+                JOIN content_items ci ON c.content_item_id = ci.id
+                JOIN channels ch ON ci.channel_id = ch.id
+                WHERE ch.workspace_id = $1
+                ORDER BY c.created_at DESC
+                LIMIT $2
+                """,
+                workspace_id,
+                comments
+            )
+    finally:
+        await close_db()
+    return [row["text"] for row in rows], [row["content_item_id"] for row in rows]
+
+def _timed(texts: list[str], page_size: int, **options) -> tuple[list[list[str]], float]:
+    keywords: list[list[str]] = []
+    started = time.perf_counter()
+    for start in range(0, len(texts), page_size):
+        page = slice(start, start + page_size)
+        groups = options.get("groups")
+        keywords.extend(extract_keywords_batch(
+            texts[page], top_k=5, mode=options.get("mode", "keybert"),
+            groups=groups[page] if groups is not None else None
+        ))
+    return keywords, time.perf_counter() - started
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workspace")
+    parser.add_argument("--comments", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=50, help="content items for synthetic comments")
+    parser.add_argument("--page-size", type=int, default=500, help="comments per pipeline page")
+    parser.add_argument("--fast-only", action="store_true")
+    args = parser.parse_args()
+
+    if args.workspace:
+        texts, groups = asyncio.run(_load_workspace(args.workspace, args.comments))
+    else:
+        texts, groups = _synthetic(args.comments, args.items, random.Random(0))
+
+    fast, fast_seconds = _timed(texts, args.page_size, mode="fast", groups=groups)
+    print(f"{len(texts)} comments in pages of {args.page_size}")
+    print(f"  fast     {len(texts) / fast_seconds:10,.0f} comments/s")
+    if args.fast_only:
+        for text, keywords in list(zip(texts, fast))[:5]:
+            print(f"    {text[:60]!r}: {keywords}")
+        return
+
+    from app.core.models import model_manager
+
+    model_manager._load_embedding_model()
+    # Repeated texts hit the keyword result cache, as they would in the pipeline
+    keybert, keybert_seconds = _timed(texts, args.page_size)
+    print(f"  keybert  {len(texts) / keybert_seconds:10,.0f} comments/s "
+          f"({keybert_seconds / fast_seconds:.0f}x slower)")
+
+    phrase_overlap, word_overlap = [], []
+    for reference, candidate in zip(keybert, fast):
+        if not reference:
+            continue
+        phrase_overlap.append(len(set(reference) & set(candidate)) / len(reference))
+        candidate_words = {word for phrase in candidate for word in phrase.split()}
+        word_overlap.append(
+            sum(1 for phrase in reference if set(phrase.split()) & candidate_words) / len(reference)
+        )
+    print(f"  KeyBERT keywords also returned by fast mode: {statistics.mean(phrase_overlap):.0%} exact, "
+          f"{statistics.mean(word_overlap):.0%} sharing a word")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Cold-start time of bundle loading versus from_pretrained
+
+Builds the sentiment and embedding bundles if needed, then loads each
+model in fresh interpreter processes, once through today's
+from_pretrained / SentenceTransformer path and once from the mmapped
+bundle. Reports the median load time (imports excluded), resident memory
+and how much of it is private to the process; bundle weights show up as
+shared file-backed pages rather than private heap. Drop the page cache
+between runs to measure a truly cold host.
+
+    python -m scripts.bench_model_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ("from_pretrained", "bundle")
+
+def _memory_mb() -> dict:
+    """Resident and private memory of this process from /proc"""
+    rss = private = 0
+    try:
+        with open("/proc/self/smaps_rollup") as handle:
+            for line in handle:
+                parts = line.split()
+                if len(parts) != 3 or parts[2] != "kB":
+                    continue
+                field, kilobytes = parts[0].rstrip(":"), int(parts[1])
+                if field == "Rss":
+                    rss = kilobytes
+                elif field in ("Private_Clean", "Private_Dirty"):
+                    private += kilobytes
+    except OSError:
+        pass
+    return {"rss_mb": rss / 1024, "private_mb": private / 1024}
+
+def _child(model: str, mode: str) -> None:
+    """Load one model one way and print timings as JSON"""
+    import torch  # noqa: F401 (import cost is the same for both paths)
+    import transformers  # noqa: F401
+    import sentence_transformers  # noqa: F401
+
+    from app.core.bundles import bundle_dir, load_mmapped_model, load_sentence_transformer
+    from app.core.config import get_settings
+    from app.core.registry import embedding_repo_id
+
+    settings = get_settings()
+    started = time.perf_counter()
+
+    if model == "sentiment":
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        path = bundle_dir(settings.model_cache_dir, "sentiment", settings.sentiment_model)
+        source = str(path) if mode == "bundle" else settings.sentiment_model
+        cache_dir = os.path.join(settings.model_cache_dir, "sentiment")
+        AutoTokenizer.from_pretrained(source, cache_dir=cache_dir)
+        if mode == "bundle":
+            loaded = load_mmapped_model(AutoModelForSequenceClassification, path)
+        else:
+            loaded = AutoModelForSequenceClassification.from_pretrained(source, cache_dir=cache_dir)
+    else:
+        from sentence_transformers import SentenceTransformer
+
+        repo = embedding_repo_id(settings.embedding_model)
+        if mode == "bundle":
+            loaded = load_sentence_transformer(bundle_dir(settings.model_cache_dir, "embeddings", repo))
+        else:
+            loaded = SentenceTransformer(
+                repo, cache_folder=os.path.join(settings.model_cache_dir, "embeddings")
+            )
+
+    elapsed = time.perf_counter() - started
+    assert loaded is not None
+    print(json.dumps({"seconds": elapsed, **_memory_mb()}))
+
+def _ensure_bundles() -> None:
+    from app.core.bundles import (
+        SENTENCE_TRANSFORMERS_BUNDLE,
+        TRANSFORMERS_BUNDLE,
+        build_bundle,
+        bundle_dir,
+        read_bundle
+    )
+    from app.core.config import get_settings
+    from app.core.registry import embedding_repo_id
+
+    settings = get_settings()
+
+    path = bundle_dir(settings.model_cache_dir, "sentiment", settings.sentiment_model)
+    if read_bundle(path, settings.sentiment_model) is None:
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        cache_dir = os.path.join(settings.model_cache_dir, "sentiment")
+        build_bundle(
+            path,
+            TRANSFORMERS_BUNDLE,
+            settings.sentiment_model,
+            AutoModelForSequenceClassification.from_pretrained(settings.sentiment_model, cache_dir=cache_dir),
+            AutoTokenizer.from_pretrained(settings.sentiment_model, cache_dir=cache_dir)
+        )
+
+    repo = embedding_repo_id(settings.embedding_model)
+    path = bundle_dir(settings.model_cache_dir, "embeddings", repo)
+    if read_bundle(path, repo) is None:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(
+            repo, cache_folder=os.path.join(settings.model_cache_dir, "embeddings"), device="cpu"
+        )
+        build_bundle(path, SENTENCE_TRANSFORMERS_BUNDLE, repo, model)
+
+def _run(model: str, mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "scripts.bench_model_startup", "--child", model, mode],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--models", nargs="+", default=["sentiment", "embeddings"], choices=["sentiment", "embeddings"])
+    parser.add_argument("--child", nargs=2, metavar=("MODEL", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(*args.child)
+        return
+
+    _ensure_bundles()
+
+    print(f"{'model':<11} {'mode':<16} {'median_s':>9} {'min_s':>7} {'rss_mb':>8} {'private_mb':>11}")
+    for model in args.models:
+        baseline = None
+        for mode in MODES:
+            runs = [_run(model, mode) for _ in range(args.runs)]
+            seconds = [run["seconds"] for run in runs]
+            median = statistics.median(seconds)
+            baseline = baseline or median
+            print(
+                f"{model:<11} {mode:<16} {median:>9.3f} {min(seconds):>7.3f} "
+                f"{runs[-1]['rss_mb']:>8.0f} {runs[-1]['private_mb']:>11.0f}"
+                + (f"   {baseline / median:.1f}x faster" if mode == "bundle" else "")
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Accuracy parity and throughput of the sentiment inference backends
+
+Runs a fixed labelled evaluation set through every backend (PyTorch fp32,
+PyTorch dynamic INT8, ONNX Runtime fp32 and INT8) using the service's own
+token-bucketed batching. Reports accuracy against the gold labels, label
+agreement and max probability drift against fp32, and throughput. Exits
+non-zero if any backend's agreement with fp32 falls below --min-agreement.
+
+    python -m scripts.bench_sentiment_backends --repeat 20
+    python -m scripts.bench_sentiment_backends --csv labelled.csv --backends torch onnx-int8
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+# Fixed evaluation set of social comments: (text, gold label)
+EVAL_SET = [
+    ("love this so much, best video this week!!!", "POS"),
+    ("this is exactly what I needed, thank you", "POS"),
+    ("absolutely stunning footage, subscribed", "POS"),
+    ("great explanation, finally understood it", "POS"),
+    ("you guys never miss 🔥🔥", "POS"),
+    ("the new feature is a game changer for my workflow", "POS"),
+    ("customer support sorted my issue in minutes, impressed", "POS"),
+    ("can't stop watching this, so wholesome", "POS"),
+    ("best purchase I've made all year", "POS"),
+    ("the editing on this is top notch", "POS"),
+    ("happy to see you back, missed these videos", "POS"),
+    ("this made my day honestly", "POS"),
+    ("wow the quality keeps getting better", "POS"),
+    ("such a helpful tutorial, saved me hours", "POS"),
+    ("great value for the price, would recommend", "POS"),
+    ("this is the worst update you've ever shipped", "NEG"),
+    ("waste of money, broke after two days", "NEG"),
+    ("so disappointed with the customer service", "NEG"),
+    ("unsubscribed, the clickbait is getting ridiculous", "NEG"),
+    ("the app keeps crashing since the last update", "NEG"),
+    ("terrible audio, couldn't hear a thing", "NEG"),
+    ("I want a refund, this is a scam", "NEG"),
+    ("why is shipping taking three weeks, awful", "NEG"),
+    ("this video is full of wrong information", "NEG"),
+    ("the price increase is outrageous", "NEG"),
+    ("ads every thirty seconds, unwatchable", "NEG"),
+    ("still waiting for a reply from support, pathetic", "NEG"),
+    ("the new design is confusing and ugly", "NEG"),
+    ("quality has really gone downhill lately", "NEG"),
+    ("I regret buying this", "NEG"),
+    ("what camera do you use for these shots?", "NEU"),
+    ("is this available in Canada?", "NEU"),
+    ("posted at 3pm, watching from Berlin", "NEU"),
+    ("when does the next episode come out", "NEU"),
+    ("the link in the description goes to the store page", "NEU"),
+    ("first time watching this channel", "NEU"),
+    ("does it come in other colours", "NEU"),
+    ("the video is 12 minutes long", "NEU"),
+    ("I think the event is on Saturday", "NEU"),
+    ("which version of the app is this", "NEU"),
+    ("they changed the logo last month", "NEU"),
+    ("can you do a comparison with the older model", "NEU"),
+    ("the tutorial uses version 3.2", "NEU"),
+    ("shipping info is on the website", "NEU"),
+    ("anyone else here from the newsletter", "NEU"),
+    ("the recipe calls for two cups of flour", "NEU"),
+    ("what song is playing at the end", "NEU"),
+    ("the store opens at nine", "NEU")
+]
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+def load_eval_set(path: str) -> list[tuple[str, str]]:
+    with open(path, newline="", encoding="utf-8") as handle:
+        return [(row["text"], row["label"].upper()) for row in csv.DictReader(handle)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--csv", help="labelled evaluation CSV with text,label columns")
+    parser.add_argument("--repeat", type=int, default=10, help="passes over the set for throughput")
+    parser.add_argument("--min-agreement", type=float, default=0.97)
+    args = parser.parse_args()
+
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+    from app.core.backends import build_sentiment_backend
+    from app.core.config import get_settings
+    from app.core.models import model_manager, _analyze_sentiment_uncached
+
+    settings = get_settings()
+    model_name = settings.sentiment_model
+    cache_dir = os.path.join(settings.model_cache_dir, "sentiment")
+
+    eval_set = load_eval_set(args.csv) if args.csv else EVAL_SET
+    texts = [text for text, _ in eval_set]
+    gold = [label for _, label in eval_set]
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+    config = AutoConfig.from_pretrained(model_name, cache_dir=cache_dir)
+    model_manager.tokenizers["sentiment"] = tokenizer
+
+    def load_model():
+        return AutoModelForSequenceClassification.from_pretrained(model_name, cache_dir=cache_dir)
+
+    reference = None
+    failed = False
+    print(f"{len(texts)} evaluation texts, {args.repeat} throughput passes\n")
+    print(f"{'backend':<11} {'accuracy':>8} {'agree':>7} {'max_dp':>7} {'texts/s':>9} {'speedup':>8}")
+
+    for name in ["torch"] + [b for b in args.backends if b != "torch"]:
+        backend = build_sentiment_backend(name, model_name, cache_dir, config.id2label, load_model)
+        model_manager.models["sentiment"] = backend
+
+        results = _analyze_sentiment_uncached(texts)
+        labels = [result["sentiment"] for result in results]
+        probabilities = np.array([[score["score"] for score in result["all_scores"]] for result in results])
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            _analyze_sentiment_uncached(texts)
+        throughput = len(texts) * args.repeat / (time.perf_counter() - started)
+
+        if reference is None:
+            reference = (labels, probabilities, throughput)
+        agreement = np.mean([a == b for a, b in zip(labels, reference[0])])
+        max_drift = float(np.abs(probabilities - reference[1]).max())
+        accuracy = np.mean([a == b for a, b in zip(labels, gold)])
+
+        print(
+            f"{name:<11} {accuracy:>8.3f} {agreement:>7.3f} {max_drift:>7.4f} "
+            f"{throughput:>9.1f} {throughput / reference[2]:>7.2f}x"
+        )
+        if agreement < args.min_agreement:
+            failed = True
+
+    if failed:
+        raise SystemExit(f"a backend agreed with fp32 on fewer than {args.min_agreement:.0%} of texts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Accuracy and merge cost of the per-day tag sketches against exact counts
+
+Streams Zipf-distributed tag mentions into one sketch per day in
+pipeline-sized pages, merges the days of a window the way sketch_trends
+does, and reports build and query time, the largest Space-Saving error
+against N/k, how often Count-Min overshoots by more than (e/w) * N and
+top-50 recall. tests/test_sketches.py asserts the documented bounds.
+
+    python -m scripts.bench_tag_sketches --mentions 2000000 --tags 200000
+"""
+
+import argparse
+import math
+import time
+from collections import Counter
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.sketches import TagSketch
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mentions", type=int, default=2_000_000)
+    parser.add_argument("--tags", type=int, default=200_000, help="vocabulary size")
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--window", type=int, default=7, help="days merged for the checked window")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    rng = np.random.default_rng(11)
+
+    # Zipf ranks folded into the vocabulary, spread uniformly over the days
+    ranks = rng.zipf(args.zipf, size=args.mentions) % args.tags
+    days = rng.integers(0, args.days, size=args.mentions)
+    polarity = rng.integers(-1, 2, size=args.mentions)
+    vocabulary = np.array([f"tag-{i}" for i in range(args.tags)])
+
+    started = time.perf_counter()
+    sketches = []
+    for day in range(args.days):
+        sketch = TagSketch.empty()
+        day_ranks = ranks[days == day]
+        day_polarity = polarity[days == day]
+        for start in range(0, day_ranks.size, args.page_size):
+            page = day_ranks[start:start + args.page_size]
+            counts = Counter(vocabulary[page].tolist())
+            sentiments = Counter()
+            for tag, value in zip(vocabulary[page].tolist(), day_polarity[start:start + args.page_size].tolist()):
+                sentiments[tag] += value
+            sketch.update(dict(counts), dict(sentiments))
+        sketches.append(sketch)
+    build_seconds = time.perf_counter() - started
+
+    window_days = list(range(args.days - args.window, args.days))
+    started = time.perf_counter()
+    window = TagSketch.merge([sketches[day] for day in window_days])
+    candidates = [tag for tag, *_ in window.heavy_hitters.top(settings.tag_sketch_capacity)]
+    daily = np.stack([sketches[day].estimate(candidates) for day in range(args.days)], axis=1)
+    query_seconds = time.perf_counter() - started
+
+    in_window = np.isin(days, window_days)
+    exact = np.bincount(ranks[in_window], minlength=args.tags)
+    total = int(in_window.sum())
+    k = settings.tag_sketch_capacity
+    tracked = window.heavy_hitters.entries
+
+    estimates = window.count_min.estimate_many(vocabulary.tolist()).astype(np.int64)
+    epsilon = math.e / settings.tag_sketch_width
+    delta = math.exp(-settings.tag_sketch_depth)
+    seen = exact > 0
+    overshoot_rate = float(((estimates - exact)[seen] > epsilon * total).mean())
+
+    top_exact = set(np.argsort(-exact)[:50].tolist())
+    top_sketch = {int(tag.split("-")[1]) for tag, *_ in window.heavy_hitters.top(50)}
+    bucket_bytes = np.mean([len(sketch.count_min.to_bytes()) for sketch in sketches])
+
+    print(
+        f"{args.mentions} mentions over {args.days} days, {args.window}-day window N={total}, "
+        f"k={k}, Count-Min {settings.tag_sketch_depth}x{settings.tag_sketch_width}"
+    )
+    print(f"build {build_seconds:.2f}s, window merge + {args.days}-day estimates {query_seconds * 1000:.0f}ms")
+    print(
+        f"max Space-Saving error {max(entry[1] for entry in tracked.values()):.0f} (N/k = {total / k:.0f}), "
+        f"Count-Min overshoot > eN for {overshoot_rate:.3%} of tags (delta {delta:.3%})"
+    )
+    print(f"top-50 recall {len(top_exact & top_sketch) / 50:.0%}, Count-Min bucket ~{bucket_bytes / 1024:.0f} KiB compressed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Topic canonicalization: tag cardinality reduction and lookup throughput
+
+Embeds keyword phrases with the configured embedding model, clusters
+them incrementally in pipeline-sized batches exactly as the writeback
+path does, and reports how many distinct tags remain (also weighted by
+mentions when counts are known), the largest merged topics for eyeballing
+the threshold, and how fast cached phrases map to topics. Phrases come
+from a workspace's stored tags (--workspace, needs DATABASE_URL), a file
+of "phrase<TAB>count" lines (--phrases), or a small built-in set of
+feedback phrases and their variants.
+
+    python -m scripts.bench_topic_canonicalization --workspace WORKSPACE_ID --threshold 0.8
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.topics import TopicCanonicalizer, assign_topics, normalize_phrase
+
+BUILT_IN = [
+    "new feature", "new features", "feature update", "latest update", "the update",
+    "great video", "great videos", "awesome video", "love this video", "loved the video",
+    "sound quality", "audio quality", "bad audio", "audio issues", "mic quality",
+    "battery life", "battery drain", "battery lasts", "charging speed", "fast charging",
+    "customer support", "customer service", "support team", "terrible support",
+    "price increase", "too expensive", "pricing", "subscription price", "price hike",
+    "dark mode", "dark theme", "night mode", "light mode",
+    "app crashes", "app crashing", "keeps crashing", "crash bug", "login bug", "login issues",
+    "shipping delay", "late delivery", "delivery time", "shipping time",
+    "camera quality", "photo quality", "video quality", "4k video",
+    "first comment", "first", "early squad", "notification squad",
+]
+
+def _load_file(path: str) -> Counter:
+    counts: Counter = Counter()
+    with open(path) as handle:
+        for line in handle:
+            phrase, _, count = line.rstrip("\n").partition("\t")
+            if phrase:
+                counts[normalize_phrase(phrase)] += int(count or 1)
+    return counts
+
+async def _load_workspace(workspace_id: str) -> Counter:
+    from app.core.database import close_db, get_db_connection
+
+    try:
+        async with get_db_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT tag, COUNT(*) AS mentions
+                FROM comments c
+                JOIN content_items ci ON c.content_item_id = ci.id
+                JOIN channels ch ON ci.channel_id = ch.id,
+                UNNEST(c.topic_tags) AS tag
+                WHERE ch.workspace_id = $1
+                GROUP BY tag
+                """,
+                workspace_id
+            )
+    finally:
+        await close_db()
+    counts: Counter = Counter()
+    for row in rows:
+        counts[normalize_phrase(row["tag"])] += row["mentions"]
+    return counts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workspace")
+    parser.add_argument("--phrases", help="file of phrase<TAB>count lines")
+    parser.add_argument("--threshold", type=float, default=get_settings().topic_merge_threshold)
+    parser.add_argument("--batch-size", type=int, default=500, help="new phrases per writeback page")
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.workspace:
+        counts = asyncio.run(_load_workspace(args.workspace))
+    elif args.phrases:
+        counts = _load_file(args.phrases)
+    else:
+        counts = Counter({phrase: 1 for phrase in BUILT_IN})
+
+    from app.core.models import embed_texts, model_manager
+
+    model_manager._load_embedding_model()
+
+    # Arrival order is what the pipeline sees; frequent tags tend to show up early
+    rng = random.Random(0)
+    arrivals = sorted(counts, key=lambda phrase: -counts[phrase] * rng.random())
+
+    leaders: list[str] = []
+    leader_vectors = None
+    topics: dict[str, str] = {}
+    embed_seconds = assign_seconds = 0.0
+    for start in range(0, len(arrivals), args.batch_size):
+        batch = sorted(arrivals[start:start + args.batch_size], key=lambda phrase: (len(phrase), phrase))
+        started = time.perf_counter()
+        vectors = embed_texts(batch)
+        embed_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        if leader_vectors is None:
+            leader_vectors = vectors[:0]
+        assigned = assign_topics(batch, vectors, leaders, leader_vectors, args.threshold)
+        founded = [i for i, (topic, _) in enumerate(assigned) if topic == batch[i]]
+        leaders.extend(batch[i] for i in founded)
+        leader_vectors = np.concatenate((leader_vectors, vectors[founded]))
+        topics.update((phrase, topic) for phrase, (topic, _) in zip(batch, assigned))
+        assign_seconds += time.perf_counter() - started
+
+    mentions = sum(counts.values())
+    topic_mentions: Counter = Counter()
+    members = defaultdict(list)
+    for phrase, topic in topics.items():
+        topic_mentions[topic] += counts[phrase]
+        members[topic].append(phrase)
+
+    print(f"threshold {args.threshold}: {len(counts)} distinct tags -> {len(members)} topics "
+          f"({1 - len(members) / len(counts):.0%} fewer), {mentions} mentions")
+    # Tags covering 90% of mentions, a proxy for what trend aggregations carry
+    for name, counter in (("tags", counts), ("topics", topic_mentions)):
+        covered, needed = 0, 0
+        for _, count in counter.most_common():
+            covered += count
+            needed += 1
+            if covered >= 0.9 * mentions:
+                break
+        print(f"  {name} covering 90% of mentions: {needed}")
+    print(f"  new phrases: {len(counts) / embed_seconds:,.0f}/s embedding, "
+          f"{len(counts) / max(assign_seconds, 1e-9):,.0f}/s clustering")
+
+    print("largest merged topics:")
+    for topic, phrases in sorted(members.items(), key=lambda item: -len(item[1]))[:10]:
+        if len(phrases) > 1:
+            print(f"  {topic!r}: {', '.join(sorted(p for p in phrases if p != topic)[:8])}")
+
+    canonicalizer = TopicCanonicalizer()
+    canonicalizer._apply(
+        {"phrase": phrase, "topic": topic, "embedding": None} for phrase, topic in topics.items()
+    )
+    stream = rng.choices(list(counts), weights=list(counts.values()), k=args.lookups)
+    started = time.perf_counter()
+    for phrase in stream:
+        canonicalizer.lookup(phrase)
+    elapsed = time.perf_counter() - started
+    print(f"cached lookups: {args.lookups / elapsed:,.0f}/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Trend scoring throughput on a synthetic tag x time matrix
+
+Generates sparse daily mention counts for many tags (the shape
+fetch_tag_bins returns), plants a few bursting tags, and times assembling
+the arrays and scoring every series with score_trends. Checks that the
+planted bursts rank first.
+
+    python -m scripts.bench_trends --tags 100000 --days 30
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.trends import score_trends
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tags", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=30, help="recent window, in daily bins")
+    parser.add_argument("--baseline-days", type=int, default=14)
+    parser.add_argument("--active-days", type=int, default=12, help="days each tag is mentioned on")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-burst", type=float, default=get_settings().trend_min_burst)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    n_bins = args.days + args.baseline_days
+
+    # Flat arrays as Python lists, the shape fetch_tag_bins decodes to
+    series = np.repeat(np.arange(args.tags), args.active_days)
+    bins = rng.integers(0, n_bins, size=series.size)
+    mentions = rng.poisson(3, size=series.size) + 1
+
+    planted = rng.choice(args.tags, size=args.bursts, replace=False)
+    series = np.concatenate([series, planted])
+    bins = np.concatenate([bins, np.full(args.bursts, n_bins - 1)])
+    mentions = np.concatenate([mentions, rng.integers(150, 400, size=args.bursts)])
+    sentiment_sums = rng.integers(-1, 2, size=series.size) * mentions
+    binned = {
+        "series": series.tolist(),
+        "bins": bins.tolist(),
+        "mentions": mentions.tolist(),
+        "sentiment_sums": sentiment_sums.tolist()
+    }
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        scored = score_trends(
+            series=np.array(binned["series"], dtype=np.int64),
+            bins=np.array(binned["bins"], dtype=np.int64),
+            mentions=np.array(binned["mentions"], dtype=np.float64),
+            sentiment_sums=np.array(binned["sentiment_sums"], dtype=np.float64),
+            n_series=args.tags,
+            n_bins=n_bins,
+            recent_bins=args.days,
+            baseline_bins=args.baseline_days,
+            min_mentions=5,
+            min_burst=args.min_burst
+        )
+        timings.append(time.perf_counter() - started)
+
+    top = set(scored["series"][:args.bursts].tolist())
+    found = len(top & set(planted.tolist()))
+    print(
+        f"{args.tags} tags x {n_bins} bins: median {np.median(timings) * 1000:.0f}ms, "
+        f"best {min(timings) * 1000:.0f}ms over {args.repeat} runs"
+    )
+    print(f"{len(scored['series'])} trends kept, {found}/{args.bursts} planted bursts in the top {args.bursts}")
+    if found < args.bursts:
+        raise SystemExit("planted bursts did not rank first")
+
+if __name__ == "__main__":
+    main()
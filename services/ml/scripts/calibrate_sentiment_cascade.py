@@ -0,0 +1,108 @@
+"""
+Calibrate the VADER-first sentiment cascade on a labelled set
+
+Reads labelled comments (CSV with text,label columns or JSONL with text
+and label fields; labels POS/NEU/NEG or positive/neutral/negative), scores
+them with VADER and picks the loosest positive and negative compound
+thresholds at which the lexicon labels still agree with the reference
+labels at --target. A held-out split reports the agreement and the share
+of texts that skip the transformer at those thresholds, and the result is
+written where SENTIMENT_CASCADE_CALIBRATION points.
+
+--reference transformer ignores the file's labels and calibrates against
+the transformer's own predictions instead, so the cascade reproduces the
+current labels rather than human ones.
+
+    python -m scripts.calibrate_sentiment_cascade labelled.csv --target 0.92
+"""
+
+import argparse
+import csv
+import json
+import random
+from pathlib import Path
+
+import numpy as np
+
+from app.core.cascade import calibrate_thresholds, lexicon_scores
+from app.core.config import get_settings
+from app.core.registry import load_nltk_data, model_registry
+
+LABELS = {
+    'pos': 'POS', 'positive': 'POS', '2': 'POS',
+    'neu': 'NEU', 'neutral': 'NEU', '1': 'NEU',
+    'neg': 'NEG', 'negative': 'NEG', '0': 'NEG'
+}
+
+def load_labelled(path: Path) -> tuple[list[str], list[str]]:
+    """Texts and their POS/NEU/NEG labels ('' where unrecognized) from CSV or JSONL"""
+    with open(path, newline='') as handle:
+        if path.suffix == '.jsonl':
+            rows = [json.loads(line) for line in handle if line.strip()]
+        else:
+            rows = list(csv.DictReader(handle))
+    texts = [str(row['text']) for row in rows]
+    labels = [LABELS.get(str(row.get('label', '')).strip().lower(), '') for row in rows]
+    return texts, labels
+
+def _transformer_labels(texts: list[str]) -> list[str]:
+    from app.core.models import analyze_sentiment_batch, model_manager
+
+    model_manager._load_sentiment_model()
+    return [result['sentiment'] for result in analyze_sentiment_batch(texts, mode='transformer')]
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("data", type=Path)
+    parser.add_argument("--target", type=float, default=0.9, help="agreement required of lexicon labels")
+    parser.add_argument("--reference", choices=["labels", "transformer"], default="labels")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of texts held out for the report")
+    parser.add_argument("--min-support", type=int, default=50, help="texts a threshold must cover")
+    parser.add_argument("--output", type=Path, default=Path(settings.sentiment_cascade_calibration))
+    args = parser.parse_args()
+
+    texts, labels = load_labelled(args.data)
+    if args.reference == "transformer":
+        labels = _transformer_labels(texts)
+    labelled = [i for i, label in enumerate(labels) if label]
+    if len(labelled) < len(texts):
+        print(f"skipping {len(texts) - len(labelled)} rows without a recognized label")
+
+    load_nltk_data(model_registry, offline=settings.model_offline)
+    scores = lexicon_scores([texts[i] for i in labelled])
+    labels = np.array([labels[i] for i in labelled])
+
+    rng = random.Random(0)
+    order = list(range(len(labelled)))
+    rng.shuffle(order)
+    cut = int(len(order) * (1 - args.holdout))
+    train, test = np.array(order[:cut], dtype=np.int64), np.array(order[cut:], dtype=np.int64)
+
+    calibration = calibrate_thresholds(scores[train], labels[train], args.target, args.min_support)
+    print(
+        f"calibrated on {len(train)} texts: POS at compound >= {calibration['positive_threshold']:.3f} "
+        f"({calibration['positive_agreement']:.1%} agree), NEG at <= {calibration['negative_threshold']:.3f} "
+        f"({calibration['negative_agreement']:.1%} agree), {calibration['coverage']:.1%} skip the transformer"
+    )
+
+    if len(test):
+        test_scores, test_labels = scores[test], labels[test]
+        positive = test_scores >= calibration['positive_threshold']
+        negative = test_scores <= calibration['negative_threshold']
+        covered = positive | negative
+        agreeing = (positive & (test_labels == 'POS')) | (negative & (test_labels == 'NEG'))
+        calibration['holdout_coverage'] = float(covered.mean())
+        calibration['holdout_agreement'] = float(agreeing.sum() / covered.sum()) if covered.any() else 0.0
+        print(
+            f"held out {len(test)} texts: {calibration['holdout_coverage']:.1%} labelled by the lexicon, "
+            f"{calibration['holdout_agreement']:.1%} of them agree"
+        )
+
+    calibration['reference'] = settings.sentiment_model if args.reference == "transformer" else str(args.data)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(calibration, indent=2))
+    print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
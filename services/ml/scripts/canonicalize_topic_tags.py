@@ -0,0 +1,38 @@
+"""
+Rewrite the stored tags of workspaces as canonical topics
+
+Comments analyzed before topic canonicalization keep their raw keyword
+phrases; this maps them through the shared topic table (assigning any
+phrase not seen yet) and rebuilds the workspace's tag rollups.
+
+    python -m scripts.canonicalize_topic_tags WORKSPACE_ID [WORKSPACE_ID ...]
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import close_db, initialize_db
+from app.core.models import model_manager
+from app.core.topics import canonicalize_workspace_tags
+
+async def run(workspace_ids: list[str]) -> None:
+    await model_manager.download_models()
+    await initialize_db()
+    try:
+        for workspace_id in workspace_ids:
+            result = await canonicalize_workspace_tags(workspace_id)
+            print(
+                f"{workspace_id}: {result['tags']} tags -> {result['topics']} topics, "
+                f"{result['comments_updated']} comments updated"
+            )
+    finally:
+        await close_db()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("workspace_ids", nargs="+")
+    args = parser.parse_args()
+    asyncio.run(run(args.workspace_ids))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Rebuild the per-day tag sketches of workspaces from their analyzed comments
+
+Needed once after deploying the sketches (comments analyzed earlier are
+not in them) or if pipeline writebacks failed to update them. Replaces
+the buckets of the last ``--days`` days.
+
+    python -m scripts.rebuild_tag_sketches WORKSPACE_ID [WORKSPACE_ID ...] --days 30
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import close_db, initialize_db
+from app.core.sketches import rebuild_tag_sketches
+
+async def run(workspace_ids: list[str], days: int) -> None:
+    await initialize_db()
+    try:
+        for workspace_id in workspace_ids:
+            buckets = await rebuild_tag_sketches(workspace_id, days=days)
+            print(f"{workspace_id}: {buckets} buckets")
+    finally:
+        await close_db()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("workspace_ids", nargs="+")
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.workspace_ids, args.days))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Scratch Postgres schema for the tests and database benchmarks
+
+Holds the subset of the application tables the ML service reads and
+writes, so tests and benchmarks can run against a throwaway schema of
+any Postgres without the Prisma migrations.
+"""
+
+def scratch_schema_sql(schema: str) -> str:
+    """DDL that drops and recreates ``schema`` with the service's tables"""
+    return f"""
+DROP SCHEMA IF EXISTS {schema} CASCADE;
+CREATE SCHEMA {schema};
+SET search_path = {schema};
+CREATE TYPE "Sentiment" AS ENUM ('NEG', 'NEU', 'POS');
+CREATE TYPE "JobStatus" AS ENUM ('PENDING', 'RUNNING', 'COMPLETED', 'FAILED');
+CREATE TABLE channels (id text PRIMARY KEY, workspace_id text NOT NULL);
+CREATE TABLE content_items (id text PRIMARY KEY, channel_id text NOT NULL REFERENCES channels(id));
+CREATE TABLE comments (
+    id text PRIMARY KEY,
+    content_item_id text NOT NULL REFERENCES content_items(id),
+    platform text NOT NULL,
+    text text NOT NULL,
+    sentiment "Sentiment",
+    topic_tags text[] NOT NULL DEFAULT '{{}}',
+    meta_json jsonb,
+    lease_owner text,
+    lease_expires_at timestamptz,
+    created_at timestamptz NOT NULL DEFAULT NOW(),
+    updated_at timestamptz NOT NULL DEFAULT NOW()
+);
+CREATE INDEX ON comments (created_at, id);
+CREATE INDEX ON comments (lease_owner);
+CREATE TABLE job_runs (
+    id text PRIMARY KEY,
+    type text NOT NULL,
+    status "JobStatus" NOT NULL,
+    started_at timestamptz,
+    finished_at timestamptz,
+    payload_json jsonb,
+    error_text text,
+    created_at timestamptz NOT NULL DEFAULT NOW(),
+    updated_at timestamptz NOT NULL DEFAULT NOW()
+);
+CREATE TABLE tag_daily_rollups (
+    workspace_id text NOT NULL,
+    platform text NOT NULL,
+    tag text NOT NULL,
+    day date NOT NULL,
+    mention_count integer NOT NULL DEFAULT 0,
+    sentiment_sum integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL,
+    PRIMARY KEY (workspace_id, platform, tag, day)
+);
+CREATE INDEX ON tag_daily_rollups (workspace_id, day);
+CREATE TABLE topic_aliases (
+    phrase text PRIMARY KEY,
+    topic text NOT NULL,
+    similarity real NOT NULL,
+    embedding bytea,
+    created_at timestamptz NOT NULL DEFAULT NOW()
+);
+CREATE TABLE workspace_sentiment_stats (
+    workspace_id text NOT NULL,
+    platform text NOT NULL,
+    day date NOT NULL,
+    comment_count integer NOT NULL DEFAULT 0,
+    positive_count integer NOT NULL DEFAULT 0,
+    neutral_count integer NOT NULL DEFAULT 0,
+    negative_count integer NOT NULL DEFAULT 0,
+    confidence_sum double precision NOT NULL DEFAULT 0,
+    confidence_count integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL,
+    PRIMARY KEY (workspace_id, platform, day)
+);
+"""
+
+def scoped_url(database_url: str, schema: str) -> str:
+    """``database_url`` with ``schema`` as the search path"""
+    separator = "&" if "?" in database_url else "?"
+    return f"{database_url}{separator}search_path={schema}"
@@ -0,0 +1,105 @@
+"""
+Train the fast-tier sentiment head on sentence embeddings
+
+Encodes a labelled set (same CSV/JSONL format as the cascade calibration)
+with the configured embedding model, splits it with a fixed seed into
+train and test sets stratified by label, fits a logistic regression and
+writes it where SENTIMENT_HEAD_PATH points. The accuracy report (overall,
+macro F1, per class and the confusion matrix) is printed and stored with
+the weights. --compare-transformer also labels the test set with the
+RoBERTa tier, so both tiers are scored on the same texts and their
+agreement is reported.
+
+    python -m scripts.train_sentiment_head labelled.csv --C 2.0
+"""
+
+import argparse
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.sentiment_head import train_sentiment_head
+from scripts.calibrate_sentiment_cascade import load_labelled
+
+def _report(name: str, labels: np.ndarray, predicted: np.ndarray) -> dict:
+    from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, f1_score
+
+    classes = sorted(set(labels))
+    print(f"{name}: accuracy {accuracy_score(labels, predicted):.3f}, "
+          f"macro F1 {f1_score(labels, predicted, average='macro'):.3f}")
+    print(classification_report(labels, predicted, labels=classes, digits=3))
+    return {
+        'accuracy': float(accuracy_score(labels, predicted)),
+        'macro_f1': float(f1_score(labels, predicted, average='macro')),
+        'confusion': {
+            'labels': classes,
+            'matrix': confusion_matrix(labels, predicted, labels=classes).tolist()
+        }
+    }
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("data", type=Path)
+    parser.add_argument("--C", type=float, default=1.0, help="inverse regularization strength")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare-transformer", action="store_true")
+    parser.add_argument("--output", type=Path, default=Path(settings.sentiment_head_path))
+    args = parser.parse_args()
+
+    from sklearn.model_selection import train_test_split
+
+    from app.core.models import analyze_sentiment_batch, embed_texts, model_manager
+
+    texts, labels = load_labelled(args.data)
+    keep = [i for i, label in enumerate(labels) if label]
+    texts, labels = [texts[i] for i in keep], np.array([labels[i] for i in keep])
+    print(f"{len(texts)} labelled texts: " + ", ".join(
+        f"{label} {count}" for label, count in zip(*np.unique(labels, return_counts=True))
+    ))
+
+    model_manager._load_embedding_model()
+    started = time.perf_counter()
+    embeddings = embed_texts(texts)
+    print(f"encoded in {time.perf_counter() - started:.1f}s with {settings.embedding_model}")
+
+    train, test = train_test_split(
+        np.arange(len(texts)), test_size=args.test_size, random_state=args.seed, stratify=labels
+    )
+    head = train_sentiment_head(embeddings[train], labels[train], settings.embedding_model, C=args.C, seed=args.seed)
+    predicted = np.array([result['sentiment'] for result in head.predict(embeddings[test])])
+    metrics = _report("head", labels[test], predicted)
+
+    if args.compare_transformer:
+        model_manager._load_sentiment_model()
+        test_texts = [texts[i] for i in test]
+        started = time.perf_counter()
+        transformer = np.array([
+            result['sentiment'] for result in analyze_sentiment_batch(test_texts, mode='transformer')
+        ])
+        transformer_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        head.predict(embed_texts(test_texts))
+        head_seconds = time.perf_counter() - started
+        metrics['transformer'] = _report(settings.sentiment_model, labels[test], transformer)
+        metrics['transformer_agreement'] = float((predicted == transformer).mean())
+        print(f"head agrees with the transformer on {metrics['transformer_agreement']:.1%} of test texts; "
+              f"{len(test) / head_seconds:,.0f} vs {len(test) / transformer_seconds:,.0f} texts/s")
+
+    metrics.update({
+        'samples': len(texts),
+        'test_size': args.test_size,
+        'seed': args.seed,
+        'C': args.C,
+        'data': str(args.data)
+    })
+    head = head._replace(version=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"), metrics=metrics)
+    head.save(args.output)
+    print(f"wrote {args.output} ({head.version})")
+
+if __name__ == "__main__":
+    main()
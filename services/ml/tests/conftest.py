@@ -0,0 +1,68 @@
+"""
+Shared fixtures for the ML service tests
+
+Database tests run against a scratch schema in the Postgres that
+DATABASE_URL points at and are skipped when it cannot be reached.
+"""
+
+import asyncio
+import os
+
+import asyncpg
+import pytest
+
+from app.core import database
+from app.core.config import get_settings
+from scripts.scratch_schema import scoped_url, scratch_schema_sql
+
+SCHEMA = "ml_tests"
+
+async def _reset_schema(database_url: str) -> None:
+    conn = await asyncpg.connect(database_url, timeout=3)
+    try:
+        await conn.execute(scratch_schema_sql(SCHEMA))
+    finally:
+        await conn.close()
+
+@pytest.fixture
+def database_run(monkeypatch):
+    """
+    Point the service's pool at a fresh scratch schema
+
+    Returns a runner for coroutines that closes the pool afterwards, since
+    a pool is bound to the event loop it was created on.
+    """
+    settings = get_settings()
+    database_url = os.environ.get("DATABASE_URL", settings.database_url)
+    try:
+        asyncio.run(_reset_schema(database_url))
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Postgres is not available: {e}")
+
+    monkeypatch.setattr(settings, "database_url", scoped_url(database_url, SCHEMA))
+    monkeypatch.setattr(database, "_db_pool", database.DatabasePool())
+
+    def run(coroutine):
+        async def scoped():
+            try:
+                return await coroutine
+            finally:
+                await database.close_db()
+        return asyncio.run(scoped())
+
+    return run
+
+async def seed_comments(workspace_id: str, comments: list[tuple]) -> None:
+    """Insert (id, text) comments under one channel and content item of the workspace"""
+    async with database.get_db_connection() as conn:
+        await conn.execute("INSERT INTO channels VALUES ($1, $2)", f"{workspace_id}-channel", workspace_id)
+        await conn.execute(
+            "INSERT INTO content_items VALUES ($1, $2)", f"{workspace_id}-item", f"{workspace_id}-channel"
+        )
+        await conn.executemany(
+            """
+            INSERT INTO comments (id, content_item_id, platform, text, created_at)
+            VALUES ($1, $2, 'YOUTUBE', $3, NOW() + make_interval(secs => $4))
+            """,
+            [(comment_id, f"{workspace_id}-item", text, float(i)) for i, (comment_id, text) in enumerate(comments)]
+        )
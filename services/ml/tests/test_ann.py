@@ -0,0 +1,99 @@
+"""ANN index over an embedding store: stale snapshots and workspace ids"""
+
+import threading
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from app.api.routers.nlp import SearchRequest
+from app.core.ann import ANNIndex
+from app.core.config import get_settings
+from app.core.embedding_store import EmbeddingStore
+
+DIM = 16
+
+def _vectors(rng: np.random.Generator, count: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "ann_min_rows", 500)
+    monkeypatch.setattr(settings, "ann_lists", 8)
+    monkeypatch.setattr(settings, "ann_pq_subspaces", 4)
+    return ANNIndex(EmbeddingStore(tmp_path / "workspace", DIM))
+
+def test_search_on_snapshot_older_than_the_codes(index):
+    rng = np.random.default_rng(0)
+    vectors = _vectors(rng, 1000)
+    index.store.add([f"c{i}" for i in range(1000)], vectors)
+    assert index.sync() == 1000
+
+    snapshot = index.store.snapshot()
+    quantizer = index._load_quantizer()
+    # Appends after the snapshot extend its shared id list and get encoded
+    index.store.add([f"d{i}" for i in range(300)], _vectors(rng, 300))
+    assert index.sync() == 300
+
+    lists, codes = index._codes(snapshot, quantizer)
+    assert len(lists) == len(codes) == len(snapshot.vectors) == 1000
+    rows = index._candidates(snapshot, quantizer, lists, codes, vectors[7], nprobe=8, rerank=50)
+    assert rows.max() < 1000
+
+def test_sync_keeps_code_files_a_search_is_mapping(index, monkeypatch):
+    rng = np.random.default_rng(2)
+    vectors = _vectors(rng, 1000)
+    index.store.add([f"c{i}" for i in range(1000)], vectors)
+    index.sync()
+    snapshot = index.store.snapshot()
+    quantizer = index._load_quantizer()
+    index.store.delete([f"c{i}" for i in range(0, 1000, 2)])
+    index.store.compact()
+
+    # Let the sync take its snapshot of the compacted store, then search while it cleans up
+    snapshotted = threading.Event()
+    load_quantizer = index._load_quantizer
+
+    def loading():
+        snapshotted.set()
+        return load_quantizer()
+
+    monkeypatch.setattr(index, "_load_quantizer", loading)
+    syncing = threading.Thread(target=index.sync)
+    syncing.start()
+    assert snapshotted.wait(5)
+    with index._lock:
+        syncing.join(0.5)
+        assert len(index._codes(snapshot, quantizer)[0]) == len(snapshot.vectors)
+    syncing.join()
+    assert not any(index.path.glob(f"*-{snapshot.generation}-*.bin"))
+
+def test_search_on_code_files_deleted_by_another_process(index):
+    rng = np.random.default_rng(3)
+    vectors = _vectors(rng, 1000)
+    index.store.add([f"c{i}" for i in range(1000)], vectors)
+    index.sync()
+
+    snapshot = index.store.snapshot()
+    quantizer = index._load_quantizer()
+    mapped_lists, mapped_codes = index._codes(snapshot, quantizer)
+    for path in index.path.glob("*.bin"):
+        path.unlink()
+
+    # Maps taken earlier stay readable; later ones fall back to exact scoring
+    assert mapped_lists.max() < len(quantizer.centroids) and len(mapped_codes) == 1000
+    lists, codes = index._codes(snapshot, quantizer)
+    assert len(lists) == len(codes) == 0
+    rows = index._candidates(snapshot, quantizer, lists, codes, vectors[7], nprobe=1, rerank=5)
+    assert sorted(rows) == list(np.flatnonzero(snapshot.live))
+    assert index.search(vectors[7], k=1)[0][0] == "c7"
+
+@pytest.mark.parametrize("workspace_id", ["../other", "a/b", "..", "", "x" * 129])
+def test_search_request_rejects_unsafe_workspace_ids(workspace_id):
+    with pytest.raises(ValidationError):
+        SearchRequest(workspace_id=workspace_id, text="query")
+
+def test_search_request_accepts_workspace_ids():
+    assert SearchRequest(workspace_id="clx2k9f0a0000qw8z_ws-1", text="query").workspace_id == "clx2k9f0a0000qw8z_ws-1"
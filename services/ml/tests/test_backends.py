@@ -0,0 +1,48 @@
+"""Sentiment backends agree on a small randomly initialized classifier"""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+transformers = pytest.importorskip("transformers")
+
+from app.core.backends import OnnxSentimentBackend, TorchSentimentBackend, export_onnx
+
+ID2LABEL = {0: "negative", 1: "neutral", 2: "positive"}
+
+@pytest.fixture(scope="module")
+def classifier():
+    config = transformers.RobertaConfig(
+        vocab_size=128, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=64, num_labels=3, id2label=ID2LABEL
+    )
+    torch.manual_seed(0)
+    return transformers.AutoModelForSequenceClassification.from_config(config).eval()
+
+def _inputs() -> tuple:
+    rng = np.random.default_rng(0)
+    input_ids = rng.integers(3, 128, size=(6, 12), dtype=np.int64)
+    attention_mask = np.ones_like(input_ids)
+    # Right padding as the tokenizer produces it
+    for row, length in enumerate((12, 9, 5, 12, 3, 7)):
+        input_ids[row, length:] = 1
+        attention_mask[row, length:] = 0
+    input_ids[:, 0] = 0
+    return input_ids, attention_mask
+
+def test_onnx_backend_matches_torch_labels(classifier, tmp_path):
+    model_path = tmp_path / "model.onnx"
+    export_onnx(classifier, model_path)
+    input_ids, attention_mask = _inputs()
+
+    expected = TorchSentimentBackend(classifier, ID2LABEL).predict_proba(input_ids, attention_mask)
+    onnx = OnnxSentimentBackend(model_path, ID2LABEL, threads=1)
+    actual = onnx.predict_proba(input_ids, attention_mask)
+    assert actual.argmax(axis=1).tolist() == expected.argmax(axis=1).tolist()
+    np.testing.assert_allclose(actual, expected, atol=1e-4)
+
+    # As a forked worker does, with more threads
+    onnx.set_threads(2)
+    assert onnx.session.get_session_options().intra_op_num_threads == 2
+    np.testing.assert_allclose(onnx.predict_proba(input_ids, attention_mask), expected, atol=1e-4)
@@ -0,0 +1,106 @@
+"""Token batch planning and the adaptive batch sizer"""
+
+import numpy as np
+import pytest
+
+from app.core.batching import AdaptiveBatchSizer, iter_token_batches, padded_tokens, plan_token_batches
+
+def test_plan_token_batches_respects_budget():
+    lengths = [5, 50, 7, 48, 6, 49]
+    batches = plan_token_batches(lengths, 100, 8)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) * max(lengths[i] for i in batch) <= 100
+
+@pytest.mark.parametrize("seed", range(5))
+def test_token_batches_stay_within_budget(seed):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(0, 600, size=300).tolist()
+    budget = int(rng.integers(256, 4096))
+    batches = plan_token_batches(lengths, budget, 16)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 16
+        # Only a sequence longer than the budget runs over it, alone
+        assert padded_tokens(lengths, batch) <= budget or len(batch) == 1
+
+def test_oversized_sequences_get_their_own_batch():
+    batches = plan_token_batches([300, 20, 250, 20], 200, 8)
+    assert batches == [[0], [2], [1, 3]]
+
+def test_callable_budget_applies_per_batch():
+    lengths = [400, 390, 380, 100, 90, 80, 70, 10, 10, 10]
+    calls = []
+
+    def budget(padded_length):
+        calls.append(padded_length)
+        # Shorter batches get a tighter budget, as a sizer's classes may
+        return 800 if padded_length > 200 else 200
+
+    batches = list(iter_token_batches(lengths, budget, 8))
+
+    assert calls == [max(lengths[i] for i in batch) for batch in batches]
+    for batch in batches:
+        assert padded_tokens(lengths, batch) <= budget(max(lengths[i] for i in batch))
+    assert batches == [[0, 1], [2, 3], [4, 5], [6, 7], [8, 9]]
+
+def test_run_batches_stay_within_the_sizers_budget():
+    rng = np.random.default_rng(3)
+    lengths = rng.integers(1, 512, size=200).tolist()
+    sizer = AdaptiveBatchSizer("test", initial_tokens=4096, max_tokens=4096)
+    budgets = []
+    budget = sizer.budget
+
+    def recording_budget(padded_length):
+        budgets.append(budget(padded_length))
+        return budgets[-1]
+
+    sizer.budget = recording_budget
+    batches = []
+
+    def run_batch(batch):
+        batches.append(list(batch))
+        # Backoffs shrink the budget part way through
+        if padded_tokens(lengths, batch) > 1024:
+            raise MemoryError("can't allocate memory")
+
+    assert sizer.run(lengths, run_batch, 32) == {}
+    # The budget is read as each batch starts
+    assert len(budgets) == len(batches)
+    assert len(set(budgets)) > 1
+    for batch, allowed in zip(batches, budgets):
+        assert len(batch) <= 32
+        assert padded_tokens(lengths, batch) <= allowed
+
+def test_budget_counts_memory_used_outside_the_process():
+    used = {"bytes": 0}
+    sizer = AdaptiveBatchSizer(
+        "test", initial_tokens=4096, max_tokens=4096,
+        memory_limit=1000 * 1024, memory_usage=lambda: used["bytes"]
+    )
+    sizer._bucket(16).bytes_per_token = 1024.0
+    assert sizer.budget(16) == 1000
+    # Other workers in the container take most of the headroom
+    used["bytes"] = 900 * 1024
+    assert sizer.budget(16) == 100
+
+def test_run_splits_batches_that_fail_to_allocate():
+    lengths = [32] * 64
+    sizer = AdaptiveBatchSizer("test", initial_tokens=2048, max_tokens=2048)
+    ran = []
+
+    def run_batch(batch):
+        if len(batch) * 32 > 512:
+            raise MemoryError("can't allocate memory")
+        if 0 in batch:
+            # Fails however small its batch gets
+            raise RuntimeError("CUDA out of memory")
+        ran.extend(batch)
+
+    failed = sizer.run(lengths, run_batch, 64)
+    assert list(failed) == [0]
+    assert sorted(ran) == list(range(1, 64))
+    stats = sizer.stats()
+    assert stats["failed"] == 1
+    assert stats["backoffs"] >= 2
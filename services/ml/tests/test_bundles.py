@@ -0,0 +1,59 @@
+"""Prepacked bundles found through the registry, and corrupted ones refused"""
+
+import json
+
+import pytest
+
+from app.core import models
+from app.core.bundles import BUNDLE_FORMAT, BUNDLE_METADATA, WEIGHTS_FILENAME, bundle_dir, read_bundle
+from app.core.config import get_settings
+from app.core.models import model_manager
+from app.core.registry import ModelRegistry, RegistryError, bundle_artifact_name
+
+SOURCE = "org/sentiment-model"
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """An offline registry with bundles enabled"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "model_offline", True)
+    monkeypatch.setattr(settings, "model_verify_checksums", True)
+    monkeypatch.setattr(settings, "model_bundles", True)
+    registry = ModelRegistry(str(tmp_path))
+    monkeypatch.setattr(models, "model_registry", registry)
+    return registry
+
+def _bundle(registry: ModelRegistry):
+    path = bundle_dir(str(registry.root), "sentiment", SOURCE)
+    path.mkdir(parents=True)
+    (path / WEIGHTS_FILENAME).write_bytes(bytes(range(256)) * 64)
+    (path / BUNDLE_METADATA).write_text(json.dumps({"format": BUNDLE_FORMAT, "kind": "transformers", "source": SOURCE}))
+    registry.register(bundle_artifact_name("sentiment"), "bundle", SOURCE, path)
+    registry.save()
+    return path
+
+def test_intact_bundle_is_found(registry):
+    path = _bundle(registry)
+
+    assert read_bundle(path, SOURCE)["kind"] == "transformers"
+    assert read_bundle(path, "org/other-model") is None
+    assert model_manager._find_bundle("sentiment", SOURCE) == path
+
+def test_bundle_checksum_mismatch_refuses_to_load(registry):
+    path = _bundle(registry)
+    weights = path / WEIGHTS_FILENAME
+    corrupted = bytearray(weights.read_bytes())
+    corrupted[100] ^= 0xFF
+    weights.write_bytes(bytes(corrupted))
+
+    with pytest.raises(RegistryError, match=f"{WEIGHTS_FILENAME} failed its checksum"):
+        model_manager._find_bundle("sentiment", SOURCE)
+
+def test_missing_bundle_refuses_to_load_offline(registry, monkeypatch):
+    with pytest.raises(RegistryError, match=bundle_artifact_name("sentiment")):
+        model_manager._find_bundle("sentiment", SOURCE)
+
+    # Online a missing bundle just means loading the model normally
+    monkeypatch.setattr(get_settings(), "model_offline", False)
+    assert model_manager._find_bundle("sentiment", SOURCE) is None
@@ -0,0 +1,89 @@
+"""Two-tier result cache: LRU tier, namespaces and batch resolution"""
+
+from app.core.cache import LRUTier, RedisTier, ResultCache, normalize_text
+
+class FakeRedis:
+    """The slice of the redis client RedisTier uses"""
+
+    def __init__(self):
+        self.values = {}
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def execute(self):
+        pass
+
+def test_lru_evicts_least_recently_used():
+    tier = LRUTier(max_size=2, ttl_seconds=60)
+    tier.set_many({"a": 1, "b": 2})
+    assert tier.get_many(["a"]) == [1]
+    tier.set_many({"c": 3})
+
+    assert len(tier) == 2
+    assert tier.get_many(["a", "b", "c"]) == [1, None, 3]
+
+def test_lru_expires_entries():
+    tier = LRUTier(max_size=10, ttl_seconds=-1)
+    tier.set_many({"a": 1})
+    assert tier.get_many(["a"]) == [None]
+    assert len(tier) == 0
+
+def test_namespaces_are_isolated():
+    cache = ResultCache(LRUTier(100, 60))
+    cache.set_many("keywords:a", ["some text"], [["x"]])
+
+    assert cache.get_many("keywords:a", ["some text"]) == [["x"]]
+    assert cache.get_many("keywords:b", ["some text"]) == [None]
+
+def test_only_sentiment_keys_keep_case():
+    assert normalize_text("  Great   PRODUCT\n") == "great product"
+    assert normalize_text("  Great   PRODUCT\n", casefold=False) == "Great PRODUCT"
+
+    assert ResultCache.key("keywords:m", "GREAT") == ResultCache.key("keywords:m", "great")
+    assert ResultCache.key("sentiment:m", "GREAT") != ResultCache.key("sentiment:m", "great")
+    assert ResultCache.key("sentiment:cascade", "GREAT") != ResultCache.key("sentiment:cascade", "great")
+    # Whitespace still folds in every namespace
+    assert ResultCache.key("sentiment:m", "so  good") == ResultCache.key("sentiment:m", "so good")
+
+def test_cached_batch_computes_each_miss_once():
+    cache = ResultCache(LRUTier(100, 60))
+    calls = []
+
+    def compute(texts):
+        calls.append(list(texts))
+        return [{"length": len(text)} for text in texts]
+
+    first = cache.cached_batch("test", ["aa", "bbb", "aa", " aa "], compute)
+    assert calls == [["aa", "bbb"]]
+    assert first == [{"length": 2}, {"length": 3}, {"length": 2}, {"length": 2}]
+
+    second = cache.cached_batch("test", ["bbb", "cccc"], compute)
+    assert calls[-1] == ["cccc"]
+    assert second == [{"length": 3}, {"length": 4}]
+
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["misses"]) == (1, 5)
+
+def test_cached_batch_skips_uncacheable_values():
+    cache = ResultCache(LRUTier(100, 60))
+    compute = lambda texts: [{"error": "model failed"} for _ in texts]
+
+    cache.cached_batch("test", ["x"], compute, cacheable=lambda value: "error" not in value)
+    assert cache.get_many("test", ["x"]) == [None]
+
+def test_shared_hits_fill_the_local_tier():
+    redis = FakeRedis()
+    writer = ResultCache(LRUTier(100, 60), RedisTier(redis, 60))
+    writer.set_many("test", ["hello"], [{"label": "POS"}])
+
+    reader = ResultCache(LRUTier(100, 60), RedisTier(redis, 60))
+    assert reader.get_many("test", ["hello"]) == [{"label": "POS"}]
+    assert reader.stats()["shared_hits"] == 1
+    assert len(reader.local) == 1
@@ -0,0 +1,78 @@
+"""Sentiment cascade: which texts the lexicon labels and which reach the transformer"""
+
+import json
+
+import numpy as np
+import pytest
+
+from app.core import cascade, models
+from app.core.cascade import LEXICON_TIER, TRANSFORMER_TIER
+from app.core.config import get_settings
+
+# VADER compound score of each text, fixed so the test doesn't need the lexicon
+SCORES = {
+    "love it": 0.9,
+    "exactly positive": 0.6,
+    "just under positive": 0.59,
+    "meh": 0.1,
+    "just above negative": -0.49,
+    "exactly negative": -0.5,
+    "hate it": -0.95,
+}
+
+@pytest.fixture
+def transformer(tmp_path, monkeypatch):
+    """Calibrated thresholds, a fake lexicon and a transformer that records its inputs"""
+    calibration = tmp_path / "sentiment_cascade.json"
+    calibration.write_text(json.dumps({
+        "negative_threshold": -0.5,
+        "positive_threshold": 0.6,
+        "negative_agreement": 0.93,
+        "positive_agreement": 0.97
+    }))
+    monkeypatch.setattr(get_settings(), "sentiment_cascade_calibration", str(calibration))
+    monkeypatch.setattr(cascade, "lexicon_scores", lambda texts: np.array([SCORES[text] for text in texts]))
+
+    calls = []
+
+    def transformer_values(texts):
+        calls.append(list(texts))
+        return [{"sentiment": "NEU", "confidence": 0.5, "all_scores": [], "tier": TRANSFORMER_TIER} for _ in texts]
+
+    monkeypatch.setattr(models, "_sentiment_values", transformer_values)
+    return calls
+
+def test_only_the_uncertain_band_reaches_the_transformer(transformer):
+    texts = list(SCORES)
+    values = models._cascade_values(texts)
+
+    assert transformer == [["just under positive", "meh", "just above negative"]]
+    labels = {text: (value["sentiment"], value["tier"]) for text, value in zip(texts, values)}
+    assert labels == {
+        "love it": ("POS", LEXICON_TIER),
+        "exactly positive": ("POS", LEXICON_TIER),
+        "just under positive": ("NEU", TRANSFORMER_TIER),
+        "meh": ("NEU", TRANSFORMER_TIER),
+        "just above negative": ("NEU", TRANSFORMER_TIER),
+        "exactly negative": ("NEG", LEXICON_TIER),
+        "hate it": ("NEG", LEXICON_TIER),
+    }
+    # Lexicon labels carry the agreement measured for their side
+    assert values[0]["confidence"] == 0.97 and values[-1]["confidence"] == 0.93
+
+def test_confident_batch_skips_the_transformer(transformer):
+    models._cascade_values(["love it", "hate it"])
+    assert transformer == []
+
+def test_without_calibration_everything_reaches_the_transformer(transformer, tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "sentiment_cascade_calibration", str(tmp_path / "missing.json"))
+    models._cascade_values(["love it", "meh"])
+    assert transformer == [["love it", "meh"]]
+
+def test_without_the_lexicon_everything_reaches_the_transformer(transformer, monkeypatch):
+    def missing_lexicon(texts):
+        raise LookupError("vader_lexicon not found")
+
+    monkeypatch.setattr(cascade, "lexicon_scores", missing_lexicon)
+    models._cascade_values(["love it", "meh"])
+    assert transformer == [["love it", "meh"]]
@@ -0,0 +1,202 @@
+"""Claim-mode analysis: concurrent lease holders, quarantine and shared limits"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import Counter
+
+import pytest
+
+from app.core import jobs
+from app.core.config import get_settings
+from app.core.database import claim_comment_batch, count_open_comments, get_db_connection
+from app.core.models import model_manager
+from app.core.pipeline import WorkspaceAnalysisPipeline
+from conftest import seed_comments
+
+WORKSPACE_ID = "claim-workspace"
+POISONED_ID = "c00000042"
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Replace the models with a stub that labels everything NEU, except a poisoned row"""
+    seen: list[str] = []
+
+    def stub_analyze(page, *args, **kwargs):
+        seen.extend(comment["id"] for comment in page)
+        return [
+            {
+                "id": comment["id"],
+                # An invalid label fails writeback validation for this row only
+                "sentiment": "BROKEN" if comment["id"] == POISONED_ID else "NEU",
+                "confidence": 1.0,
+                "topic_tags": []
+            }
+            for comment in page
+        ]
+
+    async def ready(*names):
+        return None
+
+    settings = get_settings()
+    monkeypatch.setattr(settings, "tag_sketches_enabled", False)
+    monkeypatch.setattr(settings, "topic_canonicalization_enabled", False)
+    monkeypatch.setattr(settings, "embedding_store_enabled", False)
+    monkeypatch.setattr(settings, "pipeline_page_size", 10)
+    monkeypatch.setattr(settings, "pipeline_queue_depth", 1)
+    monkeypatch.setattr(model_manager, "wait_until_ready", ready)
+    monkeypatch.setattr(WorkspaceAnalysisPipeline, "_analyze", staticmethod(stub_analyze))
+    return seen
+
+def _comments(count: int) -> list[tuple]:
+    return [(f"c{i:08d}", f"synthetic comment number {i} about the video") for i in range(count)]
+
+def test_concurrent_claimers_analyze_each_comment_once_and_keep_poisoned_rows(database_run, analyzed):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, _comments(300))
+        pipelines = [
+            WorkspaceAnalysisPipeline(WORKSPACE_ID, lease_owner=f"worker-{i}", page_size=20)
+            for i in range(3)
+        ]
+        await asyncio.gather(*(pipeline.run() for pipeline in pipelines))
+
+        async with get_db_connection() as conn:
+            unanalyzed = await conn.fetch(
+                "SELECT id, lease_owner, lease_expires_at = 'infinity' AS quarantined "
+                "FROM comments WHERE sentiment IS NULL"
+            )
+        return pipelines, unanalyzed, await count_open_comments(WORKSPACE_ID)
+
+    pipelines, unanalyzed, still_open = database_run(scenario())
+
+    counts = Counter(analyzed)
+    assert len(counts) == 300
+    assert max(counts.values()) == 1
+    assert sum(pipeline.stats["updated"] for pipeline in pipelines) == 299
+    assert sum(pipeline.stats["failed"] for pipeline in pipelines) == 1
+    # The poisoned row stays quarantined after its worker releases its leases
+    assert [(row["id"], row["quarantined"]) for row in unanalyzed] == [(POISONED_ID, True)]
+    assert still_open == 0
+
+def test_claim_job_stops_at_its_limit(database_run, analyzed):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, _comments(300))
+        job_id = uuid.uuid4().hex
+        payload = {"workspace_id": WORKSPACE_ID, "mode": "claim", "max_comments": 60, "processed": 0}
+        async with get_db_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO job_runs (id, type, status, started_at, payload_json)
+                VALUES ($1, $2, 'PENDING', NOW(), $3::jsonb)
+                """,
+                job_id, jobs.ANALYSIS_JOB_TYPE, json.dumps(payload)
+            )
+        await jobs.AnalysisJobRunner()._run_claim_job({"id": job_id, "payload_json": payload})
+        return await jobs.get_job(job_id), await count_open_comments(WORKSPACE_ID)
+
+    job, still_open = database_run(scenario())
+
+    assert job["status"] == "COMPLETED"
+    # Pages already fetched when the limit is reached still finish
+    assert 60 <= job["payload_json"]["processed"] <= 60 + 2 * 10
+    assert len(analyzed) == job["payload_json"]["processed"]
+    assert still_open == 300 - len(analyzed)
+
+def test_pipeline_releases_only_the_leases_it_claimed(database_run, analyzed):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, _comments(100))
+        # A sibling worker in the same process holds leases under the same owner
+        sibling = await claim_comment_batch(WORKSPACE_ID, "worker", 50, 300)
+        pipeline = WorkspaceAnalysisPipeline(WORKSPACE_ID, lease_owner="worker", max_comments=20, page_size=10)
+        await pipeline.run()
+
+        async with get_db_connection() as conn:
+            still_leased = await conn.fetchval(
+                "SELECT COUNT(*) FROM comments WHERE id = ANY($1::text[]) AND lease_owner = 'worker'",
+                [comment["id"] for comment in sibling]
+            )
+        return pipeline, still_leased
+
+    pipeline, still_leased = database_run(scenario())
+
+    assert pipeline.stats["updated"] == 20
+    assert still_leased == 50
+
+def _child_instance_id(pipe) -> None:
+    pipe.send(jobs.instance_id())
+
+def test_forked_workers_get_their_own_instance_id():
+    parent_id = jobs.instance_id()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    worker = multiprocessing.get_context("fork").Process(target=_child_instance_id, args=(sender,))
+    worker.start()
+    child_id = receiver.recv()
+    worker.join()
+
+    assert child_id != parent_id
+    assert jobs.instance_id() == parent_id
+
+def _abandon_leases(count: int) -> None:
+    """A worker that leases comments and dies before analyzing them"""
+    asyncio.run(claim_comment_batch(WORKSPACE_ID, jobs.instance_id(), count, 1))
+    os._exit(1)
+
+def _drain(results) -> None:
+    """A worker process draining the workspace over its own connections"""
+    analyzed = []
+
+    def stub_analyze(page, *args, **kwargs):
+        # Long enough per page for the workers to interleave
+        time.sleep(0.05)
+        analyzed.extend(comment["id"] for comment in page)
+        return [
+            {"id": comment["id"], "sentiment": "BROKEN" if comment["id"] == POISONED_ID else "NEU",
+             "confidence": 1.0, "topic_tags": []}
+            for comment in page
+        ]
+
+    WorkspaceAnalysisPipeline._analyze = staticmethod(stub_analyze)
+    pipeline = WorkspaceAnalysisPipeline(WORKSPACE_ID, lease_owner=jobs.instance_id(), page_size=20)
+    asyncio.run(pipeline.run())
+    results.put((jobs.instance_id(), analyzed))
+
+def test_worker_processes_analyze_each_comment_once(database_run, analyzed):
+    database_run(seed_comments(WORKSPACE_ID, _comments(400)))
+
+    # Processes are forked with the test's settings and stubs but open their own connections
+    context = multiprocessing.get_context("fork")
+    crashed = context.Process(target=_abandon_leases, args=(50,))
+    crashed.start()
+    crashed.join()
+    assert crashed.exitcode == 1
+    # Let the dead worker's leases expire
+    time.sleep(1.2)
+
+    results = context.Queue()
+    workers = [context.Process(target=_drain, args=(results,)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    async def final_state():
+        async with get_db_connection() as conn:
+            return await conn.fetch(
+                "SELECT id, lease_owner IS NOT NULL AS leased, lease_expires_at = 'infinity' AS quarantined "
+                "FROM comments WHERE sentiment IS NULL OR lease_owner IS NOT NULL"
+            )
+
+    leftover = database_run(final_state())
+
+    owners = {owner for owner, _ in outcomes}
+    counts = Counter(comment_id for _, ids in outcomes for comment_id in ids)
+    assert len(owners) == 3
+    assert len(counts) == 400
+    assert max(counts.values()) == 1
+    # Each worker did part of the work
+    assert all(ids for _, ids in outcomes)
+    assert [tuple(row) for row in leftover] == [(POISONED_ID, True, True)]
@@ -0,0 +1,86 @@
+"""Class-based TF-IDF keyword weights on a small fixed corpus"""
+
+import math
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+from app.core.ctfidf import _weights, class_tfidf_keywords
+
+TEXTS = [
+    "battery drains fast, battery dies by noon",
+    "battery life is short and the screen is dim",
+    "camera quality is great, camera zoom is great too",
+    "ok",
+    "it is what it is",
+    "screen cracked after one drop",
+]
+GROUPS = ["phone-a", "phone-a", "phone-b", "phone-c", "phone-c", "phone-d"]
+# Unigrams of each text after the English stop words, as the vectorizer tokenizes them
+TOKENS = [
+    ["battery", "drains", "fast", "battery", "dies", "noon"],
+    ["battery", "life", "short", "screen", "dim"],
+    ["camera", "quality", "great", "camera", "zoom", "great"],
+    [],
+    [],
+    ["screen", "cracked", "drop"],
+]
+
+def _reference(groups):
+    """weight(t, c) = tf(t, c) / words(c) * log(1 + average words per group / tf(t)), term by term"""
+    group_counts = {}
+    for tokens, group in zip(TOKENS, groups):
+        group_counts.setdefault(group, Counter()).update(tokens)
+    # Groups without a single word don't count towards the average
+    filled = [counts for counts in group_counts.values() if counts]
+    average_words = sum(sum(counts.values()) for counts in filled) / len(filled)
+    term_frequency = Counter(token for tokens in TOKENS for token in tokens)
+
+    return [
+        {
+            term: group_counts[group][term] / sum(group_counts[group].values())
+            * math.log(1 + average_words / term_frequency[term])
+            for term in set(tokens)
+        }
+        for tokens, group in zip(TOKENS, groups)
+    ]
+
+def _computed(groups):
+    indices, rows, terms, weights, words = _weights(TEXTS, groups, (1, 1), 10)
+    computed = [{} for _ in TEXTS]
+    for row, term, weight in zip(rows, terms, weights):
+        computed[indices[row]][str(words[term])] = weight
+    return computed
+
+@pytest.mark.parametrize("groups", [GROUPS, list(range(len(TEXTS)))])
+def test_weights_match_the_formula(groups):
+    computed, expected = _computed(groups), _reference(groups)
+    assert [set(weights) for weights in computed] == [set(weights) for weights in expected]
+    for got, want in zip(computed, expected):
+        for term in want:
+            assert got[term] == pytest.approx(want[term]), term
+
+def test_keywords_are_the_heaviest_terms():
+    expected = [sorted(weights, key=lambda term: (-weights[term], term))[:3] for weights in _reference(GROUPS)]
+    assert class_tfidf_keywords(TEXTS, GROUPS, top_k=3, ngram_range=(1, 1)) == expected
+
+def test_terms_frequent_in_a_class_outrank_terms_shared_across_classes():
+    keywords = class_tfidf_keywords(TEXTS, GROUPS, top_k=1, ngram_range=(1, 1))
+    # "battery" appears three times in phone-a and nowhere else
+    assert keywords[:2] == [["battery"], ["battery"]]
+    assert keywords[2] == ["camera"]
+
+def test_single_document_class_is_plain_tfidf_over_the_batch():
+    grouped = class_tfidf_keywords(TEXTS, GROUPS, top_k=10, ngram_range=(1, 1))
+    ungrouped = class_tfidf_keywords(TEXTS, None, top_k=10, ngram_range=(1, 1))
+    # phone-b holds one document; its weights only differ from plain TF-IDF by the average
+    assert grouped[2] == ungrouped[2]
+    assert set(grouped[5]) == {"screen", "cracked", "drop"}
+
+def test_empty_classes_get_no_keywords():
+    keywords = class_tfidf_keywords(TEXTS, GROUPS, top_k=3)
+    assert keywords[3] == [] and keywords[4] == []
+    assert class_tfidf_keywords(["it is what it is", "ok"], ["a", "b"]) == [[], []]
+    assert class_tfidf_keywords([], None) == []
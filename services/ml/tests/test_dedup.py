@@ -0,0 +1,111 @@
+"""Near-duplicate grouping: what shares a result, and the workspace window"""
+
+import pytest
+
+from app.core import dedup
+from app.core.config import get_settings
+from app.core.dedup import NearDuplicateIndex, resolve_near_duplicates
+
+REVIEW = "Honestly this update is great, the new camera works really well and the battery lasts all day"
+
+class Model:
+    """Counting stand-in whose value identifies the text it was computed from"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return list(texts)
+
+def _resolve(texts, index=None, model=None):
+    index = index if index is not None else NearDuplicateIndex(get_settings().dedup_threshold)
+    return resolve_near_duplicates(texts, "sentiment", model or Model(), index=index)
+
+def test_variants_share_their_leaders_result():
+    variants = [
+        REVIEW,
+        f"@fan42 {REVIEW.upper()} 🔥🔥",
+        f"{REVIEW.lower()} https://t.co/abc123",
+    ]
+    values, sizes = _resolve(variants)
+
+    assert values == [REVIEW] * 3
+    assert sizes == [3, 3, 3]
+
+@pytest.mark.parametrize("flipped", [
+    "Honestly this update is not great, the new camera works really badly and the battery lasts all day",
+    "Honestly this update is not great, the new camera works really well and the battery lasts all day",
+    "Honestly this update isn't great, the new camera works really well and the battery lasts all day",
+    "Honestly this update is great, the new camera never works really well and the battery lasts all day",
+])
+def test_negations_get_their_own_result(flipped):
+    values, _ = _resolve([REVIEW, flipped])
+    assert values == [REVIEW, flipped]
+
+def test_negation_survives_a_long_comment():
+    # One inserted word barely moves the similarity of a long text
+    long_review = " ".join([REVIEW] * 3)
+    negated = long_review.replace("is great", "is not great", 1)
+    assert dedup.jaccard(*dedup.shingle_sets([dedup.dedup_normalize(long_review), dedup.dedup_normalize(negated)])) > 0.9
+
+    values, _ = _resolve([long_review, negated])
+    assert values == [long_review, negated]
+
+@pytest.mark.parametrize("a, b", [
+    ("this video is great", "this video is awful"),
+    ("love this song", "hate this song"),
+])
+def test_one_word_flips_of_short_comments_stay_apart(a, b):
+    values, _ = _resolve([a, b])
+    assert values == [a, b]
+
+def test_window_reuses_leaders_across_pages():
+    index = NearDuplicateIndex(0.9, max_leaders=100, ttl_seconds=3600)
+    model = Model()
+
+    _resolve([REVIEW, "first page only"], index, model)
+    values, sizes = _resolve([f"{REVIEW.upper()}!!", "second page only"], index, model)
+
+    assert model.calls == [[REVIEW, "first page only"], ["second page only"]]
+    assert values == [REVIEW, "second page only"]
+    assert sizes == [2, 1]
+
+def test_window_forgets_expired_leaders(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(dedup.time, "monotonic", lambda: now["t"])
+    index = NearDuplicateIndex(0.9, ttl_seconds=60)
+    model = Model()
+
+    _resolve([REVIEW], index, model)
+    now["t"] += 30
+    _resolve([REVIEW], index, model)
+    assert len(model.calls) == 1
+
+    now["t"] += 61
+    _resolve([REVIEW], index, model)
+    assert model.calls == [[REVIEW], [REVIEW]]
+
+def test_window_evicts_oldest_leaders_beyond_max():
+    index = NearDuplicateIndex(0.9, max_leaders=2)
+    model = Model()
+    texts = ["the first distinct comment", "another unrelated remark", "a third separate message"]
+
+    _resolve(texts, index, model)
+    assert len(index) == 2
+    _resolve(texts[1:], index, model)
+    assert len(model.calls) == 1
+    _resolve(texts[:1], index, model)
+    assert model.calls[-1] == texts[:1]
+
+def test_unstorable_values_are_recomputed():
+    index = NearDuplicateIndex(0.9, max_leaders=10)
+    calls = []
+
+    def failing(texts):
+        calls.append(list(texts))
+        return [{"error": "model failed"} for _ in texts]
+
+    for _ in range(2):
+        resolve_near_duplicates([REVIEW], "sentiment", failing, index=index, storable=lambda value: "error" not in value)
+    assert len(calls) == 2
@@ -0,0 +1,87 @@
+"""Embedding store reuse by the pipeline, pruning and the shared volume check"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from app.core import embedding_store, pipeline
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+from app.core.embedding_store import EmbeddingStoreError, check_shared_store_dir, open_workspace_store
+from app.core.pipeline import WorkspaceAnalysisPipeline
+from conftest import seed_comments
+
+WORKSPACE_ID = "store-workspace"
+DIM = 8
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "embedding_store_enabled", True)
+    monkeypatch.setattr(settings, "embedding_store_dir", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "_stores", OrderedDict())
+    monkeypatch.setattr(pipeline, "workspace_ann_index", lambda workspace_id: None)
+    return tmp_path
+
+@pytest.fixture
+def encoded(monkeypatch):
+    calls = []
+
+    def embed_texts(texts):
+        calls.append(list(texts))
+        return np.stack([np.full(DIM, len(text), dtype=np.float32) for text in texts])
+
+    monkeypatch.setattr(pipeline, "embed_texts", embed_texts)
+    return calls
+
+def _page(*comments: tuple) -> list:
+    return [{"id": comment_id, "text": text} for comment_id, text in comments]
+
+def test_store_embeddings_encodes_only_missing_comments(store_dir, encoded):
+    first = WorkspaceAnalysisPipeline._store_embeddings(WORKSPACE_ID, _page(("a", "one"), ("b", "three")))
+    assert encoded == [["one", "three"]]
+    assert sorted(first) == ["one", "three"]
+
+    page = _page(("a", "one"), ("b", "three"), ("c", "three"), ("d", "seventeen"))
+    second = WorkspaceAnalysisPipeline._store_embeddings(WORKSPACE_ID, page)
+    assert encoded[-1] == ["seventeen"]
+    np.testing.assert_allclose(second["three"], np.full(DIM, 5))
+
+    store = open_workspace_store(WORKSPACE_ID)
+    assert len(store) == 4
+    # A page embedded before writes nothing
+    WorkspaceAnalysisPipeline._store_embeddings(WORKSPACE_ID, page)
+    assert len(encoded) == 2
+    assert store.snapshot().vectors.shape[0] == 4
+
+def test_prune_skips_while_another_instance_prunes(store_dir, encoded, database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, [("a", "first comment text here")])
+        WorkspaceAnalysisPipeline._store_embeddings(WORKSPACE_ID, _page(("a", "one"), ("gone", "two")))
+
+        async with get_db_connection() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('embedding_store_prune'))")
+                skipped = await embedding_store.prune_embedding_stores()
+        return skipped, await embedding_store.prune_embedding_stores()
+
+    skipped, pruned = database_run(scenario())
+
+    assert skipped is None
+    assert pruned == {WORKSPACE_ID: 1}
+    assert open_workspace_store(WORKSPACE_ID).get(["a", "gone"])[0] == ["a"]
+
+def test_claim_mode_requires_a_declared_shared_store_dir(store_dir, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "analysis_claim_mode", True)
+    monkeypatch.setattr(settings, "embedding_store_shared", False)
+    with pytest.raises(EmbeddingStoreError, match="EMBEDDING_STORE_SHARED"):
+        check_shared_store_dir()
+
+    monkeypatch.setattr(settings, "embedding_store_shared", True)
+    check_shared_store_dir()
+
+    monkeypatch.setattr(settings, "analysis_claim_mode", False)
+    monkeypatch.setattr(settings, "embedding_store_shared", False)
+    check_shared_store_dir()
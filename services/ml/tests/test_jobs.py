@@ -0,0 +1,48 @@
+"""Keyset analysis jobs: heartbeats independent of page writes"""
+
+import asyncio
+
+import pytest
+
+from app.core import jobs
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+
+WORKSPACE_ID = "jobs-workspace"
+
+@pytest.fixture
+def runner(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "analysis_claim_mode", False)
+    # Heartbeats every second
+    monkeypatch.setattr(settings, "job_stale_after_seconds", 2)
+    return jobs.AnalysisJobRunner()
+
+def test_slow_page_keeps_its_job(runner, database_run):
+    async def scenario():
+        job, _ = await jobs.create_analysis_job(WORKSPACE_ID, None, None, 10)
+        # A page that takes longer than the stale timeout to write
+        slow_page = asyncio.create_task(runner._with_heartbeat(job["id"], asyncio.sleep(2.5, "written")))
+        await asyncio.sleep(2.2)
+        stolen = await jobs.claim_stale_jobs(2)
+        return stolen, await slow_page
+
+    stolen, result = database_run(scenario())
+
+    assert stolen == []
+    assert result == "written"
+
+def test_heartbeat_stops_work_on_a_job_taken_over(runner, database_run):
+    async def scenario():
+        job, _ = await jobs.create_analysis_job(WORKSPACE_ID, None, None, 10)
+        async with get_db_connection() as conn:
+            await conn.execute(
+                "UPDATE job_runs SET payload_json = payload_json || '{\"owner\": \"other\"}' WHERE id = $1",
+                job["id"]
+            )
+        work = asyncio.ensure_future(asyncio.sleep(30))
+        with pytest.raises(jobs.JobOwnershipLost):
+            await runner._with_heartbeat(job["id"], work)
+        return work.cancelled()
+
+    assert database_run(scenario())
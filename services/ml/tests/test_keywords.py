@@ -0,0 +1,66 @@
+"""Batched MMR keyword extraction agrees with KeyBERT"""
+
+import hashlib
+
+import numpy as np
+import pytest
+
+keybert = pytest.importorskip("keybert")
+from keybert.backend import BaseEmbedder
+
+from app.core.models import KEYWORD_DIVERSITY, KEYWORD_NGRAM_RANGE, _extract_keywords_batched
+
+DOCS = [
+    "The new camera update makes low light photos look amazing on this phone",
+    "Battery life got worse after the update and the phone heats up while charging",
+    "Shipping took three weeks and the box arrived damaged, customer support never replied",
+    "Love the colour options, the green model looks great with the matte finish",
+    "Price is too high for what you get, the older model had better speakers",
+    "Great video, the camera comparison with night mode samples was really helpful",
+    "short one",
+]
+
+def _embed(texts) -> np.ndarray:
+    """Deterministic stand-in encoder: hashed character trigrams"""
+    vectors = np.zeros((len(texts), 64), dtype=np.float32)
+    for row, text in enumerate(texts):
+        padded = f"  {text.lower()}  "
+        for start in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[start:start + 3].encode(), digest_size=4).digest()
+            vectors[row, int.from_bytes(digest, "little") % 64] += 1.0
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class Encoder:
+    """The slice of a SentenceTransformer the batched extraction uses"""
+
+    def encode(self, texts, **kwargs):
+        return _embed(texts)
+
+class KeyBERTEncoder(BaseEmbedder):
+    def embed(self, documents, verbose=False):
+        return _embed(documents)
+
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_batched_mmr_matches_keybert(top_k):
+    expected = keybert.KeyBERT(model=KeyBERTEncoder()).extract_keywords(
+        DOCS,
+        keyphrase_ngram_range=KEYWORD_NGRAM_RANGE,
+        stop_words="english",
+        use_mmr=True,
+        diversity=KEYWORD_DIVERSITY,
+        top_n=top_k
+    )
+
+    actual = _extract_keywords_batched(
+        Encoder(), DOCS, top_k=top_k, keyphrase_ngram_range=KEYWORD_NGRAM_RANGE, diversity=KEYWORD_DIVERSITY
+    )
+
+    assert actual == [[word for word, _ in keywords] for keywords in expected]
+
+def test_precomputed_document_embeddings_give_the_same_keywords():
+    encoder = Encoder()
+    fresh = _extract_keywords_batched(encoder, DOCS, 5, KEYWORD_NGRAM_RANGE, KEYWORD_DIVERSITY)
+    reused = _extract_keywords_batched(
+        encoder, DOCS, 5, KEYWORD_NGRAM_RANGE, KEYWORD_DIVERSITY, doc_embeddings=_embed(DOCS)
+    )
+    assert reused == fresh
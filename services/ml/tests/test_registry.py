@@ -0,0 +1,62 @@
+"""Model registry resolution and verification"""
+
+import pytest
+
+from app.core.config import get_settings
+from app.core.registry import ModelRegistry, RegistryError
+
+SOURCE = "org/sentiment-model"
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """An empty registry, resolved offline with checksums"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "model_offline", True)
+    monkeypatch.setattr(settings, "model_verify_checksums", True)
+    return ModelRegistry(str(tmp_path))
+
+def _snapshot(registry: ModelRegistry, name: str = "sentiment", source: str = SOURCE):
+    path = registry.root / name / "snapshot"
+    path.mkdir(parents=True)
+    (path / "config.json").write_text('{"model_type": "roberta"}')
+    (path / "model.safetensors").write_bytes(b"weights" * 100)
+    registry.register(name, "huggingface", source, path)
+    registry.save()
+    return path
+
+def test_offline_resolution_fails_on_a_missing_artifact(registry, monkeypatch):
+    with pytest.raises(RegistryError, match="not in .*run the prefetch"):
+        registry.resolve("sentiment", SOURCE)
+
+    # Online the hub id is used instead
+    monkeypatch.setattr(get_settings(), "model_offline", False)
+    assert registry.resolve("sentiment", SOURCE) == SOURCE
+
+def test_offline_resolution_fails_on_a_different_source(registry):
+    _snapshot(registry)
+    with pytest.raises(RegistryError, match="was prefetched from"):
+        registry.resolve("sentiment", "org/other-model")
+
+def test_prefetched_artifact_resolves_to_its_local_path(registry):
+    path = _snapshot(registry)
+    # A fresh registry reads the saved manifest
+    assert ModelRegistry(str(registry.root)).resolve("sentiment", SOURCE) == str(path)
+
+def test_offline_resolution_fails_on_a_missing_file(registry):
+    path = _snapshot(registry)
+    (path / "config.json").unlink()
+    with pytest.raises(RegistryError, match="is missing"):
+        registry.resolve("sentiment", SOURCE)
+
+def test_checksum_catches_same_size_corruption(registry, monkeypatch):
+    path = _snapshot(registry)
+    weights = path / "model.safetensors"
+    weights.write_bytes(weights.read_bytes()[::-1])
+
+    with pytest.raises(RegistryError, match="failed its checksum"):
+        registry.resolve("sentiment", SOURCE)
+    # Start-up checks compare sizes only
+    registry.verify("sentiment", source=SOURCE, checksums=False)
+    monkeypatch.setattr(get_settings(), "model_verify_checksums", False)
+    assert registry.resolve("sentiment", SOURCE) == str(path)
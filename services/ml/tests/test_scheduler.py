@@ -0,0 +1,116 @@
+"""Micro-batching inference scheduler: coalescing, limits, overload and shutdown"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.core.scheduler import InferenceScheduler, SchedulerOverloadedError
+
+class Model:
+    """Batch function that records its batches and can be held mid-batch"""
+
+    def __init__(self, hold: bool = False):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        self.entered.set()
+        self.release.wait(timeout=10)
+        return [text.upper() for text in texts]
+
+def _scheduler(model, max_batch_size=8, max_wait_ms=200, max_queue_size=100):
+    scheduler = InferenceScheduler("test", model, max_batch_size, max_wait_ms, max_queue_size)
+    scheduler.start()
+    return scheduler
+
+def test_concurrent_requests_share_one_batch():
+    model = Model()
+    scheduler = _scheduler(model)
+
+    async def scenario():
+        return await asyncio.gather(*(scheduler.submit([f"a{i}", f"b{i}"]) for i in range(4)))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        scheduler.stop()
+
+    assert results == [[f"A{i}", f"B{i}"] for i in range(4)]
+    assert [len(batch) for batch in model.batches] == [8]
+    stats = scheduler.stats()
+    assert (stats["requests"], stats["batches"], stats["texts"]) == (4, 1, 8)
+
+def test_batches_stop_at_max_size_without_splitting_requests():
+    model = Model()
+    scheduler = _scheduler(model, max_batch_size=8)
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.submit(["a"] * 3),
+            scheduler.submit(["b"] * 3),
+            scheduler.submit(["c"] * 3),
+            scheduler.submit(["d"] * 10)
+        )
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        scheduler.stop()
+
+    assert results == [["A"] * 3, ["B"] * 3, ["C"] * 3, ["D"] * 10]
+    # The third request carries over; the oversized one runs alone
+    assert [len(batch) for batch in model.batches] == [6, 3, 10]
+
+def test_full_queue_rejects_requests():
+    model = Model(hold=True)
+    scheduler = _scheduler(model, max_wait_ms=0, max_queue_size=1)
+
+    async def scenario():
+        running = asyncio.ensure_future(scheduler.submit(["first"]))
+        await asyncio.to_thread(model.entered.wait, 5)
+        queued = asyncio.ensure_future(scheduler.submit(["second"]))
+        await asyncio.sleep(0.05)
+        with pytest.raises(SchedulerOverloadedError):
+            await scheduler.submit(["third"])
+        model.release.set()
+        return await running, await queued
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        scheduler.stop()
+
+    assert results == (["FIRST"], ["SECOND"])
+    assert scheduler.stats()["rejected"] == 1
+
+def test_stop_drains_queued_requests_and_fails_later_ones():
+    model = Model(hold=True)
+    scheduler = _scheduler(model, max_wait_ms=0)
+
+    async def scenario():
+        running = asyncio.ensure_future(scheduler.submit(["first"]))
+        await asyncio.to_thread(model.entered.wait, 5)
+        queued = [asyncio.ensure_future(scheduler.submit([name])) for name in ("second", "third")]
+        await asyncio.sleep(0.05)
+
+        stopping = asyncio.ensure_future(asyncio.to_thread(scheduler.stop))
+        while scheduler._queue.qsize() < 3:
+            await asyncio.sleep(0.01)
+        # Queued behind the stop marker
+        late = asyncio.ensure_future(scheduler.submit(["late"]))
+        await asyncio.sleep(0.05)
+
+        model.release.set()
+        await stopping
+        return await asyncio.gather(running, *queued, late, return_exceptions=True)
+
+    first, second, third, late = asyncio.run(scenario())
+
+    assert (first, second, third) == (["FIRST"], ["SECOND"], ["THIRD"])
+    assert isinstance(late, RuntimeError) and "stopped" in str(late)
+    assert not scheduler.running
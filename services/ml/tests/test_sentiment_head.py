@@ -0,0 +1,82 @@
+"""Sentiment head: saved weights, predictions and a missing head"""
+
+import numpy as np
+import pytest
+
+from app.core import models
+from app.core.config import get_settings
+from app.core.models import ModelNotReady
+from app.core.sentiment_head import HEAD_TIER, SentimentHead, load_sentiment_head
+
+CLASSES = ["NEG", "NEU", "POS"]
+
+def _head(embedding_model: str = "all-MiniLM-L6-v2") -> SentimentHead:
+    # Class i fires on embedding axis i
+    return SentimentHead(
+        coef=np.eye(3, 4, dtype=np.float32) * 10,
+        intercept=np.zeros(3, dtype=np.float32),
+        classes=CLASSES,
+        embedding_model=embedding_model,
+        version="test-1",
+        metrics={"accuracy": 0.9}
+    )
+
+def test_saved_head_loads_and_predicts(tmp_path):
+    path = tmp_path / "heads" / "sentiment_head.npz"
+    _head().save(path)
+
+    head = load_sentiment_head(str(path))
+    assert (head.classes, head.embedding_model, head.version, head.metrics) == (
+        CLASSES, "all-MiniLM-L6-v2", "test-1", {"accuracy": 0.9}
+    )
+    np.testing.assert_array_equal(head.coef, _head().coef)
+
+    results = head.predict(np.eye(3, 4, dtype=np.float32))
+    assert [result["sentiment"] for result in results] == CLASSES
+    assert all(result["tier"] == HEAD_TIER and result["confidence"] > 0.99 for result in results)
+    assert [score["label"] for score in results[0]["all_scores"]] == CLASSES
+    assert sum(score["score"] for score in results[0]["all_scores"]) == pytest.approx(1.0)
+
+def test_binary_head_scores_the_second_class():
+    head = SentimentHead(
+        coef=np.array([[4.0, 0.0]], dtype=np.float32),
+        intercept=np.zeros(1, dtype=np.float32),
+        classes=["NEG", "POS"],
+        embedding_model="m",
+        version="",
+        metrics={}
+    )
+    results = head.predict(np.array([[1.0, 0.0], [-1.0, 0.0]], dtype=np.float32))
+    assert [result["sentiment"] for result in results] == ["POS", "NEG"]
+
+def test_missing_head_is_not_ready(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "sentiment_head_path", str(tmp_path / "missing.npz"))
+    with pytest.raises(FileNotFoundError):
+        load_sentiment_head(str(tmp_path / "missing.npz"))
+    with pytest.raises(ModelNotReady, match="train one first"):
+        models._head_values(["great video"])
+
+def test_head_for_another_encoder_is_not_ready(tmp_path, monkeypatch):
+    path = tmp_path / "sentiment_head.npz"
+    _head(embedding_model="some-other-encoder").save(path)
+    monkeypatch.setattr(get_settings(), "sentiment_head_path", str(path))
+    with pytest.raises(ModelNotReady, match="some-other-encoder"):
+        models._head_values(["great video"])
+
+def test_head_uses_given_embeddings_and_encodes_the_rest(tmp_path, monkeypatch):
+    path = tmp_path / "sentiment_head.npz"
+    _head(embedding_model=get_settings().embedding_model).save(path)
+    monkeypatch.setattr(get_settings(), "sentiment_head_path", str(path))
+    encoded = []
+
+    def embed_texts(texts):
+        encoded.append(list(texts))
+        return np.tile(np.eye(1, 4, 0, dtype=np.float32), (len(texts), 1))
+
+    monkeypatch.setattr(models, "embed_texts", embed_texts)
+    given = {"great video": np.eye(1, 4, 2, dtype=np.float32)[0]}
+
+    results = models._head_values(["great video", "awful", "awful"], given)
+
+    assert encoded == [["awful"]]
+    assert [result["sentiment"] for result in results] == ["POS", "NEG", "NEG"]
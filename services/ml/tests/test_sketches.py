@@ -0,0 +1,149 @@
+"""Documented error bounds of the per-day tag sketches against exact counts"""
+
+import asyncio
+import math
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.config import get_settings
+from app.core import sketches
+from app.core.sketches import CountMinSketch, SpaceSaving, TagSketch
+
+TAGS = 20_000
+DAYS = 10
+WINDOW = 7
+
+@pytest.fixture(scope="module")
+def mentions():
+    """Zipf-distributed tag mentions spread over the days, as (tag ranks, days)"""
+    rng = np.random.default_rng(11)
+    return rng.zipf(1.1, size=300_000) % TAGS, rng.integers(0, DAYS, size=300_000)
+
+@pytest.fixture(scope="module")
+def window(mentions):
+    """The window's day sketches, built from pipeline-sized pages and merged"""
+    ranks, days = mentions
+    sketches = []
+    for day in range(DAYS - WINDOW, DAYS):
+        sketch = TagSketch.empty()
+        day_ranks = ranks[days == day]
+        for start in range(0, day_ranks.size, 500):
+            counts = Counter(f"tag-{rank}" for rank in day_ranks[start:start + 500].tolist())
+            sketch.update(dict(counts), {})
+        sketches.append(sketch)
+    return TagSketch.merge(sketches)
+
+@pytest.fixture(scope="module")
+def exact(mentions):
+    ranks, days = mentions
+    return np.bincount(ranks[days >= DAYS - WINDOW], minlength=TAGS)
+
+def test_window_total_is_exact(window, exact):
+    assert window.total == exact.sum()
+
+def test_space_saving_bounds(window, exact):
+    total = int(exact.sum())
+    k = get_settings().tag_sketch_capacity
+    tracked = window.heavy_hitters.entries
+
+    for tag, (count, error, _) in tracked.items():
+        true = exact[int(tag.split("-")[1])]
+        assert count - error <= true <= count, tag
+        assert error <= total / k, tag
+    # Every tag with more than N/k mentions is tracked
+    for rank in np.flatnonzero(exact > total / k):
+        assert f"tag-{rank}" in tracked
+
+def test_count_min_bounds(window, exact):
+    settings = get_settings()
+    total = int(exact.sum())
+    estimates = window.count_min.estimate_many([f"tag-{rank}" for rank in range(TAGS)]).astype(np.int64)
+
+    assert (estimates >= exact).all()
+    # Overshoots beyond (e/w) * N for at most a fraction e^-d of tags, with sampling slack
+    epsilon = math.e / settings.tag_sketch_width
+    delta = math.exp(-settings.tag_sketch_depth)
+    seen = exact > 0
+    assert ((estimates - exact)[seen] > epsilon * total).mean() <= 2 * delta
+
+def test_estimate_is_an_upper_bound(window, exact):
+    tags = [f"tag-{rank}" for rank in range(0, TAGS, 7)]
+    assert (window.estimate(tags) >= exact[::7]).all()
+
+def test_sketches_round_trip(window):
+    settings = get_settings()
+    count_min = CountMinSketch.from_bytes(
+        window.count_min.to_bytes(), settings.tag_sketch_width, settings.tag_sketch_depth
+    )
+    np.testing.assert_array_equal(count_min.table, window.count_min.table)
+
+    heavy_hitters = SpaceSaving.from_json(window.heavy_hitters.to_json(), settings.tag_sketch_capacity, window.total)
+    assert heavy_hitters.top(50) == window.heavy_hitters.top(50)
+
+def test_count_min_blob_keeps_its_own_size():
+    sketch = CountMinSketch(512, 3)
+    sketch.add_many(["price", "shipping"], [4, 2])
+
+    # Sized by the blob header, not by the (changed) settings passed in
+    decoded = CountMinSketch.from_bytes(sketch.to_bytes(), 2048, 4)
+    assert (decoded.width, decoded.depth) == (512, 3)
+    np.testing.assert_array_equal(decoded.table, sketch.table)
+
+    headerless = zlib.compress(sketch.table.astype("<u4").tobytes())
+    np.testing.assert_array_equal(CountMinSketch.from_bytes(headerless, 512, 3).table, sketch.table)
+    with pytest.raises(ValueError):
+        CountMinSketch.from_bytes(headerless, 2048, 4)
+
+def test_wider_sketches_fold_into_narrower_ones():
+    tags = [f"tag-{rank}" for rank in range(500)]
+    counts = list(range(1, 501))
+    wide, narrow = CountMinSketch(2048, 4), CountMinSketch(512, 3)
+    wide.add_many(tags, counts)
+    narrow.add_many(tags, counts)
+
+    np.testing.assert_array_equal(wide.folded(512, 3).table, narrow.table)
+    merged = CountMinSketch(512, 3)
+    merged.merge_into(wide)
+    np.testing.assert_array_equal(merged.table, narrow.table)
+    with pytest.raises(ValueError):
+        narrow.folded(2048, 3)
+
+def test_sketch_trends_report_counts_within_their_error(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "tag_sketch_capacity", 8)
+    monkeypatch.setattr(settings, "trend_baseline_days", 7)
+    today = datetime.utcnow().date()
+    rng = np.random.default_rng(5)
+
+    exact = Counter()
+    buckets = {}
+    for offset in range(14):
+        day = today - timedelta(days=offset)
+        # Many small tags push the bursting ones in and out of the small summaries
+        counts = {f"noise-{i}": int(rng.integers(1, 4)) for i in rng.choice(200, size=30, replace=False)}
+        if offset < 3:
+            counts.update({"launch": 40 + offset, "recall": 25})
+        sketch = TagSketch.empty()
+        sketch.update(counts, {})
+        buckets[day] = sketch
+        if offset < 3:
+            exact.update(counts)
+
+    async def fake_load_buckets(workspace_id, platform, first_day, last_day):
+        return {"YOUTUBE": {day: sketch for day, sketch in buckets.items() if first_day <= day <= last_day}}
+
+    monkeypatch.setattr(sketches, "load_buckets", fake_load_buckets)
+    trends = asyncio.run(sketches.sketch_trends("ws", days=3, min_burst=0.0))
+
+    window = TagSketch.merge([buckets[today - timedelta(days=offset)] for offset in range(3)])
+    reported = {trend["tag"]: trend for trend in trends}
+    assert {"launch", "recall"} <= set(reported)
+    for tag, trend in reported.items():
+        count, error = trend["mention_count"], trend["mention_count_error"]
+        # Count and error both come from the merged window summary
+        assert [count, error] == window.heavy_hitters.entries[tag][:2], tag
+        assert count - error <= exact[tag] <= count, tag
@@ -0,0 +1,99 @@
+"""Counter maintenance by the writeback statement and the stats reconciler"""
+
+import asyncio
+import time
+
+from app.core import stats
+from app.core.database import (
+    _apply_comment_chunk, _stage_comment_result, bulk_update_comment_results, get_db_connection
+)
+from conftest import seed_comments
+
+WORKSPACE_ID = "stats-workspace"
+
+async def _counters() -> tuple:
+    async with get_db_connection() as conn:
+        day_stats = await conn.fetch(
+            "SELECT comment_count, positive_count, neutral_count, negative_count, confidence_sum, confidence_count "
+            "FROM workspace_sentiment_stats ORDER BY day"
+        )
+        tags = await conn.fetch(
+            "SELECT tag, mention_count, sentiment_sum FROM tag_daily_rollups WHERE mention_count <> 0 ORDER BY tag"
+        )
+    return (
+        [tuple(row) for row in day_stats],
+        {row["tag"]: (row["mention_count"], row["sentiment_sum"]) for row in tags}
+    )
+
+def _result(comment_id: str, sentiment: str, confidence: float, tags: list) -> dict:
+    return {"id": comment_id, "sentiment": sentiment, "confidence": confidence, "topic_tags": tags}
+
+def test_reanalysis_retracts_previous_values(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, [("a", "first comment text here"), ("b", "second comment text here")])
+        await bulk_update_comment_results([
+            _result("a", "NEU", 0.5, ["price", "shipping"]),
+            _result("b", "NEG", 0.75, ["price"])
+        ])
+        first = await _counters()
+        await bulk_update_comment_results([_result("a", "POS", 0.875, ["shipping", "quality"])])
+        return first, await _counters()
+
+    first, second = database_run(scenario())
+
+    assert first == ([(2, 0, 1, 1, 1.25, 2)], {"price": (2, -1), "shipping": (1, 0)})
+    # Comment a moves from NEU to POS and from price to quality
+    assert second == ([(2, 1, 0, 1, 1.625, 2)], {"price": (1, -1), "quality": (1, 1), "shipping": (1, 1)})
+
+def test_reconcile_corrects_drift(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, [("a", "first comment text here"), ("b", "second comment text here")])
+        await bulk_update_comment_results([
+            _result("a", "POS", 0.5, ["price"]),
+            _result("b", "NEG", 0.5, ["price"])
+        ])
+        expected = await _counters()
+        async with get_db_connection() as conn:
+            await conn.execute("UPDATE workspace_sentiment_stats SET comment_count = 99, positive_count = 7")
+            await conn.execute("UPDATE tag_daily_rollups SET mention_count = 5")
+            await conn.execute(
+                "INSERT INTO tag_daily_rollups VALUES ($1, 'YOUTUBE', 'ghost', CURRENT_DATE, 3, 0, NOW())",
+                WORKSPACE_ID
+            )
+        corrected = await stats.reconcile_stats(7)
+        return expected, corrected, await _counters(), await stats.reconcile_stats(7)
+
+    expected, corrected, reconciled, again = database_run(scenario())
+
+    assert corrected == {"workspace_sentiment_stats": 1, "tag_daily_rollups": 2}
+    assert reconciled == expected
+    assert again == {"workspace_sentiment_stats": 0, "tag_daily_rollups": 0}
+
+def test_reconcile_keeps_writeback_that_races_it(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, [("a", "first comment text here"), ("b", "second comment text here")])
+        await bulk_update_comment_results([_result("a", "POS", 0.5, ["price"])])
+
+        async with get_db_connection() as writer, get_db_connection() as observer:
+            # A writeback that holds the counter rows when the reconciliation reaches them
+            transaction = writer.transaction()
+            await transaction.start()
+            staged = [_stage_comment_result(_result("b", "NEG", 0.5, ["price"]), time.time(), "test")]
+            await _apply_comment_chunk(writer, staged, [])
+
+            reconciling = asyncio.create_task(stats.reconcile_stats(7))
+            for _ in range(100):
+                waiting = await observer.fetchval(
+                    "SELECT COUNT(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                )
+                if waiting:
+                    break
+                await asyncio.sleep(0.05)
+            await transaction.commit()
+            await reconciling
+        return await _counters()
+
+    day_stats, tags = database_run(scenario())
+
+    assert day_stats == [(2, 1, 0, 1, 1.0, 2)]
+    assert tags == {"price": (2, 0)}
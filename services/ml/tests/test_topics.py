@@ -0,0 +1,95 @@
+"""Keyword phrases merged into canonical topics at writeback"""
+
+import json
+
+import numpy as np
+import pytest
+
+from app.core import models, pipeline
+from app.core.config import get_settings
+from app.core.database import get_db_connection
+from app.core.models import model_manager
+from app.core.pipeline import WorkspaceAnalysisPipeline
+from app.core.topics import TopicCanonicalizer, assign_topics
+from conftest import seed_comments
+
+WORKSPACE_ID = "topics-workspace"
+
+def _at(similarity: float, axis: int = 0) -> np.ndarray:
+    """Unit vector whose cosine to the ``axis`` unit vector is ``similarity``"""
+    vector = np.zeros(4, dtype=np.float32)
+    vector[axis] = similarity
+    vector[3] = np.sqrt(1 - similarity ** 2)
+    return vector
+
+# Cosine to "new feature": 0.9 and 0.7; "battery life" is unrelated
+PHRASES = {
+    "new feature": _at(1.0),
+    "new features": _at(0.9),
+    "feature update": _at(0.7),
+    "battery life": _at(1.0, axis=1),
+}
+
+def test_phrases_join_a_topic_only_at_the_threshold():
+    leaders = ["new feature"]
+    leader_vectors = np.stack([PHRASES["new feature"]])
+    phrases = ["new features", "feature update"]
+    vectors = np.stack([PHRASES[p] for p in phrases])
+
+    assigned = assign_topics(phrases, vectors, leaders, leader_vectors, threshold=0.8)
+    assert [topic for topic, _ in assigned] == ["new feature", "feature update"]
+    assert assigned[0][1] == pytest.approx(0.9)
+    assert assigned[1][1] == 1.0
+
+    assigned = assign_topics(phrases, vectors, leaders, leader_vectors, threshold=0.6)
+    assert [topic for topic, _ in assigned] == ["new feature", "new feature"]
+
+def test_phrases_found_topics_within_a_batch():
+    phrases = ["new feature", "battery life", "new features"]
+    vectors = np.stack([PHRASES[p] for p in phrases])
+
+    assigned = assign_topics(phrases, vectors, [], np.empty((0, 4), np.float32), threshold=0.8)
+    assert [topic for topic, _ in assigned] == ["new feature", "battery life", "new feature"]
+
+def test_writeback_stores_topics_and_keeps_the_phrases(database_run, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "topic_canonicalization_enabled", True)
+    monkeypatch.setattr(settings, "topic_merge_threshold", 0.8)
+    monkeypatch.setattr(settings, "tag_sketches_enabled", False)
+    monkeypatch.setattr(settings, "embedding_store_enabled", False)
+    monkeypatch.setattr(models, "embed_texts", lambda texts: np.stack([PHRASES[text] for text in texts]))
+    monkeypatch.setattr(pipeline, "topic_canonicalizer", TopicCanonicalizer())
+
+    tags = {
+        "a": ["new feature", "battery life"],
+        "b": ["New Features", "feature update"],
+        "c": ["new features", "new feature"],
+    }
+
+    def stub_analyze(page, *args, **kwargs):
+        return [
+            {"id": comment["id"], "sentiment": "POS", "confidence": 0.9, "topic_tags": tags[comment["id"]]}
+            for comment in page
+        ]
+
+    async def ready(*names):
+        return None
+
+    monkeypatch.setattr(model_manager, "wait_until_ready", ready)
+    monkeypatch.setattr(WorkspaceAnalysisPipeline, "_analyze", staticmethod(stub_analyze))
+
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, [(comment_id, f"comment {comment_id} about the video") for comment_id in tags])
+        await WorkspaceAnalysisPipeline(WORKSPACE_ID).run()
+        async with get_db_connection() as conn:
+            return await conn.fetch("SELECT id, topic_tags, meta_json FROM comments ORDER BY id")
+
+    rows = {row["id"]: row for row in database_run(scenario())}
+
+    assert rows["a"]["topic_tags"] == ["new feature", "battery life"]
+    assert "keywords" not in json.loads(rows["a"]["meta_json"])
+    # "new features" merges at 0.9; "feature update" at 0.7 founds its own topic
+    assert rows["b"]["topic_tags"] == ["new feature", "feature update"]
+    assert json.loads(rows["b"]["meta_json"])["keywords"] == ["New Features", "feature update"]
+    assert rows["c"]["topic_tags"] == ["new feature"]
+    assert json.loads(rows["c"]["meta_json"])["keywords"] == ["new features", "new feature"]
@@ -0,0 +1,105 @@
+"""Trend binning and burst scoring"""
+
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.database import (
+    bulk_update_comment_results, get_db_connection, get_trending_topics, rebuild_tag_daily_rollups
+)
+from app.core.trends import MAX_TREND_BINS, bin_edges, fetch_tag_bins, score_trends
+from conftest import seed_comments
+
+@pytest.mark.parametrize("bin_hours", [1, 5, 7, 24, 36])
+def test_bin_edges_cover_whole_bins(bin_hours):
+    now = datetime(2026, 3, 14, 15, 9, 26)
+    window_start, period_start, period_end = bin_edges(7, bin_hours, 14, now=now)
+
+    bin_seconds = bin_hours * 3600
+    n_bins = math.ceil((period_end - window_start).total_seconds() / bin_seconds)
+    assert (period_end - window_start).total_seconds() == n_bins * bin_seconds
+    assert window_start <= period_start - timedelta(days=14)
+    assert period_start < now < period_end
+    # The last comment of the window lands in the last bin, as FLOOR bins it in SQL
+    last = (period_end - timedelta(seconds=1) - window_start).total_seconds() // bin_seconds
+    assert last == n_bins - 1
+
+def test_score_trends_keeps_bursts_above_min_burst():
+    rng = np.random.default_rng(0)
+    n_series, n_bins = 200, 21
+    counts = rng.poisson(4, size=(n_series, n_bins)).astype(np.float64)
+    # Series 7 jumps in the last bin
+    counts[7, -1] = 60
+    series, bins = np.nonzero(counts)
+    mentions = counts[series, bins]
+
+    def kept(min_burst: float) -> list:
+        return score_trends(
+            series=series, bins=bins, mentions=mentions, sentiment_sums=np.zeros(len(mentions)),
+            n_series=n_series, n_bins=n_bins, recent_bins=7, baseline_bins=14,
+            min_mentions=5, min_burst=min_burst
+        )["series"].tolist()
+
+    assert len(kept(0.0)) > 50
+    assert kept(5.0) == [7]
+
+def test_score_trends_ignores_series_below_min_mentions():
+    rng = np.random.default_rng(1)
+    n_bins = 21
+    counts = rng.poisson(4, size=(50, n_bins)).astype(np.float64)
+    counts[3, -1] = 40
+    # A long tail of tags with a single mention, as real workspaces have
+    tail = np.zeros((100_000, n_bins))
+    tail[np.arange(100_000), rng.integers(0, n_bins, size=100_000)] = 1
+    everything = np.vstack([counts, tail])
+
+    def scored(matrix):
+        series, bins = np.nonzero(matrix)
+        return score_trends(
+            series=series, bins=bins, mentions=matrix[series, bins], sentiment_sums=np.zeros(len(series)),
+            n_series=len(matrix), n_bins=n_bins, recent_bins=7, baseline_bins=14, min_mentions=5
+        )
+
+    full, head = scored(everything), scored(counts)
+    assert set(full) == set(head)
+    for key in full:
+        np.testing.assert_array_equal(full[key], head[key])
+    assert 3 in full["series"]
+
+def test_score_trends_rejects_too_many_bins():
+    with pytest.raises(ValueError, match="bins"):
+        score_trends(
+            series=np.zeros(1, dtype=np.int64), bins=np.zeros(1, dtype=np.int64), mentions=np.ones(1),
+            sentiment_sums=np.zeros(1), n_series=1, n_bins=MAX_TREND_BINS + 1, recent_bins=7,
+            baseline_bins=14, min_mentions=1
+        )
+
+def test_rollups_and_bins_count_a_tag_once_per_comment(database_run):
+    async def scenario():
+        await seed_comments("trends-workspace", [(f"c{i}", f"comment number {i}") for i in range(6)])
+        await bulk_update_comment_results([
+            {"id": f"c{i}", "sentiment": "POS", "confidence": 0.9, "topic_tags": ["price", "price", "shipping"]}
+            for i in range(6)
+        ])
+        async with get_db_connection() as conn:
+            # Half the comments are older than the recent window
+            await conn.execute(
+                "UPDATE comments SET created_at = created_at - INTERVAL '3 days' WHERE id = ANY($1::text[])",
+                ["c0", "c1", "c2"]
+            )
+        await rebuild_tag_daily_rollups("trends-workspace")
+
+        topics = await get_trending_topics("trends-workspace", days=7, recent_days=1)
+        window_start, _, period_end = bin_edges(7, 24, 0)
+        row = await fetch_tag_bins("trends-workspace", None, window_start, period_end, 24)
+        return topics, row
+
+    topics, row = database_run(scenario())
+
+    assert sorted((t["tag"], t["mention_count"], t["recent_mentions"]) for t in topics) == [
+        ("price", 6, 3), ("shipping", 6, 3)
+    ]
+    price = row["tags"].index("price")
+    assert sum(m for s, m in zip(row["series"], row["mentions"]) if s == price) == 6
@@ -0,0 +1,133 @@
+"""Set-based result writeback: written rows, counters and the per-row fallback"""
+
+import json
+import time
+
+from app.core.database import (
+    _apply_comment_chunk, _stage_comment_result, bulk_update_comment_results, get_db_connection
+)
+from conftest import seed_comments
+
+WORKSPACE_ID = "writeback-workspace"
+
+COMMENTS = [(comment_id, f"comment {comment_id} with enough text") for comment_id in "abcde"]
+
+# Passes validation but Postgres cannot store a NUL in text, so only the statement fails
+BAD_TAG = "bad\x00tag"
+
+def _result(comment_id: str, sentiment: str, confidence: float, tags: list, **extra) -> dict:
+    return {"id": comment_id, "sentiment": sentiment, "confidence": confidence, "topic_tags": tags, **extra}
+
+async def _comments() -> dict:
+    async with get_db_connection() as conn:
+        rows = await conn.fetch(
+            "SELECT id, sentiment::text, topic_tags, meta_json, lease_owner, lease_expires_at FROM comments ORDER BY id"
+        )
+    return {
+        row["id"]: (
+            row["sentiment"],
+            row["topic_tags"],
+            json.loads(row["meta_json"]) if row["meta_json"] else None,
+            row["lease_owner"],
+            row["lease_expires_at"]
+        )
+        for row in rows
+    }
+
+async def _counters() -> tuple:
+    """Workspace totals and per-tag rollups, summed over days"""
+    async with get_db_connection() as conn:
+        totals = await conn.fetchrow(
+            "SELECT SUM(comment_count), SUM(positive_count), SUM(neutral_count), SUM(negative_count), "
+            "SUM(confidence_sum), SUM(confidence_count) FROM workspace_sentiment_stats"
+        )
+        tags = await conn.fetch(
+            "SELECT tag, SUM(mention_count) AS mentions, SUM(sentiment_sum) AS sentiment "
+            "FROM tag_daily_rollups GROUP BY tag HAVING SUM(mention_count) <> 0 ORDER BY tag"
+        )
+    return tuple(totals), {row["tag"]: (row["mentions"], row["sentiment"]) for row in tags}
+
+def test_writeback_stores_results_and_clears_leases(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, COMMENTS)
+        async with get_db_connection() as conn:
+            await conn.execute(
+                "UPDATE comments SET lease_owner = CASE WHEN id = 'd' THEN 'other' ELSE 'worker' END, "
+                "lease_expires_at = NOW() + INTERVAL '5 minutes'"
+            )
+        report = await bulk_update_comment_results([
+            _result("a", "POS", 0.5, ["price", "price", "shipping"], keywords=["too pricey"], cluster_size=3),
+            _result("b", "NEG", 0.25, ["price"], sentiment_tier="lexicon"),
+            _result("c", "NEU", 0.75, []),
+            # Leased to another worker since, or deleted: left alone
+            _result("d", "POS", 0.5, ["quality"]),
+            _result("gone", "POS", 0.5, ["quality"]),
+            # Rejected before anything is sent
+            _result("e", "MEH", 0.5, ["quality"])
+        ], chunk_size=2, lease_owner="worker")
+        return report, await _comments(), await _counters()
+
+    report, comments, counters = database_run(scenario())
+
+    assert report["updated"] == 3
+    assert sorted(report["missing"]) == ["d", "gone"]
+    assert [failure["id"] for failure in report["failed"]] == ["e"]
+
+    sentiment, tags, meta, lease_owner, lease_expires_at = comments["a"]
+    assert (sentiment, tags, lease_owner, lease_expires_at) == ("POS", ["price", "price", "shipping"], None, None)
+    assert meta["sentiment_confidence"] == 0.5
+    assert (meta["keywords"], meta["cluster_size"]) == (["too pricey"], 3)
+    assert comments["b"][:2] == ("NEG", ["price"])
+    assert comments["b"][2]["sentiment_tier"] == "lexicon"
+    assert comments["c"][:2] == ("NEU", [])
+    # Untouched rows keep their lease and stay unanalyzed
+    assert comments["d"][0] is None and comments["d"][3] == "other"
+    assert comments["e"][0] is None and comments["e"][3] == "worker"
+
+    # A tag repeated on one comment is one mention
+    assert counters == ((3, 1, 1, 1, 1.5, 3), {"price": (2, 0), "shipping": (1, 1)})
+
+def test_bad_row_falls_back_to_per_row_savepoints(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, COMMENTS)
+        report = await bulk_update_comment_results([
+            _result("a", "POS", 0.5, ["price"]),
+            _result("b", "NEG", 0.5, [BAD_TAG, "price"]),
+            _result("c", "NEG", 0.25, ["shipping"]),
+            _result("d", "NEU", 0.75, ["price"])
+        ], chunk_size=3)
+        return report, await _comments(), await _counters()
+
+    report, comments, counters = database_run(scenario())
+
+    assert report["updated"] == 3
+    assert report["missing"] == []
+    assert [failure["id"] for failure in report["failed"]] == ["b"]
+    # The rest of b's chunk is written; b keeps its previous state
+    assert {comment_id: comments[comment_id][0] for comment_id in "abcd"} == {
+        "a": "POS", "b": None, "c": "NEG", "d": "NEU"
+    }
+    # Counters hold the written rows once each, nothing from b or the failed chunk statement
+    assert counters == ((3, 1, 1, 1, 1.5, 3), {"price": (2, 1), "shipping": (1, -1)})
+
+def test_apply_chunk_isolates_the_failing_row(database_run):
+    async def scenario():
+        await seed_comments(WORKSPACE_ID, COMMENTS)
+        processed_at = time.time()
+        staged = [
+            _stage_comment_result(_result("a", "POS", 0.5, ["price"]), processed_at, "test"),
+            _stage_comment_result(_result("b", "NEG", 0.5, [BAD_TAG]), processed_at, "test"),
+            _stage_comment_result(_result("gone", "NEG", 0.5, ["price"]), processed_at, "test"),
+            _stage_comment_result(_result("c", "NEU", 0.5, ["price"]), processed_at, "test")
+        ]
+        failed = []
+        async with get_db_connection() as conn:
+            updated = await _apply_comment_chunk(conn, staged, failed)
+        return updated, failed, await _counters()
+
+    updated, failed, counters = database_run(scenario())
+
+    assert updated == {"a", "c"}
+    assert [failure["id"] for failure in failed] == ["b"]
+    assert failed[0]["error"]
+    assert counters == ((2, 1, 1, 0, 1.0, 2), {"price": (2, 1)})